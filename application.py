@@ -1,15 +1,24 @@
-import logging, os
+import logging, os, time, json, threading
+from multiprocessing.pool import ThreadPool
 from ec2interface import EC2Interface
 from s3interface import S3Interface
 from manifest import Manifest
 from instancemanager import InstanceManager
+from asyncs3interface import AsyncS3Interface
+from asyncinstancemanager import AsyncInstanceManager
 from instancemetadatafactory import InstanceMetadataFactory
+from manifestdigest import ManifestDigest
+from workerpool import WorkerPool
+from transfersettings import TransferSettings
+from archivesettings import ArchiveSettings
 class Application(object):
     
-    def __init__(self, s3, manifestPath, localWorkingDir):
+    def __init__(self, s3, manifestPath, localWorkingDir, transferSettings=None,
+                 manifestCacheDir=None):
         self.manifestPath = manifestPath
-        self.manifest = Manifest(manifestPath)
+        self.manifest = Manifest(manifestPath, cacheDir=manifestCacheDir)
         self.s3interface = S3Interface(s3, self.manifest.GetBucketName(), localWorkingDir)
+        self.s3interface.transferSettings = transferSettings
         metafac = InstanceMetadataFactory(self.manifest)
         self.instanceManager = InstanceManager(self.s3interface, self.manifest, metafac)
         self.manifestKey = "/".join([self.manifest.GetS3KeyPrefix(), "manifest.json"])
@@ -29,38 +38,235 @@ class Application(object):
             raise ValueError("manifest error")
 
         doc = filteredDocs[0]
-        self.s3interface.downloadCompressed(self.manifest.GetS3KeyPrefix(), documentName,
-                                            os.path.abspath(doc["LocalPath"]))
+        self.s3interface.downloadDocument(self.manifest.GetS3KeyPrefix(), doc,
+                                          os.path.abspath(doc["LocalPath"]))
 
-    def downloadS3Documents(self):
+    def downloadS3Documents(self, downloadConcurrency=1, unpackConcurrency=1):
+        """downloads and unpacks each AWSToLocal document.
+
+        Args:
+            downloadConcurrency: the number of archives fetched from S3 at once
+            unpackConcurrency: the number of fetched archives unpacked at once.
+            Fetching and unpacking run on separate thread pools, so even with
+            both concurrencies at 1 one document is unpacked while the next
+            is being fetched. Each archive is removed once it is unpacked, and
+            at most downloadConcurrency + unpackConcurrency archives are
+            staged in localTempDir at once
+
+        Returns:
+            a list of per-document transfer summaries with the keys "Name",
+            "Bytes", "FetchSeconds" and "UnpackSeconds"
+        """
         logging.info("downloading files from s3 bucket {0}".format(self.s3interface.bucketName))
+        keyPrefix = self.manifest.GetS3KeyPrefix()
+        docs = self.manifest.GetS3Documents(filter = {"Direction": "AWSToLocal"})
+        # fetches wait for a slot, released once the archive is unpacked and
+        # removed, so they do not run ahead of the unpacks
+        stagedSlots = threading.BoundedSemaphore(downloadConcurrency + unpackConcurrency)
+
+        def fetch(doc):
+            start = time.time()
+            localPath = os.path.abspath(doc["LocalPath"])
+            if self.s3interface.stagesArchive(doc):
+                stagedSlots.acquire()
+                try:
+                    with self.s3interface.documentContext(doc):
+                        archive = self.s3interface.downloadArchive(
+                            keyPrefix, doc["Name"], self.s3interface.documentTransferSettings(doc))
+                except:
+                    stagedSlots.release()
+                    raise
+                size = S3Interface.archiveSize(archive)
+            else:
+                # fetched and unpacked together, leaving nothing to unpack
+                archive = None
+                size = self.s3interface.downloadDocument(keyPrefix, doc, localPath)
+            return { "Name": doc["Name"],
+                     "LocalPath": localPath,
+                     "Archive": archive,
+                     "Bytes": size,
+                     "FetchSeconds": time.time() - start }
+
+        def unpack(summary):
+            start = time.time()
+            archive = summary.pop("Archive")
+            localPath = summary.pop("LocalPath")
+            if archive is not None:
+                try:
+                    self.s3interface.unpackFileOrDirectory(archive, localPath)
+                finally:
+                    S3Interface.removeArchive(archive)
+                    stagedSlots.release()
+            summary["UnpackSeconds"] = time.time() - start
+            return summary
 
-        for doc in self.manifest.GetS3Documents(filter = {"Direction": "AWSToLocal"}):
-            self.s3interface.downloadCompressed(self.manifest.GetS3KeyPrefix(), doc["Name"],
-                                                os.path.abspath(doc["LocalPath"]))
+        def guarded(func, name):
+            def wrapper(item):
+                try:
+                    return (item, func(item), None)
+                except Exception as ex:
+                    logging.exception("error downloading document '{0}'".format(name(item)))
+                    return (item, None, ex)
+            return wrapper
+
+        fetchPool = ThreadPool(downloadConcurrency)
+        unpackPool = ThreadPool(unpackConcurrency)
+        failures = []
+        pending = []
+        try:
+            for doc, summary, ex in fetchPool.imap_unordered(
+                    guarded(fetch, lambda d: d["Name"]), docs):
+                if ex is not None:
+                    failures.append(doc["Name"])
+                else:
+                    pending.append(unpackPool.apply_async(
+                        guarded(unpack, lambda s: s["Name"]), (summary,)))
+            summaries = []
+            for result in pending:
+                summary, unpacked, ex = result.get()
+                if ex is not None:
+                    failures.append(summary["Name"])
+                else:
+                    summaries.append(unpacked)
+        finally:
+            fetchPool.close()
+            unpackPool.close()
+            fetchPool.join()
+            unpackPool.join()
+
+        for summary in summaries:
+            logging.info(
+                "document '{0}': {1} bytes fetched in {2:.2f}s ({3:.0f} bytes/s), unpacked in {4:.2f}s"
+                .format(summary["Name"], summary["Bytes"], summary["FetchSeconds"],
+                        summary["Bytes"] / max(summary["FetchSeconds"], 1e-6),
+                        summary["UnpackSeconds"]))
+        if len(failures) > 0:
+            raise ValueError("{0} of {1} documents failed to download: {2}"
+                             .format(len(failures), len(docs), ",".join(failures)))
         logging.info("downloading finished")
+        return summaries
 
-    def downloadLogs(self, outputdir):
+    def downloadLogs(self, outputdir, concurrency=64):
+        """download the logs of every instance to outputdir, with up to
+        concurrency requests in flight"""
         logging.info("downloading instance logs s3 bucket {0}".format(self.s3interface.bucketName))
-        for j in self.manifest.GetJobs():
-            self.instanceManager.downloadInstanceLog(j["Id"], outputdir)
+        with AsyncS3Interface(self.s3interface, concurrency) as s3:
+            downloaded = AsyncInstanceManager(self.instanceManager, s3).downloadInstanceLogs(
+                [j["Id"] for j in self.manifest.GetJobs()], outputdir)
+        logging.info("downloaded {0} instance logs".format(len(downloaded)))
 
-    def uploadS3Documents(self):
+    def uploadS3Documents(self, concurrency=1, skipUnchanged=False):
+        """uploads the manifest, and then archives and uploads each LocalToAWS
+        document.
+
+        Args:
+            concurrency: the number of documents archived and uploaded at
+            once. The manifest upload always finishes before any document is
+            processed
+            skipUnchanged: if True documents whose content fingerprint
+            matches the object already in S3 are not archived or uploaded
+        """
         logging.info("uploading files to s3 bucket {0}".format(self.s3interface.bucketName))
         logging.info("uploading manifest {0} to {1}".format(self.manifestPath, self.manifestKey))
         self.s3interface.uploadFile(self.manifestPath, self.manifestKey)
 
-        for doc in self.manifest.GetS3Documents(filter = {"Direction": "LocalToAWS"}):
-            self.s3interface.uploadCompressed(self.manifest.GetS3KeyPrefix(), doc["Name"],
-                                              os.path.abspath(doc["LocalPath"]))
+        def upload(doc):
+            self.s3interface.uploadDocument(self.manifest.GetS3KeyPrefix(), doc,
+                                            os.path.abspath(doc["LocalPath"]),
+                                            skipUnchanged=skipUnchanged)
+
+        docs = self.manifest.GetS3Documents(filter = {"Direction": "LocalToAWS"})
+        results = WorkerPool(concurrency).run(upload, docs)
+        failures = WorkerPool.failures(results)
+        for doc, ex in failures:
+            logging.error("failed to upload document '{0}': {1}".format(doc["Name"], ex))
+        if len(failures) > 0:
+            raise ValueError("{0} of {1} documents failed to upload: {2}"
+                             .format(len(failures), len(results),
+                                     ",".join([doc["Name"] for doc, ex in failures])))
         logging.info("uploading finished")
 
-    def runInstances(self, ec2, instanceConfig):
+    def uploadManifestSignature(self):
+        """signs the validated manifest with a new ManifestDigest key and
+        uploads the signature alongside the manifest, so that instances
+        given the key skip validating the manifest if it is unchanged
+
+        Returns:
+            the key
+        """
+        key = ManifestDigest.NewKey()
+        signatureKey = ManifestDigest.SignatureKey(self.manifestKey)
+        localPath = os.path.join(self.s3interface.localTempDir, "manifest.json.digest")
+        with open(localPath, "w") as f:
+            f.write(ManifestDigest(key).sign(self.manifest.contents))
+        self.s3interface.uploadFile(localPath, signatureKey)
+        os.remove(localPath)
+        return key
+
+    def uploadManifestSlices(self, manifestDigestKey, concurrency=64):
+        """publishes for each job a manifest holding only the job and the
+        documents it requires, see Manifest.GetJobSlice, under the job's
+        <ProjectName>/instances/<id>/ keys, along with its signature with
+        manifestDigestKey, so each instance downloads and loads only its own
+        job
+
+        Args:
+            concurrency: the number of uploads in flight at once
+        """
+        logging.info("uploading manifest slices")
+        digest = ManifestDigest(manifestDigestKey)
+        jobIds = [j["Id"] for j in self.manifest.GetJobs()]
+        with AsyncS3Interface(self.s3interface, concurrency) as s3:
+            results = []
+            for jobId in jobIds:
+                contents = json.dumps(self.manifest.GetJobSlice(jobId)).encode("utf-8")
+                keyName = self.instanceManager.GetManifestKey(jobId)
+                results.append(s3.put(keyName, contents))
+                results.append(s3.put(ManifestDigest.SignatureKey(keyName),
+                                      digest.sign(contents).encode("ascii")))
+            gathered = AsyncS3Interface.gather(results)
+        failures = [ex for result, ex in gathered if ex is not None]
+        if len(failures) > 0:
+            raise ValueError("{0} of {1} manifest slice uploads failed: {2}"
+                             .format(len(failures), len(results), failures[0]))
+        logging.info("uploaded {0} manifest slices".format(len(jobIds)))
+
+    def runInstances(self, ec2, instanceConfig, archiveSettings=None):
+        """uploads the manifest and launches an instance for each job
+
+        Args:
+            ec2: boto3 ec2 resource
+            instanceConfig: the instance configuration dictionary
+            archiveSettings: optional ArchiveSettings for instances,
+            overriding the "ArchiveSettings" section of the BootStrapperConfig
+        """
+        manifestDigestKey = self.uploadManifestSignature()
+        self.uploadManifestSlices(manifestDigestKey)
         ec2interface = EC2Interface(ec2, instanceConfig["BootStrapperConfig"]["WorkingDirectory"], 
                                      self.manifest, self.manifestKey, self.instanceManager,
                                      instanceConfig["BootStrapperConfig"]["PythonPath"],
                                      instanceConfig["BootStrapperConfig"]["BootStrapScriptPath"],
                                      instanceConfig["BootStrapperConfig"]["LineBreak"],
-                                     instanceConfig["BootStrapperConfig"]["BootstrapCommands"])
+                                     instanceConfig["BootStrapperConfig"]["BootstrapCommands"],
+                                     self.__instanceTransferSettings(instanceConfig),
+                                     instanceConfig["BootStrapperConfig"].get("DocumentCache"),
+                                     manifestDigestKey, manifestSlices=True,
+                                     archiveSettings=self.__instanceArchiveSettings(
+                                         instanceConfig, archiveSettings))
         ec2interface.launchInstances(instanceConfig["EC2Config"]["InstanceConfig"])
-        logging.info("ec2 launch finished")
\ No newline at end of file
+        logging.info("ec2 launch finished")
+
+    def __instanceTransferSettings(self, instanceConfig):
+        """the TransferSettings for instances, from the optional
+        "TransferSettings" section of the BootStrapperConfig"""
+        values = instanceConfig["BootStrapperConfig"].get("TransferSettings")
+        return None if values is None else TransferSettings(values)
+
+    def __instanceArchiveSettings(self, instanceConfig, archiveSettings):
+        """the ArchiveSettings for instances, from the optional
+        "ArchiveSettings" section of the BootStrapperConfig overridden by
+        archiveSettings"""
+        values = dict(instanceConfig["BootStrapperConfig"].get("ArchiveSettings") or {})
+        if archiveSettings is not None:
+            values.update(archiveSettings.values)
+        return ArchiveSettings(values)
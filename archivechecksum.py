@@ -0,0 +1,180 @@
+import os, uuid, zlib, logging
+
+class _ChecksumWriter(object):
+    """a write-only file-like object adding the data written to it to an
+    ArchiveChecksum before passing it on to another"""
+
+    def __init__(self, fileobj, checksum):
+        self.fileobj = fileobj
+        self.checksum = checksum
+
+    def write(self, data):
+        self.checksum.update(data)
+        self.fileobj.write(data)
+
+class _VerifyingReader(object):
+    """a read-only file-like object returning the data of another only once
+    each of its blocks has been verified, see ArchiveChecksum.reader"""
+
+    def __init__(self, fileobj, checksum, fetchRange, retries):
+        self.fileobj = fileobj
+        self.checksum = checksum
+        self.fetchRange = fetchRange
+        self.retries = retries
+        self.__offset = 0
+        # verified data before __position has been read, see
+        # tarstream._DecompressingReader
+        self.__buffer = bytearray()
+        self.__position = 0
+
+    def read(self, size=-1):
+        while ((size < 0 or len(self.__buffer) - self.__position < size)
+               and self.__offset < self.checksum.size):
+            length = min(self.checksum.blockSize, self.checksum.size - self.__offset)
+            data = self.__readFully(length)
+            self.__buffer.extend(self.checksum.repair(data, self.__offset, self.__offset + length,
+                                                      self.fetchRange, self.retries))
+            self.__offset += length
+        end = len(self.__buffer) if size < 0 else min(len(self.__buffer), self.__position + size)
+        data = bytes(self.__buffer[self.__position:end])
+        self.__position = end
+        if 2 * self.__position >= len(self.__buffer):
+            del self.__buffer[:self.__position]
+            self.__position = 0
+        return data
+
+    def __readFully(self, length):
+        chunks = []
+        remaining = length
+        while remaining > 0:
+            chunk = self.fileobj.read(remaining)
+            if len(chunk) == 0:
+                break # truncated, repaired from the ranges fetched again
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        return b"".join(chunks)
+
+class ArchiveChecksum(object):
+    """CRC-32 checksums of the consecutive blocks of an archive, computed
+    while the archive is written and checked while it is read back, so that
+    a corrupt or truncated download is detected per block and only the
+    corrupt blocks are fetched again.
+
+    The checksums are saved as json (see toJson), and each upload gets a new
+    id, stored as the "checksum" metadata of the archive object, so that the
+    checksums of a different upload of the same key are never applied.
+    """
+
+    def __init__(self, blockSize=8 * 1024 * 1024, id=None):
+        """
+        Args:
+            blockSize: the number of archive bytes covered by each checksum
+            id: the id of existing checksums, a new id by default
+        """
+        self.blockSize = blockSize
+        self.id = uuid.uuid4().hex if id is None else id
+        self.size = 0
+        self.blocks = []
+        self.__crc = 0
+        self.__blockBytes = 0
+
+    def update(self, data):
+        """add the next bytes of the archive"""
+        offset = 0
+        while offset < len(data):
+            length = min(len(data) - offset, self.blockSize - self.__blockBytes)
+            self.__crc = zlib.crc32(data[offset:offset + length], self.__crc)
+            self.__blockBytes += length
+            offset += length
+            if self.__blockBytes == self.blockSize:
+                self.__endBlock()
+        self.size += len(data)
+
+    def finish(self):
+        """add the checksum of the last partial block, returning self"""
+        if self.__blockBytes > 0:
+            self.__endBlock()
+        return self
+
+    def __endBlock(self):
+        self.blocks.append(self.__crc & 0xffffffff)
+        self.__crc = 0
+        self.__blockBytes = 0
+
+    def writer(self, fileobj):
+        """returns a file-like object computing the checksums of the archive
+        written to fileobj, of which only the write method is used"""
+        return _ChecksumWriter(fileobj, self)
+
+    def reader(self, fileobj, fetchRange, retries=3):
+        """returns a file-like object reading the archive from fileobj,
+        verifying each block before returning it and repairing corrupt
+        blocks, see repair"""
+        return _VerifyingReader(fileobj, self, fetchRange, retries)
+
+    def toJson(self):
+        return { "Id": self.id,
+                 "BlockSize": self.blockSize,
+                 "Size": self.size,
+                 "Blocks": ["{0:08x}".format(crc) for crc in self.blocks] }
+
+    @staticmethod
+    def FromJson(data):
+        checksum = ArchiveChecksum(data["BlockSize"], data["Id"])
+        checksum.size = data["Size"]
+        checksum.blocks = [int(crc, 16) for crc in data["Blocks"]]
+        return checksum
+
+    def verifyBlock(self, block, start):
+        """returns True if block is the complete block of the archive
+        starting at offset start"""
+        n = start // self.blockSize
+        return n < len(self.blocks) and \
+            len(block) == min(self.blockSize, self.size - start) and \
+            zlib.crc32(block) & 0xffffffff == self.blocks[n]
+
+    def repair(self, data, start, end, fetchRange, retries=3):
+        """returns data, the archive bytes from the block aligned offset
+        start up to end, with the blocks that do not match their checksums
+        replaced by fetching them again. data may be truncated
+
+        Args:
+            fetchRange: a function returning the archive bytes from start up
+            to but excluding end
+            retries: the number of times a corrupt block is fetched again
+
+        Raises:
+            ValueError: if a block is still corrupt after retries attempts
+        """
+        if start % self.blockSize != 0:
+            raise ValueError("offset {0} is not aligned to a block".format(start))
+        blocks = []
+        for blockStart in range(start, end, self.blockSize):
+            blockEnd = min(end, blockStart + self.blockSize)
+            block = data[blockStart - start:blockEnd - start]
+            attempt = 0
+            while not self.verifyBlock(block, blockStart):
+                if attempt == retries:
+                    raise ValueError("archive bytes {0}-{1} are corrupt after {2} retries"
+                                     .format(blockStart, blockEnd - 1, retries))
+                attempt += 1
+                logging.warning("archive bytes {0}-{1} failed verification, fetching them again"
+                                .format(blockStart, blockEnd - 1))
+                block = fetchRange(blockStart, blockEnd)
+            blocks.append(block)
+        return b"".join(blocks)
+
+    def repairFile(self, path, fetchRange, retries=3):
+        """verify the complete archive at path, repairing corrupt or missing
+        blocks in place, see repair"""
+        with open(path, "r+b") as f:
+            if os.path.getsize(path) > self.size:
+                f.truncate(self.size)
+            for start in range(0, self.size, self.blockSize):
+                end = min(self.size, start + self.blockSize)
+                f.seek(start)
+                data = f.read(end - start)
+                repaired = self.repair(data, start, end, fetchRange, retries)
+                if repaired != data:
+                    f.seek(start)
+                    f.write(repaired)
@@ -0,0 +1,84 @@
+import logging, numbers
+
+class ArchiveSettings(object):
+    """the settings of how S3Interface stores document archives, which are
+    applied to its attributes of the same name. Settings are read from a
+    dictionary such as the "ArchiveSettings" of the instance config's
+    BootStrapperConfig, or from command line arguments. A setting of 0
+    turns the feature off
+    """
+
+    # dictionary key, command line argument and S3Interface attribute, the
+    # default, None for off, and whether 0 turns the feature off
+    fields = [
+        ("ResumableThreshold", "resumableThreshold", "resumableThreshold", None, True),
+        ("ShardSize", "shardSize", "shardSize", None, True),
+        ("MaxShards", "maxShards", "maxShards", 64, False),
+        ("ChecksumBlockSize", "checksumBlockSize", "checksumBlockSize", 8 * 1024 * 1024, True)
+    ]
+
+    def __init__(self, values=None):
+        """
+        Args:
+            values: optional dictionary of setting names to integers,
+            unspecified settings keep the S3Interface defaults
+        """
+        self.values = {}
+        if values is not None:
+            keys = [key for key, arg, attribute, default, optional in self.fields]
+            for key, value in values.items():
+                if key not in keys:
+                    raise ValueError("unknown archive setting '{0}', expected one of {1}"
+                                     .format(key, ",".join(keys)))
+                optional = [f[4] for f in self.fields if f[0] == key][0]
+                # numbers.Integral includes the long of python 2
+                if not isinstance(value, numbers.Integral) or isinstance(value, bool) \
+                   or value < (0 if optional else 1):
+                    raise ValueError("archive setting '{0}' must be a {1} integer, got {2}"
+                                     .format(key, "non-negative" if optional else "positive",
+                                             value))
+                self.values[key] = value
+
+    def apply(self, s3interface):
+        """set the attributes of an S3Interface to these settings. Settings
+        are not applied to an S3Interface whose resource only transfers
+        files, see S3Interface.objectRequests"""
+        if len(self.values) == 0:
+            return
+        if not s3interface.objectRequests:
+            logging.warning("the S3 resource only transfers files, ignoring archive settings {0}"
+                            .format(self))
+            return
+        for key, arg, attribute, default, optional in self.fields:
+            if key in self.values:
+                value = self.values[key]
+                setattr(s3interface, attribute, None if optional and value == 0 else value)
+
+    def toArguments(self):
+        """returns the command line arguments that reproduce these settings"""
+        return " ".join("--{0} {1}".format(arg, self.values[key])
+                        for key, arg, attribute, default, optional in self.fields
+                        if key in self.values)
+
+    def __str__(self):
+        return ", ".join("{0} {1}".format(key, self.values[key])
+                         for key, arg, attribute, default, optional in self.fields
+                         if key in self.values)
+
+    @staticmethod
+    def addArguments(parser):
+        """add the optional archive setting arguments to an argparse parser"""
+        for key, arg, attribute, default, optional in ArchiveSettings.fields:
+            parser.add_argument("--{0}".format(arg), type=int, default=None, required=False,
+                                help = "optional archive setting {0} (default {1}{2})"
+                                .format(key, "off" if default is None else default,
+                                        ", 0 turns it off" if optional else ""))
+
+    @staticmethod
+    def FromArguments(args, values=None):
+        """returns the settings given in a dictionary of parsed arguments,
+        overriding the optional dictionary values"""
+        values = dict(values or {})
+        values.update((key, args[arg]) for key, arg, attribute, default, optional
+                      in ArchiveSettings.fields if args.get(arg) is not None)
+        return ArchiveSettings(values)
@@ -0,0 +1,65 @@
+import os, logging
+from loghelper import LogHelper
+from asyncs3interface import AsyncS3Interface
+
+class AsyncInstanceManager(object):
+    """the operations of an InstanceManager over many instances at once,
+    issued through an AsyncS3Interface. Instance data is stored under the
+    same <ProjectName>/instances/<id>/ keys as InstanceManager's, so both
+    can be used with the same instances"""
+
+    def __init__(self, instanceManager, asyncS3Interface):
+        self.instanceManager = instanceManager
+        self.asyncS3Interface = asyncS3Interface
+        self.__metadataFileName = "metadata.json"
+
+    def GetKey(self, instanceId, s3DocumentName):
+        return "/".join([self.instanceManager.GetKeyPrefix(instanceId), s3DocumentName])
+
+    def downloadMetaData(self, instanceIds):
+        """returns a dictionary of the InstanceMetadata of each instance id,
+        which is None for instances that have not published metadata"""
+        factory = self.instanceManager.instanceMetadataFactory
+        results = [self.asyncS3Interface.get(self.GetKey(i, self.__metadataFileName))
+                   for i in instanceIds]
+        metadata = {}
+        for instanceId, (data, ex) in zip(instanceIds, AsyncS3Interface.gather(results)):
+            if ex is not None:
+                raise ex
+            metadata[instanceId] = None if data is None \
+                else factory.FromJsonString(data.decode("utf-8"))
+        return metadata
+
+    def uploadMetaData(self, metadataList):
+        """upload the metadata of each InstanceMetadata in metadataList"""
+        factory = self.instanceManager.instanceMetadataFactory
+        self.__raiseFirst([self.asyncS3Interface.put(
+            self.GetKey(m.Get("Id"), self.__metadataFileName),
+            factory.ToJsonString(m).encode("utf-8")) for m in metadataList])
+
+    def downloadInstanceLogs(self, instanceIds, localDir):
+        """download the log of each instance to localDir, skipping instances
+        that have not uploaded a log
+
+        Returns:
+            the instance ids whose logs were downloaded
+        """
+        results = [self.asyncS3Interface.download(
+            self.GetKey(i, LogHelper.instanceLogFileName(i)),
+            os.path.join(localDir, LogHelper.instanceLogFileName(i))) for i in instanceIds]
+        downloaded = []
+        for instanceId, (result, ex) in zip(instanceIds, AsyncS3Interface.gather(results)):
+            if ex is None:
+                downloaded.append(instanceId)
+                continue
+            code = getattr(ex, "response", {}).get("Error", {}).get("Code")
+            if code not in ["404", "NoSuchKey", "NotFound"]:
+                raise ex
+            logging.warning("instance {0} has not uploaded a log".format(instanceId))
+        return downloaded
+
+    @staticmethod
+    def __raiseFirst(results):
+        for result, ex in AsyncS3Interface.gather(results):
+            if ex is not None:
+                raise ex
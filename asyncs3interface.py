@@ -0,0 +1,105 @@
+from multiprocessing.pool import ThreadPool
+
+class AsyncS3Interface(object):
+    """issues many small S3 operations at once for an S3Interface, eg. to
+    poll the status or collect the logs of every instance.
+
+    Each operation is queued on one shared pool of concurrency threads and
+    returns a multiprocessing AsyncResult immediately, so a caller can have
+    hundreds of requests in flight without starting a thread per request.
+    Requests are made with the calling thread's TransferScheduler priority,
+    and small objects are read and written in memory rather than through
+    files. Close the interface, or use it as a context manager, to stop the
+    pool.
+    """
+
+    def __init__(self, s3interface, concurrency=64):
+        """
+        Args:
+            s3interface: the S3Interface whose bucket and scheduler are used
+            concurrency: the number of requests in flight at once
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1, got {0}".format(concurrency))
+        self.s3interface = s3interface
+        self.concurrency = concurrency
+        self.__pool = ThreadPool(concurrency)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """wait for the queued operations and stop the pool"""
+        self.__pool.close()
+        self.__pool.join()
+
+    def __submit(self, func, scheduled=True):
+        """run func on the pool with the calling thread's scheduler context,
+        in a scheduler request slot unless it takes its own"""
+        scheduler = self.s3interface.scheduler
+        context = scheduler.current()
+        def run():
+            with scheduler.context(*context):
+                if not scheduled:
+                    return func()
+                with scheduler.request():
+                    return func()
+        return self.__pool.apply_async(run)
+
+    def get(self, keyName):
+        """returns an AsyncResult of the contents of keyName, or None if it
+        does not exist"""
+        def get():
+            try:
+                return self.s3interface.bucket.Object(keyName).get()["Body"].read()
+            except Exception as ex:
+                code = getattr(ex, "response", {}).get("Error", {}).get("Code")
+                if code in ["404", "NoSuchKey", "NotFound"]:
+                    return None
+                raise
+        return self.__submit(get)
+
+    def put(self, keyName, data, metadata=None):
+        """returns an AsyncResult of storing the bytes data as keyName"""
+        def put():
+            if metadata is None:
+                return self.s3interface.bucket.Object(keyName).put(Body=data)
+            return self.s3interface.bucket.Object(keyName).put(Body=data, Metadata=metadata)
+        return self.__submit(put)
+
+    def delete(self, keyName):
+        return self.__submit(lambda: self.s3interface.deleteFile(keyName, False))
+
+    def list(self, prefix):
+        """returns an AsyncResult of the sorted keys starting with prefix"""
+        return self.__submit(lambda: sorted(
+            x.key for x in self.s3interface.bucket.objects.filter(Prefix=prefix)))
+
+    def download(self, keyName, localPath):
+        """returns an AsyncResult of downloading keyName to a local file"""
+        return self.__submit(lambda: self.s3interface.downloadFile(keyName, localPath, False),
+                             scheduled=False)
+
+    def upload(self, localPath, keyName):
+        """returns an AsyncResult of uploading a local file to keyName"""
+        return self.__submit(lambda: self.s3interface.uploadFile(localPath, keyName, False),
+                             scheduled=False)
+
+    @staticmethod
+    def gather(results):
+        """wait for each of the AsyncResults
+
+        Returns:
+            a list of (result, exception) tuples in the same order as
+            results. For each result exactly one of result or exception is set
+        """
+        gathered = []
+        for result in results:
+            try:
+                gathered.append((result.get(), None))
+            except Exception as ex:
+                gathered.append((None, ex))
+        return gathered
@@ -48,8 +48,9 @@ class AWSInstanceBootStrapper(object):
                 self.metadata.UpdateMessage("Downloading '{0}'"
                                             .format(documentName))
                 self.UploadStatus()
-                self.s3interface.downloadCompressed(
-                    keyPrefix, documentName, localPath)
+                self.s3interface.downloadDocument(
+                    keyPrefix, documentData, localPath,
+                    include=self.manifest.GetIncludePatterns(self.instanceId, documentName))
                 self.metadata.IncrementDownloadFinished()
                 self.UploadStatus()
 
@@ -108,29 +109,67 @@ class AWSInstanceBootStrapper(object):
                 self.metadata.UpdateMessage("Uploading '{0}'"
                     .format(documentName))
                 self.UploadStatus()
-                self.s3interface.uploadCompressed(keyPrefix, documentName, localPath)
+                self.s3interface.uploadDocument(keyPrefix, documentData, localPath)
                 self.metadata.IncrementUploadsFinished()
                 self.UploadStatus()
 
+def downloadManifest(s3interface, manifestKey, localWorkingDir, manifestDigestKey=None):
+    """download the manifest, and if manifestDigestKey is specified the
+    signature stored alongside it, and load it. A manifest signed with the
+    key is loaded without validation
+
+    Returns:
+        the Manifest
+    """
+    from manifest import Manifest
+    from manifestdigest import ManifestDigest
+    localManifestPath = os.path.join(localWorkingDir, "manifest.json")
+    logging.info("downloading manifest from S3")
+    s3interface.downloadFile(manifestKey, localManifestPath)
+    if manifestDigestKey is None:
+        return Manifest(localManifestPath)
+    localSignaturePath = localManifestPath + ".digest"
+    try:
+        s3interface.downloadFile(ManifestDigest.SignatureKey(manifestKey), localSignaturePath)
+    except Exception as ex:
+        code = getattr(ex, "response", {}).get("Error", {}).get("Code")
+        if code not in ["404", "NoSuchKey", "NotFound"]:
+            raise
+        logging.info("manifest has no signature")
+        return Manifest(localManifestPath)
+    with open(localSignaturePath) as f:
+        signature = f.read()
+    return Manifest(localManifestPath, ManifestDigest(manifestDigestKey), signature)
+
 def main():
     """to be run on by each instance as a startup command"""
     import argparse, sys
-    import boto3
     #from powershell_s3 import powershell_s3
     from s3interface import S3Interface
-    from manifest import Manifest
     from instancemanager import InstanceManager
     from instancemetadatafactory import InstanceMetadataFactory
     from loghelper import LogHelper
+    from transfersettings import TransferSettings
+    from s3clientfactory import S3ClientFactory
+    from documentcache import DocumentCache
+    from transferscheduler import TransferScheduler
+    from archivesettings import ArchiveSettings
     parser = argparse.ArgumentParser(
         description="AWS Instance bootstrapper" +
                     "Loads manifest which contains data and commands to run on this instance,"+
                     "downloads data from S3, runs commands, and uploads results to S3")
 
     parser.add_argument("--bucketName", help = "the name of the S3 bucket to work with", required=True)
-    parser.add_argument("--manifestKey", help = "the key pointing to the manifest file in the s3 bucket", required=True)
+    parser.add_argument("--manifestKey", help = "the key pointing to the manifest file, or the slice of it holding this instance's job, in the s3 bucket", required=True)
     parser.add_argument("--instanceId", help = "the id of this instance as defined in the manifest file", required=True)
     parser.add_argument("--localWorkingDir", help = "a directory to store working files, it will be created if it does not exist on the instance", required=True)
+    TransferSettings.addArguments(parser)
+    S3ClientFactory.addArguments(parser)
+    TransferScheduler.addArguments(parser)
+    ArchiveSettings.addArguments(parser)
+    parser.add_argument("--cacheDir", help = "optional directory caching unpacked input documents between runs, for example on an attached volume", required=False)
+    parser.add_argument("--manifestDigestKey", help = "optional key of the signature stored alongside the manifest by the launcher. A manifest with a valid signature is not validated again", required=False)
+    parser.add_argument("--cacheMaxBytes", help = "optional size the document cache is limited to (default 50GB)", type=int, default=50 * 1024 ** 3, required=False)
 
     try:
         #boto3.set_stream_logger(name='botocore')
@@ -148,15 +187,18 @@ def main():
         LogHelper.start_logging(logPath)
         logging.info("startup")
         logging.info("creating boto3 s3 resource")
-        s3 = boto3.resource('s3')
+        s3 = S3ClientFactory.FromArguments(args)
 
         logging.info("creating S3Interface")
         s3interface = S3Interface(s3, bucketName, localWorkingDir)
-
-        localManifestPath = os.path.join(localWorkingDir, "manifest.json")
-        logging.info("downloading manifest from S3")
-        s3interface.downloadFile(manifestKey, localManifestPath)
-        manifest = Manifest(localManifestPath)
+        s3interface.transferSettings = TransferSettings.FromArguments(args)
+        s3interface.scheduler = TransferScheduler.FromArguments(args)
+        ArchiveSettings.FromArguments(args).apply(s3interface)
+        if args["cacheDir"] is not None:
+            s3interface.documentCache = DocumentCache(args["cacheDir"], args["cacheMaxBytes"])
+
+        manifest = downloadManifest(s3interface, manifestKey, localWorkingDir,
+                                    args["manifestDigestKey"])
         metafac = InstanceMetadataFactory(manifest)
         instancemanager = InstanceManager(s3interface, manifest, metafac)
         metadata = instancemanager.downloadMetaData(instanceId)
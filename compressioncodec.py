@@ -0,0 +1,167 @@
+import bz2, re, zlib
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+class _Identity(object):
+    def compress(self, data):
+        return data
+
+    def decompress(self, data):
+        return data
+
+    def flush(self):
+        return b""
+
+class _FlushlessDecompressor(object):
+    """adds a no-op flush to decompressors that do not have one"""
+
+    def __init__(self, decompressor):
+        self.decompressor = decompressor
+
+    def decompress(self, data):
+        return self.decompressor.decompress(data)
+
+    def flush(self):
+        return b""
+
+class CompressionCodec(object):
+    """a compression method for archive members, identified by its manifest
+    "Compression" setting and by the zip method id recorded in each member's
+    headers, which is what unpacking uses to pick the decoder.
+
+    Settings are "store", "deflate", "deflate:<0-9>", "bzip2", "bzip2:<1-9>",
+    "zstd", "zstd:<1-22>" (if the zstandard package is installed) and "auto",
+    which samples each file and stores incompressible ones.
+    """
+
+    __settingPattern = re.compile(r"^(store|deflate|bzip2|zstd|auto)(?::(\d+))?$")
+    __levels = { "deflate": (0, 9), "bzip2": (1, 9), "zstd": (1, 22) }
+    __defaultLevels = { "deflate": zlib.Z_DEFAULT_COMPRESSION, "bzip2": 9, "zstd": 3 }
+    # zip method ids from the PKWARE APPNOTE
+    methods = { "store": 0, "deflate": 8, "bzip2": 12, "zstd": 93 }
+
+    def __init__(self, name, level=None):
+        self.name = name
+        self.level = self.__defaultLevels.get(name) if level is None else level
+        self.method = self.methods[name]
+        # deflate blocks ending on a sync flush concatenate into one stream,
+        # so members can be compressed as independent blocks in parallel
+        self.splittable = name in ["store", "deflate"]
+
+    @property
+    def setting(self):
+        if self.level is None or self.level == self.__defaultLevels.get(self.name):
+            return self.name
+        return "{0}:{1}".format(self.name, self.level)
+
+    def compressor(self):
+        """returns an object with compress and flush methods"""
+        if self.name == "store":
+            return _Identity()
+        elif self.name == "deflate":
+            return zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        elif self.name == "bzip2":
+            return bz2.BZ2Compressor(self.level)
+        else:
+            # zstd spreads compression of large members over all cores itself
+            return zstandard.ZstdCompressor(level=self.level, threads=-1).compressobj()
+
+    def decompressor(self):
+        """returns an object with decompress and flush methods"""
+        if self.name == "store":
+            return _Identity()
+        elif self.name == "deflate":
+            return zlib.decompressobj(-15)
+        elif self.name == "bzip2":
+            return _FlushlessDecompressor(bz2.BZ2Decompressor())
+        else:
+            return _FlushlessDecompressor(zstandard.ZstdDecompressor().decompressobj())
+
+    def compressBlock(self, data, last):
+        """compress one block of a member independently of the others. Only
+        valid for splittable codecs"""
+        if self.name == "store":
+            return data
+        compressor = self.compressor()
+        return compressor.compress(data) + \
+            compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+    def forFile(self, filename):
+        """the concrete codec used for the member read from filename"""
+        return self
+
+    def forData(self, data):
+        """the concrete codec used for a member with the specified contents"""
+        return self
+
+    @staticmethod
+    def parse(setting):
+        """validates a "Compression" setting, returning (name, level). level
+        is None when the setting does not specify one"""
+        match = CompressionCodec.__settingPattern.match(str(setting))
+        if match is None:
+            raise ValueError("unknown compression setting '{0}'".format(setting))
+        name, level = match.group(1), match.group(2)
+        if level is None:
+            return name, None
+        if name not in CompressionCodec.__levels:
+            raise ValueError("compression '{0}' does not take a level".format(name))
+        low, high = CompressionCodec.__levels[name]
+        if not low <= int(level) <= high:
+            raise ValueError("compression level for '{0}' must be between {1} and {2}"
+                             .format(name, low, high))
+        return name, int(level)
+
+    @staticmethod
+    def get(setting):
+        """returns the codec for a "Compression" setting"""
+        name, level = CompressionCodec.parse(setting)
+        if name == "auto":
+            return AutoCompressionCodec()
+        if name == "zstd" and zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package")
+        return CompressionCodec(name, level)
+
+    @staticmethod
+    def forMethod(method):
+        """returns a codec that decodes members with the specified zip method"""
+        for name, value in CompressionCodec.methods.items():
+            if value == method and (name != "zstd" or zstandard is not None):
+                return CompressionCodec(name)
+        raise ValueError("unsupported zip compression method {0}".format(method))
+
+class AutoCompressionCodec(CompressionCodec):
+    """deflates each member unless a sample of its data does not compress,
+    in which case it is stored. This avoids spending CPU on already
+    compressed inputs such as NetCDF, HDF5 or PNG files"""
+
+    def __init__(self, sampleSize=64 * 1024, threshold=0.9):
+        CompressionCodec.__init__(self, "deflate")
+        self.name = "auto"
+        self.sampleSize = sampleSize
+        self.threshold = threshold
+
+    @property
+    def setting(self):
+        return "auto"
+
+    def forFile(self, filename):
+        # sample the start, middle and end of the file
+        with open(filename, "rb") as f:
+            f.seek(0, 2)
+            size = f.tell()
+            samples = []
+            for offset in sorted(set([0, max(0, size // 2 - self.sampleSize // 2),
+                                      max(0, size - self.sampleSize)])):
+                f.seek(offset)
+                samples.append(f.read(self.sampleSize))
+        return self.forData(b"".join(samples))
+
+    def forData(self, data):
+        sample = data[:3 * self.sampleSize]
+        if len(sample) > 0 and \
+           len(zlib.compress(sample, 1)) > self.threshold * len(sample):
+            return CompressionCodec("store")
+        return CompressionCodec("deflate")
@@ -0,0 +1,218 @@
+import os, json, time, shutil, hashlib, logging, threading
+
+class DocumentCache(object):
+    """an on-disk cache of unpacked documents, keyed by the bucket, key and
+    ETag of the S3 object they were unpacked from.
+
+    Each entry is kept under <cacheDir>/entries/ and is materialized at a
+    destination by hard-linking its files, falling back to copies where
+    links are not supported (eg. across devices). Linked files share their
+    contents with the cache, so jobs should not modify input files in place.
+    The least recently used entries are evicted once the cache holds more
+    than maxBytes.
+    """
+
+    def __init__(self, cacheDir, maxBytes):
+        """
+        Args:
+            cacheDir: the cache directory, created if it does not exist
+            maxBytes: the size the cache is reduced to after each new entry
+        """
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.indexPath = os.path.join(cacheDir, "index.json")
+        # the paths written by the last materialization of each document at
+        # each destination, see materialize
+        self.materializedPath = os.path.join(cacheDir, "materialized.json")
+        self.__lock = threading.Lock()
+        if not os.path.isdir(os.path.join(cacheDir, "entries")):
+            os.makedirs(os.path.join(cacheDir, "entries"))
+        self.index = self.__loadJson(self.indexPath)
+        self.materialized = self.__loadJson(self.materializedPath)
+        # drop entries whose content is missing, eg. partially written
+        for entryId in list(self.index):
+            if not os.path.exists(self.__entryPath(entryId)):
+                del self.index[entryId]
+
+    def lookup(self, bucketName, keyName, etag):
+        """returns the path of the cached content for the object, or None"""
+        entryId = self.__entryId(bucketName, keyName, etag)
+        with self.__lock:
+            if entryId not in self.index:
+                return None
+            self.index[entryId]["LastUsed"] = time.time()
+            self.__save()
+        return self.__entryPath(entryId)
+
+    def store(self, bucketName, keyName, etag, populate):
+        """add an entry for the object, then evict least recently used
+        entries beyond maxBytes
+
+        Args:
+            populate: a function writing the unpacked document to the path
+            passed to it, returning the number of bytes downloaded
+
+        Returns:
+            (path, bytes) the path of the cached content and the result of
+            populate
+        """
+        entryId = self.__entryId(bucketName, keyName, etag)
+        tempDir = os.path.join(self.cacheDir, "entries", entryId + ".tmp")
+        if os.path.exists(tempDir):
+            shutil.rmtree(tempDir)
+        os.makedirs(tempDir)
+        try:
+            downloaded = populate(os.path.join(tempDir, "content"))
+            size = self.__size(os.path.join(tempDir, "content"))
+            with self.__lock:
+                if os.path.exists(os.path.join(self.cacheDir, "entries", entryId)):
+                    shutil.rmtree(os.path.join(self.cacheDir, "entries", entryId))
+                os.rename(tempDir, os.path.join(self.cacheDir, "entries", entryId))
+                self.index[entryId] = {
+                    "Bucket": bucketName, "Key": keyName, "ETag": etag,
+                    "Size": size, "LastUsed": time.time() }
+                self.__evict(entryId)
+                self.__save()
+        except:
+            shutil.rmtree(tempDir, ignore_errors=True)
+            raise
+        return self.__entryPath(entryId), downloaded
+
+    def materialize(self, cachedPath, destinationPath, documentId=None):
+        """hard-link the cached file or tree at cachedPath to destinationPath,
+        replacing the paths the cached tree provides. Other entries at
+        destinationPath, such as other documents sharing it, are kept
+
+        Args:
+            documentId: optional identifier of the document, under which the
+            paths written are recorded. Paths recorded by the previous
+            materialization of the document at destinationPath that are not
+            in the cached tree are removed
+        """
+        if os.path.isfile(cachedPath):
+            if os.path.isdir(destinationPath):
+                shutil.rmtree(destinationPath)
+            self.__link(cachedPath, destinationPath)
+            return
+        if os.path.isfile(destinationPath):
+            os.remove(destinationPath)
+        directories, files = self.__tree(cachedPath)
+        recordId = None
+        if documentId is not None:
+            recordId = "\n".join([documentId, os.path.abspath(destinationPath)])
+            with self.__lock:
+                previous = self.materialized.get(recordId)
+            if previous is not None:
+                self.__removeStale(destinationPath, previous, directories, files)
+        for relpath in directories:
+            target = self.__localPath(destinationPath, relpath)
+            if os.path.isfile(target) or os.path.islink(target):
+                os.remove(target)
+            if not os.path.isdir(target):
+                os.makedirs(target)
+        for relpath in files:
+            target = self.__localPath(destinationPath, relpath)
+            if os.path.isdir(target) and not os.path.islink(target):
+                shutil.rmtree(target)
+            self.__link(self.__localPath(cachedPath, relpath), target)
+        if recordId is not None:
+            with self.__lock:
+                self.materialized[recordId] = { "Directories": directories, "Files": files }
+                self.__saveJson(self.materializedPath, self.materialized)
+
+    @classmethod
+    def __removeStale(cls, destinationPath, previous, directories, files):
+        """remove the files of a previous materialization that are not in
+        the new tree, and its directories that are no longer in the tree and
+        are left empty"""
+        for relpath in sorted(set(previous["Files"]) - set(files)):
+            path = cls.__localPath(destinationPath, relpath)
+            if os.path.isfile(path) or os.path.islink(path):
+                os.remove(path)
+        # nested directories sort after their parents
+        for relpath in sorted(set(previous["Directories"]) - set(directories), reverse=True):
+            path = cls.__localPath(destinationPath, relpath)
+            if os.path.isdir(path) and not os.path.islink(path) and not os.listdir(path):
+                os.rmdir(path)
+
+    @staticmethod
+    def __tree(path):
+        """returns the sorted relative paths of the directories and of the
+        files under path, separated by '/'"""
+        directories, files = [], []
+        for root, dirs, names in os.walk(path):
+            relroot = os.path.relpath(root, path)
+            prefix = "" if relroot == "." else relroot.replace(os.sep, "/") + "/"
+            directories.extend(prefix + d for d in dirs)
+            files.extend(prefix + f for f in names)
+        return sorted(directories), sorted(files)
+
+    @staticmethod
+    def __localPath(root, relpath):
+        return os.path.join(root, *relpath.split("/"))
+
+    def totalSize(self):
+        return sum(e["Size"] for e in self.index.values())
+
+    def __evict(self, keepId):
+        total = self.totalSize()
+        for entryId in sorted(self.index, key=lambda x: self.index[x]["LastUsed"]):
+            if total <= self.maxBytes:
+                break
+            if entryId == keepId:
+                continue
+            entry = self.index.pop(entryId)
+            total -= entry["Size"]
+            shutil.rmtree(os.path.join(self.cacheDir, "entries", entryId), ignore_errors=True)
+            logging.info("evicted '{0}' ({1} bytes) from the document cache"
+                         .format(entry["Key"], entry["Size"]))
+
+    @staticmethod
+    def __link(source, destination):
+        parent = os.path.dirname(destination)
+        if parent and not os.path.isdir(parent):
+            os.makedirs(parent)
+        if os.path.exists(destination):
+            os.remove(destination)
+        try:
+            os.link(source, destination)
+        except (AttributeError, OSError):
+            # no os.link on python 2 for windows, or a different device
+            shutil.copy2(source, destination)
+
+    @staticmethod
+    def __size(path):
+        if os.path.isfile(path):
+            return os.path.getsize(path)
+        return sum(os.path.getsize(os.path.join(root, f))
+                   for root, dirs, files in os.walk(path) for f in files)
+
+    @staticmethod
+    def __entryId(bucketName, keyName, etag):
+        value = "\n".join([bucketName, keyName, etag])
+        return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+    def __entryPath(self, entryId):
+        return os.path.join(self.cacheDir, "entries", entryId, "content")
+
+    def __save(self):
+        self.__saveJson(self.indexPath, self.index)
+
+    @staticmethod
+    def __loadJson(path):
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    return json.load(f)
+            except ValueError:
+                logging.warning("ignoring unreadable document cache index '{0}'".format(path))
+        return {}
+
+    @staticmethod
+    def __saveJson(path, value):
+        tmpPath = path + ".tmp"
+        with open(tmpPath, "w") as f:
+            json.dump(value, f)
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(tmpPath, path)
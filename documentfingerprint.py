@@ -0,0 +1,126 @@
+import os, json, hashlib, logging
+
+class DocumentFingerprint(object):
+    """computes a content fingerprint of a file or directory tree.
+
+    The fingerprint covers the relative path, size and sha256 hash of each
+    file, plus the directory structure. File hashes are cached in an index
+    file keyed by size and mtime, so unchanged files are not read again on
+    later runs.
+    """
+
+    def __init__(self, indexPath, blockSize=1024 * 1024):
+        """
+        Args:
+            indexPath: the path of the json file caching the file hashes
+            blockSize: the number of bytes read at a time when hashing
+        """
+        self.indexPath = indexPath
+        self.blockSize = blockSize
+        self.index = {}
+        if os.path.exists(indexPath):
+            try:
+                with open(indexPath) as f:
+                    self.index = json.load(f)
+            except ValueError:
+                logging.warning("ignoring unreadable fingerprint index '{0}'".format(indexPath))
+
+    def compute(self, path):
+        """returns the hex fingerprint of the file or directory at path"""
+        digest = hashlib.sha256()
+        if os.path.isdir(path):
+            digest.update(b"dir\n")
+            for relpath, size, fileHash in self.treeEntries(path):
+                if fileHash is None:
+                    digest.update(self.__toBytes("{0}/\n".format(relpath)))
+                else:
+                    digest.update(self.__toBytes(
+                        "{0}\0{1}\0{2}\n".format(relpath, size, fileHash)))
+        elif os.path.isfile(path):
+            # the name of a single file is not part of the fingerprint, since
+            # it is renamed to the destination path when unpacked
+            index = {}
+            size, fileHash = self.__hashFile(path, "", index)
+            self.__save(index)
+            digest.update(self.__toBytes("file\0{0}\0{1}\n".format(size, fileHash)))
+        else:
+            raise ValueError(
+                "specified path '{0}' is neither a dir or a file path".format(path))
+        return digest.hexdigest()
+
+    def statSignature(self, path):
+        """returns a hex digest of the relative path, size and mtime of the
+        file or of each file under path, which changes when files are
+        modified, added or removed but is computed without reading them"""
+        digest = hashlib.sha256()
+        if os.path.isfile(path):
+            entries = [("", path)]
+        else:
+            entries = [(relpath, filename) for relpath, filename in self.__walk(path)]
+        for relpath, filename in entries:
+            if filename is None:
+                digest.update(self.__toBytes("{0}/\n".format(relpath)))
+            else:
+                st = os.stat(filename)
+                digest.update(self.__toBytes("{0}\0{1}\0{2!r}\n".format(
+                    relpath, st.st_size, st.st_mtime)))
+        return digest.hexdigest()
+
+    def treeEntries(self, path):
+        """returns a sorted list of (relpath, size, hash) for each directory
+        and regular file under path, where size and hash are None for
+        directories. relpath is "/" separated and relative to path"""
+        index = {}
+        entries = []
+        for relpath, filename in self.__walk(path):
+            if filename is None:
+                entries.append((relpath, None, None))
+            else:
+                size, fileHash = self.__hashFile(filename, relpath, index)
+                entries.append((relpath, size, fileHash))
+        self.__save(index)
+        return entries
+
+    def __walk(self, path):
+        """yields (relpath, filename) for every file in sorted order, and
+        (relpath, None) for every directory"""
+        relroot = os.path.abspath(path)
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            relpath = os.path.relpath(root, relroot).replace(os.sep, "/")
+            yield relpath, None
+            for file in sorted(files):
+                filename = os.path.join(root, file)
+                if os.path.isfile(filename): # regular files only, as archived
+                    yield (file if relpath == "." else "/".join([relpath, file])), filename
+
+    def __hashFile(self, filename, relpath, index):
+        st = os.stat(filename)
+        cached = self.index.get(relpath)
+        if cached is not None and cached["Size"] == st.st_size \
+           and cached["MTime"] == st.st_mtime:
+            fileHash = cached["Hash"]
+        else:
+            h = hashlib.sha256()
+            with open(filename, "rb") as f:
+                for block in iter(lambda: f.read(self.blockSize), b""):
+                    h.update(block)
+            fileHash = h.hexdigest()
+        index[relpath] = { "Size": st.st_size, "MTime": st.st_mtime, "Hash": fileHash }
+        return st.st_size, fileHash
+
+    @staticmethod
+    def __toBytes(value):
+        return value if isinstance(value, bytes) else value.encode("utf-8")
+
+    def __save(self, index):
+        self.index = index
+        directory = os.path.dirname(self.indexPath)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmpPath = self.indexPath + ".tmp"
+        with open(tmpPath, "w") as f:
+            json.dump(self.index, f)
+        if os.path.exists(self.indexPath):
+            os.remove(self.indexPath)
+        os.rename(tmpPath, self.indexPath)
@@ -0,0 +1,203 @@
+import os, json, shutil, logging
+from workerpool import WorkerPool
+
+class DocumentSync(object):
+    """stores a directory document in S3 as one object per distinct file
+    content plus an index object, so that only changed files are transferred.
+
+    Content objects are keyed by the sha256 of the file under
+    <keyNamePrefix>/<documentName>/objects/, and the index object
+    <keyNamePrefix>/<documentName>/index.json maps each relative file path to
+    its size and hash, and lists the directories of the tree.
+    """
+
+    def __init__(self, s3interface, concurrency=16, transferSettings=None):
+        """
+        Args:
+            s3interface: the S3Interface used for transfers
+            concurrency: the number of files transferred at once
+            transferSettings: optional TransferSettings for each file transfer
+        """
+        self.s3interface = s3interface
+        self.concurrency = concurrency
+        self.transferSettings = transferSettings
+
+    def indexKey(self, keyNamePrefix, documentName):
+        return "/".join([keyNamePrefix, documentName, "index.json"])
+
+    def objectKey(self, keyNamePrefix, documentName, fileHash):
+        return "/".join([keyNamePrefix, documentName, "objects", fileHash])
+
+    def upload(self, keyNamePrefix, documentName, localPath):
+        """upload the files under localPath that are not already stored for
+        the document, then replace the index and remove content objects that
+        are no longer referenced"""
+        if not os.path.isdir(localPath):
+            raise ValueError("sync mode document '{0}' must be a directory, got '{1}'"
+                             .format(documentName, localPath))
+        fingerprint = self.s3interface.getDocumentFingerprint(documentName)
+        index = { "Directories": [], "Files": {} }
+        sources = {}
+        for relpath, size, fileHash in fingerprint.treeEntries(localPath):
+            if fileHash is None:
+                if relpath != ".":
+                    index["Directories"].append(relpath)
+            else:
+                index["Files"][relpath] = { "Size": size, "Hash": fileHash }
+                sources.setdefault(fileHash, (self.__localPath(localPath, relpath), size))
+
+        remote = self.readIndex(keyNamePrefix, documentName)
+        remoteHashes = set() if remote is None else \
+            set(f["Hash"] for f in remote["Files"].values())
+        pending = [(h, sources[h]) for h in sorted(sources) if h not in remoteHashes]
+
+        scheduler = self.s3interface.scheduler
+        context = scheduler.current()
+        def upload(item):
+            fileHash, (path, size) = item
+            # worker threads transfer with the priority of the calling thread
+            with scheduler.context(*context):
+                self.s3interface.uploadFile(
+                    path, self.objectKey(keyNamePrefix, documentName, fileHash), False,
+                    transferSettings=self.transferSettings)
+        self.__raiseFailures("upload", documentName,
+                             WorkerPool(self.concurrency).run(upload, pending))
+
+        indexPath = self.__tempIndexPath(documentName)
+        with open(indexPath, "w") as f:
+            json.dump(index, f)
+        try:
+            self.s3interface.uploadFile(indexPath, self.indexKey(keyNamePrefix, documentName))
+        finally:
+            os.remove(indexPath)
+
+        orphans = sorted(remoteHashes - set(sources))
+        for fileHash in orphans:
+            self.s3interface.deleteFile(self.objectKey(keyNamePrefix, documentName, fileHash))
+        logging.info("synced document '{0}': uploaded {1} of {2} distinct files ({3} bytes), removed {4}"
+                     .format(documentName, len(pending), len(sources),
+                             sum(size for h, (path, size) in pending), len(orphans)))
+
+    def download(self, keyNamePrefix, documentName, localPath):
+        """download the document's tree to localPath. Local files that
+        already match the index are kept. Files and directories synced to
+        localPath by the previous download of the document that are no longer
+        in the index are removed, while other local entries, such as other
+        documents or logs sharing localPath, are kept
+
+        Returns:
+            the number of bytes downloaded
+        """
+        index = self.readIndex(keyNamePrefix, documentName)
+        if index is None:
+            raise ValueError("no sync index found for document '{0}'".format(documentName))
+        local = {}
+        if os.path.isdir(localPath):
+            fingerprint = self.s3interface.getDocumentFingerprint(documentName)
+            for relpath, size, fileHash in fingerprint.treeEntries(localPath):
+                if fileHash is not None:
+                    local[relpath] = fileHash
+        synced = self.readSynced(documentName, localPath)
+        staleFiles = sorted(set(synced["Files"]).intersection(local) - set(index["Files"]))
+        for relpath in staleFiles:
+            os.remove(self.__localPath(localPath, relpath))
+        # nested directories sort after their parents
+        for relpath in sorted(set(synced["Directories"]) - set(index["Directories"]),
+                              reverse=True):
+            path = self.__localPath(localPath, relpath)
+            if os.path.isdir(path) and not os.listdir(path):
+                os.rmdir(path)
+        # replace the paths whose type changed between file and directory
+        for relpath in index["Directories"]:
+            if relpath in local:
+                os.remove(self.__localPath(localPath, relpath))
+                del local[relpath]
+        for relpath in index["Files"]:
+            path = self.__localPath(localPath, relpath)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+        for relpath in ["."] + index["Directories"]:
+            path = self.__localPath(localPath, relpath)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+        pending = sorted((relpath, f) for relpath, f in index["Files"].items()
+                         if local.get(relpath) != f["Hash"])
+
+        scheduler = self.s3interface.scheduler
+        context = scheduler.current()
+        def download(item):
+            relpath, f = item
+            with scheduler.context(*context):
+                self.s3interface.downloadFile(
+                    self.objectKey(keyNamePrefix, documentName, f["Hash"]),
+                    self.__localPath(localPath, relpath), False,
+                    transferSettings=self.transferSettings)
+        self.__raiseFailures("download", documentName,
+                             WorkerPool(self.concurrency).run(download, pending))
+        self.writeSynced(documentName, localPath, index)
+        size = sum(f["Size"] for relpath, f in pending)
+        logging.info("synced document '{0}': downloaded {1} of {2} files ({3} bytes), removed {4}"
+                     .format(documentName, len(pending), len(index["Files"]), size,
+                             len(staleFiles)))
+        return size
+
+    def readIndex(self, keyNamePrefix, documentName):
+        """returns the document's index, or None if it has not been uploaded"""
+        keyName = self.indexKey(keyNamePrefix, documentName)
+        if self.s3interface.getMetadata(keyName) is None:
+            return None
+        indexPath = self.__tempIndexPath(documentName)
+        self.s3interface.downloadFile(keyName, indexPath)
+        try:
+            with open(indexPath) as f:
+                return json.load(f)
+        finally:
+            os.remove(indexPath)
+
+    def syncedPath(self, documentName):
+        """returns the path of the local record of the files synced for the
+        document, which is kept under localTempDir"""
+        return os.path.join(self.s3interface.localTempDir, "synced",
+                            "{0}.json".format(documentName.replace('/', '_')))
+
+    def readSynced(self, documentName, localPath):
+        """returns the "Files" and "Directories" written to localPath by the
+        last download of the document, which are empty if there is none"""
+        path = self.syncedPath(documentName)
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    synced = json.load(f)
+                if synced.get("LocalPath") == os.path.abspath(localPath):
+                    return synced
+            except ValueError:
+                logging.warning("ignoring unreadable sync record '{0}'".format(path))
+        return { "Files": [], "Directories": [] }
+
+    def writeSynced(self, documentName, localPath, index):
+        path = self.syncedPath(documentName)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path + ".tmp", "w") as f:
+            json.dump({ "LocalPath": os.path.abspath(localPath),
+                        "Files": sorted(index["Files"]),
+                        "Directories": sorted(index["Directories"]) }, f)
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(path + ".tmp", path)
+
+    def __tempIndexPath(self, documentName):
+        return os.path.join(self.s3interface.localTempDir,
+                            "{0}_index.json".format(documentName.replace('/', '_')))
+
+    @staticmethod
+    def __localPath(root, relpath):
+        return os.path.join(root, *relpath.split("/"))
+
+    @staticmethod
+    def __raiseFailures(action, documentName, results):
+        failures = WorkerPool.failures(results)
+        if len(failures) > 0:
+            raise ValueError("{0} of {1} files of document '{2}' failed to {3}"
+                             .format(len(failures), len(results), documentName, action))
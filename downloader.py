@@ -1,6 +1,11 @@
-import boto3, logging, argparse, os, sys
+import logging, argparse, os, sys
 from application import Application
+from manifest import Manifest
 from loghelper import LogHelper
+from transfersettings import TransferSettings
+from s3clientfactory import S3ClientFactory
+from transferscheduler import TransferScheduler
+from archivesettings import ArchiveSettings
 
 def main():
 
@@ -12,20 +17,31 @@ def main():
 
     parser.add_argument("--manifestPath", help = "path to a manifest file describing the jobs and data requirements for the application", required=True)
     parser.add_argument("--localWorkingDir", help = "path to dir with read/write for processing data for upload and download to AWS S3", required=True)
+    parser.add_argument("--downloadConcurrency", help = "optional number of archives to fetch from S3 in parallel (default 1)", type=int, default=1, required=False)
+    parser.add_argument("--unpackConcurrency", help = "optional number of fetched archives to unpack in parallel (default 1)", type=int, default=1, required=False)
+    TransferSettings.addArguments(parser)
+    S3ClientFactory.addArguments(parser)
+    Manifest.addArguments(parser)
+    TransferScheduler.addArguments(parser)
+    ArchiveSettings.addArguments(parser)
     parser.add_argument("--documentName", help = "optional name of document to download (if unspecified all 'AWSToLocal' documents are downloaded)", required=False) 
     try:
         args = vars(parser.parse_args())
         manifestPath = os.path.abspath(args["manifestPath"])
         localWorkingDir = os.path.abspath(args["localWorkingDir"])
 
-        s3 = boto3.resource('s3')
+        s3 = S3ClientFactory.FromArguments(args)
 
-        app = Application(s3, manifestPath, localWorkingDir)
+        app = Application(s3, manifestPath, localWorkingDir,
+                          TransferSettings.FromArguments(args), args["manifestCacheDir"])
+        app.s3interface.scheduler = TransferScheduler.FromArguments(args)
+        ArchiveSettings.FromArguments(args).apply(app.s3interface)
 
         if "documentName" in args and not args["documentName"] is None:
             app.downloadS3Document(args["documentName"]) 
         else:
-            app.downloadS3Documents()
+            app.downloadS3Documents(args["downloadConcurrency"],
+                                    args["unpackConcurrency"])
 
     except Exception as ex:
         logging.exception("error in downloader")
@@ -3,7 +3,9 @@ class EC2Interface(object):
     
     def __init__(self, ec2Resource, instanceLocalWorkingDir, manifest, 
                  manifestKey, instanceManager, pythonpath, bootstrapScriptPath,
-                 lineBreak, bootstrapCommands):
+                 lineBreak, bootstrapCommands, transferSettings=None,
+                 documentCache=None, manifestDigestKey=None, manifestSlices=False,
+                 archiveSettings=None):
         """
         Args:
             ec2Resource: boto3 ec2 resource used to issue commands to the AWS 
@@ -30,6 +32,23 @@ class EC2Interface(object):
             bootstrapCommands: the list of commands to issue on instance 
             startup.  The magic name "$BootStrapScript" represents the
             position in the commands where the awsbootstrap script will be run
+
+            transferSettings: optional TransferSettings passed to the
+            awsbootstrap script for its S3 transfers
+
+            documentCache: optional dictionary with the "Path" of a document
+            cache directory on instances and optionally its "MaxBytes"
+
+            manifestDigestKey: optional ManifestDigest key passed to instances,
+            which load the manifest without validating it if its signature
+            made with the key is stored alongside it
+
+            manifestSlices: if True instances load the slice of the manifest
+            holding only their job, published at the instanceManager's
+            GetManifestKey, instead of the whole manifest
+
+            archiveSettings: optional ArchiveSettings passed to the
+            awsbootstrap script for the archives it stores
         """
         self.ec2Resource = ec2Resource
         self.instanceLocalWorkingDir = instanceLocalWorkingDir
@@ -40,6 +59,11 @@ class EC2Interface(object):
         self.bootstrapScriptPath = bootstrapScriptPath
         self.lineBreak = lineBreak
         self.bootstrapCommands = bootstrapCommands
+        self.transferSettings = transferSettings
+        self.documentCache = documentCache
+        self.manifestDigestKey = manifestDigestKey
+        self.manifestSlices = manifestSlices
+        self.archiveSettings = archiveSettings
         self.__bootStrapScriptMagicName = "$BootStrapScript"
 
     def launchInstance(self, config):
@@ -72,9 +96,20 @@ class EC2Interface(object):
                    pythonpath=self.pythonpath,
                    scriptPath=self.bootstrapScriptPath,
                    bucketName=self.manifest.GetBucketName(),
-                   manifestKey=self.manifestKey,
+                   manifestKey=self.instanceManager.GetManifestKey(instanceId)
+                       if self.manifestSlices else self.manifestKey,
                    instanceId=instanceId,
                    localWorkingDir=self.instanceLocalWorkingDir)
+        if self.transferSettings is not None:
+            bootstrapperCommand += " " + self.transferSettings.toArguments()
+        if self.documentCache is not None:
+            bootstrapperCommand += ' --cacheDir "{0}"'.format(self.documentCache["Path"])
+            if "MaxBytes" in self.documentCache:
+                bootstrapperCommand += " --cacheMaxBytes {0}".format(self.documentCache["MaxBytes"])
+        if self.manifestDigestKey is not None:
+            bootstrapperCommand += " --manifestDigestKey {0}".format(self.manifestDigestKey)
+        if self.archiveSettings is not None and len(self.archiveSettings.values) > 0:
+            bootstrapperCommand += " " + self.archiveSettings.toArguments()
 
         #copy the command list so this instance's list wont be modified
         cmdList = list(self.bootstrapCommands)
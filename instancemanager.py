@@ -12,6 +12,11 @@ class InstanceManager(object):
         return "/".join([self.manifest.GetS3KeyPrefix(),
                          "instances",str(instanceId)])
 
+    def GetManifestKey(self, instanceId):
+        """the key of the manifest slice holding only the instance's job,
+        see Manifest.GetJobSlice"""
+        return "/".join([self.GetKeyPrefix(instanceId), "manifest.json"])
+
     def GetMetaFileTempPath(self, instanceId):
         localMetaFile = os.path.join(self.s3Interface.localTempDir,
                                 "instance_metadata{0}.json"
@@ -6,6 +6,8 @@ class InstanceMetadataFactory(object):
 
     def __init__(self, manifest):
         self.manifest = manifest
+        # names of the AWSToLocal documents, read from the manifest once
+        self.__uploadedDocuments = None
 
     def InitializeMetadata(self, id, aws_id):
         ncommands = len(self.manifest.GetJob(id)["Commands"])
@@ -24,10 +26,12 @@ class InstanceMetadataFactory(object):
         return inst
 
     def _GetUploadCount(self, id):
+        if self.__uploadedDocuments is None:
+            self.__uploadedDocuments = set(x["Name"] for x in self.manifest.GetS3Documents()
+                                           if x["Direction"] == "AWSToLocal")
         count = 0
-        alldocs = { x["Name"] : x for x in self.manifest.GetS3Documents() }
         for r in self.manifest.GetJob(id)["RequiredS3Data"]:
-            if alldocs[r]["Direction"] == "AWSToLocal":
+            if r in self.__uploadedDocuments:
                 count = count + 1
         return count
 
@@ -35,18 +39,24 @@ class InstanceMetadataFactory(object):
         with open(outputpath, 'w') as outfile:
             json.dump(inst._doc, outfile, indent=4)
 
+    def ToJsonString(self, inst):
+        return json.dumps(inst._doc, indent=4)
+
     def FromJson(self, filepath):
         with open(filepath) as f:
-            data = json.load(f)
-            inst = InstanceMetadata(
-                data["Id"],
-                data["AWS_Instance_Id"],
-                data["CommandCount"],
-                data["UploadCount"],
-                data["DownloadCount"],
-                data["LastMessage"],
-                data["LastUpdate"],
-                data["NCommandsFinished"],
-                data["NUploadsFinished"],
-                data["NDownloadsFinished"])
+            return self.FromJsonString(f.read())
+
+    def FromJsonString(self, text):
+        data = json.loads(text)
+        inst = InstanceMetadata(
+            data["Id"],
+            data["AWS_Instance_Id"],
+            data["CommandCount"],
+            data["UploadCount"],
+            data["DownloadCount"],
+            data["LastMessage"],
+            data["LastUpdate"],
+            data["NCommandsFinished"],
+            data["NUploadsFinished"],
+            data["NDownloadsFinished"])
         return inst
\ No newline at end of file
@@ -1,6 +1,9 @@
 import boto3, logging, argparse, json, os, sys
 from application import Application
+from manifest import Manifest
 from loghelper import LogHelper
+from s3clientfactory import S3ClientFactory
+from archivesettings import ArchiveSettings
 
 def main():
 
@@ -13,6 +16,9 @@ def main():
     parser.add_argument("--manifestPath", help = "path to a manifest file describing the jobs and data requirements for the application", required=True)
     parser.add_argument("--instanceConfigPath", help = "file path to a json file with EC2 instance configuration", required=True)
     parser.add_argument("--localWorkingDir", help = "path to dir with read/write for processing data for upload and download to AWS S3", required=True)
+    S3ClientFactory.addArguments(parser)
+    Manifest.addArguments(parser)
+    ArchiveSettings.addArguments(parser)
     try:
         args = vars(parser.parse_args())
         manifestPath = os.path.abspath(args["manifestPath"])
@@ -22,11 +28,12 @@ def main():
         with open(instanceConfigPath) as f:
             instanceConfig = json.load(f)
 
-        s3 = boto3.resource('s3')
+        s3 = S3ClientFactory.FromArguments(args)
         ec2 = boto3.resource('ec2', region_name=instanceConfig["EC2Config"]["Region"])
 
-        app = Application(s3, manifestPath, localWorkingDir)
-        app.runInstances(ec2, instanceConfig)
+        app = Application(s3, manifestPath, localWorkingDir,
+                          manifestCacheDir=args["manifestCacheDir"])
+        app.runInstances(ec2, instanceConfig, ArchiveSettings.FromArguments(args))
     except Exception as ex:
         logging.exception("error in launcher")
         sys.exit(1)
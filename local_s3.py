@@ -0,0 +1,359 @@
+import os, json, time, uuid, shutil, hashlib, logging, threading
+try:
+    from urllib import quote, unquote # python 2
+except ImportError:
+    from urllib.parse import quote, unquote
+
+class LocalS3Error(Exception):
+    """an error with the "response" shape of botocore's ClientError, which
+    callers inspect for the S3 error code"""
+
+    def __init__(self, code, message):
+        Exception.__init__(self, "{0}: {1}".format(code, message))
+        self.response = {"Error": {"Code": code, "Message": message}}
+
+class _Link(object):
+    """the simulated network between the process and the bucket: each
+    request waits latency seconds, and the data of all transfers shares
+    bytesPerSecond of bandwidth"""
+
+    def __init__(self, latency=0.0, bytesPerSecond=None):
+        self.latency = latency
+        self.bytesPerSecond = bytesPerSecond
+        self.__lock = threading.Lock()
+        self.__available = 0.0
+
+    def request(self):
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def transfer(self, nbytes):
+        """wait until nbytes have passed over the link"""
+        if self.bytesPerSecond is None or nbytes == 0:
+            return
+        with self.__lock:
+            now = time.time()
+            start = max(now, self.__available)
+            self.__available = start + float(nbytes) / self.bytesPerSecond
+            delay = self.__available - now
+        time.sleep(delay)
+
+class _ThrottledReader(object):
+    """the Body of a get response, reading length bytes of fileobj over
+    the link"""
+
+    def __init__(self, fileobj, length, link):
+        self.fileobj = fileobj
+        self.remaining = length
+        self.link = link
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        if size == 0:
+            self.fileobj.close()
+            return b""
+        data = self.fileobj.read(size)
+        self.remaining -= len(data)
+        self.link.transfer(len(data))
+        if self.remaining == 0:
+            self.fileobj.close()
+        return data
+
+    def close(self):
+        self.fileobj.close()
+
+class _Collection(object):
+    """the bucket's objects collection, supporting all and filter(Prefix)"""
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+
+    def all(self):
+        return self.filter()
+
+    def filter(self, Prefix=""):
+        self.bucket.link.request()
+        keys = sorted(k for k in (unquote(n) for n in os.listdir(self.bucket.objectsDir))
+                      if k.startswith(Prefix))
+        return [LocalS3Object(self.bucket, k) for k in keys]
+
+class LocalMultipartUpload(object):
+    """a multipart upload whose parts are files under the bucket's uploads
+    directory until the upload is completed"""
+
+    def __init__(self, obj, id):
+        self.object = obj
+        self.bucket = obj.bucket
+        self.id = id
+        self.path = os.path.join(self.bucket.uploadsDir, id)
+
+    def Part(self, partNumber):
+        upload = self
+        class Part(object):
+            def upload(self, Body):
+                upload.bucket.link.request()
+                upload.bucket.link.transfer(len(Body))
+                upload.check()
+                path = os.path.join(upload.path, "{0:05d}".format(partNumber))
+                upload.bucket.writeAtomic(path, Body)
+                return {"ETag": '"{0}"'.format(hashlib.md5(Body).hexdigest())}
+        return Part()
+
+    def complete(self, MultipartUpload):
+        self.bucket.link.request()
+        self.check()
+        with open(os.path.join(self.path, "upload.json")) as f:
+            metadata = json.load(f)["Metadata"]
+        digests = []
+        tmpPath = self.bucket.tempPath()
+        with open(tmpPath, "wb") as out:
+            for part in MultipartUpload["Parts"]:
+                path = os.path.join(self.path, "{0:05d}".format(part["PartNumber"]))
+                if not os.path.exists(path):
+                    raise LocalS3Error("InvalidPart", "part {0} of upload {1} was not uploaded"
+                                       .format(part["PartNumber"], self.id))
+                with open(path, "rb") as f:
+                    data = f.read()
+                if part["ETag"] != '"{0}"'.format(hashlib.md5(data).hexdigest()):
+                    raise LocalS3Error("InvalidPart", "part {0} of upload {1} has a different ETag"
+                                       .format(part["PartNumber"], self.id))
+                digests.append(hashlib.md5(data).digest())
+                out.write(data)
+        etag = '"{0}-{1}"'.format(hashlib.md5(b"".join(digests)).hexdigest(), len(digests))
+        self.bucket.commit(self.object.key, tmpPath, metadata, etag)
+        shutil.rmtree(self.path)
+
+    def abort(self):
+        self.bucket.link.request()
+        self.check()
+        shutil.rmtree(self.path)
+
+    def check(self):
+        """raise NoSuchUpload if the upload was completed or aborted"""
+        if not os.path.isdir(self.path):
+            raise LocalS3Error("NoSuchUpload", "upload {0} does not exist".format(self.id))
+
+class LocalS3Object(object):
+    """an S3 object stored as a file in the bucket's directory"""
+
+    def __init__(self, bucket, key):
+        self.bucket = bucket
+        self.key = key
+
+    def __head(self):
+        self.bucket.link.request()
+        info = self.bucket.readInfo(self.key)
+        if info is None:
+            raise LocalS3Error("404", "Not Found")
+        return info
+
+    @property
+    def content_length(self):
+        self.__head()
+        return os.path.getsize(self.bucket.objectPath(self.key))
+
+    # the attribute name of boto3's ObjectSummary
+    size = content_length
+
+    @property
+    def e_tag(self):
+        return self.__head()["ETag"]
+
+    @property
+    def metadata(self):
+        return self.__head()["Metadata"]
+
+    def get(self, Range=None, IfMatch=None):
+        self.bucket.link.request()
+        info, f = self.bucket.open(self.key)
+        if info is None:
+            raise LocalS3Error("NoSuchKey", "the key '{0}' does not exist".format(self.key))
+        if IfMatch is not None and IfMatch != info["ETag"]:
+            f.close()
+            raise LocalS3Error("PreconditionFailed", "the ETag of '{0}' does not match"
+                               .format(self.key))
+        size = os.fstat(f.fileno()).st_size
+        start, end = 0, size - 1
+        if Range is not None:
+            first, last = Range[len("bytes="):].split("-")
+            start, end = int(first), min(size - 1, int(last))
+        f.seek(start)
+        return { "Body": _ThrottledReader(f, end - start + 1, self.bucket.link),
+                 "ContentLength": end - start + 1,
+                 "ETag": info["ETag"],
+                 "Metadata": info["Metadata"] }
+
+    def put(self, Body, Metadata=None):
+        if not isinstance(Body, bytes):
+            Body = Body.read()
+        self.bucket.link.request()
+        self.bucket.link.transfer(len(Body))
+        tmpPath = self.bucket.tempPath()
+        with open(tmpPath, "wb") as f:
+            f.write(Body)
+        self.bucket.commit(self.key, tmpPath, Metadata or {},
+                           '"{0}"'.format(hashlib.md5(Body).hexdigest()))
+        return {"ETag": '"{0}"'.format(hashlib.md5(Body).hexdigest())}
+
+    def delete(self):
+        self.bucket.link.request()
+        self.bucket.remove(self.key)
+
+    def initiate_multipart_upload(self, Metadata=None):
+        self.bucket.link.request()
+        id = uuid.uuid4().hex
+        upload = LocalMultipartUpload(self, id)
+        os.makedirs(upload.path)
+        self.bucket.writeAtomic(os.path.join(upload.path, "upload.json"), json.dumps(
+            {"Key": self.key, "Metadata": Metadata or {}}).encode("utf-8"))
+        return upload
+
+    def MultipartUpload(self, id):
+        upload = LocalMultipartUpload(self, id)
+        path = os.path.join(upload.path, "upload.json")
+        if not os.path.exists(path):
+            raise LocalS3Error("NoSuchUpload", "upload {0} does not exist".format(id))
+        with open(path) as f:
+            if json.load(f)["Key"] != self.key:
+                raise LocalS3Error("NoSuchUpload", "upload {0} is not for '{1}'"
+                                   .format(id, self.key))
+        return upload
+
+class LocalS3Bucket(object):
+    """a drop in replacement for a boto3 s3 Bucket storing its objects in a
+    local directory, for offline runs and benchmarks, see LocalS3.
+
+    Objects are stored under <bucket dir>/objects with their keys url
+    quoted, their metadata and ETag under <bucket dir>/info, and the parts
+    of multipart uploads under <bucket dir>/uploads. Objects are written to
+    <bucket dir>/tmp and then replaced atomically, so concurrent readers
+    see either version.
+    """
+
+    def __init__(self, name, path, link):
+        self.name = name
+        self.path = path
+        self.link = link
+        self.objectsDir = os.path.join(path, "objects")
+        self.infoDir = os.path.join(path, "info")
+        self.uploadsDir = os.path.join(path, "uploads")
+        self.tmpDir = os.path.join(path, "tmp")
+        self.__lock = threading.Lock()
+        for directory in [self.objectsDir, self.infoDir, self.uploadsDir, self.tmpDir]:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+        self.objects = _Collection(self)
+
+    def Object(self, key):
+        return LocalS3Object(self, key)
+
+    def download_file(self, Key, Filename, ExtraArgs=None, Callback=None, Config=None):
+        response = self.Object(Key).get()
+        tmpPath = Filename + "." + uuid.uuid4().hex + ".tmp"
+        with open(tmpPath, "wb") as f:
+            self.__copy(response["Body"], f, Callback)
+        if os.path.exists(Filename):
+            os.remove(Filename)
+        os.rename(tmpPath, Filename)
+
+    def upload_file(self, Filename, Key, ExtraArgs=None, Callback=None, Config=None):
+        self.link.request()
+        metadata = (ExtraArgs or {}).get("Metadata", {})
+        md5 = hashlib.md5()
+        tmpPath = self.tempPath()
+        with open(Filename, "rb") as f:
+            with open(tmpPath, "wb") as out:
+                for data in iter(lambda: f.read(1024 * 1024), b""):
+                    self.link.transfer(len(data))
+                    md5.update(data)
+                    out.write(data)
+                    if Callback is not None:
+                        Callback(len(data))
+        self.commit(Key, tmpPath, metadata, '"{0}"'.format(md5.hexdigest()))
+
+    def __copy(self, source, destination, callback):
+        while True:
+            data = source.read(1024 * 1024)
+            if len(data) == 0:
+                break
+            destination.write(data)
+            if callback is not None:
+                callback(len(data))
+
+    def objectPath(self, key):
+        return os.path.join(self.objectsDir, quote(key, safe=""))
+
+    def __infoPath(self, key):
+        return os.path.join(self.infoDir, quote(key, safe="") + ".json")
+
+    def tempPath(self):
+        return os.path.join(self.tmpDir, uuid.uuid4().hex)
+
+    def readInfo(self, key):
+        """returns the metadata and ETag of key, or None if it does not exist"""
+        with self.__lock:
+            if not os.path.exists(self.objectPath(key)):
+                return None
+            with open(self.__infoPath(key)) as f:
+                return json.load(f)
+
+    def open(self, key):
+        """returns the metadata and ETag of key and its open data file, or
+        (None, None) if it does not exist"""
+        with self.__lock:
+            if not os.path.exists(self.objectPath(key)):
+                return None, None
+            with open(self.__infoPath(key)) as f:
+                return json.load(f), open(self.objectPath(key), "rb")
+
+    def commit(self, key, tmpPath, metadata, etag):
+        """replace key with the data written to tmpPath"""
+        with self.__lock:
+            self.writeAtomic(self.__infoPath(key), json.dumps(
+                {"Metadata": metadata, "ETag": etag}).encode("utf-8"))
+            if os.path.exists(self.objectPath(key)):
+                os.remove(self.objectPath(key))
+            os.rename(tmpPath, self.objectPath(key))
+
+    def remove(self, key):
+        with self.__lock:
+            for path in [self.objectPath(key), self.__infoPath(key)]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def writeAtomic(self, path, data):
+        tmpPath = self.tempPath()
+        with open(tmpPath, "wb") as f:
+            f.write(data)
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(tmpPath, path)
+
+class LocalS3(object):
+    """a drop in replacement for a boto3 s3 resource storing each bucket in
+    a directory under rootDir, with simulated request latency and
+    bandwidth, so that every entry point can run offline, eg. for
+    benchmarks. Select it with S3ClientFactory's --localS3Dir argument
+    """
+
+    def __init__(self, rootDir, latency=0.0, bytesPerSecond=None):
+        """
+        Args:
+            rootDir: the directory containing a directory per bucket
+            latency: the seconds each request waits before it is served
+            bytesPerSecond: optional bandwidth shared by all transfers
+        """
+        self.rootDir = rootDir
+        self.link = _Link(latency, bytesPerSecond)
+        self.__buckets = {}
+        self.__lock = threading.Lock()
+
+    def Bucket(self, bucketName):
+        with self.__lock:
+            if bucketName not in self.__buckets:
+                logging.info("using local directory '{0}' as S3 bucket '{1}'"
+                             .format(os.path.join(self.rootDir, bucketName), bucketName))
+                self.__buckets[bucketName] = LocalS3Bucket(
+                    bucketName, os.path.join(self.rootDir, bucketName), self.link)
+            return self.__buckets[bucketName]
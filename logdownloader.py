@@ -1,6 +1,8 @@
-import boto3, argparse, os, sys, logging
+import argparse, os, sys, logging
 from application import Application
+from manifest import Manifest
 from loghelper import LogHelper
+from s3clientfactory import S3ClientFactory
 def main():
     LogHelper.start_logging("logdownloader.log")
     parser = argparse.ArgumentParser(
@@ -8,13 +10,16 @@ def main():
                     "Downloads instances logs from AWS S3")
     parser.add_argument("--manifestPath", help = "path to a manifest file describing the jobs and data requirements for the application", required=True)
     parser.add_argument("--outputPath", help = "directory to where instance logs will be copied", required=True)
+    S3ClientFactory.addArguments(parser)
+    Manifest.addArguments(parser)
 
     try:
         args = vars(parser.parse_args())
         manifestPath = os.path.abspath(args["manifestPath"])
         outputdir = os.path.abspath(args["outputPath"])
-        s3 = boto3.resource('s3')
-        app = Application(s3, manifestPath, outputdir)
+        s3 = S3ClientFactory.FromArguments(args)
+        app = Application(s3, manifestPath, outputdir,
+                          manifestCacheDir=args["manifestCacheDir"])
         app.downloadLogs(outputdir)
 
     except Exception as ex:
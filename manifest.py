@@ -1,22 +1,181 @@
-import json, logging
-from sets import Set
+import os, sys, json, uuid, numbers, marshal, hashlib, logging
+from compressioncodec import CompressionCodec
+from transfersettings import TransferSettings
+from manifestdigest import ManifestDigest
+
+class _ManifestView(object):
+    """a read-only sequence over part of a manifest section. The items are
+    those of an index list that also match conditions, which are checked
+    when the view is first used, and only once"""
+
+    def __init__(self, items, conditions=None):
+        self.__items = items
+        self.__conditions = conditions or []
+        self.__cached = None if self.__conditions else items
+
+    def __iter__(self):
+        return iter(self.__matches())
+
+    def __matches(self):
+        if self.__cached is None:
+            self.__cached = [item for item in self.__items
+                             if all(item[k] == v for k, v in self.__conditions)]
+        return self.__cached
+
+    def __len__(self):
+        return len(self.__matches())
+
+    def __getitem__(self, index):
+        return self.__matches()[index]
+
+    def __repr__(self):
+        return repr(self.__matches())
 
 class Manifest(object):
     # class for processing the manifest information
-    def __init__(self, manifestPath):
+    def __init__(self, manifestPath, digest=None, signature=None, cacheDir=None):
+        """
+        Args:
+            manifestPath: path to the manifest json file
+            digest: optional ManifestDigest. If signature is its signature
+            of the manifest file, the manifest was already validated, eg. by
+            the launcher, and is loaded without validation
+            signature: optional signature of the manifest file
+            cacheDir: optional directory caching the parsed and validated
+            manifest and its indexes, so that loading the same unchanged
+            manifest file again skips parsing and validation
+        """
         self.validDirections = [
             "LocalToAWS", # document is copied to S3 by this application. Any document required by instance jobs will be downloaded by instance
             "AWSToLocal", # document is placed on S3 by an instance (eg. simulation output).  The document will be downloaded to a local path by this application.
             "Static" # document is assumed to be on S3 outside this scope of this application.  Can be downloaded to instances
         ]
-        with open(manifestPath) as f:
-            self.data = json.load(f)
-        logging.info("validating manifest")
-        self.__checkBasicFormat()
-        s = self.__checkForDuplicateDocumentNames()
-        self.__checkForDuplicateJobIds()
-        self.__checkForMissingDocumentReferencedInJob(s)
-        self.__checkAWSToLocalJobsReferences()
+        self.validModes = [
+            "Archive", # document is transferred as a single compressed archive (default)
+            "Sync" # directory document is stored as one S3 object per file plus an index, and only changed files are transferred
+        ]
+        self.validFormats = [
+            "zip", # Archive mode document is stored as a zip archive, which supports pipelined and partial downloads (default)
+            "tar" # Archive mode document is stored as a tar stream compressed as a whole, produced and consumed in a single pass
+        ]
+        with open(manifestPath, "rb") as f:
+            self.contents = f.read()
+        self.__read(manifestPath, digest, signature, cacheDir)
+
+    def __read(self, manifestPath, digest, signature, cacheDir):
+        cacheKey = None
+        if cacheDir is not None:
+            stat = os.stat(manifestPath)
+            cacheKey = { "Version": ManifestDigest.version,
+                         "Python": sys.version,
+                         "Path": os.path.abspath(manifestPath),
+                         "Size": stat.st_size,
+                         "MTime": stat.st_mtime,
+                         "SHA256": hashlib.sha256(self.contents).hexdigest() }
+            if self.__loadCached(cacheDir, cacheKey):
+                logging.info("loaded validated manifest from cache")
+                return
+        self.data = json.loads(self.contents.decode("utf-8"))
+        if digest is not None and signature is not None \
+           and digest.verify(self.contents, signature):
+            logging.info("manifest signature verified, skipping validation")
+            self.__load(False)
+        else:
+            logging.info("validating manifest")
+            self.__load(True)
+        if cacheKey is not None:
+            try:
+                self.__storeCached(cacheDir, cacheKey)
+            except (IOError, OSError) as ex:
+                logging.warning("could not cache manifest in '{0}': {1}".format(cacheDir, ex))
+
+    @staticmethod
+    def addArguments(parser):
+        """add the optional manifest arguments to an argparse parser"""
+        parser.add_argument("--manifestCacheDir", default=None, required=False,
+                            help = "optional directory caching the validated manifest between runs, so that an unchanged manifest is not parsed and validated again")
+
+    @staticmethod
+    def __cachePath(cacheDir, cacheKey):
+        # an entry per python version, whose marshal formats differ
+        name = hashlib.sha256(repr((cacheKey["Path"], cacheKey["Python"])).encode("utf-8")).hexdigest()
+        return os.path.join(cacheDir, name + ".manifest")
+
+    def __loadCached(self, cacheDir, cacheKey):
+        '''
+        restore the parsed manifest from the cache entry of the manifest
+        path, if the entry was stored for the same version, size,
+        modification time and contents, and rebuild its indexes. Returns True
+        if restored
+        '''
+        path = self.__cachePath(cacheDir, cacheKey)
+        if not os.path.isfile(path):
+            return False
+        try:
+            # marshal is the fastest format for plain json values, and the
+            # entry is only read by the python version that wrote it
+            with open(path, "rb") as f:
+                entry = marshal.loads(f.read())
+        except Exception as ex:
+            logging.warning("ignoring unreadable manifest cache entry '{0}': {1}".format(path, ex))
+            return False
+        if entry.get("Key") != cacheKey:
+            return False
+        self.data = entry["Data"]
+        self.__load(False)
+        self.includePatterns = entry["IncludePatterns"]
+        return True
+
+    def __storeCached(self, cacheDir, cacheKey):
+        entry = { "Key": cacheKey,
+                  "Data": self.data,
+                  "IncludePatterns": self.includePatterns }
+        if not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+        path = self.__cachePath(cacheDir, cacheKey)
+        tmpPath = "{0}.{1}.tmp".format(path, uuid.uuid4().hex)
+        with open(tmpPath, "wb") as f:
+            f.write(marshal.dumps(entry))
+        if os.path.exists(path):
+            os.remove(path) # os.rename does not replace files on windows
+        os.rename(tmpPath, path)
+
+    def __load(self, validate):
+        '''
+        read the documents and then the jobs once, building the lookup
+        indexes and, if validate is True, checking each entry as it is read.
+        All errors found are reported together in a single ValueError
+        '''
+        if validate:
+            self.__checkBasicFormat()
+        errors = []
+        self.__documentsByName = {}
+        self.__documentsByDirection = dict((d, []) for d in self.validDirections)
+        for doc in self.data["Documents"]:
+            if validate:
+                if doc["Name"] in self.__documentsByName:
+                    errors.append("duplicate document name detected in manifest '{0}'"
+                                  .format(doc["Name"]))
+                errors.extend(self.__checkDocument(doc))
+            self.__documentsByName[doc["Name"]] = doc
+            self.__documentsByDirection.setdefault(doc["Direction"], []).append(doc)
+
+        self.includePatterns = {}
+        self.__jobsById = {}
+        uploaders = {} # job id of each AWSToLocal document referenced by a job
+        for job in self.data["InstanceJobs"]:
+            if validate and job["Id"] in self.__jobsById:
+                errors.append("duplicate job id detected in manifest '{0}'".format(job["Id"]))
+            self.__jobsById[job["Id"]] = job
+            jobErrors = self.__readIncludePatterns(job)
+            if validate:
+                errors.extend(jobErrors)
+                errors.extend(self.__checkJobReferences(job, uploaders))
+
+        if len(errors) == 1:
+            raise ValueError(errors[0])
+        if len(errors) > 1:
+            raise ValueError("manifest has {0} errors:\n{1}".format(len(errors), "\n".join(errors)))
 
     def __checkBasicFormat(self):
         expectedKeys = set([
@@ -30,73 +189,102 @@ class Manifest(object):
             raise ValueError("expected {0} sections in config, found {1}"
                 .format(expectedKeys, foundKeys))
 
-    def __checkAWSToLocalJobsReferences(self):
+    def __readIncludePatterns(self, job):
         '''
-        If any 2 or more instances refer to the same AWSToLocal document, this
-        is troublesome, since each of the instances will be writing, and or
-        overwriting the same s3-key
+        RequiredS3Data entries are either a document name, or an object with
+        the document "Name" and a list of "Include" patterns selecting the
+        archive members the job needs. Object entries are replaced by the
+        name, and the patterns are stored keyed by (job id, document name).
+        Returns the errors of malformed entries, which are left in place
         '''
-        jobs = self.GetJobs()
-        if len(jobs) == 0:
-            return
-        #collect AWSToLocal docs
-        docs = set([x["Name"] for x in self.GetS3Documents(filter = {"Direction": "AWSToLocal"})])
-        docset = set([])
-        for j in jobs:
-            jobdocs = j["RequiredS3Data"]
-            #check if the same name appears 2 times in the same job, which is also an error
-            if len(set(jobdocs)) != len(jobdocs):
-                raise ValueError(
-                    "duplicate required document name(s) detected in job {0}"
-                    .format(j["Id"]))
-            for docname in jobdocs:
-                if docname not in docs:
-                    continue # not an AWSToLocal job, multiple references are fine
-                if docname in docset:
-                    #the docname refers to an AWSToLocal document, and it was referenced in at least one other job
-                    raise ValueError("AWSToLocal document '{0}' found in more than one job".format(docname))
-                else:
-                    docset.add(docname)
+        errors = []
+        documentList = job["RequiredS3Data"]
+        for i, d in enumerate(documentList):
+            if not isinstance(d, dict):
+                continue
+            if "Name" not in d or not isinstance(d.get("Include"), list) \
+               or len(d["Include"]) == 0:
+                errors.append("RequiredS3Data entry {0} in job {1} must have a 'Name' and a non-empty 'Include' list"
+                              .format(d, job["Id"]))
+                continue
+            documentList[i] = d["Name"]
+            self.includePatterns[(job["Id"], d["Name"])] = list(d["Include"])
+        return errors
 
-
-
-    def __checkForDuplicateDocumentNames(self):
+    def __checkDocument(self, doc):
         '''
-        do not allow the same document name to appear twice in the manifest
+        returns the errors in the settings of a document
         '''
-        s = Set([])
-        if "Documents" in self.data:
-            for doc in self.data["Documents"]:
-                name = doc["Name"]
-                if name in s:
-                    raise ValueError("duplicate document name detected in manifest '{0}'"
-                                     .format(name))
-                else:
-                    s.add(name)
-        return s
+        errors = []
+        if not self.validateDirection(doc["Direction"]):
+            errors.append("document '{0}' has direction '{1}', expected one of {2}"
+                          .format(doc["Name"], doc["Direction"], ",".join(self.validDirections)))
+        mode = doc.get("Mode", "Archive")
+        if mode not in self.validModes:
+            errors.append("document '{0}' has mode '{1}', expected one of {2}"
+                          .format(doc["Name"], mode, ",".join(self.validModes)))
+        if "Compression" in doc:
+            try:
+                CompressionCodec.parse(doc["Compression"])
+            except ValueError as ex:
+                errors.append("document '{0}': {1}".format(doc["Name"], ex))
+        format = doc.get("Format", "zip")
+        if format not in self.validFormats:
+            errors.append("document '{0}' has format '{1}', expected one of {2}"
+                          .format(doc["Name"], format, ",".join(self.validFormats)))
+        if format == "tar" and (mode != "Archive" or doc.get("Compression") == "auto"):
+            errors.append("document '{0}' with format 'tar' must be an Archive mode document without 'auto' compression"
+                          .format(doc["Name"]))
+        for key in ["ShardSize", "MaxShards"]:
+            value = doc.get(key, 1)
+            if not isinstance(value, numbers.Integral) or isinstance(value, bool) or value < 1:
+                errors.append("document '{0}' has {1} '{2}', expected a positive integer"
+                              .format(doc["Name"], key, value))
+            elif key in doc and (mode != "Archive" or format != "zip"):
+                errors.append("document '{0}' with {1} must be a zip format Archive mode document"
+                              .format(doc["Name"], key))
+        if "TransferSettings" in doc:
+            try:
+                TransferSettings(doc["TransferSettings"])
+            except (ValueError, AttributeError) as ex:
+                errors.append("document '{0}' TransferSettings: {1}".format(doc["Name"], ex))
+        return errors
 
-    def __checkForDuplicateJobIds(self):
+    def __checkJobReferences(self, job, uploaders):
         '''
-        do not allow the same job id to appear twice in the manifest
+        returns the errors in the documents required by a job. If any 2 or
+        more instances refer to the same AWSToLocal document, this is
+        troublesome, since each of the instances will be writing, and or
+        overwriting the same s3-key. uploaders maps the AWSToLocal documents
+        referenced so far to their job id
         '''
-        s = Set([])
-        if "InstanceJobs" in self.data:
-            for job in self.data["InstanceJobs"]:
-                id = job["Id"]
-                if id in s:
-                    raise ValueError("duplicate job id detected in manifest '{0}'"
-                                     .format(id))
+        errors = []
+        names = [d for d in job["RequiredS3Data"] if not isinstance(d, dict)]
+        #check if the same name appears 2 times in the same job, which is also an error
+        if len(set(names)) != len(names):
+            errors.append("duplicate required document name(s) detected in job {0}"
+                          .format(job["Id"]))
+        checked = set()
+        for docname in names:
+            if docname in checked:
+                continue
+            checked.add(docname)
+            doc = self.__documentsByName.get(docname)
+            if doc is None:
+                errors.append("Referenced S3 document '{0}' not found in defined documents"
+                              .format(docname))
+                continue
+            if doc["Direction"] == "AWSToLocal":
+                if docname in uploaders:
+                    errors.append("AWSToLocal document '{0}' found in more than one job".format(docname))
                 else:
-                    s.add(id)
-
-    def __checkForMissingDocumentReferencedInJob(self, nameset):
-        if "InstanceJobs" in self.data:
-            for job in self.data["InstanceJobs"]:
-                documentList = job["RequiredS3Data"]
-                for d in documentList:
-                    if d not in nameset:
-                        raise ValueError("Referenced S3 document '{0}' not found in defined documents"
-                                         .format(d))
+                    uploaders[docname] = job["Id"]
+            if (job["Id"], docname) in self.includePatterns \
+               and (doc["Direction"] not in ["LocalToAWS", "Static"]
+                    or doc.get("Mode", "Archive") != "Archive" or doc.get("Format", "zip") != "zip"):
+                errors.append("include patterns in job {0} require document '{1}' to be a LocalToAWS or Static zip Archive mode document"
+                              .format(job["Id"], docname))
+        return errors
 
     def validateDirection(self, direction):
         if(direction in self.validDirections):
@@ -109,31 +297,31 @@ class Manifest(object):
 
     def GetS3Documents(self, filter=None):
         """get the sequence of S3 documents to process using the specified
-        optional filters"""
-        matches = []
-        for doc in self.data["Documents"]:
-            if not self.validateDirection(doc["Direction"]):
-                raise ValueError("specified direction should be one of {0}"
-                             .format(",".join(self.validDirections)))
-            match = True
-            if not filter is None:
-                for k,v in filter.iteritems():
-                    if doc[k] != v:
-                        match = False
-                        break
-
-            if match:
-                matches.append(doc)
-        return matches
+        optional filters. Name and Direction filters are looked up in
+        indexes, and the other filters are applied as the returned sequence
+        is iterated"""
+        conditions = list(filter.items()) if filter is not None else []
+        documents = self.data["Documents"]
+        for k, v in conditions:
+            if k == "Name":
+                documents = [self.__documentsByName[v]] if v in self.__documentsByName else []
+                break
+            if k == "Direction":
+                documents = self.__documentsByDirection.get(v, [])
+        return _ManifestView(documents, conditions)
 
     def GetJob(self, instanceId):
         """get the job to run on the specified instance"""
-        for job in self.data["InstanceJobs"]:
-            if instanceId == job["Id"]:
-                return job
-        raise ValueError("specified job id {0} not found in manifest"
-                         .format(instanceId))
+        if instanceId not in self.__jobsById:
+            raise ValueError("specified job id {0} not found in manifest"
+                             .format(instanceId))
+        return self.__jobsById[instanceId]
+
 
+    def GetIncludePatterns(self, instanceId, documentName):
+        """get the member include patterns the specified job declared for a
+        required document, or None if the job requires the whole document"""
+        return self.includePatterns.get((instanceId, documentName))
 
     def GetS3KeyPrefix(self):
         """constructs the "directory" in S3 in which the documents are stored"""
@@ -141,7 +329,19 @@ class Manifest(object):
         return root
 
     def GetJobs(self):
-        jobs = []
-        for job in self.data["InstanceJobs"]:
-            jobs.append(job)
-        return jobs
\ No newline at end of file
+        return _ManifestView(self.data["InstanceJobs"])
+
+    def GetJobSlice(self, instanceId):
+        """get a manifest holding only the specified job and the documents
+        it requires, which an instance can load in place of the whole
+        manifest"""
+        job = dict(self.GetJob(instanceId))
+        job["RequiredS3Data"] = [
+            name if self.GetIncludePatterns(instanceId, name) is None
+            else { "Name": name, "Include": self.GetIncludePatterns(instanceId, name) }
+            for name in job["RequiredS3Data"]]
+        return { "ProjectName": self.data["ProjectName"],
+                 "BucketName": self.data["BucketName"],
+                 "Documents": [self.__documentsByName[name]
+                               for name in self.GetJob(instanceId)["RequiredS3Data"]],
+                 "InstanceJobs": [job] }
\ No newline at end of file
@@ -0,0 +1,42 @@
+import os, hmac, hashlib, binascii
+
+class ManifestDigest(object):
+    """signs the contents of a manifest that passed validation, so that a
+    process holding the same key, eg. an instance started by the launcher,
+    can load the manifest without validating it again.
+
+    The signature is an HMAC-SHA256 of the SHA-256 digest of the manifest
+    file, so it only matches the exact bytes that were validated, and only
+    a holder of the key can produce it.
+    """
+
+    # changes whenever the rules of Manifest validation change, so that
+    # signatures made by older validators are not trusted
+    version = "manifest-v1"
+
+    def __init__(self, key):
+        """
+        Args:
+            key: the secret key as a hex string, see NewKey
+        """
+        self.key = binascii.unhexlify(key)
+
+    @staticmethod
+    def NewKey():
+        """returns a new random key as a hex string"""
+        return binascii.hexlify(os.urandom(32)).decode("ascii")
+
+    @staticmethod
+    def SignatureKey(manifestKey):
+        """the S3 key of the signature stored alongside a manifest"""
+        return manifestKey + ".digest"
+
+    def sign(self, contents):
+        """returns the signature of the bytes of a manifest file"""
+        message = self.version.encode("ascii") + b":" + hashlib.sha256(contents).digest()
+        return hmac.new(self.key, message, hashlib.sha256).hexdigest()
+
+    def verify(self, contents, signature):
+        """returns True if signature is the signature of the bytes of a
+        manifest file"""
+        return hmac.compare_digest(str(self.sign(contents)), str(signature.strip()))
@@ -0,0 +1,115 @@
+import logging, threading
+from multiprocessing.pool import ThreadPool
+from transferscheduler import TransferScheduler
+
+class MultipartUploadStream(object):
+    """a write-only file-like object that uploads the data written to it to
+    an S3 key as a multipart upload.
+
+    Data is buffered until a full part is available, and parts are uploaded
+    on background threads while writing continues. At most one part is
+    buffered plus queueDepth parts in flight, so memory use is bounded
+    regardless of the total upload size. Since the total size is not known
+    up front, the part size doubles every partsPerSize parts, so that
+    streams of up to partSize * partsPerSize * 1023 bytes fit in the 10,000
+    parts S3 allows, eg. 8TB with 8MB parts.
+    """
+
+    partsPerSize = 1000
+
+    def __init__(self, bucket, keyName, partSize=8 * 1024 * 1024, queueDepth=2,
+                 metadata=None, scheduler=None):
+        """
+        Args:
+            bucket: a boto3 s3 Bucket (or compatible) object
+            keyName: the destination S3 key
+            partSize: the size of the first partsPerSize uploaded parts in
+            bytes. S3 requires every part except the last to be at least 5MB
+            queueDepth: the maximum number of parts uploading at once
+            metadata: optional user metadata dictionary for the object
+            scheduler: optional TransferScheduler for the part uploads,
+            which are scheduled with the priority of the constructing thread
+        """
+        self.keyName = keyName
+        self.partSize = partSize
+        self.queueDepth = queueDepth
+        self.bytesWritten = 0
+        self.scheduler = TransferScheduler() if scheduler is None else scheduler
+        self.__priority, self.__owner = self.scheduler.current()
+        if metadata is None:
+            self.__upload = bucket.Object(keyName).initiate_multipart_upload()
+        else:
+            self.__upload = bucket.Object(keyName).initiate_multipart_upload(Metadata=metadata)
+        self.__buffer = bytearray()
+        self.__parts = []
+        self.__pending = []
+        self.__error = None
+        self.__slots = threading.BoundedSemaphore(queueDepth)
+        self.__pool = ThreadPool(queueDepth)
+        self.__closed = False
+
+    def write(self, data):
+        self.__raiseError()
+        self.__buffer.extend(data)
+        self.bytesWritten += len(data)
+        while len(self.__buffer) >= self.currentPartSize():
+            partSize = self.currentPartSize()
+            part = bytes(self.__buffer[:partSize])
+            del self.__buffer[:partSize]
+            self.__submit(part)
+
+    def currentPartSize(self):
+        """the size of the next part, see partsPerSize"""
+        return self.partSize * 2 ** (len(self.__pending) // self.partsPerSize)
+
+    def close(self):
+        """upload the remaining buffered data and complete the upload"""
+        if self.__closed:
+            return
+        if len(self.__buffer) > 0 or len(self.__pending) == 0:
+            # S3 requires at least one part, even when nothing was written
+            self.__submit(bytes(self.__buffer))
+            self.__buffer = bytearray()
+        self.__finishPool()
+        self.__raiseError()
+        parts = sorted(self.__parts, key=lambda p: p["PartNumber"])
+        self.__upload.complete(MultipartUpload={"Parts": parts})
+        self.__closed = True
+        logging.info("completed multipart upload of {0} bytes in {1} parts to '{2}'"
+                     .format(self.bytesWritten, len(parts), self.keyName))
+
+    def abort(self):
+        """abandon the upload, discarding any uploaded parts"""
+        if self.__closed:
+            return
+        self.__closed = True
+        self.__finishPool()
+        self.__upload.abort()
+        logging.info("aborted multipart upload to '{0}'".format(self.keyName))
+
+    def __submit(self, data):
+        self.__slots.acquire()
+        self.__raiseError()
+        partNumber = len(self.__pending) + 1
+        self.__pending.append(
+            self.__pool.apply_async(self.__uploadPart, (partNumber, data)))
+
+    def __uploadPart(self, partNumber, data):
+        try:
+            with self.scheduler.transfer(len(data), self.__priority, self.__owner):
+                response = self.__upload.Part(partNumber).upload(Body=data)
+            self.__parts.append({"PartNumber": partNumber, "ETag": response["ETag"]})
+        except Exception as ex:
+            logging.exception("error uploading part {0} of '{1}'"
+                              .format(partNumber, self.keyName))
+            self.__error = ex
+        finally:
+            self.__slots.release()
+
+    def __finishPool(self):
+        self.__pool.close()
+        self.__pool.join()
+
+    def __raiseError(self):
+        if self.__error is not None:
+            raise self.__error
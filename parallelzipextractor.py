@@ -0,0 +1,77 @@
+import os, zipfile, logging
+from multiprocessing.pool import ThreadPool
+from remotezip import RangeZipArchive
+
+class ParallelZipExtractor(object):
+    """extracts a zip archive on local disk on a pool of threads.
+
+    The members are split into one group per worker, balanced by
+    uncompressed size, and each worker extracts its group through its own
+    zipfile.ZipFile handle on the archive. The directory tree is created up
+    front so workers never race to create parent directories. zlib and file
+    writes release the GIL, so members are inflated and written on all
+    workers at once.
+    """
+
+    def __init__(self, workers, minParallelSize=4 * 1024 * 1024):
+        """
+        Args:
+            workers: the number of extraction threads
+            minParallelSize: archives whose members total fewer
+            uncompressed bytes than this are extracted serially
+        """
+        self.workers = workers
+        self.minParallelSize = minParallelSize
+
+    def extractAll(self, archivePath, destinationDir):
+        """extract every member of the archive under destinationDir, as
+        zipfile.ZipFile.extractall"""
+        with zipfile.ZipFile(archivePath, "r", allowZip64=True) as z:
+            infos = z.infolist()
+            if self.workers <= 1 or len(infos) < 2 or \
+               sum(i.file_size for i in infos) < self.minParallelSize:
+                z.extractall(destinationDir)
+                return
+
+        self.createDirectories(infos, destinationDir)
+        groups = self.__partition(infos, self.workers)
+        logging.info("extracting {0} members of '{1}' on {2} threads"
+                     .format(len(infos), archivePath, len(groups)))
+        pool = ThreadPool(len(groups))
+        try:
+            pool.map(lambda group: self.__extractGroup(archivePath, group, destinationDir),
+                     groups)
+        finally:
+            pool.close()
+            pool.join()
+
+    @staticmethod
+    def createDirectories(infos, destinationDir):
+        """create destinationDir and the directories of the specified
+        zipfile.ZipInfo members under it"""
+        directories = set([destinationDir])
+        for info in infos:
+            path = RangeZipArchive.memberPath(destinationDir, info.filename)
+            directories.add(path if info.filename.endswith("/") else os.path.dirname(path))
+        for directory in sorted(directories):
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+    @staticmethod
+    def __partition(infos, workers):
+        """split the members into at most workers groups, assigning the
+        largest members first to the group with the least data"""
+        groups = [[] for i in range(min(workers, len(infos)))]
+        sizes = [0] * len(groups)
+        for info in sorted(infos, key=lambda i: i.file_size, reverse=True):
+            smallest = sizes.index(min(sizes))
+            groups[smallest].append(info)
+            sizes[smallest] += info.file_size
+        # each worker reads its members in archive order
+        return [sorted(g, key=lambda i: i.header_offset) for g in groups if len(g) > 0]
+
+    @staticmethod
+    def __extractGroup(archivePath, infos, destinationDir):
+        with zipfile.ZipFile(archivePath, "r", allowZip64=True) as z:
+            for info in infos:
+                z.extract(info, destinationDir)
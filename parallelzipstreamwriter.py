@@ -0,0 +1,95 @@
+from collections import deque
+from multiprocessing.pool import ThreadPool
+from zipstreamwriter import ZipStreamWriter
+
+def _compressBlock(filename, data, offset, length, codec, last):
+    """returns the (raw, compressed) bytes of one block of a member"""
+    if filename is not None:
+        with open(filename, "rb") as f:
+            f.seek(offset)
+            data = f.read(length)
+    return data, codec.compressBlock(data, last)
+
+class ParallelZipStreamWriter(ZipStreamWriter):
+    """a ZipStreamWriter that compresses member data on a pool of threads.
+
+    Files are split into blocks that are deflated independently. Every block
+    but the last of a member ends on a sync flush, so the compressed blocks
+    concatenate into one valid deflate stream (the technique used by pigz).
+    zlib releases the GIL while compressing, so blocks are compressed on all
+    workers at once while the archive is still written in order. At most
+    2 * workers blocks are held in memory.
+
+    Members whose codec cannot be split this way (bzip2, zstd) are written
+    serially once the queued members are complete.
+    """
+
+    def __init__(self, fileobj, workers, codec=None, blockSize=1024 * 1024):
+        """
+        Args:
+            fileobj: the destination, only its write method is used
+            workers: the number of compression threads
+            codec: the CompressionCodec of file members, deflate by default
+            blockSize: the number of bytes of a file compressed as one block
+        """
+        ZipStreamWriter.__init__(self, fileobj, codec, blockSize)
+        self.workers = workers
+        self.__pool = ThreadPool(workers)
+        self.__queue = deque()
+        self.__inFlight = 0
+        self.__maxInFlight = 2 * workers
+        self.__member = None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.__pool.terminate()
+            self.__pool.join()
+
+    def close(self):
+        """write the remaining members and the central directory"""
+        if self.closed:
+            return
+        try:
+            while len(self.__queue) > 0:
+                self.__emitNext()
+        finally:
+            self.__pool.close()
+            self.__pool.join()
+        ZipStreamWriter.close(self)
+
+    def _addMember(self, arcname, mtime, externalAttr, codec, fileSize,
+                   filename=None, data=b""):
+        if self.closed:
+            raise ValueError("cannot add members to a closed archive")
+        if not codec.splittable:
+            while len(self.__queue) > 0:
+                self.__emitNext()
+            ZipStreamWriter._addMember(self, arcname, mtime, externalAttr, codec,
+                                       fileSize, filename, data)
+            return
+        self.__queue.append(("begin", (arcname, mtime, externalAttr, codec.method, fileSize)))
+        if filename is None:
+            offsets = [0]
+        else:
+            offsets = list(range(0, fileSize, self.chunkSize)) or [0]
+        for i, offset in enumerate(offsets):
+            while self.__inFlight >= self.__maxInFlight:
+                self.__emitNext()
+            self.__queue.append(("block", self.__pool.apply_async(
+                _compressBlock, (filename, data, offset, self.chunkSize,
+                                 codec, i == len(offsets) - 1))))
+            self.__inFlight += 1
+        self.__queue.append(("end", None))
+
+    def __emitNext(self):
+        kind, value = self.__queue.popleft()
+        if kind == "begin":
+            self.__member = self._beginMember(*value)
+        elif kind == "block":
+            raw, compressed = value.get()
+            self.__inFlight -= 1
+            self._writeBlock(self.__member, raw, compressed)
+        else:
+            self._endMember(self.__member)
@@ -1,44 +1,203 @@
-import subprocess, logging, shutil, os
+import subprocess, logging, shutil, os, json, base64, threading
+
+class PowerShellS3Error(Exception):
+    """a failed transfer, with the "response" shape of botocore's
+    ClientError, which callers inspect for the S3 error code"""
+
+    def __init__(self, code, message):
+        Exception.__init__(self, "{0}: {1}".format(code, message))
+        self.response = {"Error": {"Code": code, "Message": message}}
+
+class _PowerShellSession(object):
+    """one long-lived powershell process, which loads the AWS module once
+    and then runs the json transfer commands written to its stdin one at a
+    time, answering each with a result line on stdout"""
+
+    resultPrefix = "##result "
+    readyLine = "##ready"
+
+    script = r"""
+$ErrorActionPreference = 'Stop'
+Import-Module AWSPowerShell
+[Console]::Out.WriteLine('##ready')
+while ($null -ne ($line = [Console]::In.ReadLine())) {
+    $c = ConvertFrom-Json $line
+    try {
+        if ($c.Op -eq 'download') {
+            Copy-S3Object -BucketName $c.Bucket -Key $c.Key -LocalFile $c.File | Out-Null
+        } else {
+            $metadata = @{}
+            if ($c.Metadata) {
+                $c.Metadata.PSObject.Properties | ForEach-Object { $metadata[$_.Name] = $_.Value }
+            }
+            if ($c.Shared) {
+                # read alongside other processes that still have the file open
+                $stream = [System.IO.File]::Open($c.File, 'Open', 'Read', 'ReadWrite')
+                try {
+                    Write-S3Object -BucketName $c.Bucket -Key $c.Key -Stream $stream -Metadata $metadata | Out-Null
+                } finally {
+                    $stream.Dispose()
+                }
+            } else {
+                Write-S3Object -BucketName $c.Bucket -Key $c.Key -File $c.File -Metadata $metadata | Out-Null
+            }
+        }
+        $result = @{ Ok = $true }
+    } catch {
+        $ex = $_.Exception
+        while ($ex.InnerException -and -not $ex.ErrorCode) { $ex = $ex.InnerException }
+        $code = if ($ex.StatusCode -eq 'NotFound') { '404' } elseif ($ex.ErrorCode) { [string]$ex.ErrorCode } else { 'PowerShellError' }
+        $result = @{ Ok = $false; Code = $code; Message = $ex.Message }
+    }
+    [Console]::Out.WriteLine('##result ' + (ConvertTo-Json $result -Compress))
+}
+"""
+
+    @staticmethod
+    def defaultCommand():
+        encoded = base64.b64encode(_PowerShellSession.script.encode("utf-16-le")).decode("ascii")
+        return ['powershell', '-NoProfile', '-NonInteractive', '-EncodedCommand', encoded]
+
+    def __init__(self, command):
+        logging.info("starting powershell session")
+        # the session ends when its stdin is closed, at the latest when
+        # this process exits
+        self.process = subprocess.Popen(command,
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT,
+                                        shell=False,
+                                        universal_newlines=True)
+        self.__readUntil(lambda line: line == self.readyLine)
+
+    def run(self, command):
+        """run a transfer command, raising PowerShellS3Error if it fails"""
+        logging.info("issuing command: {0}".format(command))
+        try:
+            self.process.stdin.write(json.dumps(command) + "\n")
+            self.process.stdin.flush()
+        except (IOError, OSError):
+            raise ValueError("powershell session exited with code {0}"
+                             .format(self.process.wait()))
+        line = self.__readUntil(lambda line: line.startswith(self.resultPrefix))
+        result = json.loads(line[len(self.resultPrefix):])
+        if not result["Ok"]:
+            logging.error("error occurred running command: {0}".format(result["Message"]))
+            raise PowerShellS3Error(result["Code"], result["Message"])
+        logging.info("command executed successfully")
+
+    def __readUntil(self, isEnd):
+        while True:
+            line = self.process.stdout.readline()
+            if line == "":
+                raise ValueError("powershell session exited with code {0}"
+                                 .format(self.process.wait()))
+            line = line.rstrip("\r\n")
+            if isEnd(line):
+                return line
+            logging.info(line)
+
+    def close(self, kill=False):
+        """end the session, killing it if it may be stuck in a command"""
+        try:
+            if kill:
+                self.process.kill()
+            self.process.stdin.close()
+        except (IOError, OSError):
+            pass
+        self.process.wait()
 
 class powershell_s3(object):
-    """drop in replacement for boto3 s3 (windows only)"""
+    """drop in replacement for boto3 s3 (windows only)
+
+    Transfers are run by up to concurrency long-lived powershell sessions,
+    started as they are needed, so the cost of starting powershell and
+    loading the AWS module is paid once per session rather than per
+    transfer.
+    """
+
+    # only files are transferred, so S3Interface turns off the features that
+    # make object level requests, see S3Interface.objectRequests
+    objectRequests = False
+
+    def __init__(self, concurrency=4, command=None):
+        """
+        Args:
+            concurrency: the number of transfers run at once
+            command: the command line of a session, by default powershell
+            running the _PowerShellSession script
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1, got {0}".format(concurrency))
+        self.concurrency = concurrency
+        self.command = _PowerShellSession.defaultCommand() if command is None else command
+        self.__slots = threading.Semaphore(concurrency)
+        self.__lock = threading.Lock()
+        self.__idle = []
+
     def Bucket(self, bucketName):
         self.bucketName = bucketName
         return self
 
-    def download_file(self, keyName, localPath):
-        cmd = ['powershell', 
-               'Copy-S3Object', 
-               '-BucketName', "'{}'".format(self.bucketName),
-               '-LocalFile', "'{}'".format(localPath),
-               '-Key', "'{}'".format(keyName)]
-        self.execute(cmd)
-
-    def upload_file(self, localPath, keyName):
-        # the Write-S3Object command appears to require a file that has no other processes touching it
-        # so make a copy
-        tmpFile = "{}.tmp".format(localPath)
-        shutil.copyfile(localPath, tmpFile)
-        cmd = ['powershell', 
-               'Write-S3Object', 
-               '-BucketName', "'{}'".format(self.bucketName),
-               '-File', "'{}'".format(tmpFile),
-               '-Key', "'{}'".format(keyName)]
-        self.execute(cmd)
-        os.remove(tmpFile)
+    def download_file(self, keyName, localPath, ExtraArgs=None, Callback=None, Config=None):
+        self.execute({"Op": "download", "Bucket": self.bucketName,
+                      "Key": keyName, "File": os.path.abspath(localPath)})
+        if Callback is not None:
+            Callback(os.path.getsize(localPath))
+
+    def upload_file(self, localPath, keyName, ExtraArgs=None, Callback=None, Config=None):
+        command = {"Op": "upload", "Bucket": self.bucketName, "Key": keyName,
+                   "Metadata": (ExtraArgs or {}).get("Metadata", {})}
+        size = os.path.getsize(localPath)
+        if not self.__isBeingWritten(localPath):
+            # read in place, sharing the file with any process that has it open
+            command.update({"File": os.path.abspath(localPath), "Shared": True})
+            self.execute(command)
+        else:
+            # the log file this process is writing may change during the
+            # upload, so upload a copy
+            tmpFile = "{}.tmp".format(localPath)
+            shutil.copyfile(localPath, tmpFile)
+            command.update({"File": os.path.abspath(tmpFile), "Shared": False})
+            try:
+                self.execute(command)
+            finally:
+                os.remove(tmpFile)
+        if Callback is not None:
+            Callback(size)
+
+    @staticmethod
+    def __isBeingWritten(localPath):
+        path = os.path.abspath(localPath)
+        return any(isinstance(h, logging.FileHandler) and h.baseFilename == path
+                   for h in logging.getLogger().handlers)
 
     def execute(self, command):
-        try:
-            logging.info("issuing command: {0}".format(command))
-            cmnd_output = subprocess.check_output(command, 
-                                                    stderr=subprocess.STDOUT,
-                                                    shell=False, 
-                                                    universal_newlines=True);
-            logging.info("command executed successfully")
-        except subprocess.CalledProcessError as cp_ex:
-            logging.exception("error occurred running command")
-            logging.error(cp_ex.output)
-            raise cp_ex
-        except Exception as ex:
-            logging.exception("error occurred running command")
-            raise ex
+        """run a transfer command on an idle session, starting one if there
+        is none"""
+        with self.__slots:
+            with self.__lock:
+                session = self.__idle.pop() if self.__idle else None
+            if session is None:
+                session = _PowerShellSession(self.command)
+            try:
+                session.run(command)
+            except PowerShellS3Error:
+                self.__release(session)
+                raise
+            except Exception:
+                logging.exception("error occurred running command")
+                session.close(kill=True)
+                raise
+            self.__release(session)
+
+    def __release(self, session):
+        with self.__lock:
+            self.__idle.append(session)
+
+    def close(self):
+        """end the idle sessions"""
+        with self.__lock:
+            sessions, self.__idle = self.__idle, []
+        for session in sessions:
+            session.close()
@@ -0,0 +1,101 @@
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+class RangedStreamReader(object):
+    """reads byte spans of a remote object front to back, fetching the
+    chunks ahead of the read position in parallel.
+
+    At most concurrency chunks are in flight plus the one being read, so
+    memory use is bounded by (concurrency + 1) * chunkSize however large the
+    spans are.
+    """
+
+    def __init__(self, fetchRange, spans, chunkSize=8 * 1024 * 1024, concurrency=4,
+                 alignment=1):
+        """
+        Args:
+            fetchRange: a function (start, end) returning the bytes of the
+            object in the half-open range [start, end)
+            spans: sorted, non-overlapping (start, end) half-open ranges of
+            the object that will be read
+            chunkSize: the maximum size of each fetch
+            concurrency: the number of chunks fetched ahead at once
+            alignment: chunks end at multiples of alignment, except at the
+            end of a span, so that they do not straddle the blocks of an
+            ArchiveChecksum. A chunk is one block when chunkSize is smaller
+        """
+        self.fetchRange = fetchRange
+        self.position = spans[0][0] if len(spans) > 0 else 0
+        self.__chunks = deque()
+        for start, end in spans:
+            chunkStart = start
+            while chunkStart < end:
+                chunkEnd = (chunkStart + chunkSize) // alignment * alignment
+                if chunkEnd <= chunkStart:
+                    chunkEnd = (chunkStart // alignment + 1) * alignment
+                chunkEnd = min(chunkEnd, end)
+                self.__chunks.append((chunkStart, chunkEnd))
+                chunkStart = chunkEnd
+        self.__window = deque()
+        self.__windowSize = concurrency
+        self.__pool = ThreadPool(concurrency)
+        self.__buffer = b""
+        self.__bufferStart = self.position
+        self.__fill()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def read(self, n):
+        """read n bytes from the current position. Fewer bytes are returned
+        only at the end of the last span"""
+        out = []
+        while n > 0:
+            offset = self.position - self.__bufferStart
+            if 0 <= offset < len(self.__buffer):
+                data = self.__buffer[offset:offset + n]
+                out.append(data)
+                n -= len(data)
+                self.position += len(data)
+            elif not self.__next():
+                break
+        return b"".join(out)
+
+    def seek(self, position):
+        """move the read position forward. Chunks wholly before the new
+        position are discarded"""
+        if position < self.position:
+            raise ValueError("RangedStreamReader can only seek forward")
+        self.position = position
+
+    def close(self):
+        self.__pool.terminate()
+        self.__pool.join()
+
+    def __next(self):
+        """advance the buffer to the next fetched chunk containing the read
+        position. Returns False when no chunks remain"""
+        while len(self.__window) > 0:
+            start, end, result = self.__window.popleft()
+            self.__fill()
+            if end <= self.position:
+                continue
+            if start > self.position:
+                raise ValueError("position {0} is outside of the requested spans"
+                                 .format(self.position))
+            self.__bufferStart = start
+            self.__buffer = result.get()
+            if len(self.__buffer) != end - start:
+                raise IOError("expected {0} bytes for range {1}-{2}, received {3}"
+                              .format(end - start, start, end, len(self.__buffer)))
+            return True
+        return False
+
+    def __fill(self):
+        while len(self.__window) < self.__windowSize and len(self.__chunks) > 0:
+            start, end = self.__chunks.popleft()
+            self.__window.append(
+                (start, end, self.__pool.apply_async(self.fetchRange, (start, end))))
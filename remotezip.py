@@ -0,0 +1,277 @@
+import os, struct, zlib, logging, threading
+from rangedreader import RangedStreamReader
+from compressioncodec import CompressionCodec
+from transferscheduler import TransferScheduler
+
+class RemoteZipMember(object):
+    """the central directory record of one member of a RangeZipArchive"""
+
+    def __init__(self, name, flags, compressType, crc, compressSize, fileSize,
+                 headerOffset, externalAttr):
+        self.name = name
+        self.flags = flags
+        self.compressType = compressType
+        self.crc = crc
+        self.compressSize = compressSize
+        self.fileSize = fileSize
+        self.headerOffset = headerOffset
+        self.externalAttr = externalAttr
+
+    def isDir(self):
+        return self.name.endswith("/")
+
+class RangeZipArchive(object):
+    """a zip archive read through a fetchRange(start, end) method, which
+    subclasses implement.
+
+    Only the central directory is read on construction. Members are
+    extracted while their bytes arrive, with the following chunks of the
+    archive fetched in parallel. Each member is decoded according to the
+    compression method recorded in its headers, see CompressionCodec.
+    """
+
+    __endArchive = struct.Struct("<4s4H2LH")
+    __endArchive64 = struct.Struct("<4sQ2H2L4Q")
+    __endArchive64Locator = struct.Struct("<4sLQL")
+    __centralDir = struct.Struct("<4s4B4HL2L5H2L")
+    __localHeader = struct.Struct("<4s2B4HL2L2H")
+    __maxTailSize = 65536 + 22
+
+    def __init__(self, name, size, chunkSize=8 * 1024 * 1024, concurrency=4):
+        """
+        Args:
+            name: the name of the archive used in messages
+            size: the size of the archive in bytes
+            chunkSize: the size of each range read when extracting
+            concurrency: the number of range reads in flight when extracting
+        """
+        self.name = name
+        self.size = size
+        self.chunkSize = chunkSize
+        self.concurrency = concurrency
+        self.members = self.__readCentralDirectory()
+
+    def fetchRange(self, start, end):
+        """returns the bytes of the archive in the half-open range [start, end)"""
+        raise NotImplementedError()
+
+    def chunkAlignment(self):
+        """the multiple of the archive offset that the range reads of extract
+        end at, see RangedStreamReader"""
+        return 1
+
+    def namelist(self):
+        return [m.name for m in self.members]
+
+    def extractAll(self, destinationDir):
+        """extract every member under destinationDir, as ZipFile.extractall"""
+        self.extract(self.members,
+                     lambda m: self.memberPath(destinationDir, m.name))
+
+    def extract(self, members, targetPath):
+        """extract the specified members
+
+        Args:
+            members: a sequence of RemoteZipMember
+            targetPath: a function returning the local path for a member
+        """
+        members = sorted(members, key=lambda m: m.headerOffset)
+        if len(members) == 0:
+            return
+        # each member's data ends before the next member's header, or before
+        # the central directory for the last member
+        boundaries = sorted([m.headerOffset for m in self.members] + [self.centralDirOffset])
+        nextBoundary = dict(zip(boundaries[:-1], boundaries[1:]))
+        spans = []
+        for m in members:
+            end = nextBoundary[m.headerOffset]
+            if len(spans) > 0 and spans[-1][1] == m.headerOffset:
+                spans[-1] = (spans[-1][0], end)
+            else:
+                spans.append((m.headerOffset, end))
+
+        with RangedStreamReader(self.fetchRange, spans, self.chunkSize,
+                                self.concurrency, self.chunkAlignment()) as reader:
+            for m in members:
+                self.__extractMember(reader, m, targetPath(m))
+
+    @staticmethod
+    def memberPath(destinationDir, name):
+        """the path a member is extracted to under destinationDir, with
+        absolute and parent directory components dropped as ZipFile.extract
+        does"""
+        parts = [x for x in name.split("/") if x not in ("", ".", "..")]
+        parts = [os.path.splitdrive(x)[1] for x in parts]
+        return os.path.join(destinationDir, *parts) if len(parts) > 0 else destinationDir
+
+    def __extractMember(self, reader, member, path):
+        if member.isDir():
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            return
+        codec = CompressionCodec.forMethod(member.compressType)
+        reader.seek(member.headerOffset)
+        header = self.__localHeader.unpack(reader.read(self.__localHeader.size))
+        if header[0] != b"PK\x03\x04":
+            raise ValueError("bad local header for member '{0}'".format(member.name))
+        reader.read(header[10] + header[11])
+
+        parent = os.path.dirname(path)
+        if parent and not os.path.isdir(parent):
+            os.makedirs(parent)
+        decompressor = codec.decompressor()
+        crc = 0
+        remaining = member.compressSize
+        with open(path, "wb") as f:
+            while remaining > 0:
+                data = reader.read(min(remaining, self.chunkSize))
+                if len(data) == 0:
+                    raise IOError("archive '{0}' is truncated".format(self.name))
+                remaining -= len(data)
+                data = decompressor.decompress(data)
+                crc = zlib.crc32(data, crc)
+                f.write(data)
+            data = decompressor.flush()
+            crc = zlib.crc32(data, crc)
+            f.write(data)
+        if crc & 0xffffffff != member.crc:
+            raise ValueError("bad CRC for member '{0}'".format(member.name))
+
+    def __readCentralDirectory(self):
+        tailStart = max(0, self.size - self.__maxTailSize)
+        tail = self.fetchRange(tailStart, self.size)
+        pos = tail.rfind(b"PK\x05\x06")
+        if pos < 0:
+            raise ValueError("'{0}' is not a zip archive".format(self.name))
+        end = self.__endArchive.unpack(tail[pos:pos + self.__endArchive.size])
+        count, centralDirSize, centralDirOffset = end[4], end[5], end[6]
+
+        locatorPos = pos - self.__endArchive64Locator.size
+        if locatorPos >= 0 and tail[locatorPos:locatorPos + 4] == b"PK\x06\x07":
+            locator = self.__endArchive64Locator.unpack(
+                tail[locatorPos:locatorPos + self.__endArchive64Locator.size])
+            end64 = self.__endArchive64.unpack(self.fetchRange(
+                locator[2], locator[2] + self.__endArchive64.size))
+            count, centralDirSize, centralDirOffset = end64[7], end64[8], end64[9]
+
+        self.centralDirOffset = centralDirOffset
+        if centralDirOffset >= tailStart:
+            data = tail[centralDirOffset - tailStart:centralDirOffset - tailStart + centralDirSize]
+        else:
+            data = self.fetchRange(centralDirOffset, centralDirOffset + centralDirSize)
+
+        members = []
+        offset = 0
+        for i in range(count):
+            record = self.__centralDir.unpack(data[offset:offset + self.__centralDir.size])
+            if record[0] != b"PK\x01\x02":
+                raise ValueError("bad central directory in '{0}'".format(self.name))
+            flags, compressType, crc = record[5], record[6], record[9]
+            compressSize, fileSize = record[10], record[11]
+            nameLen, extraLen, commentLen = record[12], record[13], record[14]
+            headerOffset, externalAttr = record[18], record[17]
+            offset += self.__centralDir.size
+            name = data[offset:offset + nameLen]
+            extra = data[offset + nameLen:offset + nameLen + extraLen]
+            offset += nameLen + extraLen + commentLen
+
+            fileSize, compressSize, headerOffset = self.__decodeZip64(
+                extra, fileSize, compressSize, headerOffset)
+            name = name.decode("utf-8" if flags & 0x800 else "cp437")
+            members.append(RemoteZipMember(name, flags, compressType, crc,
+                                           compressSize, fileSize,
+                                           headerOffset, externalAttr))
+        logging.info("read {0} member entries from '{1}'".format(len(members), self.name))
+        return members
+
+    @staticmethod
+    def __decodeZip64(extra, fileSize, compressSize, headerOffset):
+        # the zip64 extra field holds, in order, each value that overflowed
+        while len(extra) >= 4:
+            headerId, length = struct.unpack("<HH", extra[:4])
+            if headerId == 1:
+                values = list(struct.unpack("<" + "Q" * (length // 8), extra[4:4 + length]))
+                if fileSize == 0xffffffff:
+                    fileSize = values.pop(0)
+                if compressSize == 0xffffffff:
+                    compressSize = values.pop(0)
+                if headerOffset == 0xffffffff:
+                    headerOffset = values.pop(0)
+            extra = extra[4 + length:]
+        return fileSize, compressSize, headerOffset
+
+class RemoteZipArchive(RangeZipArchive):
+    """a zip archive stored as an S3 object, read with ranged GET requests so
+    that nothing is staged on local disk"""
+
+    def __init__(self, bucket, keyName, chunkSize=8 * 1024 * 1024, concurrency=4,
+                 scheduler=None, checksum=None):
+        """
+        Args:
+            bucket: a boto3 s3 Bucket (or compatible) object
+            keyName: the key of the zip archive
+            chunkSize: the size of each ranged GET when extracting
+            concurrency: the number of ranged GETs in flight when extracting
+            scheduler: optional TransferScheduler for the ranged GETs, which
+            are scheduled with the priority of the constructing thread
+            checksum: optional ArchiveChecksum of the archive. The blocks
+            a range covers completely are then verified and corrupt blocks
+            are fetched again, and extract reads ranges of whole blocks
+        """
+        self.bucket = bucket
+        self.checksum = checksum
+        self.scheduler = TransferScheduler() if scheduler is None else scheduler
+        self.__priority, self.__owner = self.scheduler.current()
+        self.keyName = keyName
+        self.bytesFetched = 0
+        self.__lock = threading.Lock()
+        RangeZipArchive.__init__(self, keyName, bucket.Object(keyName).content_length,
+                                 chunkSize, concurrency)
+
+    def fetchRange(self, start, end):
+        data = self.__get(start, end)
+        if self.checksum is None:
+            return data
+        # ranges are not widened to whole blocks, which would fetch up to
+        # two extra blocks for small reads such as the central directory.
+        # The bytes of partly covered blocks are still checked by the
+        # member CRCs and the central directory signatures
+        blockSize = self.checksum.blockSize
+        first = -(-start // blockSize) * blockSize
+        last = end if end == self.size else end - end % blockSize
+        if first >= last:
+            return data
+        return (data[:first - start] +
+                self.checksum.repair(data[first - start:last - start], first, last, self.__get) +
+                data[last - start:])
+
+    def chunkAlignment(self):
+        return 1 if self.checksum is None else self.checksum.blockSize
+
+    def __get(self, start, end):
+        with self.scheduler.transfer(end - start, self.__priority, self.__owner):
+            response = self.bucket.Object(self.keyName).get(
+                Range="bytes={0}-{1}".format(start, end - 1))
+            data = response["Body"].read()
+        with self.__lock:
+            self.bytesFetched += len(data)
+        return data
+
+class LocalZipArchive(RangeZipArchive):
+    """a zip archive on local disk, used to unpack archives with compression
+    methods that zipfile does not support"""
+
+    def __init__(self, path, chunkSize=1024 * 1024, concurrency=2):
+        """
+        Args:
+            path: the path of the zip archive
+            chunkSize: the number of bytes read at a time when extracting
+            concurrency: the number of reads in flight when extracting
+        """
+        self.path = path
+        RangeZipArchive.__init__(self, path, os.path.getsize(path), chunkSize, concurrency)
+
+    def fetchRange(self, start, end):
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            return f.read(end - start)
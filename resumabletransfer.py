@@ -0,0 +1,331 @@
+import os, json, time, logging, threading
+from multiprocessing.pool import ThreadPool
+from transferscheduler import TransferScheduler
+
+class TransferState(object):
+    """the checkpoint of a resumable transfer, kept as a small json file.
+
+    Transfers save the state at most every interval seconds while parts
+    complete, see due, and once more when a part fails, so that the file is
+    not rewritten after every part of a transfer with many parts.
+    """
+
+    def __init__(self, path, interval=5.0):
+        """
+        Args:
+            path: the path of the state file
+            interval: the minimum number of seconds between the saves of a
+            transfer in progress
+        """
+        self.path = path
+        self.interval = interval
+        self.__lock = threading.Lock()
+        self.__saved = None
+
+    def read(self):
+        """returns the saved state dictionary, or None"""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except ValueError:
+            logging.warning("ignoring unreadable transfer state '{0}'".format(self.path))
+            return None
+
+    def save(self, state):
+        with self.__lock:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            tmpPath = self.path + ".tmp"
+            with open(tmpPath, "w") as f:
+                json.dump(state, f)
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            os.rename(tmpPath, self.path)
+            self.__saved = time.time()
+
+    def due(self):
+        """returns True if interval seconds have passed since the state was
+        last saved"""
+        return self.__saved is None or time.time() - self.__saved >= self.interval
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    @staticmethod
+    def partSizeFor(size, partSize, maxParts=10000):
+        """returns partSize, increased if needed so that size bytes fit in
+        maxParts parts, the S3 limit for multipart uploads"""
+        return max(partSize, -(-size // maxParts))
+
+    @staticmethod
+    def transferParts(partNumbers, transferPart, concurrency):
+        """call transferPart on each part number on concurrency threads,
+        raising the first error after every part has been attempted"""
+        errors = []
+        def run(partNumber):
+            try:
+                transferPart(partNumber)
+            except Exception as ex:
+                logging.exception("error transferring part {0}".format(partNumber))
+                errors.append(ex)
+        pool = ThreadPool(max(1, min(concurrency, len(partNumbers))))
+        try:
+            pool.map(run, partNumbers)
+        finally:
+            pool.close()
+            pool.join()
+        if len(errors) > 0:
+            raise errors[0]
+
+class ResumableUpload(object):
+    """uploads a local file to S3 as a multipart upload, checkpointing the
+    upload id and the completed parts in a state file.
+
+    If the process is interrupted, running a ResumableUpload with the same
+    state file again uploads only the missing parts, provided the local
+    file's size and mtime are unchanged. The state file is removed once the
+    upload completes, and the upload of a state discarded because the file
+    changed is aborted. Uploads that are never resumed stay incomplete in
+    the bucket until aborted, eg. by a lifecycle rule.
+    """
+
+    def __init__(self, bucket, keyName, localPath, statePath, partSize=8 * 1024 * 1024,
+                 concurrency=10, metadata=None, tag=None, scheduler=None,
+                 checkpointInterval=5.0):
+        """
+        Args:
+            bucket: a boto3 s3 Bucket (or compatible) object
+            keyName: the destination S3 key
+            localPath: the file to upload
+            statePath: the path of the state file
+            partSize: the minimum size of each part in bytes
+            concurrency: the number of parts uploaded at once
+            metadata: optional user metadata dictionary for the object
+            tag: optional json value saved in the state, see readTag
+            scheduler: optional TransferScheduler for the part uploads
+            checkpointInterval: the minimum number of seconds between
+            checkpoints of the completed parts, see TransferState
+        """
+        self.bucket = bucket
+        self.keyName = keyName
+        self.localPath = localPath
+        self.state = TransferState(statePath, checkpointInterval)
+        self.partSize = partSize
+        self.concurrency = concurrency
+        self.metadata = metadata
+        self.tag = tag
+        self.scheduler = TransferScheduler() if scheduler is None else scheduler
+        self.__priority, self.__owner = self.scheduler.current()
+
+    @staticmethod
+    def readTag(statePath):
+        """returns the tag and local path of an interrupted upload, or
+        (None, None) if there is none"""
+        state = TransferState(statePath).read()
+        if state is None:
+            return None, None
+        return state.get("Tag"), state.get("LocalPath")
+
+    def run(self):
+        st = os.stat(self.localPath)
+        state = self.state.read()
+        if state is not None and (state.get("Key"), state.get("LocalPath"), state.get("Size"),
+                                  state.get("MTime"), state.get("Metadata")) != \
+           (self.keyName, self.localPath, st.st_size, st.st_mtime, self.metadata):
+            logging.info("discarding the state of an upload to '{0}' of different content"
+                         .format(self.keyName))
+            self.__abort(state)
+            state = None
+        if state is not None:
+            try:
+                self.__upload(state)
+                return
+            except Exception as ex:
+                code = getattr(ex, "response", {}).get("Error", {}).get("Code")
+                if code != "NoSuchUpload":
+                    raise
+                logging.info("interrupted upload to '{0}' no longer exists, restarting"
+                             .format(self.keyName))
+        obj = self.bucket.Object(self.keyName)
+        if self.metadata is None:
+            upload = obj.initiate_multipart_upload()
+        else:
+            upload = obj.initiate_multipart_upload(Metadata=self.metadata)
+        state = { "Key": self.keyName, "LocalPath": self.localPath, "Size": st.st_size,
+                  "MTime": st.st_mtime, "Metadata": self.metadata, "Tag": self.tag,
+                  "UploadId": upload.id,
+                  "PartSize": TransferState.partSizeFor(st.st_size, self.partSize), "Parts": {} }
+        self.state.save(state)
+        self.__upload(state, upload)
+
+    def __abort(self, state):
+        """abort the multipart upload of a discarded state, whose parts
+        would otherwise be stored until a lifecycle rule removes them"""
+        try:
+            with self.scheduler.request(self.__priority, self.__owner):
+                self.bucket.Object(state["Key"]).MultipartUpload(state["UploadId"]).abort()
+        except Exception as ex:
+            code = getattr(ex, "response", {}).get("Error", {}).get("Code")
+            if code != "NoSuchUpload":
+                logging.warning("failed to abort the upload '{0}' to '{1}': {2}"
+                                .format(state["UploadId"], state["Key"], ex))
+
+    def __upload(self, state, upload=None):
+        if upload is None:
+            upload = self.bucket.Object(self.keyName).MultipartUpload(state["UploadId"])
+        partSize = state["PartSize"]
+        # S3 requires at least one part, even for an empty file
+        partCount = max(1, -(-state["Size"] // partSize))
+        pending = [n for n in range(1, partCount + 1) if str(n) not in state["Parts"]]
+        if len(state["Parts"]) > 0:
+            logging.info("resuming upload to '{0}', {1} of {2} parts remaining"
+                         .format(self.keyName, len(pending), partCount))
+        lock = threading.Lock()
+
+        def uploadPart(partNumber):
+            with open(self.localPath, "rb") as f:
+                f.seek((partNumber - 1) * partSize)
+                data = f.read(partSize)
+            with self.scheduler.transfer(len(data), self.__priority, self.__owner):
+                response = upload.Part(partNumber).upload(Body=data)
+            with lock:
+                state["Parts"][str(partNumber)] = response["ETag"]
+                if self.state.due():
+                    self.state.save(state)
+        try:
+            TransferState.transferParts(pending, uploadPart, self.concurrency)
+        except:
+            self.state.save(state)
+            raise
+        upload.complete(MultipartUpload={"Parts": [
+            {"PartNumber": n, "ETag": state["Parts"][str(n)]}
+            for n in range(1, partCount + 1)]})
+        self.state.remove()
+        logging.info("completed resumable upload of {0} bytes in {1} parts to '{2}'"
+                     .format(state["Size"], partCount, self.keyName))
+
+class ResumableDownload(object):
+    """downloads an S3 object with ranged GETs into a partial file next to
+    the destination, checkpointing the completed parts in a state file.
+
+    If the process is interrupted, running a ResumableDownload with the same
+    state file again fetches only the missing parts, provided the object's
+    ETag is unchanged. The partial file is renamed to the destination and
+    the state file removed once every part has been written.
+
+    With an ArchiveChecksum the parts are aligned to its blocks, and each
+    part is verified before it is written, fetching corrupt blocks again.
+    The partial file is synced to disk before each checkpoint, so that the
+    parts it records are never lost. Without checkpoints the parts are
+    neither synced nor recorded, and a download always starts over.
+    """
+
+    def __init__(self, bucket, keyName, localPath, statePath, partSize=8 * 1024 * 1024,
+                 concurrency=10, scheduler=None, checksum=None, checkpoint=True,
+                 size=None, etag=None, checkpointInterval=5.0):
+        """
+        Args:
+            bucket: a boto3 s3 Bucket (or compatible) object
+            keyName: the S3 key to download
+            localPath: the destination file
+            statePath: the path of the state file
+            partSize: the size of each ranged GET in bytes
+            concurrency: the number of ranged GETs in flight
+            scheduler: optional TransferScheduler for the ranged GETs
+            checksum: optional ArchiveChecksum of the object
+            checkpoint: if False the completed parts are not checkpointed
+            size, etag: optional size and ETag of the object, read with a
+            HEAD request unless both are given
+            checkpointInterval: the minimum number of seconds between
+            checkpoints of the completed parts, see TransferState
+        """
+        self.bucket = bucket
+        self.keyName = keyName
+        self.localPath = localPath
+        self.checksum = checksum
+        if checksum is not None:
+            partSize = -(-partSize // checksum.blockSize) * checksum.blockSize
+        self.partialPath = localPath + ".partial"
+        self.state = TransferState(statePath, checkpointInterval)
+        self.partSize = partSize
+        self.concurrency = concurrency
+        self.checkpoint = checkpoint
+        self.size = size
+        self.etag = etag
+        self.scheduler = TransferScheduler() if scheduler is None else scheduler
+        self.__priority, self.__owner = self.scheduler.current()
+
+    def run(self):
+        obj = self.bucket.Object(self.keyName)
+        if self.size is None or self.etag is None:
+            size, etag = obj.content_length, obj.e_tag
+        else:
+            size, etag = self.size, self.etag
+        state = self.state.read() if self.checkpoint else None
+        if state is None or (state.get("Key"), state.get("ETag"), state.get("Size")) != \
+           (self.keyName, etag, size) or not os.path.exists(self.partialPath) or \
+           (self.checksum is not None and state["PartSize"] % self.checksum.blockSize != 0):
+            state = { "Key": self.keyName, "ETag": etag, "Size": size,
+                      "PartSize": self.partSize, "Parts": [] }
+            with open(self.partialPath, "wb") as f:
+                f.truncate(size)
+            if self.checkpoint:
+                self.state.save(state)
+        partSize = state["PartSize"]
+        partCount = -(-size // partSize)
+        done = set(state["Parts"])
+        pending = [n for n in range(partCount) if n not in done]
+        if len(done) > 0:
+            logging.info("resuming download of '{0}', {1} of {2} parts remaining"
+                         .format(self.keyName, len(pending), partCount))
+        lock = threading.Lock()
+
+        def fetchRange(start, end):
+            with self.scheduler.transfer(end - start, self.__priority, self.__owner):
+                # IfMatch fails the request if the object changed since the
+                # download started
+                return obj.get(Range="bytes={0}-{1}".format(start, end - 1),
+                               IfMatch=etag)["Body"].read()
+
+        def downloadPart(n):
+            start = n * partSize
+            end = min(size, start + partSize)
+            data = fetchRange(start, end)
+            if self.checksum is not None:
+                data = self.checksum.repair(data, start, end, fetchRange)
+            with open(self.partialPath, "r+b") as f:
+                f.seek(start)
+                f.write(data)
+            if self.checkpoint:
+                with lock:
+                    state["Parts"].append(n)
+                    if self.state.due():
+                        self.__save(state)
+        try:
+            TransferState.transferParts(pending, downloadPart, self.concurrency)
+        except:
+            if self.checkpoint:
+                self.__save(state)
+            raise
+        if self.checkpoint:
+            self.__sync()
+        if os.path.exists(self.localPath):
+            os.remove(self.localPath)
+        os.rename(self.partialPath, self.localPath)
+        self.state.remove()
+        logging.info("completed ranged download of {0} bytes in {1} parts from '{2}'"
+                     .format(size, partCount, self.keyName))
+
+    def __sync(self):
+        """sync the parts written to the partial file to disk"""
+        with open(self.partialPath, "r+b") as f:
+            os.fsync(f.fileno())
+
+    def __save(self, state):
+        """checkpoint the parts of state, which have all been written"""
+        self.__sync()
+        self.state.save(state)
@@ -0,0 +1,90 @@
+import logging, threading
+
+class S3ClientFactory(object):
+    """creates the boto3 S3 resource shared by every S3Interface in the
+    process.
+
+    One boto3 session and one S3 client are created on first use. The
+    client's urllib3 connection pool is sized for the concurrent transfers
+    this application makes, and its connections are kept alive and reused
+    between requests, so TLS handshakes are not repeated for every small
+    object. boto3 clients are thread safe. Callers create their own Bucket
+    and Object resources from the shared resource, which all use the same
+    client.
+    """
+
+    maxPoolConnections = 50
+    __lock = threading.Lock()
+    __resource = None
+
+    @staticmethod
+    def configure(maxPoolConnections):
+        """set the connection pool size. Must be called before the first
+        call to resource"""
+        if maxPoolConnections < 1:
+            raise ValueError("maxPoolConnections must be at least 1, got {0}"
+                             .format(maxPoolConnections))
+        with S3ClientFactory.__lock:
+            if S3ClientFactory.__resource is not None:
+                raise ValueError("the shared S3 client has already been created")
+            S3ClientFactory.maxPoolConnections = maxPoolConnections
+
+    @staticmethod
+    def configureLocal(rootDir, latency=0.0, bytesPerSecond=None):
+        """share a LocalS3 resource storing buckets under rootDir instead of
+        a boto3 resource, to run offline. Must be called before the first
+        call to resource"""
+        from local_s3 import LocalS3
+        with S3ClientFactory.__lock:
+            if S3ClientFactory.__resource is not None:
+                raise ValueError("the shared S3 client has already been created")
+            S3ClientFactory.__resource = LocalS3(rootDir, latency, bytesPerSecond)
+
+    @staticmethod
+    def resource():
+        """returns the shared boto3 S3 resource, creating it on first use"""
+        with S3ClientFactory.__lock:
+            if S3ClientFactory.__resource is None:
+                S3ClientFactory.__resource = S3ClientFactory.__createResource(
+                    S3ClientFactory.maxPoolConnections)
+            return S3ClientFactory.__resource
+
+    @staticmethod
+    def reset():
+        """discard the shared resource, so the next call to resource creates
+        a new session and client"""
+        with S3ClientFactory.__lock:
+            S3ClientFactory.__resource = None
+
+    @staticmethod
+    def __createResource(maxPoolConnections):
+        import boto3
+        from botocore.config import Config
+        logging.info("creating shared S3 client with a pool of {0} connections"
+                     .format(maxPoolConnections))
+        session = boto3.session.Session()
+        return session.resource("s3", config=Config(max_pool_connections=maxPoolConnections))
+
+    @staticmethod
+    def addArguments(parser):
+        """add the optional connection pool argument to an argparse parser"""
+        parser.add_argument("--maxPoolConnections", type=int, default=None, required=False,
+                            help = "optional size of the S3 connection pool (default {0})"
+                            .format(S3ClientFactory.maxPoolConnections))
+        parser.add_argument("--localS3Dir", default=None, required=False,
+                            help = "optional local directory storing the buckets in place of S3, for offline runs and benchmarks")
+        parser.add_argument("--localS3Latency", type=float, default=0.0, required=False,
+                            help = "seconds of simulated latency per request with --localS3Dir (default 0)")
+        parser.add_argument("--localS3BytesPerSecond", type=int, default=None, required=False,
+                            help = "optional simulated bandwidth with --localS3Dir")
+
+    @staticmethod
+    def FromArguments(args):
+        """configure the factory from a dictionary of parsed arguments and
+        return the shared resource"""
+        if args.get("maxPoolConnections") is not None:
+            S3ClientFactory.configure(args["maxPoolConnections"])
+        if args.get("localS3Dir") is not None:
+            S3ClientFactory.configureLocal(args["localS3Dir"], args.get("localS3Latency", 0.0),
+                                           args.get("localS3BytesPerSecond"))
+        return S3ClientFactory.resource()
@@ -1,56 +1,396 @@
-import os, shutil, zipfile, logging
+import os, json, shutil, zipfile, fnmatch, logging, multiprocessing
+from zipstreamwriter import ZipStreamWriter
+from parallelzipstreamwriter import ParallelZipStreamWriter
+from multipartupload import MultipartUploadStream
+from remotezip import RemoteZipArchive, LocalZipArchive
+from parallelzipextractor import ParallelZipExtractor
+from compressioncodec import CompressionCodec
+from transfersettings import TransferSettings
+from s3clientfactory import S3ClientFactory
+from transferscheduler import TransferScheduler
+from resumabletransfer import ResumableUpload, ResumableDownload, TransferState
+from documentfingerprint import DocumentFingerprint
+from documentsync import DocumentSync
+from shardeddocument import ShardedDocument
+from tarstream import TarStream
+from archivechecksum import ArchiveChecksum
 
 class S3Interface(object):
 
     def __init__(self, s3Resource, bucketName, localTempDir):
+        """
+        Args:
+            s3Resource: a boto3 s3 resource, or None for the resource shared
+            through S3ClientFactory
+            bucketName: the name of the bucket storing the documents
+            localTempDir: a writable directory for temporary files
+        """
+        if s3Resource is None:
+            s3Resource = S3ClientFactory.resource()
         self.bucketName = bucketName
         self.bucket = s3Resource.Bucket(bucketName)
         self.localTempDir = localTempDir
         self.__format = "zip"
         self.__singleFileFlag = "__is__single__file_archive__"
+        self.multipartPartSize = 8 * 1024 * 1024
+        self.multipartQueueDepth = 2
+        self.rangeChunkSize = 8 * 1024 * 1024
+        self.rangeConcurrency = 4
+        self.syncConcurrency = 16
+        self.compressionWorkers = multiprocessing.cpu_count()
+        self.extractionWorkers = multiprocessing.cpu_count()
+        self.parallelExtractionMinSize = 4 * 1024 * 1024
+        # TransferSettings for upload_file and download_file, None for the
+        # boto3 defaults
+        self.transferSettings = None
+        # optional DocumentCache of unpacked Archive mode documents
+        self.documentCache = None
+        # limits the requests and bandwidth of all transfers, and orders
+        # waiting transfers by the priority of their documents
+        self.scheduler = TransferScheduler()
+        # False for drop in resources that only transfer files, such as
+        # powershell_s3. The resumable transfers, sharding and checksums
+        # below make object level requests, and are turned off for them
+        self.objectRequests = getattr(s3Resource, "objectRequests", True)
+        # files of at least this size are transferred with checkpoints under
+        # localTempDir, so an interrupted transfer resumes where it stopped.
+        # None transfers every file with upload_file and download_file
+        self.resumableThreshold = None
+        # directories of more than shardSize bytes are uploaded as up to
+        # maxShards shard archives, shardConcurrency of which are processed
+        # at once, see ShardedDocument. None uploads one archive per document.
+        # Sharding is opt-in, since resources that only transfer files fetch
+        # just the single archive. Downloads read documents stored as shards
+        # whatever this setting is
+        self.shardSize = None
+        self.maxShards = 64
+        self.shardConcurrency = 4
+        # archives are uploaded with CRC-32 checksums of blocks of this size,
+        # which are verified on download, see ArchiveChecksum. None uploads
+        # archives without checksums. Downloads verify archives stored with
+        # checksums whatever this setting is
+        self.checksumBlockSize = 8 * 1024 * 1024 if self.objectRequests else None
 
-    def downloadFile(self, keyName, localPath, logged=True):
+    def downloadFile(self, keyName, localPath, logged=True, transferSettings=None, size=None,
+                     checksum=None, etag=None):
+        """download an S3 object to a local file
+
+        Args:
+            size: optional size of the object. Objects of at least
+            resumableThreshold bytes are downloaded with downloadFileResumable
+            checksum: optional ArchiveChecksum of the object. The object is
+            then downloaded with ranged GETs that are verified as they arrive,
+            fetching corrupt blocks again, see downloadFileResumable
+            etag: optional ETag of the object, which with its size saves the
+            ranged download a HEAD request
+        """
+        resumable = size is not None and self.resumableThreshold is not None \
+            and size >= self.resumableThreshold
+        if resumable or checksum is not None:
+            self.downloadFileResumable(keyName, localPath, logged, transferSettings, checksum,
+                                       checkpoint=resumable, size=size, etag=etag)
+            return
+        settings, args = self.__transferArgs(transferSettings)
         if logged:
-            logging.info("downloading file from S3 '{0}' to '{1}'".format(keyName, localPath))
-        self.bucket.download_file(keyName, localPath)
+            logging.info("downloading file from S3 '{0}' to '{1}' ({2})"
+                         .format(keyName, localPath, settings))
+        with self.scheduler.request():
+            self.bucket.download_file(keyName, localPath, **self.__throttled(args))
 
-    def uploadFile(self, localPath, keyName, logged=True):
+    def uploadFile(self, localPath, keyName, logged=True, metadata=None,
+                   transferSettings=None, resumeTag=None):
+        """upload a local file, with a resumable upload if it is at least
+        resumableThreshold bytes
+
+        Args:
+            resumeTag: optional json value stored with the checkpoint of a
+            resumable upload, see resumeTag
+        """
+        if self.resumableThreshold is not None and os.path.isfile(localPath) \
+           and os.path.getsize(localPath) >= self.resumableThreshold:
+            self.uploadFileResumable(localPath, keyName, logged, metadata,
+                                     transferSettings, resumeTag)
+            return
+        settings, args = self.__transferArgs(transferSettings)
         if logged:
-            logging.info("uploading file '{0}' to S3 '{1}'".format(localPath, keyName))
-        self.bucket.upload_file(localPath, keyName)
+            logging.info("uploading file '{0}' to S3 '{1}' ({2})"
+                         .format(localPath, keyName, settings))
+        if metadata is not None:
+            args["ExtraArgs"] = {"Metadata": metadata}
+        with self.scheduler.request():
+            self.bucket.upload_file(localPath, keyName, **self.__throttled(args))
+
+    def uploadFileResumable(self, localPath, keyName, logged=True, metadata=None,
+                            transferSettings=None, resumeTag=None):
+        """upload a local file as a multipart upload checkpointed under
+        localTempDir, continuing an interrupted upload of the same file to
+        keyName. Parts are sized and uploaded concurrently according to the
+        effective transfer settings"""
+        settings = self.__effectiveTransferSettings(transferSettings)
+        if logged:
+            logging.info("uploading file '{0}' to S3 '{1}' with checkpoints ({2})"
+                         .format(localPath, keyName, settings))
+        ResumableUpload(self.bucket, keyName, localPath,
+                        self.__transferStatePath(keyName, "upload"),
+                        settings.values["MultipartChunkSize"],
+                        settings.values["MaxConcurrency"],
+                        metadata, resumeTag, self.scheduler).run()
+
+    def downloadFileResumable(self, keyName, localPath, logged=True, transferSettings=None,
+                              checksum=None, checkpoint=True, size=None, etag=None):
+        """download an S3 object with ranged GETs checkpointed under
+        localTempDir, continuing an interrupted download of the same object
+        version to localPath. With an ArchiveChecksum each range is verified
+        as it arrives
+
+        Args:
+            checkpoint: if False the ranges are not checkpointed, and the
+            download is not resumed
+            size, etag: optional size and ETag of the object, see
+            ResumableDownload
+        """
+        settings = self.__effectiveTransferSettings(transferSettings)
+        if logged:
+            logging.info("downloading file from S3 '{0}' to '{1}'{2} ({3})"
+                         .format(keyName, localPath, " with checkpoints" if checkpoint else "",
+                                 settings))
+        ResumableDownload(self.bucket, keyName, localPath,
+                          self.__transferStatePath(keyName, "download"),
+                          settings.values["MultipartChunkSize"],
+                          settings.values["MaxConcurrency"], self.scheduler, checksum,
+                          checkpoint, size, etag).run()
+
+    def __rangeFetcher(self, keyName, inRequest=False):
+        """returns a function fetching a byte range of keyName, scheduled
+        with the priority of the calling thread
 
-    def make_zipfile(self, output_filename, source_dir):
+        Args:
+            inRequest: if True the ranges are fetched on behalf of a request
+            whose slot the caller holds, so they only consume bandwidth
+            instead of waiting for a slot of their own
+        """
+        priority, owner = self.scheduler.current()
+        def fetchRange(start, end):
+            if inRequest:
+                self.scheduler.consume(end - start, priority, owner)
+                return self.__getRange(keyName, start, end)
+            with self.scheduler.transfer(end - start, priority, owner):
+                return self.__getRange(keyName, start, end)
+        return fetchRange
+
+    def __getRange(self, keyName, start, end):
+        return self.bucket.Object(keyName).get(
+            Range="bytes={0}-{1}".format(start, end - 1))["Body"].read()
+
+    def newChecksum(self):
+        """returns a new ArchiveChecksum for an archive being uploaded, or
+        None if checksumBlockSize is None"""
+        if self.checksumBlockSize is None:
+            return None
+        return ArchiveChecksum(self.checksumBlockSize)
+
+    def __checksumKey(self, keyName):
+        return keyName + ".checksum.json"
+
+    def putChecksum(self, keyName, checksum):
+        """store the ArchiveChecksum of the archive uploaded to keyName,
+        whose "checksum" metadata is the checksum's id"""
+        with self.scheduler.request():
+            self.bucket.Object(self.__checksumKey(keyName)).put(
+                Body=json.dumps(checksum.toJson()).encode("utf-8"))
+
+    def getChecksum(self, keyName, metadata=None):
+        """returns the ArchiveChecksum of the archive at keyName, or None if
+        it was uploaded without checksums
+
+        Args:
+            metadata: the archive's metadata if already known, otherwise it
+            is read with a HEAD request
+        """
+        if metadata is None:
+            metadata = self.getMetadata(keyName)
+        if metadata is None or "checksum" not in metadata:
+            return None
+        try:
+            with self.scheduler.request():
+                data = json.loads(self.bucket.Object(self.__checksumKey(keyName))
+                                  .get()["Body"].read().decode("utf-8"))
+        except Exception as ex:
+            code = getattr(ex, "response", {}).get("Error", {}).get("Code")
+            if code not in ["404", "NoSuchKey", "NotFound"]:
+                raise
+            data = None
+        if data is None or data["Id"] != metadata["checksum"]:
+            logging.warning("the checksums of S3 '{0}' are missing, not verifying the download"
+                            .format(keyName))
+            return None
+        return ArchiveChecksum.FromJson(data)
+
+    def deleteArchive(self, keyName):
+        """remove an archive and its checksums"""
+        self.deleteFile(keyName)
+        self.deleteFile(self.__checksumKey(keyName))
+
+    def resumeTag(self, keyName):
+        """returns the resumeTag and local path of an interrupted upload to
+        keyName, or (None, None)"""
+        return ResumableUpload.readTag(self.__transferStatePath(keyName, "upload"))
+
+    def __transferStatePath(self, keyName, direction):
+        return os.path.join(self.localTempDir, "transfers",
+                            "{0}.{1}.json".format(keyName.replace('/', '_'), direction))
+
+    def __effectiveTransferSettings(self, transferSettings):
+        settings = self.transferSettings if transferSettings is None else transferSettings
+        return TransferSettings() if settings is None else settings
+
+    def __throttled(self, args):
+        """add a progress callback consuming the transferred bytes from the
+        scheduler's bandwidth budget to the managed transfer arguments. The
+        callback runs on boto3's threads, so the calling thread's priority
+        is captured here"""
+        if self.scheduler.bytesPerSecond is not None:
+            priority, owner = self.scheduler.current()
+            args["Callback"] = lambda n: self.scheduler.consume(n, priority, owner)
+        return args
+
+    def __transferArgs(self, transferSettings):
+        """returns the effective transfer settings, or a description of the
+        defaults, and the keyword arguments passing them to boto3"""
+        settings = self.transferSettings if transferSettings is None else transferSettings
+        if settings is None:
+            return "default transfer settings", {}
+        return settings, {"Config": settings.toTransferConfig()}
+
+    def documentTransferSettings(self, document):
+        """returns transferSettings with the manifest document's
+        "TransferSettings" overrides applied"""
+        if "TransferSettings" not in document:
+            return self.transferSettings
+        settings = TransferSettings() if self.transferSettings is None else self.transferSettings
+        return settings.override(document["TransferSettings"])
+
+    def documentPriority(self, document):
+        """returns the TransferScheduler class of the document's transfers.
+        Documents produced by instances are outputs, all others are inputs"""
+        if document.get("Direction") == "AWSToLocal":
+            return TransferScheduler.OUTPUT
+        return TransferScheduler.INPUT
+
+    def documentContext(self, document):
+        """returns a context manager scheduling the transfers made on the
+        calling thread as transfers of the specified manifest document"""
+        return self.scheduler.context(self.documentPriority(document), document["Name"])
+
+    def deleteFile(self, keyName, logged=True):
+        if logged:
+            logging.info("deleting S3 '{0}'".format(keyName))
+        self.bucket.Object(keyName).delete()
+
+    def getMetadata(self, keyName):
+        """returns the user metadata dictionary of the specified S3 object,
+        or None if the object does not exist"""
+        return self.__headAttribute(keyName, "metadata")
+
+    def getETag(self, keyName):
+        """returns the ETag of the specified S3 object, or None if the object
+        does not exist"""
+        return self.__headAttribute(keyName, "e_tag")
+
+    def __headAttribute(self, keyName, attribute):
+        """read an attribute of an S3 object that is loaded with a HEAD
+        request, returning None if the object does not exist"""
+        head = self.__head(keyName)
+        return None if head is None else getattr(head, attribute)
+
+    def __head(self, keyName):
+        """returns the S3 Object of keyName with its attributes loaded by a
+        HEAD request, or None if the object does not exist. Further
+        attributes of the returned Object are read without another request"""
+        head = self.bucket.Object(keyName)
+        try:
+            head.content_length
+        except Exception as ex:
+            # botocore's ClientError, imported lazily by boto3
+            code = getattr(ex, "response", {}).get("Error", {}).get("Code")
+            if code in ["404", "NoSuchKey", "NotFound"]:
+                return None
+            raise
+        return head
+
+    def make_zipfile(self, output_filename, source_dir, compression="deflate", checksum=None):
         """
         mostly borrowed from an answer on Stack overflow
         https://stackoverflow.com/questions/1855095/how-to-create-a-zip-archive-of-a-directory
         """
-        relroot = os.path.abspath(source_dir)
+        if self.__usesStreamWriter(compression) or checksum is not None:
+            with open(output_filename, "wb") as f:
+                with self.__newStreamWriter(self.__checksummed(f, checksum), compression) as zip:
+                    self.__writeTree(zip, source_dir)
+            return
         with zipfile.ZipFile(output_filename, "w", zipfile.ZIP_DEFLATED, allowZip64=True) as zip:
-            for root, dirs, files in os.walk(source_dir):
-                # add directory (needed for empty dirs)
-                zip.write(root, os.path.relpath(root, relroot))
-                for file in files:
-                    filename = os.path.join(root, file)
-                    if os.path.isfile(filename): # regular files only
-                        arcname = os.path.join(os.path.relpath(root, relroot), file)
-                        zip.write(filename, arcname)
-
-    def archiveFileOrDirectory(self, pathToArchive, archiveName):
+            self.__writeTree(zip, source_dir)
+
+    def __usesStreamWriter(self, compression):
+        """zipfile is used for local archives only when it supports the
+        compression setting and compression is single threaded"""
+        return self.compressionWorkers > 1 or compression != "deflate"
+
+    def __newStreamWriter(self, fileobj, compression="deflate"):
+        """returns the ZipStreamWriter for an archive written to fileobj with
+        the specified compression setting, compressing on compressionWorkers
+        threads"""
+        codec = CompressionCodec.get(compression)
+        if self.compressionWorkers > 1:
+            return ParallelZipStreamWriter(fileobj, self.compressionWorkers, codec)
+        return ZipStreamWriter(fileobj, codec)
+
+    @staticmethod
+    def __checksummed(fileobj, checksum):
+        """returns fileobj, or a writer adding what is written to it to
+        checksum"""
+        return fileobj if checksum is None else checksum.writer(fileobj)
+
+    def __writeTree(self, zip, source_dir):
+        """add the directory tree at source_dir to zip, which is either a
+        zipfile.ZipFile or a ZipStreamWriter"""
+        relroot = os.path.abspath(source_dir)
+        for root, dirs, files in os.walk(source_dir):
+            # add directory (needed for empty dirs)
+            zip.write(root, os.path.relpath(root, relroot))
+            for file in files:
+                filename = os.path.join(root, file)
+                if os.path.isfile(filename): # regular files only
+                    arcname = os.path.join(os.path.relpath(root, relroot), file)
+                    zip.write(filename, arcname)
+
+    def archiveFileOrDirectory(self, pathToArchive, archiveName, compression="deflate",
+                               checksum=None):
+        """
+        Args:
+            checksum: optional ArchiveChecksum, computed while the archive is
+            written
+        """
         if os.path.isdir(pathToArchive):
             archivePath = os.path.join(self.localTempDir, archiveName)
             logging.info("archiving documents at '{0}' to '{1}'".format(pathToArchive, archivePath))
             outputPath = archivePath + '.zip'
-            self.make_zipfile(outputPath, pathToArchive)
+            self.make_zipfile(outputPath, pathToArchive, compression, checksum)
             return outputPath;
         elif os.path.isfile(pathToArchive):
             outputPath =  os.path.join(self.localTempDir, archiveName) + "." + self.__format
             logging.info("archiving file '{0}' to '{1}'".format(pathToArchive, outputPath))
+            if self.__usesStreamWriter(compression) or checksum is not None:
+                with open(outputPath, "wb") as f:
+                    with self.__newStreamWriter(self.__checksummed(f, checksum), compression) as z:
+                        z.write(pathToArchive, os.path.basename(pathToArchive))
+                        z.writestr(self.__singleFileFlag, "")
+                return outputPath
             with zipfile.ZipFile(outputPath, 'w', zipfile.ZIP_DEFLATED, True) as z:
                 z.write(pathToArchive, os.path.basename(pathToArchive))
-                singleFilePath = os.path.join(self.localTempDir, self.__singleFileFlag)
-                with open(singleFilePath, mode='w') as tmp:
-                    z.write(singleFilePath, self.__singleFileFlag)
-                os.remove(singleFilePath)
+                # written from memory so that concurrent archiving in the same
+                # temp dir does not share a flag file
+                z.writestr(self.__singleFileFlag, "")
             return outputPath
         else:
             raise ValueError(
@@ -58,8 +398,17 @@ class S3Interface(object):
                 .format(pathToArchive))
 
     def unpackFileOrDirectory(self, archiveName, destinationPath):
+        if os.path.isdir(archiveName):
+            # the shard archives of a document, see downloadArchive
+            ShardedDocument(self, self.shardConcurrency).unpack(archiveName, destinationPath)
+            return
         logging.info("upacking files in '{0}' to '{1}'".format(archiveName, destinationPath))
         with zipfile.ZipFile(archiveName, 'r', allowZip64=True) as z:
+            if any(i.compress_type not in [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED]
+                   for i in z.infolist()):
+                # bzip2 and zstd members are decoded by LocalZipArchive
+                self.__extractArchive(LocalZipArchive(archiveName), destinationPath)
+                return
             files = z.namelist()
             if self.__singleFileFlag in files:
                 if len(files) != 2:
@@ -69,27 +418,550 @@ class S3Interface(object):
                 destinationDir = os.path.dirname(destinationPath)
                 destinationFileName = os.path.basename(destinationPath)
                 compressedFileName = [x for x in files if x != self.__singleFileFlag][0]
-                z.extractall(destinationDir)
+                z.extract(compressedFileName, destinationDir)
                 os.rename(os.path.join(destinationDir, compressedFileName), os.path.join(destinationDir, destinationFileName))
-                os.remove(os.path.join(destinationDir, self.__singleFileFlag))
             else:
-                z.extractall(destinationPath)
+                ParallelZipExtractor(self.extractionWorkers,
+                                     self.parallelExtractionMinSize).extractAll(
+                                         archiveName, destinationPath)
+
+    @staticmethod
+    def archiveSize(archiveName):
+        """returns the size of an archive returned by downloadArchive"""
+        if os.path.isdir(archiveName):
+            return sum(os.path.getsize(os.path.join(archiveName, x))
+                       for x in os.listdir(archiveName))
+        return os.path.getsize(archiveName)
+
+    @staticmethod
+    def removeArchive(archiveName):
+        """remove an archive returned by downloadArchive"""
+        if os.path.isdir(archiveName):
+            shutil.rmtree(archiveName)
+        elif os.path.exists(archiveName):
+            os.remove(archiveName)
+
+    def __extractArchive(self, archive, destinationPath):
+        """extract a RangeZipArchive to destinationPath, which is the full
+        path of the file for single file archives"""
+        files = archive.namelist()
+        if self.__singleFileFlag in files:
+            if len(files) != 2:
+                raise ValueError("single file archive expected to have a single file")
+            member = [x for x in archive.members if x.name != self.__singleFileFlag][0]
+            archive.extract([member], lambda m: destinationPath)
+        else:
+            archive.extractAll(destinationPath)
+
+    def uploadDocument(self, keyNamePrefix, document, localPath, skipUnchanged=False):
+        """upload the file or directory at localPath as the specified manifest
+        document, according to the document's "Mode", "Format",
+        "StreamingUpload", "Compression", "ShardSize" and "MaxShards" options
+        and "TransferSettings" overrides. Sync mode documents are always
+        uploaded incrementally, see DocumentSync. Options that make object
+        level requests raise a ValueError when objectRequests is False"""
+        self.__checkObjectRequests(document, "upload", [
+            ('"Mode": "Sync"', document.get("Mode", "Archive") == "Sync"),
+            ('"StreamingUpload"', document.get("StreamingUpload", False)),
+            ("skipUnchanged", skipUnchanged)])
+        with self.documentContext(document):
+            self.__uploadDocument(keyNamePrefix, document, localPath, skipUnchanged)
+
+    def __uploadDocument(self, keyNamePrefix, document, localPath, skipUnchanged):
+        transferSettings = self.documentTransferSettings(document)
+        if document.get("Mode", "Archive") == "Sync":
+            DocumentSync(self, self.syncConcurrency, transferSettings).upload(
+                keyNamePrefix, document["Name"], localPath)
+        elif document.get("Format", "zip") == "tar":
+            self.uploadTarStream(keyNamePrefix, document["Name"], localPath,
+                                 streaming=document.get("StreamingUpload", False),
+                                 skipUnchanged=skipUnchanged,
+                                 compression=document.get("Compression", "deflate"),
+                                 transferSettings=transferSettings)
+        else:
+            self.uploadCompressed(keyNamePrefix, document["Name"], localPath,
+                                  streaming=document.get("StreamingUpload", False),
+                                  skipUnchanged=skipUnchanged,
+                                  compression=document.get("Compression", "deflate"),
+                                  transferSettings=transferSettings,
+                                  shardSize=document.get("ShardSize") if self.objectRequests
+                                            else None,
+                                  maxShards=document.get("MaxShards"))
 
+    def downloadDocument(self, keyNamePrefix, document, localPath, include=None):
+        """download the specified manifest document to localPath according to
+        the document's "Mode", "Format" and "PipelinedDownload" options and
+        "TransferSettings" overrides. Options that make object level
+        requests raise a ValueError when objectRequests is False
+
+        Args:
+            include: optional list of member patterns, see downloadMembers
+
+        Returns:
+            the number of bytes downloaded
+        """
+        self.__checkObjectRequests(document, "download", [
+            ('"Mode": "Sync"', document.get("Mode", "Archive") == "Sync"),
+            ('"Format": "tar"', document.get("Format", "zip") == "tar"),
+            ('"PipelinedDownload"', document.get("PipelinedDownload", False)),
+            ("include patterns", include is not None),
+            ("the document cache", self.documentCache is not None)])
+        with self.documentContext(document):
+            return self.__downloadDocument(keyNamePrefix, document, localPath, include)
 
-    def uploadCompressed(self, keyNamePrefix, documentName, localPath):
+    def __checkObjectRequests(self, document, action, options):
+        """raise a ValueError naming the options of (name, used) pairs used
+        for the document that make object level requests, when the S3
+        resource only transfers files"""
+        used = [name for name, isUsed in options if isUsed]
+        if not self.objectRequests and len(used) > 0:
+            raise ValueError("cannot {0} document '{1}' with {2}: the S3 resource only "
+                             "transfers whole files".format(action, document["Name"],
+                                                            ", ".join(used)))
 
-        fn = self.archiveFileOrDirectory(localPath, documentName)
-        #archive directory may add a file extension
-        ext = os.path.splitext(fn)[1]
-        documentName = documentName + ext
-        self.uploadFile(fn, "/".join([keyNamePrefix, documentName]))
+    def __downloadDocument(self, keyNamePrefix, document, localPath, include):
+        if include is not None:
+            return self.downloadMembers(keyNamePrefix, document["Name"], localPath, include)
+        transferSettings = self.documentTransferSettings(document)
+        if document.get("Mode", "Archive") == "Sync":
+            return DocumentSync(self, self.syncConcurrency, transferSettings).download(
+                keyNamePrefix, document["Name"], localPath)
+        format = document.get("Format", "zip")
+        if format == "tar":
+            download = lambda path: self.downloadTarStream(keyNamePrefix, document["Name"], path)
+        else:
+            download = lambda path: self.downloadCompressed(
+                keyNamePrefix, document["Name"], path,
+                pipelined=document.get("PipelinedDownload", False),
+                transferSettings=transferSettings)
+        if self.documentCache is not None:
+            return self.downloadCached(keyNamePrefix, document["Name"], localPath, download,
+                                       format)
+        return download(localPath)
+
+    def downloadCached(self, keyNamePrefix, documentName, localPath, download, format="zip"):
+        """materialize the specified document at localPath from documentCache,
+        checking the archive's current ETag with a HEAD request. On a miss
+        the document is unpacked into the cache with download, a function
+        taking the destination path and returning the bytes downloaded
+
+        Args:
+            format: the document's "Format", "zip" or "tar"
+
+        Returns:
+            the number of bytes downloaded
+        """
+        keyName = self.__documentKey(keyNamePrefix, documentName, format)
+        etag = self.getETag(keyName)
+        if etag is None and format == "zip":
+            # the index of a document stored as shards identifies its version
+            keyName = ShardedDocument(self).indexKey(keyNamePrefix, documentName)
+            etag = self.getETag(keyName)
+        if etag is None:
+            raise ValueError("document '{0}' not found at S3 '{1}'".format(documentName, keyName))
+        cachedPath = self.documentCache.lookup(self.bucketName, keyName, etag)
+        downloaded = 0
+        if cachedPath is None:
+            cachedPath, downloaded = self.documentCache.store(
+                self.bucketName, keyName, etag, download)
+        else:
+            logging.info("document '{0}' with ETag {1} found in cache".format(documentName, etag))
+        self.documentCache.materialize(cachedPath, localPath,
+                                       "/".join([self.bucketName, keyNamePrefix, documentName]))
+        return downloaded
+
+    def stagesArchive(self, document):
+        """True if downloadDocument fetches the whole archive of the document
+        to localTempDir before unpacking it, in which case the two steps can
+        be run separately with downloadArchive and unpackFileOrDirectory"""
+        return document.get("Mode", "Archive") == "Archive" and \
+            document.get("Format", "zip") == "zip" and \
+            not document.get("PipelinedDownload", False) and self.documentCache is None
+
+    def uploadCompressed(self, keyNamePrefix, documentName, localPath, streaming=False,
+                         skipUnchanged=False, compression="deflate", transferSettings=None,
+                         shardSize=None, maxShards=None):
+        """archive the file or directory at localPath and upload it to S3.
+        The compression setting is stored as metadata on the uploaded object.
+        If localPath is a directory of more than shardSize bytes it is
+        uploaded as shards, see ShardedDocument. While shardSize is set, the
+        shards of a previous upload are removed when a single archive
+        replaces them
+
+        Args:
+            streaming: if True the archive is compressed directly into the
+            parts of a multipart upload, without writing a temporary archive
+            to localTempDir
+            skipUnchanged: if True a content fingerprint of localPath is
+            stored as metadata on the uploaded object, and both archiving and
+            upload are skipped when the object already has the same
+            fingerprint and compression
+            compression: a CompressionCodec setting for the archive members
+            transferSettings: optional TransferSettings for the upload of the
+            archive, replacing the transferSettings attribute
+            shardSize: optional shard size replacing the shardSize attribute
+            maxShards: optional shard limit replacing the maxShards attribute
+        """
+        shardSize = self.shardSize if shardSize is None else shardSize
+        maxShards = self.maxShards if maxShards is None else maxShards
+        metadata = {"compression": compression}
+        sharded = ShardedDocument(self, self.shardConcurrency)
+        archiveKey = self.__documentKey(keyNamePrefix, documentName)
+        indexKey = sharded.indexKey(keyNamePrefix, documentName)
+        # the key of the previous upload of the document, where it is known
+        previousKey = None
+        if skipUnchanged:
+            previousKey, remote = self.__previousUpload([archiveKey, indexKey])
+            if self.__isUnchanged(documentName, localPath, metadata, remote):
+                return
+        elif shardSize is not None and self.getMetadata(indexKey) is not None:
+            previousKey = indexKey
+        shardCount = sharded.shardCount(localPath, shardSize, maxShards)
+        if shardCount > 1:
+            sharded.upload(keyNamePrefix, documentName, localPath, shardCount, metadata,
+                           compression, streaming, transferSettings)
+            if previousKey == archiveKey or \
+               (not skipUnchanged and self.getMetadata(archiveKey) is not None):
+                self.deleteArchive(archiveKey)
+            return
+        self.__uploadArchive(keyNamePrefix, documentName, localPath, streaming, metadata,
+                             compression, transferSettings)
+        if previousKey == indexKey:
+            # remove the shards of the previous upload of the document
+            sharded.delete(keyNamePrefix, documentName)
+
+    def __uploadArchive(self, keyNamePrefix, documentName, localPath, streaming, metadata,
+                        compression, transferSettings):
+        if streaming:
+            self.uploadCompressedStream(keyNamePrefix, documentName, localPath, metadata,
+                                        compression)
+            return
+        keyName = self.__documentKey(keyNamePrefix, documentName)
+        # an archive whose upload was interrupted is uploaded again if the
+        # files under localPath have not been modified since. The files are
+        # only listed when the upload can be resumed or resumes one
+        tag, fn = self.resumeTag(keyName)
+        resumeTag = None
+        if self.resumableThreshold is not None or tag is not None:
+            resumeTag = [self.getDocumentFingerprint(documentName).statSignature(localPath),
+                         metadata]
+        # the checksums are kept with the transfer state of the archive
+        checksumPath = self.__transferStatePath(keyName, "checksum")
+        if tag is not None and tag == resumeTag and fn is not None and os.path.isfile(fn):
+            logging.info("resuming the interrupted upload of archive '{0}'".format(fn))
+            checksum = None
+            if os.path.isfile(checksumPath):
+                with open(checksumPath) as f:
+                    checksum = ArchiveChecksum.FromJson(json.load(f))
+        else:
+            checksum = self.newChecksum()
+            fn = self.archiveFileOrDirectory(localPath, documentName, compression, checksum)
+            if checksum is not None:
+                TransferState(checksumPath).save(checksum.finish().toJson())
+        if checksum is not None:
+            metadata = dict(metadata, checksum=checksum.id)
+        resumable = self.resumableThreshold is not None and \
+            os.path.getsize(fn) >= self.resumableThreshold
+        try:
+            self.uploadFile(fn, keyName, metadata=metadata, transferSettings=transferSettings,
+                            resumeTag=resumeTag)
+        except:
+            # only an archive uploaded with checkpoints is kept to resume
+            if not resumable:
+                os.remove(fn)
+                TransferState(checksumPath).remove()
+            raise
         os.remove(fn)
+        if checksum is not None:
+            self.putChecksum(keyName, checksum)
+            TransferState(checksumPath).remove()
+
+    def __previousUpload(self, keyNames):
+        """returns the first of keyNames that exists and its metadata, or
+        (None, None)"""
+        for keyName in keyNames:
+            remote = self.getMetadata(keyName)
+            if remote is not None:
+                return keyName, remote
+        return None, None
+
+    def __isUnchanged(self, documentName, localPath, metadata, remote):
+        """add the fingerprint of localPath to the upload metadata, returning
+        True if remote, the metadata of the previous upload or None, has the
+        same fingerprint and compression"""
+        fingerprint = self.fingerprintDocument(documentName, localPath)
+        if remote is not None and remote.get("fingerprint") == fingerprint \
+           and remote.get("compression", "deflate") == metadata["compression"]:
+            logging.info("document '{0}' at '{1}' is unchanged, skipping upload"
+                         .format(documentName, localPath))
+            return True
+        metadata["fingerprint"] = fingerprint
+        return False
+
+    def uploadTarStream(self, keyNamePrefix, documentName, localPath, streaming=False,
+                        skipUnchanged=False, compression="deflate", transferSettings=None):
+        """archive the file or directory at localPath as a compressed tar
+        stream, the "tar" document format, and upload it to S3. The
+        compression setting and whether the stream holds a single file or a
+        directory are stored as metadata on the uploaded object
+
+        Args:
+            streaming: if True the stream is compressed directly into the
+            parts of a multipart upload, without writing it to localTempDir
+            skipUnchanged: see uploadCompressed
+            compression: a CompressionCodec setting for the whole stream,
+            other than "auto"
+            transferSettings: optional TransferSettings for the upload of the
+            stream when it is not streaming
+        """
+        keyName = self.__documentKey(keyNamePrefix, documentName, "tar")
+        kind = TarStream.DIRECTORY if os.path.isdir(localPath) else TarStream.FILE
+        metadata = {"compression": compression, "content": kind}
+        if skipUnchanged and self.__isUnchanged(documentName, localPath, metadata,
+                                                self.getMetadata(keyName)):
+            return
+        tar = TarStream(CompressionCodec.get(compression))
+        checksum = self.newChecksum()
+        if checksum is not None:
+            metadata["checksum"] = checksum.id
+        if streaming:
+            logging.info("streaming tar stream of '{0}' to S3 '{1}'".format(localPath, keyName))
+            stream = MultipartUploadStream(self.bucket, keyName, self.multipartPartSize,
+                                           self.multipartQueueDepth, metadata, self.scheduler)
+            try:
+                tar.write(self.__checksummed(stream, checksum), localPath)
+                stream.close()
+            except:
+                stream.abort()
+                raise
+        else:
+            archivePath = os.path.join(self.localTempDir,
+                                       documentName.replace('/', '_') + ".tar")
+            logging.info("archiving '{0}' to tar stream '{1}'".format(localPath, archivePath))
+            try:
+                with open(archivePath, "wb") as f:
+                    tar.write(self.__checksummed(f, checksum), localPath)
+                self.uploadFile(archivePath, keyName, metadata=metadata,
+                                transferSettings=transferSettings)
+            finally:
+                if os.path.exists(archivePath):
+                    os.remove(archivePath)
+        if checksum is not None:
+            self.putChecksum(keyName, checksum.finish())
 
-    def downloadCompressed(self, keyNamePrefix, documentName, localPath):
-        documentName = "{0}.{1}".format(documentName, self.__format)
-        archiveName =  os.path.join(self.localTempDir, documentName.replace('/', '_'))
+    def downloadTarStream(self, keyNamePrefix, documentName, localPath):
+        """download the tar stream of the specified document and unpack it
+        to localPath as it arrives, in a single pass over one GET request.
+        Each block of the stream is verified against the stream's checksums
+        before it is unpacked, and corrupt blocks are fetched again
+
+        Returns:
+            the size of the stream in bytes
+        """
+        keyName = self.__documentKey(keyNamePrefix, documentName, "tar")
+        logging.info("streaming download and unpack of S3 '{0}' to '{1}'".format(keyName, localPath))
+        with self.scheduler.request():
+            response = self.bucket.Object(keyName).get()
+        metadata = response.get("Metadata", {})
+        body = response["Body"]
+        # fetched before the slot streaming the body is taken, which the
+        # blocks fetched again to repair the stream then run within
+        checksum = self.getChecksum(keyName, metadata)
+        if checksum is not None:
+            body = checksum.reader(body, self.__rangeFetcher(keyName, inRequest=True))
+        with self.scheduler.request():
+            TarStream(CompressionCodec.get(metadata.get("compression", "deflate"))).extract(
+                body, localPath, metadata.get("content", TarStream.DIRECTORY),
+                self.scheduler.consume)
+        return response["ContentLength"]
+
+    def fingerprintDocument(self, documentName, localPath):
+        """returns the content fingerprint of the file or directory at
+        localPath, caching file hashes in an index under localTempDir"""
+        return self.getDocumentFingerprint(documentName).compute(localPath)
+
+    def getDocumentFingerprint(self, documentName):
+        """returns the DocumentFingerprint for the specified document, whose
+        file hash index is kept under localTempDir"""
+        indexPath = os.path.join(self.localTempDir, "fingerprints",
+                                 "{0}.json".format(documentName.replace('/', '_')))
+        return DocumentFingerprint(indexPath)
+
+    def uploadCompressedStream(self, keyNamePrefix, documentName, localPath, metadata=None,
+                               compression="deflate"):
+        """archive the file or directory at localPath straight into a
+        multipart upload. At most multipartQueueDepth + 1 parts of the
+        archive are held in memory, which start at multipartPartSize bytes
+        and grow for very large archives, see MultipartUploadStream. The
+        archive is equivalent to the one produced by archiveFileOrDirectory
+        """
+        if not os.path.isdir(localPath) and not os.path.isfile(localPath):
+            raise ValueError(
+                "specified pathToArchive '{0}' is neither a dir or a file path"
+                .format(localPath))
+        keyName = self.__documentKey(keyNamePrefix, documentName)
+        logging.info("streaming archive of '{0}' to S3 '{1}'".format(localPath, keyName))
+        checksum = self.newChecksum()
+        if checksum is not None:
+            metadata = dict(metadata or {}, checksum=checksum.id)
+        stream = MultipartUploadStream(self.bucket, keyName,
+                                       self.multipartPartSize,
+                                       self.multipartQueueDepth,
+                                       metadata, self.scheduler)
+        try:
+            with self.__newStreamWriter(self.__checksummed(stream, checksum), compression) as z:
+                if os.path.isdir(localPath):
+                    self.__writeTree(z, localPath)
+                else:
+                    z.write(localPath, os.path.basename(localPath))
+                    z.writestr(self.__singleFileFlag, "")
+            stream.close()
+        except:
+            stream.abort()
+            raise
+        if checksum is not None:
+            self.putChecksum(keyName, checksum.finish())
+
+    def __documentKey(self, keyNamePrefix, documentName, format=None):
+        """the S3 key of the archive for the specified document, in the
+        zip format by default"""
+        return "/".join([keyNamePrefix, "{0}.{1}".format(
+            documentName, self.__format if format is None else format)])
+
+    def downloadArchive(self, keyNamePrefix, documentName, transferSettings=None):
+        """downloads the archive for the specified document to the temp dir,
+        with a resumable download if it is at least resumableThreshold bytes,
+        verifying it against the checksums stored with it.
+        The shards of a document stored as shards are downloaded to a
+        directory in the temp dir
+
+        Returns:
+            the local path of the downloaded archive or shard directory, see
+            unpackFileOrDirectory, archiveSize and removeArchive
+        """
+        keyName = self.__documentKey(keyNamePrefix, documentName)
+        archiveName =  os.path.join(self.localTempDir, "{0}.{1}".format(
+            documentName, self.__format).replace('/', '_'))
         #for the above replace: if the documentname itself represents a nested S3 key, 
         #convert it to something that can be written to file systems for the local temp file
-        self.downloadFile("/".join([keyNamePrefix, documentName]), archiveName)
+        if not self.objectRequests:
+            self.downloadFile(keyName, archiveName, transferSettings=transferSettings)
+            return archiveName
+        # the size, checksum id and existence of the archive are all read
+        # with a single HEAD request
+        head = self.__head(keyName)
+        if head is not None:
+            self.downloadFile(keyName, archiveName, transferSettings=transferSettings,
+                              size=head.content_length,
+                              checksum=self.getChecksum(keyName, head.metadata),
+                              etag=head.e_tag)
+            return archiveName
+        sharded = ShardedDocument(self, self.shardConcurrency)
+        shardIndex = sharded.readIndex(keyNamePrefix, documentName)
+        if shardIndex is None:
+            # neither the archive nor shards were found, the download
+            # reports the missing archive
+            self.downloadFile(keyName, archiveName, transferSettings=transferSettings)
+            return archiveName
+        archiveName = archiveName + ".shards"
+        sharded.download(shardIndex, archiveName, transferSettings)
+        return archiveName
+
+    def __shardIndex(self, keyNamePrefix, documentName):
+        """returns the shard index of a document stored as shards, or None
+        if the document's single archive exists"""
+        if self.__head(self.__documentKey(keyNamePrefix, documentName)) is not None:
+            return None
+        return ShardedDocument(self, self.shardConcurrency).readIndex(keyNamePrefix, documentName)
+
+    def downloadCompressed(self, keyNamePrefix, documentName, localPath, pipelined=False,
+                           transferSettings=None):
+        """download the archive for the specified document and unpack it to
+        localPath. Each member is decoded with the compression method
+        recorded in the archive, so documents uploaded with any
+        "Compression" setting are unpacked the same way
+
+        Args:
+            pipelined: if True the archive is fetched with parallel ranged
+            GETs and unpacked as its bytes arrive, see downloadCompressedPipelined
+            transferSettings: optional TransferSettings for the download of
+            the archive when it is not pipelined
+
+        Returns:
+            the size of the archive in bytes
+        """
+        if pipelined:
+            return self.downloadCompressedPipelined(keyNamePrefix, documentName, localPath)
+        archiveName = self.downloadArchive(keyNamePrefix, documentName, transferSettings)
+        size = self.archiveSize(archiveName)
         self.unpackFileOrDirectory(archiveName, localPath)
-        os.remove(archiveName)
+        self.removeArchive(archiveName)
+        return size
+
+    def listDocumentMembers(self, keyNamePrefix, documentName):
+        """returns the names of the members in the archive of the specified
+        document, reading only the archive's central directory"""
+        shardIndex = self.__shardIndex(keyNamePrefix, documentName)
+        if shardIndex is not None:
+            return ShardedDocument(self, self.shardConcurrency).namelist(shardIndex)
+        archive = RemoteZipArchive(self.bucket, self.__documentKey(keyNamePrefix, documentName),
+                                   self.rangeChunkSize, self.rangeConcurrency,
+                                   self.scheduler)
+        return [x for x in archive.namelist() if x != self.__singleFileFlag]
+
+    def downloadMembers(self, keyNamePrefix, documentName, localPath, include):
+        """download and extract only the members of the specified document's
+        archive whose names match one of the include patterns, fetching just
+        their byte ranges. Patterns are fnmatch patterns matched against the
+        "/" separated member names, where "*" also matches "/". Single file
+        archives are extracted whole
+
+        Returns:
+            the number of bytes downloaded
+        """
+        keyName = self.__documentKey(keyNamePrefix, documentName)
+        select = lambda archive: [m for m in archive.members
+                                  if any(fnmatch.fnmatchcase(m.name, p) for p in include)]
+        shardIndex = self.__shardIndex(keyNamePrefix, documentName)
+        if shardIndex is not None:
+            extracted, total, fetched = ShardedDocument(self, self.shardConcurrency) \
+                .extractRemote(shardIndex, localPath, select)
+            logging.info("extracted {0} of {1} members of the shards of '{2}' to '{3}', fetching {4} bytes"
+                         .format(extracted, total, documentName, localPath, fetched))
+            return fetched
+        archive = RemoteZipArchive(self.bucket, keyName, self.rangeChunkSize,
+                                   self.rangeConcurrency, self.scheduler)
+        if self.__singleFileFlag in archive.namelist():
+            self.__extractArchive(archive, localPath)
+            return archive.bytesFetched
+        members = select(archive)
+        archive.extract(members, lambda m: archive.memberPath(localPath, m.name))
+        logging.info("extracted {0} of {1} members of S3 '{2}' to '{3}', fetching {4} of {5} bytes"
+                     .format(len(members), len(archive.members), keyName, localPath,
+                             archive.bytesFetched, archive.size))
+        return archive.bytesFetched
+
+    def downloadCompressedPipelined(self, keyNamePrefix, documentName, localPath):
+        """unpack the archive for the specified document to localPath while
+        it is downloaded, without writing the archive to localTempDir.
+        rangeConcurrency chunks of rangeChunkSize bytes are fetched ahead of
+        the member being extracted, and single file archives are written
+        directly to localPath. The shards of a document stored as shards are
+        extracted concurrently
+
+        Returns:
+            the size of the archive in bytes
+        """
+        shardIndex = self.__shardIndex(keyNamePrefix, documentName)
+        if shardIndex is not None:
+            logging.info("pipelined download and unpack of {0} shards of '{1}' to '{2}'"
+                         .format(len(shardIndex["Shards"]), documentName, localPath))
+            ShardedDocument(self, self.shardConcurrency).extractRemote(shardIndex, localPath)
+            return sum(shard["Size"] for shard in shardIndex["Shards"])
+        keyName = self.__documentKey(keyNamePrefix, documentName)
+        logging.info("pipelined download and unpack of S3 '{0}' to '{1}'".format(keyName, localPath))
+        archive = RemoteZipArchive(self.bucket, keyName, self.rangeChunkSize,
+                                   self.rangeConcurrency, self.scheduler,
+                                   self.getChecksum(keyName))
+        self.__extractArchive(archive, localPath)
+        return archive.size
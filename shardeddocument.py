@@ -0,0 +1,305 @@
+import os, json, glob, uuid, zipfile, logging
+from workerpool import WorkerPool
+from zipstreamwriter import ZipStreamWriter
+from multipartupload import MultipartUploadStream
+from compressioncodec import CompressionCodec
+from remotezip import RemoteZipArchive
+from parallelzipextractor import ParallelZipExtractor
+from archivechecksum import ArchiveChecksum
+
+class ShardedDocument(object):
+    """stores a large directory document in S3 as several independently
+    compressed zip archives (shards) plus an index object, so that the
+    shards are compressed, transferred and extracted in parallel.
+
+    Files are assigned to shards balanced by size, and every directory is
+    stored in the first shard. Shards are stored as
+    <keyNamePrefix>/<documentName>.shards/<id>/<n>.zip, and the index object
+    <keyNamePrefix>/<documentName>.shards.json lists their keys and sizes.
+    The index carries the metadata of the document, the ArchiveChecksum of
+    each shard, and the new id of each upload, so that its ETag identifies
+    the uploaded version. Since every upload writes its shards under its own
+    id, the shards of the version the index refers to are never overwritten.
+    """
+
+    def __init__(self, s3interface, concurrency=4):
+        """
+        Args:
+            s3interface: the S3Interface used for transfers
+            concurrency: the number of shards processed at once
+        """
+        self.s3interface = s3interface
+        self.concurrency = concurrency
+
+    def indexKey(self, keyNamePrefix, documentName):
+        return "/".join([keyNamePrefix, "{0}.shards.json".format(documentName)])
+
+    def shardKey(self, keyNamePrefix, documentName, uploadId, shard):
+        return "/".join([keyNamePrefix, "{0}.shards".format(documentName), uploadId,
+                         "{0:05d}.zip".format(shard)])
+
+    @staticmethod
+    def shardCount(localPath, shardSize, maxShards):
+        """returns the number of shards for the document at localPath, which
+        is 1 for files and for directories of at most shardSize bytes"""
+        if shardSize is None or not os.path.isdir(localPath):
+            return 1
+        total = sum(size for filename, arcname, size
+                    in ShardedDocument.treeEntries(localPath) if size is not None)
+        return int(max(1, min(maxShards, -(-total // shardSize))))
+
+    @staticmethod
+    def treeEntries(localPath):
+        """returns (filename, arcname, size) for each directory and regular
+        file under localPath in the order S3Interface archives them, where
+        size is None for directories"""
+        entries = []
+        relroot = os.path.abspath(localPath)
+        for root, dirs, files in os.walk(localPath):
+            entries.append((root, os.path.relpath(root, relroot), None))
+            for file in files:
+                filename = os.path.join(root, file)
+                if os.path.isfile(filename): # regular files only
+                    entries.append((filename, os.path.join(os.path.relpath(root, relroot), file),
+                                    os.path.getsize(filename)))
+        return entries
+
+    @staticmethod
+    def partition(entries, count):
+        """split treeEntries into count shards, assigning the largest files
+        first to the shard with the least data. Directories are assigned to
+        the first shard, and each shard keeps the order of entries"""
+        shards = [[] for i in range(count)]
+        sizes = [0] * count
+        order = dict((entry[1], i) for i, entry in enumerate(entries))
+        for entry in entries:
+            if entry[2] is None:
+                shards[0].append(entry)
+        for entry in sorted([e for e in entries if e[2] is not None],
+                            key=lambda e: e[2], reverse=True):
+            smallest = sizes.index(min(sizes))
+            shards[smallest].append(entry)
+            sizes[smallest] += entry[2]
+        return [sorted(s, key=lambda e: order[e[1]]) for s in shards]
+
+    def readIndex(self, keyNamePrefix, documentName):
+        """returns the document's shard index, or None if the document is
+        not stored as shards"""
+        keyName = self.indexKey(keyNamePrefix, documentName)
+        if self.s3interface.getMetadata(keyName) is None:
+            return None
+        indexPath = self.__tempPath("{0}.shards.json".format(documentName))
+        self.s3interface.downloadFile(keyName, indexPath)
+        try:
+            with open(indexPath) as f:
+                return json.load(f)
+        finally:
+            os.remove(indexPath)
+
+    def upload(self, keyNamePrefix, documentName, localPath, shardCount, metadata=None,
+               compression="deflate", streaming=False, transferSettings=None):
+        """archive the directory at localPath as shardCount shards, upload
+        them under a new id, then replace the index and remove the shards of
+        the previous upload. If an upload fails, the index and the shards it
+        refers to are left unchanged
+
+        Args:
+            metadata: optional user metadata dictionary for the index
+            compression: a CompressionCodec setting for the archive members
+            streaming: if True each shard is compressed directly into a
+            multipart upload
+            transferSettings: optional TransferSettings for the shard uploads
+        """
+        previous = self.readIndex(keyNamePrefix, documentName)
+        shards = self.partition(self.treeEntries(localPath), shardCount)
+        # fewer files than shards leaves shards empty
+        shards = shards[:1] + [x for x in shards[1:] if len(x) > 0]
+        logging.info("uploading '{0}' as {1} shards of {2} bytes".format(
+            localPath, len(shards),
+            ",".join(str(sum(e[2] or 0 for e in s)) for s in shards)))
+        uploadId = uuid.uuid4().hex
+        shardKey = lambda shard: self.shardKey(keyNamePrefix, documentName, uploadId, shard)
+        scheduler = self.s3interface.scheduler
+        context = scheduler.current()
+        def upload(item):
+            shard, entries = item
+            # worker threads transfer with the priority of the calling thread
+            with scheduler.context(*context):
+                return self.__uploadShard(shardKey(shard), entries, compression, streaming,
+                                          transferSettings)
+        results = WorkerPool(self.concurrency).run(upload, list(enumerate(shards)))
+        uploaded = [shardKey(shard) for (shard, entries), result, ex in results if ex is None]
+        if len(uploaded) < len(results):
+            # the shards uploaded so far are not referenced by any index
+            self.__deleteKeys(uploaded)
+        self.__raiseFailures("upload", documentName, results)
+
+        index = { "Id": uploadId, "Compression": compression, "Shards": [] }
+        for (shard, entries), (size, checksum), ex in results:
+            entry = { "Key": shardKey(shard),
+                      "Size": size,
+                      "Files": len([e for e in entries if e[2] is not None]),
+                      "Bytes": sum(e[2] or 0 for e in entries) }
+            if checksum is not None:
+                entry["Checksum"] = checksum.toJson()
+            index["Shards"].append(entry)
+        indexPath = self.__tempPath("{0}.shards.json".format(documentName))
+        with open(indexPath, "w") as f:
+            json.dump(index, f)
+        try:
+            self.s3interface.uploadFile(indexPath, self.indexKey(keyNamePrefix, documentName),
+                                        metadata=metadata)
+        except:
+            self.__deleteKeys(uploaded)
+            raise
+        finally:
+            os.remove(indexPath)
+        if previous is not None:
+            self.__deleteKeys([shard["Key"] for shard in previous["Shards"]])
+
+    def __deleteKeys(self, keyNames):
+        for keyName in keyNames:
+            try:
+                self.s3interface.deleteFile(keyName)
+            except Exception as ex:
+                logging.warning("failed to remove shard '{0}': {1}".format(keyName, ex))
+
+    def delete(self, keyNamePrefix, documentName):
+        """remove the document's index and shards if it is stored as shards"""
+        index = self.readIndex(keyNamePrefix, documentName)
+        if index is None:
+            return
+        self.s3interface.deleteFile(self.indexKey(keyNamePrefix, documentName))
+        for shard in index["Shards"]:
+            self.s3interface.deleteFile(shard["Key"])
+
+    def __uploadShard(self, keyName, entries, compression, streaming, transferSettings):
+        """archive the entries to keyName, returning the archive size and
+        its ArchiveChecksum, or None"""
+        codec = CompressionCodec.get(compression)
+        s3 = self.s3interface
+        checksum = s3.newChecksum()
+        writer = lambda fileobj: fileobj if checksum is None else checksum.writer(fileobj)
+        if streaming:
+            stream = MultipartUploadStream(s3.bucket, keyName, s3.multipartPartSize,
+                                           s3.multipartQueueDepth, None, s3.scheduler)
+            try:
+                with ZipStreamWriter(writer(stream), codec) as z:
+                    self.__write(z, entries)
+                stream.close()
+            except:
+                stream.abort()
+                raise
+            size = stream.bytesWritten
+        else:
+            archivePath = self.__tempPath("_".join(keyName.split("/")[-3:]))
+            try:
+                with open(archivePath, "wb") as f:
+                    with ZipStreamWriter(writer(f), codec) as z:
+                        self.__write(z, entries)
+                size = os.path.getsize(archivePath)
+                s3.uploadFile(archivePath, keyName, transferSettings=transferSettings)
+            finally:
+                if os.path.exists(archivePath):
+                    os.remove(archivePath)
+        if checksum is not None:
+            checksum.finish()
+        return size, checksum
+
+    @staticmethod
+    def __write(z, entries):
+        for filename, arcname, size in entries:
+            z.write(filename, arcname)
+
+    def download(self, index, shardDir, transferSettings=None):
+        """download the shard archives listed in index to shardDir, verifying
+        them against their checksums, see unpack"""
+        if not os.path.isdir(shardDir):
+            os.makedirs(shardDir)
+        scheduler = self.s3interface.scheduler
+        context = scheduler.current()
+        def download(item):
+            n, shard = item
+            with scheduler.context(*context):
+                self.s3interface.downloadFile(
+                    shard["Key"], os.path.join(shardDir, "{0:05d}.zip".format(n)),
+                    transferSettings=transferSettings, size=shard["Size"],
+                    checksum=self.__checksum(shard))
+        self.__raiseFailures("download", shardDir,
+                             WorkerPool(self.concurrency).run(download,
+                                                              list(enumerate(index["Shards"]))))
+
+    @staticmethod
+    def __checksum(shard):
+        """the ArchiveChecksum of a shard listed in an index, or None"""
+        checksum = shard.get("Checksum")
+        return None if checksum is None else ArchiveChecksum.FromJson(checksum)
+
+    def unpack(self, shardDir, destinationPath):
+        """extract the shard archives in shardDir to destinationPath, on
+        concurrency threads"""
+        paths = sorted(glob.glob(os.path.join(shardDir, "*.zip")))
+        infos = []
+        for path in paths:
+            with zipfile.ZipFile(path, "r", allowZip64=True) as z:
+                infos.extend(z.infolist())
+        # shards extracted at once must not race to create directories
+        ParallelZipExtractor.createDirectories(infos, destinationPath)
+        self.__raiseFailures("unpack", shardDir, WorkerPool(self.concurrency).run(
+            lambda path: self.s3interface.unpackFileOrDirectory(path, destinationPath), paths))
+
+    def extractRemote(self, index, localPath, select=None):
+        """extract the shards listed in index to localPath while they are
+        downloaded with ranged GETs, see S3Interface.downloadCompressedPipelined
+
+        Args:
+            select: optional function returning the members to extract from
+            a RemoteZipArchive, all members by default
+
+        Returns:
+            (extracted, total, fetched) the number of members extracted, the
+            number of members and the number of bytes fetched
+        """
+        s3 = self.s3interface
+        archives = [RemoteZipArchive(s3.bucket, shard["Key"], s3.rangeChunkSize,
+                                     s3.rangeConcurrency, s3.scheduler,
+                                     self.__checksum(shard))
+                    for shard in index["Shards"]]
+        selected = [a.members if select is None else select(a) for a in archives]
+        directories = set([localPath])
+        for archive, members in zip(archives, selected):
+            for m in members:
+                path = archive.memberPath(localPath, m.name)
+                directories.add(path if m.isDir() else os.path.dirname(path))
+        for directory in sorted(directories):
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+        scheduler = s3.scheduler
+        context = scheduler.current()
+        def extract(item):
+            archive, members = item
+            with scheduler.context(*context):
+                archive.extract(members, lambda m: archive.memberPath(localPath, m.name))
+        self.__raiseFailures("extract", localPath, WorkerPool(self.concurrency).run(
+            extract, list(zip(archives, selected))))
+        return (sum(len(m) for m in selected), sum(len(a.members) for a in archives),
+                sum(a.bytesFetched for a in archives))
+
+    def namelist(self, index):
+        """returns the member names of all shards listed in index"""
+        s3 = self.s3interface
+        names = []
+        for shard in index["Shards"]:
+            names.extend(RemoteZipArchive(s3.bucket, shard["Key"], s3.rangeChunkSize,
+                                          s3.rangeConcurrency, s3.scheduler).namelist())
+        return names
+
+    def __tempPath(self, name):
+        return os.path.join(self.s3interface.localTempDir, name.replace('/', '_'))
+
+    @staticmethod
+    def __raiseFailures(action, name, results):
+        failures = WorkerPool.failures(results)
+        if len(failures) > 0:
+            raise ValueError("{0} of {1} shards of '{2}' failed to {3}"
+                             .format(len(failures), len(results), name, action))
@@ -0,0 +1,148 @@
+import os, shutil, tarfile
+from compressioncodec import CompressionCodec
+
+class _CompressingWriter(object):
+    """a write-only file-like object compressing the data written to it
+    into another"""
+
+    def __init__(self, fileobj, compressor):
+        self.fileobj = fileobj
+        self.compressor = compressor
+
+    def write(self, data):
+        compressed = self.compressor.compress(data)
+        if len(compressed) > 0:
+            self.fileobj.write(compressed)
+
+    def close(self):
+        self.fileobj.write(self.compressor.flush())
+
+class _DecompressingReader(object):
+    """a read-only file-like object decompressing the data read from
+    another"""
+
+    def __init__(self, fileobj, decompressor, chunkSize, onRead=None):
+        self.fileobj = fileobj
+        self.decompressor = decompressor
+        self.chunkSize = chunkSize
+        self.onRead = onRead
+        # data before __position has been read, and is dropped once it is
+        # at least half the buffer so reads cost no more than the data read
+        self.__buffer = bytearray()
+        self.__position = 0
+        self.__eof = False
+
+    def read(self, size=-1):
+        while not self.__eof and (size < 0 or len(self.__buffer) - self.__position < size):
+            data = self.fileobj.read(self.chunkSize)
+            if self.onRead is not None:
+                self.onRead(len(data))
+            if len(data) == 0:
+                self.__eof = True
+                self.__buffer.extend(self.decompressor.flush())
+            else:
+                self.__buffer.extend(self.decompressor.decompress(data))
+        end = len(self.__buffer) if size < 0 else min(len(self.__buffer), self.__position + size)
+        data = bytes(self.__buffer[self.__position:end])
+        self.__position = end
+        if 2 * self.__position >= len(self.__buffer):
+            del self.__buffer[:self.__position]
+            self.__position = 0
+        return data
+
+class TarStream(object):
+    """writes and reads documents as a tar stream compressed as a whole,
+    in a single forward pass, so that neither side needs a seekable file.
+
+    Unlike zip archives the stream has no central directory, and whether
+    it holds a single file or a directory tree is recorded by the caller,
+    eg. in the S3 object's metadata. Directories are written in the same
+    order and with the same member names as S3Interface's zip archives.
+    """
+
+    FILE = "file"
+    DIRECTORY = "directory"
+
+    def __init__(self, codec=None, chunkSize=1024 * 1024):
+        """
+        Args:
+            codec: the CompressionCodec of the whole stream, deflate by
+            default. zstd or deflate:1 are the fastest choices
+            chunkSize: the number of compressed bytes read at a time
+        """
+        self.codec = CompressionCodec.get("deflate") if codec is None else codec
+        if self.codec.setting == "auto":
+            raise ValueError("'auto' compression applies to zip members, not tar streams")
+        self.chunkSize = chunkSize
+
+    def write(self, fileobj, localPath):
+        """write the file or directory at localPath to fileobj, of which only
+        the write method is used
+
+        Returns:
+            FILE or DIRECTORY
+        """
+        writer = _CompressingWriter(fileobj, self.codec.compressor())
+        # regular files and links to them are stored as files, as in zip archives
+        tar = tarfile.open(fileobj=writer, mode="w|", bufsize=self.chunkSize,
+                           dereference=True)
+        if os.path.isdir(localPath):
+            kind = self.DIRECTORY
+            relroot = os.path.abspath(localPath)
+            for root, dirs, files in os.walk(localPath):
+                tar.add(root, os.path.relpath(root, relroot), recursive=False)
+                for file in files:
+                    filename = os.path.join(root, file)
+                    if os.path.isfile(filename): # regular files only
+                        tar.add(filename, os.path.join(os.path.relpath(root, relroot), file))
+        elif os.path.isfile(localPath):
+            kind = self.FILE
+            tar.add(localPath, os.path.basename(localPath))
+        else:
+            raise ValueError(
+                "specified pathToArchive '{0}' is neither a dir or a file path"
+                .format(localPath))
+        tar.close()
+        writer.close()
+        return kind
+
+    def extract(self, fileobj, destinationPath, kind, onRead=None):
+        """extract a stream read from fileobj to destinationPath, which is
+        the full path of the file for FILE streams
+
+        Args:
+            kind: FILE or DIRECTORY, as returned by write
+            onRead: optional function called with the number of bytes of
+            each read from fileobj
+        """
+        reader = _DecompressingReader(fileobj, self.codec.decompressor(), self.chunkSize, onRead)
+        tar = tarfile.open(fileobj=reader, mode="r|", bufsize=self.chunkSize)
+        try:
+            files = 0
+            for member in tar:
+                self.__checkMemberName(member.name)
+                if kind == self.FILE:
+                    files += 1
+                    if not member.isfile() or files > 1:
+                        raise ValueError("single file tar stream expected to have a single file")
+                    directory = os.path.dirname(destinationPath)
+                    if directory and not os.path.isdir(directory):
+                        os.makedirs(directory)
+                    with open(destinationPath, "wb") as f:
+                        shutil.copyfileobj(tar.extractfile(member), f, self.chunkSize)
+                    os.utime(destinationPath, (member.mtime, member.mtime))
+                elif member.isfile() or member.isdir():
+                    tar.extract(member, destinationPath)
+                else:
+                    raise ValueError("unsupported tar member '{0}'".format(member.name))
+            # consume the end of archive padding so the whole stream is read
+            while len(reader.read(self.chunkSize)) > 0:
+                pass
+        finally:
+            tar.close()
+
+    @staticmethod
+    def __checkMemberName(name):
+        parts = name.replace("\\", "/").split("/")
+        if name.startswith("/") or ".." in parts or (len(parts[0]) > 1 and parts[0][1] == ":"):
+            raise ValueError("tar member '{0}' is outside the destination".format(name))
@@ -0,0 +1,205 @@
+import unittest, os, json, threading, shutil, time
+from mock import Mock, call
+from application import Application
+from s3interface import S3Interface
+from transferscheduler import TransferScheduler
+from manifestdigest import ManifestDigest
+from manifest import Manifest
+from local_s3 import LocalS3
+
+class Application_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(os.getcwd(), "tests", "test_application_manifest.json")
+        with open(self.path, 'w') as f:
+            f.write(json.dumps({
+                "ProjectName": "project",
+                "BucketName": "bucket",
+                "Documents": [
+                    { "Name": "doc{0}".format(i),
+                      "Direction": "LocalToAWS" if i % 2 == 0 else "AWSToLocal",
+                      "LocalPath": "local{0}".format(i),
+                      "AWSInstancePath": "aws{0}".format(i) }
+                    for i in range(8)],
+                "InstanceJobs": []
+            }))
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def createApplication(self):
+        app = Application(Mock(), self.path, "temp")
+        app.s3interface = Mock(spec=S3Interface)
+        app.s3interface.bucketName = "bucket"
+        app.s3interface.stagesArchive.side_effect = lambda doc: \
+            not doc.get("PipelinedDownload", False)
+        app.s3interface.documentTransferSettings.side_effect = lambda doc: \
+            doc.get("TransferSettings")
+        app.s3interface.documentContext.side_effect = lambda doc: \
+            TransferScheduler().context(TransferScheduler.OUTPUT, doc["Name"])
+        return app
+
+    def test_uploadS3Documents_uploads_manifest_first(self):
+        app = self.createApplication()
+        calls = []
+        app.s3interface.uploadFile.side_effect = lambda *args: calls.append("manifest")
+        app.s3interface.uploadDocument.side_effect = lambda *args, **kwargs: calls.append(args[1]["Name"])
+        app.uploadS3Documents(concurrency=3)
+        self.assertEqual(calls[0], "manifest")
+        self.assertEqual(sorted(calls[1:]), ["doc0", "doc2", "doc4", "doc6"])
+        app.s3interface.uploadFile.assert_called_once_with(
+            self.path, "project/manifest.json")
+        app.s3interface.uploadDocument.assert_any_call(
+            "project", app.manifest.GetS3Documents(filter={"Name": "doc4"})[0],
+            os.path.abspath("local4"), skipUnchanged=False)
+
+    def test_uploadS3Documents_reports_each_failed_document(self):
+        app = self.createApplication()
+        uploaded = []
+        def upload(prefix, doc, path, skipUnchanged):
+            if doc["Name"] in ["doc2", "doc6"]:
+                raise IOError("upload failed")
+            uploaded.append(doc["Name"])
+        app.s3interface.uploadDocument.side_effect = upload
+        with self.assertRaises(ValueError) as context:
+            app.uploadS3Documents(concurrency=2)
+        self.assertTrue("2 of 4" in str(context.exception))
+        self.assertTrue("doc2,doc6" in str(context.exception))
+        self.assertEqual(sorted(uploaded), ["doc0", "doc4"])
+
+    def test_downloadS3Documents_fetches_and_unpacks_each_document(self):
+        app = self.createApplication()
+        tempDir = os.path.join(os.getcwd(), "tests")
+        def downloadArchive(prefix, name, transferSettings):
+            archive = os.path.join(tempDir, "{0}.zip".format(name))
+            with open(archive, 'w') as f:
+                f.write("x" * 10)
+            return archive
+        unpacked = []
+        app.s3interface.downloadArchive.side_effect = downloadArchive
+        app.s3interface.unpackFileOrDirectory.side_effect = \
+            lambda archive, path: unpacked.append((os.path.basename(archive), path))
+        app.manifest.GetS3Documents(filter={"Name": "doc3"})[0]["TransferSettings"] = "settings"
+        summaries = app.downloadS3Documents(downloadConcurrency=3, unpackConcurrency=2)
+        app.s3interface.downloadArchive.assert_any_call("project", "doc3", "settings")
+        app.s3interface.downloadArchive.assert_any_call("project", "doc5", None)
+
+        self.assertEqual(sorted(unpacked), [
+            ("doc{0}.zip".format(i), os.path.abspath("local{0}".format(i)))
+            for i in [1, 3, 5, 7]])
+        self.assertEqual(sorted(x["Name"] for x in summaries), ["doc1", "doc3", "doc5", "doc7"])
+        for summary in summaries:
+            self.assertEqual(summary["Bytes"], 10)
+            self.assertTrue(summary["FetchSeconds"] >= 0)
+            self.assertTrue(summary["UnpackSeconds"] >= 0)
+            self.assertFalse(os.path.exists(os.path.join(tempDir, summary["Name"] + ".zip")))
+
+    def test_downloadS3Documents_removes_archives_as_they_are_unpacked(self):
+        app = self.createApplication()
+        tempDir = os.path.join(os.getcwd(), "tests", "staged")
+        os.makedirs(tempDir)
+        staged = []
+        def downloadArchive(prefix, name, transferSettings):
+            archive = os.path.join(tempDir, "{0}.zip".format(name))
+            with open(archive, 'w') as f:
+                f.write("x")
+            staged.append(len(os.listdir(tempDir)))
+            return archive
+        app.s3interface.downloadArchive.side_effect = downloadArchive
+        app.s3interface.unpackFileOrDirectory.side_effect = lambda archive, path: time.sleep(0.05)
+        try:
+            app.downloadS3Documents(downloadConcurrency=1, unpackConcurrency=1)
+            self.assertEqual(len(staged), 4)
+            # fetches wait for unpacks rather than staging every archive
+            self.assertTrue(max(staged) <= 2)
+            self.assertEqual(os.listdir(tempDir), [])
+        finally:
+            shutil.rmtree(tempDir)
+
+    def test_downloadS3Documents_unstaged_document_skips_unpack_stage(self):
+        app = self.createApplication()
+        for doc in app.manifest.GetS3Documents(filter={"Direction": "AWSToLocal"}):
+            doc["PipelinedDownload"] = True
+        app.s3interface.downloadDocument.return_value = 123
+        summaries = app.downloadS3Documents(downloadConcurrency=2, unpackConcurrency=2)
+        app.s3interface.downloadDocument.assert_any_call(
+            "project", app.manifest.GetS3Documents(filter={"Name": "doc3"})[0],
+            os.path.abspath("local3"))
+        self.assertEqual(app.s3interface.downloadDocument.call_count, 4)
+        self.assertFalse(app.s3interface.downloadArchive.called)
+        self.assertFalse(app.s3interface.unpackFileOrDirectory.called)
+        self.assertTrue(all(x["Bytes"] == 123 for x in summaries))
+
+    def test_downloadS3Documents_reports_each_failed_document(self):
+        app = self.createApplication()
+        tempDir = os.path.join(os.getcwd(), "tests")
+        def downloadArchive(prefix, name, transferSettings):
+            if name == "doc3":
+                raise IOError("fetch failed")
+            archive = os.path.join(tempDir, "{0}.zip".format(name))
+            with open(archive, 'w') as f:
+                f.write("x")
+            return archive
+        def unpack(archive, path):
+            if "doc5" in archive:
+                raise IOError("unpack failed")
+        app.s3interface.downloadArchive.side_effect = downloadArchive
+        app.s3interface.unpackFileOrDirectory.side_effect = unpack
+        with self.assertRaises(ValueError) as context:
+            app.downloadS3Documents(downloadConcurrency=2, unpackConcurrency=2)
+        self.assertTrue("2 of 4" in str(context.exception))
+        self.assertTrue("doc3" in str(context.exception))
+        self.assertTrue("doc5" in str(context.exception))
+        for i in [1, 5, 7]:
+            self.assertFalse(os.path.exists(os.path.join(tempDir, "doc{0}.zip".format(i))))
+
+    def test_uploadManifestSignature_signs_the_loaded_manifest(self):
+        app = self.createApplication()
+        app.s3interface.localTempDir = os.path.join(os.getcwd(), "tests")
+        uploaded = {}
+        def upload(localPath, keyName):
+            with open(localPath) as f:
+                uploaded[keyName] = f.read()
+        app.s3interface.uploadFile.side_effect = upload
+        key = app.uploadManifestSignature()
+        with open(self.path, "rb") as f:
+            contents = f.read()
+        self.assertEqual(list(uploaded.keys()), ["project/manifest.json.digest"])
+        self.assertTrue(ManifestDigest(key).verify(
+            contents, uploaded["project/manifest.json.digest"]))
+        self.assertFalse(os.path.exists(os.path.join("tests", "manifest.json.digest")))
+
+    def test_uploadManifestSlices_publishes_a_signed_slice_per_job(self):
+        tempDir = os.path.join(os.getcwd(), "tests", "temp")
+        os.makedirs(tempDir)
+        try:
+            with open(self.path, 'w') as f:
+                f.write(json.dumps({
+                    "ProjectName": "project",
+                    "BucketName": "bucket",
+                    "Documents": [
+                        { "Name": "doc{0}".format(i), "Direction": "LocalToAWS",
+                          "LocalPath": "local", "AWSInstancePath": "aws" } for i in range(3)],
+                    "InstanceJobs": [
+                        { "Id": i, "RequiredS3Data": ["doc{0}".format(i)], "Commands": [] }
+                        for i in range(3)]}))
+            app = Application(LocalS3(tempDir), self.path, tempDir)
+            key = ManifestDigest.NewKey()
+            app.uploadManifestSlices(key)
+
+            bucket = app.s3interface.bucket
+            self.assertEqual(sorted(x.key for x in bucket.objects.all()),
+                             sorted("project/instances/{0}/manifest.json{1}".format(i, suffix)
+                                    for i in range(3) for suffix in ["", ".digest"]))
+            contents = bucket.Object("project/instances/1/manifest.json").get()["Body"].read()
+            signature = bucket.Object("project/instances/1/manifest.json.digest").get()["Body"].read()
+            self.assertTrue(ManifestDigest(key).verify(contents, signature.decode("ascii")))
+            jobSlice = json.loads(contents.decode("utf-8"))
+            self.assertEqual([d["Name"] for d in jobSlice["Documents"]], ["doc1"])
+            self.assertEqual([j["Id"] for j in jobSlice["InstanceJobs"]], [1])
+        finally:
+            shutil.rmtree(tempDir)
+
+if __name__ == '__main__':
+    unittest.main()
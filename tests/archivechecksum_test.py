@@ -0,0 +1,79 @@
+import unittest, os, shutil, io, zlib
+from archivechecksum import ArchiveChecksum
+
+class ArchiveChecksum_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.data = os.urandom(2500)
+        self.checksum = ArchiveChecksum(1000)
+        for i in range(0, len(self.data), 300):
+            self.checksum.update(self.data[i:i + 300])
+        self.checksum.finish()
+        self.fetched = []
+
+    def fetchRange(self, start, end):
+        self.fetched.append((start, end))
+        return self.data[start:end]
+
+    def corrupt(self, data, offset):
+        """returns data with the byte at offset changed"""
+        changed = b"\x00" if data[offset:offset + 1] != b"\x00" else b"\x01"
+        return data[:offset] + changed + data[offset + 1:]
+
+    def test_blocks_are_checksummed_across_writes(self):
+        self.assertEqual(self.checksum.size, 2500)
+        self.assertEqual(self.checksum.blocks,
+                         [zlib.crc32(self.data[i:i + 1000]) & 0xffffffff
+                          for i in range(0, 2500, 1000)])
+        restored = ArchiveChecksum.FromJson(self.checksum.toJson())
+        self.assertEqual((restored.id, restored.size, restored.blocks, restored.blockSize),
+                         (self.checksum.id, 2500, self.checksum.blocks, 1000))
+
+    def test_writer_checksums_written_data(self):
+        checksum = ArchiveChecksum(1000)
+        out = io.BytesIO()
+        checksum.writer(out).write(self.data)
+        self.assertEqual(out.getvalue(), self.data)
+        self.assertEqual(checksum.finish().blocks, self.checksum.blocks)
+
+    def test_repair_fetches_only_corrupt_and_missing_blocks(self):
+        self.assertEqual(self.checksum.repair(self.data, 0, 2500, self.fetchRange), self.data)
+        self.assertEqual(self.fetched, [])
+        damaged = self.corrupt(self.data, 1500)[:2200]
+        self.assertEqual(self.checksum.repair(damaged, 0, 2500, self.fetchRange), self.data)
+        self.assertEqual(self.fetched, [(1000, 2000), (2000, 2500)])
+        self.assertRaises(ValueError, lambda: self.checksum.repair(
+            self.data, 500, 1500, self.fetchRange))
+
+    def test_repair_fails_after_retries(self):
+        bad = self.corrupt(self.data, 10)
+        self.assertRaises(ValueError, lambda: self.checksum.repair(
+            bad, 0, 1000, lambda start, end: bad[start:end], retries=2))
+
+    def test_reader_returns_verified_data(self):
+        reader = self.checksum.reader(io.BytesIO(self.corrupt(self.data, 2400)), self.fetchRange)
+        data = b""
+        while True:
+            chunk = reader.read(700)
+            if len(chunk) == 0:
+                break
+            data += chunk
+        self.assertEqual(data, self.data)
+        self.assertEqual(self.fetched, [(2000, 2500)])
+
+    def test_repairFile(self):
+        tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        os.makedirs(tempPath)
+        try:
+            path = os.path.join(tempPath, "archive")
+            with open(path, "wb") as f:
+                f.write(self.corrupt(self.data, 5) + b"trailing")
+            self.checksum.repairFile(path, self.fetchRange)
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), self.data)
+            self.assertEqual(self.fetched, [(0, 1000)])
+        finally:
+            shutil.rmtree(tempPath)
+
+if __name__ == '__main__':
+    unittest.main()
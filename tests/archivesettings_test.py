@@ -0,0 +1,47 @@
+import unittest, argparse
+from mock import Mock
+from archivesettings import ArchiveSettings
+
+class ArchiveSettings_Test(unittest.TestCase):
+
+    def test_apply(self):
+        s3interface = Mock(objectRequests=True, checksumBlockSize=8)
+        ArchiveSettings().apply(s3interface)
+        self.assertEqual(s3interface.checksumBlockSize, 8)
+        ArchiveSettings({"ChecksumBlockSize": 1000}).apply(s3interface)
+        self.assertEqual(s3interface.checksumBlockSize, 1000)
+        ArchiveSettings({"ChecksumBlockSize": 0}).apply(s3interface)
+        self.assertIsNone(s3interface.checksumBlockSize)
+        ArchiveSettings({"ShardSize": 0, "MaxShards": 8}).apply(s3interface)
+        self.assertIsNone(s3interface.shardSize)
+        self.assertEqual(s3interface.maxShards, 8)
+        ArchiveSettings({"ResumableThreshold": 1000}).apply(s3interface)
+        self.assertEqual(s3interface.resumableThreshold, 1000)
+        # resources that only transfer files keep the features off
+        s3interface = Mock(objectRequests=False, checksumBlockSize=None)
+        ArchiveSettings({"ChecksumBlockSize": 1000}).apply(s3interface)
+        self.assertIsNone(s3interface.checksumBlockSize)
+
+    def test_invalid_settings(self):
+        self.assertRaises(ValueError, lambda: ArchiveSettings({"BlockSize": 4}))
+        self.assertRaises(ValueError, lambda: ArchiveSettings({"ChecksumBlockSize": -1}))
+        self.assertRaises(ValueError, lambda: ArchiveSettings({"ChecksumBlockSize": "4"}))
+        self.assertRaises(ValueError, lambda: ArchiveSettings({"ChecksumBlockSize": True}))
+        self.assertRaises(ValueError, lambda: ArchiveSettings({"MaxShards": 0}))
+        # a long on python 2
+        self.assertEqual(ArchiveSettings({"ShardSize": 4 * 1024 ** 3}).values["ShardSize"],
+                         4 * 1024 ** 3)
+
+    def test_command_line_arguments(self):
+        parser = argparse.ArgumentParser()
+        ArchiveSettings.addArguments(parser)
+        self.assertEqual(ArchiveSettings.FromArguments(vars(parser.parse_args([]))).values, {})
+        settings = ArchiveSettings.FromArguments(vars(parser.parse_args(
+            ["--checksumBlockSize", "0"])), {"ChecksumBlockSize": 1000})
+        self.assertEqual(settings.values["ChecksumBlockSize"], 0)
+        roundTrip = ArchiveSettings.FromArguments(vars(parser.parse_args(
+            settings.toArguments().split())))
+        self.assertEqual(roundTrip.values, settings.values)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest, os, shutil
+from mock import Mock
+from local_s3 import LocalS3
+from s3interface import S3Interface
+from manifest import Manifest
+from loghelper import LogHelper
+from instancemanager import InstanceManager
+from instancemetadatafactory import InstanceMetadataFactory
+from instancemetadata import InstanceMetadata
+from asyncs3interface import AsyncS3Interface
+from asyncinstancemanager import AsyncInstanceManager
+
+class AsyncInstanceManager_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        self.workPath = os.path.join(self.tempPath, "work")
+        os.makedirs(self.workPath)
+        self.s3interface = S3Interface(LocalS3(os.path.join(self.tempPath, "buckets")),
+                                       "b", self.workPath)
+        manifest = Mock(spec=Manifest)
+        manifest.GetS3KeyPrefix.side_effect = lambda: "project"
+        self.instanceManager = InstanceManager(self.s3interface, manifest,
+                                               InstanceMetadataFactory(manifest))
+        self.asyncS3Interface = AsyncS3Interface(self.s3interface, 8)
+        self.manager = AsyncInstanceManager(self.instanceManager, self.asyncS3Interface)
+
+    def tearDown(self):
+        self.asyncS3Interface.close()
+        shutil.rmtree(self.tempPath)
+
+    def metadata(self, id):
+        return InstanceMetadata(id, "aws{0}".format(id), 2, 1, 1, "Initialize",
+                                "2020-01-01 00:00:00", 0, 0, 0)
+
+    def test_GetKey(self):
+        self.assertEqual(self.manager.GetKey(3, "metadata.json"),
+                         "project/instances/3/metadata.json")
+
+    def test_metadata_round_trip_is_compatible_with_InstanceManager(self):
+        self.manager.uploadMetaData([self.metadata(1), self.metadata(2)])
+        self.assertEqual(self.instanceManager.downloadMetaData(2).Get("AWS_Instance_Id"), "aws2")
+
+        self.instanceManager.uploadMetaData(self.metadata(3))
+        result = self.manager.downloadMetaData([1, 2, 3, 4])
+        self.assertEqual(sorted(result.keys()), [1, 2, 3, 4])
+        self.assertEqual([result[i].Get("AWS_Instance_Id") for i in [1, 2, 3]],
+                         ["aws1", "aws2", "aws3"])
+        self.assertIsNone(result[4])
+
+    def test_downloadInstanceLogs_skips_missing_logs(self):
+        for i in [1, 3]:
+            self.s3interface.bucket.Object(
+                self.manager.GetKey(i, LogHelper.instanceLogFileName(i))).put(
+                    Body="log {0}".format(i).encode("utf-8"))
+        outputDir = os.path.join(self.workPath, "logs")
+        os.makedirs(outputDir)
+        self.assertEqual(self.manager.downloadInstanceLogs([1, 2, 3], outputDir), [1, 3])
+        self.assertEqual(sorted(os.listdir(outputDir)),
+                         sorted(LogHelper.instanceLogFileName(i) for i in [1, 3]))
+        with open(os.path.join(outputDir, LogHelper.instanceLogFileName(3)), "rb") as f:
+            self.assertEqual(f.read(), b"log 3")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest, os, shutil, time, threading
+from local_s3 import LocalS3
+from s3interface import S3Interface
+from transferscheduler import TransferScheduler
+from asyncs3interface import AsyncS3Interface
+
+class AsyncS3Interface_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        self.workPath = os.path.join(self.tempPath, "work")
+        os.makedirs(self.workPath)
+        self.s3 = LocalS3(os.path.join(self.tempPath, "buckets"))
+        self.s3interface = S3Interface(self.s3, "b", self.workPath)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempPath)
+
+    def test_put_get_list_and_delete(self):
+        with AsyncS3Interface(self.s3interface, 4) as a:
+            AsyncS3Interface.gather([a.put("p/1", b"one"), a.put("p/2", b"two", {"k": "v"}),
+                                     a.put("q/3", b"three")])
+            self.assertEqual(a.get("p/2").get(), b"two")
+            self.assertEqual(self.s3interface.bucket.Object("p/2").metadata, {"k": "v"})
+            self.assertIsNone(a.get("p/missing").get())
+            self.assertEqual(a.list("p/").get(), ["p/1", "p/2"])
+            a.delete("p/1").get()
+            self.assertEqual(a.list("p/").get(), ["p/2"])
+
+    def test_upload_and_download(self):
+        source = os.path.join(self.workPath, "source")
+        with open(source, "wb") as f:
+            f.write(b"file contents")
+        destination = os.path.join(self.workPath, "destination")
+        with AsyncS3Interface(self.s3interface) as a:
+            a.upload(source, "f").get()
+            a.download("f", destination).get()
+        with open(destination, "rb") as f:
+            self.assertEqual(f.read(), b"file contents")
+
+    def test_gather_returns_results_and_exceptions_in_order(self):
+        with AsyncS3Interface(self.s3interface) as a:
+            a.put("k", b"v").get()
+            gathered = AsyncS3Interface.gather([
+                a.get("k"), a.download("missing", os.path.join(self.workPath, "x"))])
+        self.assertEqual(gathered[0], (b"v", None))
+        self.assertIsNone(gathered[1][0])
+        self.assertEqual(gathered[1][1].response["Error"]["Code"], "NoSuchKey")
+
+    def test_requests_are_concurrent(self):
+        s3 = LocalS3(os.path.join(self.tempPath, "buckets"), latency=0.1)
+        s3interface = S3Interface(s3, "b", self.workPath)
+        for i in range(40):
+            s3interface.bucket.Object(str(i)).put(Body=b"x")
+        start = time.time()
+        with AsyncS3Interface(s3interface, 40) as a:
+            gathered = AsyncS3Interface.gather([a.get(str(i)) for i in range(40)])
+        self.assertEqual([r for r, ex in gathered], [b"x"] * 40)
+        # 40 sequential requests would take at least 4 seconds
+        self.assertLess(time.time() - start, 2.0)
+
+    def test_requests_use_the_callers_scheduler_context(self):
+        self.s3interface.scheduler = TransferScheduler(maxInFlight=2)
+        contexts = []
+        bucket = self.s3interface.bucket
+        class RecordingBucket(object):
+            def Object(inner, key):
+                contexts.append(self.s3interface.scheduler.current())
+                self.assertLessEqual(self.s3interface.scheduler.inFlight, 2)
+                return bucket.Object(key)
+        self.s3interface.bucket = RecordingBucket()
+        with AsyncS3Interface(self.s3interface, 8) as a:
+            with self.s3interface.scheduler.context(TransferScheduler.OUTPUT, "owner"):
+                results = [a.put(str(i), b"x") for i in range(8)]
+            AsyncS3Interface.gather(results)
+        self.assertEqual(contexts, [(TransferScheduler.OUTPUT, "owner")] * 8)
+
+    def test_concurrency_must_be_positive(self):
+        self.assertRaises(ValueError, lambda: AsyncS3Interface(self.s3interface, 0))
+
+if __name__ == '__main__':
+    unittest.main()
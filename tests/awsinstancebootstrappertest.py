@@ -1,6 +1,8 @@
-import unittest
+import unittest, os, json, shutil
 from mock import Mock, call
-from awsinstancebootstrapper import AWSInstanceBootStrapper
+from awsinstancebootstrapper import AWSInstanceBootStrapper, downloadManifest
+from manifestdigest import ManifestDigest
+from local_s3 import LocalS3Error
 from manifest import Manifest
 from instancemanager import InstanceManager
 from instancemetadata import InstanceMetadata
@@ -56,14 +58,19 @@ class AWSInstanceBootStrapper_Test(unittest.TestCase):
             }
         ]
         m.GetS3KeyPrefix.return_value = "prefix"
+        m.GetIncludePatterns.side_effect = lambda id, name: \
+            ["*.csv"] if name == "doc3" else None
 
         a = AWSInstanceBootStrapper(999, m, s, i, im)
         a.DownloadS3Documents()
-        self.assertEqual(s.downloadCompressed.call_count, 2)
-        s.downloadCompressed.assert_has_calls([
-            call("prefix", "doc1", "{0}AWSInstancePath".format("doc1")),
-            call("prefix", "doc3", "{0}AWSInstancePath".format("doc3"))
+        self.assertEqual(s.downloadDocument.call_count, 2)
+        s.downloadDocument.assert_has_calls([
+            call("prefix", m.GetS3Documents(filter={"Name": "doc1"})[0],
+                 "{0}AWSInstancePath".format("doc1"), include=None),
+            call("prefix", m.GetS3Documents(filter={"Name": "doc3"})[0],
+                 "{0}AWSInstancePath".format("doc3"), include=["*.csv"])
             ])
+        m.GetIncludePatterns.assert_any_call(999, "doc3")
         i.uploadMetaData.assert_called()
         i.uploadInstanceLog.assert_any_call(999)
 
@@ -136,9 +143,11 @@ class AWSInstanceBootStrapper_Test(unittest.TestCase):
 
         a = AWSInstanceBootStrapper(101, m, s, i, im)
         a.UploadS3Documents()
-        s.uploadCompressed.assert_has_calls([
-            call("prefix", "doc2", "{0}AWSInstancePath".format("doc2")),
-            call("prefix", "doc4", "{0}AWSInstancePath".format("doc4"))
+        s.uploadDocument.assert_has_calls([
+            call("prefix", m.GetS3Documents(filter={"Name": "doc2"})[0],
+                 "{0}AWSInstancePath".format("doc2")),
+            call("prefix", m.GetS3Documents(filter={"Name": "doc4"})[0],
+                 "{0}AWSInstancePath".format("doc4"))
             ])
         i.uploadInstanceLog.assert_any_call(101)
         im.UpdateMessage.assert_called()
@@ -146,5 +155,31 @@ class AWSInstanceBootStrapper_Test(unittest.TestCase):
         #self.assertTrue(self.uploadCompressedWasCalled)
         #self.assertTrue(self.uploadLogCalled)
 
+    def test_downloadManifest_skips_validation_of_signed_manifest(self):
+        workDir = os.path.join(os.getcwd(), "tests", "temp")
+        os.makedirs(workDir)
+        try:
+            # invalid, so only a manifest with a valid signature loads
+            contents = json.dumps({"ProjectName": "p", "BucketName": "b", "Documents": [],
+                                   "InstanceJobs": [{"Id": 1, "RequiredS3Data": ["missing"],
+                                                     "Commands": []}]})
+            key = ManifestDigest.NewKey()
+            objects = {"p/manifest.json": contents}
+            def download(keyName, localPath):
+                if keyName not in objects:
+                    raise LocalS3Error("NoSuchKey", keyName)
+                with open(localPath, "w") as f:
+                    f.write(objects[keyName])
+            s = Mock(spec=S3Interface)
+            s.downloadFile.side_effect = download
+
+            self.assertRaises(ValueError, lambda: downloadManifest(s, "p/manifest.json", workDir, key))
+            objects["p/manifest.json.digest"] = ManifestDigest(key).sign(contents.encode("utf-8"))
+            m = downloadManifest(s, "p/manifest.json", workDir, key)
+            self.assertEqual(m.GetJob(1)["RequiredS3Data"], ["missing"])
+            self.assertRaises(ValueError, lambda: downloadManifest(s, "p/manifest.json", workDir))
+        finally:
+            shutil.rmtree(workDir)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,63 @@
+import unittest, os, shutil
+from compressioncodec import CompressionCodec
+
+class CompressionCodec_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        os.makedirs(self.tempPath)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempPath)
+
+    def roundTrip(self, codec, data):
+        compressor = codec.compressor()
+        compressed = compressor.compress(data) + compressor.flush()
+        decompressor = codec.decompressor()
+        return decompressor.decompress(compressed) + decompressor.flush()
+
+    def test_parse_settings(self):
+        self.assertEqual(CompressionCodec.parse("deflate"), ("deflate", None))
+        self.assertEqual(CompressionCodec.parse("deflate:1"), ("deflate", 1))
+        self.assertEqual(CompressionCodec.parse("zstd:19"), ("zstd", 19))
+        self.assertEqual(CompressionCodec.parse("auto"), ("auto", None))
+        self.assertRaises(ValueError, lambda: CompressionCodec.parse("lzma"))
+        self.assertRaises(ValueError, lambda: CompressionCodec.parse("deflate:10"))
+        self.assertRaises(ValueError, lambda: CompressionCodec.parse("store:1"))
+        self.assertRaises(ValueError, lambda: CompressionCodec.parse(None))
+
+    def test_codecs_round_trip(self):
+        data = os.urandom(1000) + b"compressible " * 1000
+        for setting in ["store", "deflate", "deflate:1", "bzip2:1"]:
+            codec = CompressionCodec.get(setting)
+            self.assertEqual(codec.setting, setting)
+            self.assertEqual(self.roundTrip(codec, data), data)
+            self.assertEqual(self.roundTrip(CompressionCodec.forMethod(codec.method), data), data)
+
+    def test_deflate_blocks_concatenate(self):
+        codec = CompressionCodec.get("deflate")
+        blocks = [b"a" * 1000, os.urandom(100), b"b" * 1000]
+        compressed = b"".join(codec.compressBlock(b, i == len(blocks) - 1)
+                              for i, b in enumerate(blocks))
+        decompressor = codec.decompressor()
+        self.assertEqual(decompressor.decompress(compressed) + decompressor.flush(),
+                         b"".join(blocks))
+
+    def test_unknown_method(self):
+        self.assertRaises(ValueError, lambda: CompressionCodec.forMethod(99))
+
+    def test_auto_samples_files(self):
+        codec = CompressionCodec.get("auto")
+        random = os.path.join(self.tempPath, "random")
+        with open(random, "wb") as f:
+            f.write(os.urandom(300000))
+        text = os.path.join(self.tempPath, "text")
+        with open(text, "wb") as f:
+            f.write(b"compressible " * 30000)
+        self.assertEqual(codec.forFile(random).name, "store")
+        self.assertEqual(codec.forFile(text).name, "deflate")
+        self.assertEqual(codec.forData(b"").name, "deflate")
+        self.assertEqual(codec.setting, "auto")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import unittest, os, shutil, time
+from documentcache import DocumentCache
+
+class DocumentCache_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        self.cacheDir = os.path.join(self.tempPath, "cache")
+        os.makedirs(self.tempPath)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempPath)
+
+    def populateTree(self, size):
+        def populate(path):
+            os.makedirs(os.path.join(path, "sub"))
+            with open(os.path.join(path, "sub", "file"), 'wb') as f:
+                f.write(b"x" * size)
+            return size
+        return populate
+
+    def test_store_lookup_and_materialize(self):
+        cache = DocumentCache(self.cacheDir, 1000)
+        self.assertIsNone(cache.lookup("b", "k", '"etag"'))
+        path, downloaded = cache.store("b", "k", '"etag"', self.populateTree(100))
+        self.assertEqual(downloaded, 100)
+        self.assertEqual(cache.lookup("b", "k", '"etag"'), path)
+        self.assertIsNone(cache.lookup("b", "k", '"other"'))
+
+        destination = os.path.join(self.tempPath, "out")
+        cache.materialize(path, destination)
+        cached = os.path.join(path, "sub", "file")
+        linked = os.path.join(destination, "sub", "file")
+        self.assertEqual(os.path.getsize(linked), 100)
+        if hasattr(os, "link"):
+            self.assertEqual(os.stat(cached).st_ino, os.stat(linked).st_ino)
+
+        # the index is persisted
+        self.assertEqual(DocumentCache(self.cacheDir, 1000).lookup("b", "k", '"etag"'), path)
+
+    def populateFiles(self, files):
+        def populate(path):
+            for relpath, contents in files.items():
+                if not os.path.isdir(os.path.dirname(os.path.join(path, relpath))):
+                    os.makedirs(os.path.dirname(os.path.join(path, relpath)))
+                with open(os.path.join(path, relpath), 'w') as f:
+                    f.write(contents)
+            return len(files)
+        return populate
+
+    def test_materialize_removes_only_paths_of_the_previous_version(self):
+        cache = DocumentCache(self.cacheDir, 1000)
+        first, d = cache.store("b", "k", "e1", self.populateFiles(
+            {"old": "1", os.path.join("gone", "deeper", "x"): "1", os.path.join("sub", "file"): "1"}))
+        second, d = cache.store("b", "k", "e2", self.populateTree(10))
+        destination = os.path.join(self.tempPath, "out")
+        cache.materialize(first, destination, "b/p/doc")
+        os.makedirs(os.path.join(destination, "logs"))
+        with open(os.path.join(destination, "logs", "instance.log"), 'w') as f:
+            f.write("log")
+        cache.materialize(second, destination, "b/p/doc")
+        self.assertEqual(sorted(os.listdir(destination)), ["logs", "sub"])
+        self.assertEqual(os.listdir(os.path.join(destination, "sub")), ["file"])
+        self.assertEqual(os.path.getsize(os.path.join(destination, "sub", "file")), 10)
+        # the record persists
+        cache = DocumentCache(self.cacheDir, 1000)
+        cache.materialize(first, destination, "b/p/doc")
+        cache.materialize(second, destination, "b/p/doc")
+        self.assertEqual(sorted(os.listdir(destination)), ["logs", "sub"])
+
+    def test_documents_sharing_a_destination_are_merged(self):
+        destination = os.path.join(self.tempPath, "out")
+        # the cache may live under the destination
+        cache = DocumentCache(os.path.join(destination, "cache"), 1000)
+        a, d = cache.store("b", "a", "e", self.populateFiles({"a.txt": "a"}))
+        b, d = cache.store("b", "b", "e", self.populateFiles({"b.txt": "b"}))
+        with open(os.path.join(destination, "unrelated.txt"), 'w') as f:
+            f.write("keep")
+        cache.materialize(a, destination, "b/p/a")
+        cache.materialize(b, destination, "b/p/b")
+        cache.materialize(a, destination, "b/p/a")
+        self.assertEqual(sorted(os.listdir(destination)),
+                         ["a.txt", "b.txt", "cache", "unrelated.txt"])
+        self.assertEqual(cache.lookup("b", "a", "e"), a)
+        self.assertTrue(os.path.isfile(os.path.join(a, "a.txt")))
+
+    def test_materialize_replaces_paths_that_changed_type(self):
+        cache = DocumentCache(self.cacheDir, 1000)
+        path, downloaded = cache.store("b", "k", "e", self.populateTree(10))
+        destination = os.path.join(self.tempPath, "out")
+        os.makedirs(os.path.join(destination, "sub", "file"))
+        cache.materialize(path, destination)
+        self.assertEqual(os.path.getsize(os.path.join(destination, "sub", "file")), 10)
+
+    def test_single_file_documents(self):
+        cache = DocumentCache(self.cacheDir, 1000)
+        def populate(path):
+            with open(path, 'w') as f:
+                f.write("single")
+            return 6
+        path, downloaded = cache.store("b", "k", "e", populate)
+        cache.materialize(path, os.path.join(self.tempPath, "renamed"))
+        with open(os.path.join(self.tempPath, "renamed")) as f:
+            self.assertEqual(f.read(), "single")
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = DocumentCache(self.cacheDir, 250)
+        first, d = cache.store("b", "k1", "e", self.populateTree(100))
+        second, d = cache.store("b", "k2", "e", self.populateTree(100))
+        time.sleep(0.01)
+        cache.lookup("b", "k1", "e")
+        cache.store("b", "k3", "e", self.populateTree(100))
+        self.assertIsNotNone(cache.lookup("b", "k1", "e"))
+        self.assertIsNone(cache.lookup("b", "k2", "e"))
+        self.assertFalse(os.path.exists(second))
+        self.assertEqual(cache.totalSize(), 200)
+
+    def test_failed_populate_leaves_no_entry(self):
+        cache = DocumentCache(self.cacheDir, 1000)
+        def populate(path):
+            os.makedirs(path)
+            raise IOError("download failed")
+        self.assertRaises(IOError, lambda: cache.store("b", "k", "e", populate))
+        self.assertIsNone(cache.lookup("b", "k", "e"))
+        self.assertEqual(os.listdir(os.path.join(self.cacheDir, "entries")), [])
+
+if __name__ == '__main__':
+    unittest.main()
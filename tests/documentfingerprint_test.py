@@ -0,0 +1,53 @@
+import unittest, os, shutil, time
+from documentfingerprint import DocumentFingerprint
+
+class DocumentFingerprint_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        self.treePath = os.path.join(self.tempPath, "tree")
+        self.indexPath = os.path.join(self.tempPath, "index", "doc.json")
+        os.makedirs(os.path.join(self.treePath, "sub"))
+        for name in ["a", os.path.join("sub", "b")]:
+            with open(os.path.join(self.treePath, name), 'w') as f:
+                f.write("contents of {0}".format(name))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempPath)
+
+    def test_fingerprint_is_stable(self):
+        first = DocumentFingerprint(self.indexPath).compute(self.treePath)
+        second = DocumentFingerprint(self.indexPath).compute(self.treePath)
+        self.assertEqual(first, second)
+        self.assertTrue(os.path.exists(self.indexPath))
+
+    def test_fingerprint_changes_with_content_and_structure(self):
+        f = DocumentFingerprint(self.indexPath)
+        original = f.compute(self.treePath)
+        with open(os.path.join(self.treePath, "a"), 'w') as out:
+            out.write("different contents")
+        changed = f.compute(self.treePath)
+        self.assertNotEqual(original, changed)
+        os.makedirs(os.path.join(self.treePath, "empty"))
+        self.assertNotEqual(changed, f.compute(self.treePath))
+
+    def test_unchanged_files_are_not_rehashed(self):
+        f = DocumentFingerprint(self.indexPath)
+        f.compute(self.treePath)
+        # a cached hash is trusted while size and mtime are unchanged
+        f.index["sub/b"]["Hash"] = "cached"
+        self.assertNotEqual(f.compute(self.treePath), DocumentFingerprint(
+            os.path.join(self.tempPath, "other.json")).compute(self.treePath))
+
+    def test_single_file_name_is_not_fingerprinted(self):
+        other = os.path.join(self.tempPath, "renamed")
+        shutil.copy(os.path.join(self.treePath, "a"), other)
+        f = DocumentFingerprint(self.indexPath)
+        self.assertEqual(f.compute(os.path.join(self.treePath, "a")), f.compute(other))
+
+    def test_missing_path_raises(self):
+        f = DocumentFingerprint(self.indexPath)
+        self.assertRaises(ValueError, lambda: f.compute(os.path.join(self.tempPath, "x")))
+
+if __name__ == '__main__':
+    unittest.main()
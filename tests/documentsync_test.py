@@ -0,0 +1,124 @@
+import unittest, os, shutil
+from s3interface import S3Interface
+from documentsync import DocumentSync
+from s3interface_test import MockS3Resource, MockS3Bucket
+
+class DocumentSync_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        self.sourcePath = os.path.join(self.tempPath, "source")
+        self.destPath = os.path.join(self.tempPath, "dest")
+        os.makedirs(os.path.join(self.sourcePath, "sub"))
+        os.makedirs(os.path.join(self.sourcePath, "empty"))
+        self.writeFile("a", "contents a")
+        self.writeFile(os.path.join("sub", "b"), "contents b")
+        self.writeFile(os.path.join("sub", "copy_of_a"), "contents a")
+
+        m = MockS3Resource()
+        m.bind_bucket_method(lambda name: MockS3Bucket(name))
+        self.s3 = S3Interface(m, "b", self.tempPath)
+        bucket = self.s3.bucket
+        self.uploads = []
+        self.downloads = []
+        def upload(localPath, keyName):
+            with open(localPath, 'rb') as f:
+                bucket.objects[keyName] = f.read()
+            self.uploads.append(keyName)
+        def download(keyName, localPath):
+            with open(localPath, 'wb') as f:
+                f.write(bucket.objects[keyName])
+            self.downloads.append(keyName)
+        bucket.bind_upload_file_method(upload)
+        bucket.bind_download_file_method(download)
+        self.sync = DocumentSync(self.s3, concurrency=4)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempPath)
+
+    def writeFile(self, relpath, contents):
+        with open(os.path.join(self.sourcePath, relpath), 'w') as f:
+            f.write(contents)
+
+    def assertTreesEqual(self):
+        for relpath in ["a", os.path.join("sub", "b"), os.path.join("sub", "copy_of_a")]:
+            with open(os.path.join(self.sourcePath, relpath)) as expected:
+                with open(os.path.join(self.destPath, relpath)) as actual:
+                    self.assertEqual(expected.read(), actual.read())
+        self.assertTrue(os.path.isdir(os.path.join(self.destPath, "empty")))
+
+    def test_upload_stores_distinct_contents_and_index(self):
+        self.sync.upload("prefix", "doc", self.sourcePath)
+        objects = [k for k in self.uploads if k.startswith("prefix/doc/objects/")]
+        # identical contents are stored once
+        self.assertEqual(len(objects), 2)
+        self.assertEqual(self.uploads[-1], "prefix/doc/index.json")
+        index = self.sync.readIndex("prefix", "doc")
+        self.assertEqual(sorted(index["Files"].keys()), ["a", "sub/b", "sub/copy_of_a"])
+        self.assertEqual(sorted(index["Directories"]), ["empty", "sub"])
+
+    def test_upload_sends_only_changed_files_and_removes_orphans(self):
+        self.sync.upload("prefix", "doc", self.sourcePath)
+        del self.uploads[:]
+        self.writeFile(os.path.join("sub", "b"), "changed b")
+        self.sync.upload("prefix", "doc", self.sourcePath)
+        self.assertEqual(len(self.uploads), 2)
+        self.assertTrue(self.uploads[0].startswith("prefix/doc/objects/"))
+        objects = [k for k in self.s3.bucket.objects if k.startswith("prefix/doc/objects/")]
+        self.assertEqual(len(objects), 2)
+
+    def test_download_recreates_tree(self):
+        self.sync.upload("prefix", "doc", self.sourcePath)
+        size = self.sync.download("prefix", "doc", self.destPath)
+        self.assertTreesEqual()
+        self.assertEqual(size, 30)
+
+    def test_download_skips_matching_local_files(self):
+        self.sync.upload("prefix", "doc", self.sourcePath)
+        self.sync.download("prefix", "doc", self.destPath)
+        del self.downloads[:]
+        self.writeFile("a", "new a")
+        self.sync.upload("prefix", "doc", self.sourcePath)
+        self.sync.download("prefix", "doc", self.destPath)
+        self.assertEqual([k for k in self.downloads if "objects" in k], ["prefix/doc/objects/" +
+                          self.sync.readIndex("prefix", "doc")["Files"]["a"]["Hash"]])
+        self.assertTreesEqual()
+
+    def test_download_removes_synced_files_missing_from_index(self):
+        self.sync.upload("prefix", "doc", self.sourcePath)
+        self.sync.download("prefix", "doc", self.destPath)
+        os.remove(os.path.join(self.sourcePath, "sub", "b"))
+        shutil.rmtree(os.path.join(self.sourcePath, "empty"))
+        self.sync.upload("prefix", "doc", self.sourcePath)
+        self.sync.download("prefix", "doc", self.destPath)
+        self.assertEqual(sorted(os.listdir(self.destPath)), ["a", "sub"])
+        self.assertEqual(os.listdir(os.path.join(self.destPath, "sub")), ["copy_of_a"])
+
+    def test_download_keeps_unrelated_local_files(self):
+        os.makedirs(os.path.join(self.destPath, "logs"))
+        with open(os.path.join(self.destPath, "logs", "instance.log"), 'w') as f:
+            f.write("log")
+        with open(os.path.join(self.destPath, "sub"), 'w') as f:
+            f.write("replaced by a directory")
+        self.sync.upload("prefix", "doc", self.sourcePath)
+        self.sync.download("prefix", "doc", self.destPath)
+        with open(os.path.join(self.destPath, "sub", "unrelated"), 'w') as f:
+            f.write("kept")
+        os.remove(os.path.join(self.sourcePath, "sub", "b"))
+        os.remove(os.path.join(self.sourcePath, "sub", "copy_of_a"))
+        os.rmdir(os.path.join(self.sourcePath, "sub"))
+        self.sync.upload("prefix", "doc", self.sourcePath)
+        self.sync.download("prefix", "doc", self.destPath)
+        self.assertEqual(sorted(os.listdir(self.destPath)), ["a", "empty", "logs", "sub"])
+        self.assertEqual(os.listdir(os.path.join(self.destPath, "sub")), ["unrelated"])
+        self.assertEqual(os.listdir(os.path.join(self.destPath, "logs")), ["instance.log"])
+
+    def test_download_missing_index_raises(self):
+        self.assertRaises(ValueError, lambda: self.sync.download("prefix", "doc", self.destPath))
+
+    def test_upload_requires_directory(self):
+        self.assertRaises(ValueError, lambda: self.sync.upload(
+            "prefix", "doc", os.path.join(self.sourcePath, "a")))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,8 @@ import unittest
 from ec2interface import EC2Interface
 from manifest import Manifest
 from instancemanager import InstanceManager
+from transfersettings import TransferSettings
+from archivesettings import ArchiveSettings
 from mock import Mock
 
 class MockEC2Instance(object):
@@ -96,6 +98,38 @@ class EC2Interface_Test(unittest.TestCase):
                        '--localWorkingDir "instanceLocalWorkingDir"' +
                        '\nextraCommand')
 
+        instanceManager.GetManifestKey.side_effect = lambda id: "project/instances/{0}/manifest.json".format(id)
+        ec2interface.manifestSlices = True
+        result = ec2interface.buildBootstrapCommand(1001)
+        self.assertTrue('--manifestKey "project/instances/1001/manifest.json" ' in result)
+
+    def test_buildBootstrapCommandPassesTransferSettings(self):
+        manifest = Mock(spec = Manifest)
+        manifest.GetBucketName.side_effect = lambda: "bucket"
+        ec2interface = EC2Interface(
+            ec2Resource=MockEC2Resource(),
+            instanceLocalWorkingDir = "instanceLocalWorkingDir",
+            manifest = manifest,
+            manifestKey = "key/to/manifest",
+            instanceManager = Mock(spec = InstanceManager),
+            pythonpath="pythonpath",
+            bootstrapScriptPath = "/path/to/script.py",
+            lineBreak = "\n",
+            bootstrapCommands = ["$BootStrapScript"],
+            transferSettings = TransferSettings({"MaxConcurrency": 32}))
+        result = ec2interface.buildBootstrapCommand(1000)
+        self.assertTrue(result.startswith('pythonpath "/path/to/script.py" '))
+        self.assertTrue(result.endswith(" --maxConcurrency 32 --maxQueueDepth 100"))
+        ec2interface.documentCache = {"Path": "/mnt/cache", "MaxBytes": 1000}
+        result = ec2interface.buildBootstrapCommand(1000)
+        self.assertTrue(result.endswith(' --cacheDir "/mnt/cache" --cacheMaxBytes 1000'))
+        ec2interface.manifestDigestKey = "abc123"
+        result = ec2interface.buildBootstrapCommand(1000)
+        self.assertTrue(result.endswith(' --cacheMaxBytes 1000 --manifestDigestKey abc123'))
+        ec2interface.archiveSettings = ArchiveSettings({"ChecksumBlockSize": 0})
+        result = ec2interface.buildBootstrapCommand(1000)
+        self.assertTrue(result.endswith(' --manifestDigestKey abc123 --checksumBlockSize 0'))
+
     def test_launchInstances(self):
         ec2Resource = MockEC2Resource()
         self.args = {
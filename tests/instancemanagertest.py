@@ -17,6 +17,13 @@ class InstanceManager_Test(unittest.TestCase):
         self.assertTrue(inst.s3Interface == mockS3Interface)
         self.assertTrue(inst.instanceMetadataFactory == mockInstanceMetaFac)
 
+    def test_GetManifestKey(self):
+        mockManifest = Mock(spec=Manifest)
+        mockManifest.GetS3KeyPrefix.side_effect = lambda : "project"
+        inst = InstanceManager(Mock(spec=S3Interface), mockManifest,
+                               Mock(spec=InstanceMetadataFactory))
+        self.assertEqual(inst.GetManifestKey(7), "project/instances/7/manifest.json")
+
     def test_GetMetaFileTempPath(self):
         mockManifest = Mock(spec=Manifest)
         mockS3Interface = Mock(spec=S3Interface)
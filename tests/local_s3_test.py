@@ -0,0 +1,180 @@
+import unittest, os, shutil, json, sys
+from mock import patch
+from local_s3 import LocalS3, LocalS3Error, LocalMultipartUpload
+from s3clientfactory import S3ClientFactory
+import uploader
+from s3interface import S3Interface
+from resumabletransfer import ResumableUpload
+from documentcache import DocumentCache
+
+class LocalS3_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        self.rootDir = os.path.join(self.tempPath, "buckets")
+        self.workPath = os.path.join(self.tempPath, "work")
+        os.makedirs(self.workPath)
+        self.s3 = LocalS3(self.rootDir)
+        self.bucket = self.s3.Bucket("b")
+
+    def tearDown(self):
+        shutil.rmtree(self.tempPath)
+
+    def errorCode(self, fn):
+        try:
+            fn()
+        except LocalS3Error as ex:
+            return ex.response["Error"]["Code"]
+        self.fail("no error raised")
+
+    def test_objects_round_trip_with_metadata_ranges_and_listing(self):
+        obj = self.bucket.Object("a/b")
+        obj.put(Body=b"0123456789", Metadata={"k": "v"})
+        self.assertEqual(obj.content_length, 10)
+        self.assertEqual(obj.metadata, {"k": "v"})
+        self.assertEqual(obj.get(Range="bytes=2-4")["Body"].read(), b"234")
+        self.assertEqual(obj.get(Range="bytes=8-20")["Body"].read(), b"89")
+        self.assertEqual(self.errorCode(lambda: obj.get(IfMatch='"other"')), "PreconditionFailed")
+        self.assertEqual(obj.get(IfMatch=obj.e_tag)["Body"].read(), b"0123456789")
+
+        source = os.path.join(self.workPath, "source")
+        with open(source, "wb") as f:
+            f.write(b"file contents")
+        self.bucket.upload_file(source, "a/c.tmp", ExtraArgs={"Metadata": {"x": "y"}})
+        self.bucket.Object("b").put(Body=b"")
+        self.assertEqual([o.key for o in self.bucket.objects.filter(Prefix="a/")], ["a/b", "a/c.tmp"])
+        self.assertEqual([o.size for o in self.bucket.objects.all()], [10, 13, 0])
+        destination = os.path.join(self.workPath, "destination")
+        sizes = []
+        self.bucket.download_file("a/c.tmp", destination, Callback=sizes.append)
+        with open(destination, "rb") as f:
+            self.assertEqual(f.read(), b"file contents")
+        self.assertEqual(sum(sizes), 13)
+
+        obj.delete()
+        self.assertEqual(self.errorCode(lambda: obj.content_length), "404")
+        self.assertEqual(self.errorCode(lambda: obj.get()), "NoSuchKey")
+        # a new resource sees the stored objects
+        self.assertEqual(LocalS3(self.rootDir).Bucket("b").Object("a/c.tmp").metadata, {"x": "y"})
+
+    def test_multipart_upload(self):
+        obj = self.bucket.Object("key")
+        upload = obj.initiate_multipart_upload(Metadata={"m": "1"})
+        parts = [{"PartNumber": n, "ETag": upload.Part(n).upload(Body=data)["ETag"]}
+                 for n, data in [(2, b"world"), (1, b"hello ")]]
+        self.assertFalse("key" in [o.key for o in self.bucket.objects.all()])
+        resumed = obj.MultipartUpload(upload.id)
+        resumed.complete(MultipartUpload={"Parts": sorted(parts, key=lambda p: p["PartNumber"])})
+        self.assertEqual(obj.get()["Body"].read(), b"hello world")
+        self.assertEqual(obj.metadata, {"m": "1"})
+        self.assertTrue(obj.e_tag.endswith('-2"'))
+        self.assertEqual(self.errorCode(lambda: obj.MultipartUpload(upload.id)), "NoSuchUpload")
+
+        aborted = obj.initiate_multipart_upload()
+        aborted.Part(1).upload(Body=b"x")
+        aborted.abort()
+        self.assertEqual(self.errorCode(lambda: aborted.Part(2).upload(Body=b"y")), "NoSuchUpload")
+        self.assertEqual(os.listdir(os.path.join(self.rootDir, "b", "uploads")), [])
+
+    def test_latency_and_bandwidth_are_simulated(self):
+        s3 = LocalS3(self.rootDir, latency=0.05, bytesPerSecond=1000)
+        sleeps = []
+        with patch("time.sleep", side_effect=sleeps.append):
+            s3.Bucket("b").Object("key").put(Body=b"x" * 500)
+            s3.Bucket("b").Object("key").get()["Body"].read()
+        self.assertEqual(sleeps[0], 0.05)
+        self.assertAlmostEqual(sleeps[1], 0.5, places=1)
+        self.assertEqual(sleeps[2], 0.05)
+        # the second transfer waits for the first to pass over the link
+        self.assertAlmostEqual(sleeps[3], 1.0, places=1)
+
+    def test_s3interface_runs_against_local_bucket(self):
+        s = S3Interface(self.s3, "b", self.workPath)
+        s.multipartPartSize = 5000
+        s.resumableThreshold = 20000
+        s.checksumBlockSize = 4096
+        source = os.path.join(self.tempPath, "source")
+        os.makedirs(os.path.join(source, "sub"))
+        files = { "a": os.urandom(30000), os.path.join("sub", "b"): b"b" * 1000 }
+        for relpath, contents in files.items():
+            with open(os.path.join(source, relpath), "wb") as f:
+                f.write(contents)
+        documents = [{"Name": "zip"}, {"Name": "streamed", "StreamingUpload": True},
+                     {"Name": "pipelined", "PipelinedDownload": True, "Compression": "store"},
+                     {"Name": "tar", "Format": "tar", "StreamingUpload": True}]
+        for document in documents:
+            destination = os.path.join(self.tempPath, "dest", document["Name"])
+            s.uploadDocument("p", document, source)
+            s.downloadDocument("p", document, destination)
+            for relpath, contents in files.items():
+                with open(os.path.join(destination, relpath), "rb") as f:
+                    self.assertEqual(f.read(), contents)
+        self.assertEqual(s.getMetadata("p/zip.zip")["compression"], "deflate")
+        self.assertEqual(sorted(s.listDocumentMembers("p", "pipelined")),
+                         ["./", "a", "sub/", "sub/b"])
+        self.assertEqual(os.listdir(os.path.join(self.rootDir, "b", "tmp")), [])
+
+    def test_interrupted_uploader_run_resumes_the_archive_upload(self):
+        source = os.path.join(self.tempPath, "source")
+        os.makedirs(source)
+        contents = os.urandom(30000)
+        with open(os.path.join(source, "a"), "wb") as f:
+            f.write(contents)
+        manifestPath = os.path.join(self.tempPath, "manifest.json")
+        with open(manifestPath, "w") as f:
+            json.dump({ "ProjectName": "p", "BucketName": "b", "InstanceJobs": [],
+                        "Documents": [{ "Name": "doc", "Direction": "LocalToAWS",
+                                        "LocalPath": source, "AWSInstancePath": "doc",
+                                        "Compression": "store",
+                                        "TransferSettings": { "MultipartChunkSize": 5000,
+                                                              "MaxConcurrency": 1 } }] }, f)
+        argv = ["uploader.py", "--manifestPath", manifestPath, "--localWorkingDir",
+                self.workPath, "--localS3Dir", self.rootDir, "--resumableThreshold", "10000"]
+        part = LocalMultipartUpload.Part
+        def run(failures, uploaded):
+            def Part(upload, partNumber):
+                if partNumber in failures:
+                    raise IOError("connection lost")
+                uploaded.append(partNumber)
+                return part(upload, partNumber)
+            S3ClientFactory.reset()
+            try:
+                with patch.object(sys, "argv", argv), patch("uploader.LogHelper"), \
+                     patch.object(LocalMultipartUpload, "Part", Part):
+                    uploader.main()
+            finally:
+                S3ClientFactory.reset()
+
+        first, second = [], []
+        self.assertRaises(SystemExit, lambda: run([3], first))
+        self.assertFalse(3 in first)
+        self.assertRaises(LocalS3Error, lambda: self.bucket.Object("p/doc.zip").content_length)
+        run([], second)
+        # the parts uploaded before the interruption are not sent again
+        self.assertEqual(second, [3])
+        s = S3Interface(self.s3, "b", self.workPath)
+        destination = os.path.join(self.tempPath, "dest")
+        s.downloadDocument("p", {"Name": "doc"}, destination)
+        with open(os.path.join(destination, "a"), "rb") as f:
+            self.assertEqual(f.read(), contents)
+
+    def test_cached_documents_share_a_destination(self):
+        s = S3Interface(self.s3, "b", self.workPath)
+        destination = os.path.join(self.tempPath, "dest")
+        s.documentCache = DocumentCache(os.path.join(destination, "cache"), 1024 * 1024)
+        for name in ["a", "b"]:
+            source = os.path.join(self.tempPath, "source_" + name)
+            os.makedirs(source)
+            with open(os.path.join(source, name + ".txt"), "w") as f:
+                f.write(name)
+            s.uploadDocument("p", {"Name": name}, source)
+        os.makedirs(os.path.join(destination, "logs"))
+        with open(os.path.join(destination, "logs", "instance.log"), "w") as f:
+            f.write("log")
+        for name in ["a", "b", "a"]:
+            s.downloadDocument("p", {"Name": name}, destination)
+        self.assertEqual(sorted(os.listdir(destination)), ["a.txt", "b.txt", "cache", "logs"])
+        self.assertEqual(os.listdir(os.path.join(destination, "logs")), ["instance.log"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
 import unittest
-import os, json
+import os, json, shutil
+from mock import patch
 from manifest import Manifest
+from manifestdigest import ManifestDigest
 class Manifest_Test(unittest.TestCase):
 
     def tearDown(self):
@@ -36,9 +38,8 @@ class Manifest_Test(unittest.TestCase):
             }))
         self.assertEqual( m.GetBucketName(), "myBucketName");
         
-    def test_GetS3DocumentsThrowsErrorWithBadDirectionParameterInJson(self):
-        
-        m = Manifest(self.writeTestJsonFile({
+    def test_ThrowsErrorWithBadDirectionParameterInJson(self):
+        path = self.writeTestJsonFile({
         "ProjectName": "testProject",
         "BucketName": "bucket",
         "Documents": [
@@ -49,10 +50,10 @@ class Manifest_Test(unittest.TestCase):
         "AWSInstancePath": "awsinstancepath"
         }],
         "InstanceJobs": []
-        }))
+        })
 
         with self.assertRaises(ValueError) as context:
-            m.GetS3Documents()
+            Manifest(path)
 
     def test_GetS3DocumentsThrowsErrorWithBadFilter(self):
 
@@ -150,6 +151,123 @@ class Manifest_Test(unittest.TestCase):
                                         "Name": "document3"}))
         self.assertEqual(result[0]["Name"], "document3")
 
+    def test_errorThrownOnInvalidDocumentMode(self):
+        self.assertRaises(ValueError,
+            lambda: Manifest(self.writeTestJsonFile({
+                "ProjectName": "projectname",
+                "BucketName": "bucket",
+                "Documents": [
+                  {
+                    "Name": "document1",
+                    "Direction": "LocalToAWS",
+                    "LocalPath": ".",
+                    "AWSInstancePath": "awsinstancepath",
+                    "Mode": "Bundle"
+                  }],
+                "InstanceJobs": []})))
+        m = Manifest(self.writeTestJsonFile({
+            "ProjectName": "projectname",
+            "BucketName": "bucket",
+            "Documents": [
+              {
+                "Name": "document1",
+                "Direction": "LocalToAWS",
+                "LocalPath": ".",
+                "AWSInstancePath": "awsinstancepath",
+                "Mode": "Sync"
+              }],
+            "InstanceJobs": []}))
+        self.assertEqual(m.GetS3Documents()[0]["Mode"], "Sync")
+
+    def test_errorThrownOnInvalidDocumentCompression(self):
+        def document(compression):
+            return self.writeTestJsonFile({
+                "ProjectName": "projectname",
+                "BucketName": "bucket",
+                "Documents": [
+                  {
+                    "Name": "document1",
+                    "Direction": "LocalToAWS",
+                    "LocalPath": ".",
+                    "AWSInstancePath": "awsinstancepath",
+                    "Compression": compression
+                  }],
+                "InstanceJobs": []})
+        self.assertRaises(ValueError, lambda: Manifest(document("lz4")))
+        self.assertRaises(ValueError, lambda: Manifest(document("deflate:12")))
+        m = Manifest(document("deflate:1"))
+        self.assertEqual(m.GetS3Documents()[0]["Compression"], "deflate:1")
+
+    def test_errorThrownOnInvalidDocumentFormat(self):
+        def document(**options):
+            doc = {
+                "Name": "document1",
+                "Direction": "LocalToAWS",
+                "LocalPath": ".",
+                "AWSInstancePath": "awsinstancepath" }
+            doc.update(options)
+            return self.writeTestJsonFile({
+                "ProjectName": "projectname",
+                "BucketName": "bucket",
+                "Documents": [doc],
+                "InstanceJobs": []})
+        self.assertRaises(ValueError, lambda: Manifest(document(Format="7z")))
+        self.assertRaises(ValueError, lambda: Manifest(document(Format="tar", Mode="Sync")))
+        self.assertRaises(ValueError, lambda: Manifest(document(Format="tar", Compression="auto")))
+        m = Manifest(document(Format="tar", Compression="deflate:1"))
+        self.assertEqual(m.GetS3Documents()[0]["Format"], "tar")
+        self.assertRaises(ValueError, lambda: Manifest(document(ShardSize=0)))
+        self.assertRaises(ValueError, lambda: Manifest(document(MaxShards="4")))
+        self.assertRaises(ValueError, lambda: Manifest(document(Format="tar", ShardSize=1000)))
+        self.assertRaises(ValueError, lambda: Manifest(document(Mode="Sync", MaxShards=4)))
+        Manifest(document(ShardSize=1000, MaxShards=4))
+
+    def test_errorThrownOnInvalidDocumentTransferSettings(self):
+        def document(settings):
+            return self.writeTestJsonFile({
+                "ProjectName": "projectname",
+                "BucketName": "bucket",
+                "Documents": [
+                  {
+                    "Name": "document1",
+                    "Direction": "LocalToAWS",
+                    "LocalPath": ".",
+                    "AWSInstancePath": "awsinstancepath",
+                    "TransferSettings": settings
+                  }],
+                "InstanceJobs": []})
+        self.assertRaises(ValueError, lambda: Manifest(document({"Threads": 2})))
+        self.assertRaises(ValueError, lambda: Manifest(document({"MaxConcurrency": -1})))
+        self.assertRaises(ValueError, lambda: Manifest(document([1])))
+        Manifest(document({"MaxConcurrency": 2, "MultipartChunkSize": 67108864}))
+
+    def test_GetIncludePatterns(self):
+        def manifest(required, direction="Static"):
+            return self.writeTestJsonFile({
+                "ProjectName": "projectname",
+                "BucketName": "bucket",
+                "Documents": [
+                  {
+                    "Name": "document1",
+                    "Direction": direction,
+                    "LocalPath": ".",
+                    "AWSInstancePath": "awsinstancepath"
+                  }],
+                "InstanceJobs": [
+                  {
+                    "Id": 1,
+                    "RequiredS3Data": required,
+                    "Commands": []
+                  }]})
+        m = Manifest(manifest([{"Name": "document1", "Include": ["data/*.csv"]}]))
+        self.assertEqual(m.GetJob(1)["RequiredS3Data"], ["document1"])
+        self.assertEqual(m.GetIncludePatterns(1, "document1"), ["data/*.csv"])
+        m = Manifest(manifest(["document1"]))
+        self.assertIsNone(m.GetIncludePatterns(1, "document1"))
+        self.assertRaises(ValueError, lambda: Manifest(manifest([{"Name": "document1"}])))
+        self.assertRaises(ValueError, lambda: Manifest(manifest(
+            [{"Name": "document1", "Include": ["*"]}], direction="AWSToLocal")))
+
     def test_errorThrownOnMissingJsonKeys(self):
         self.assertRaises(ValueError, 
             lambda: Manifest(self.writeTestJsonFile(
@@ -365,5 +483,158 @@ class Manifest_Test(unittest.TestCase):
         self.assertEqual(j3["Commands"],[{ "Command": "run3.exe", "Args": [ 1] },
                                          { "Command": "run4.exe", "Args": [ "a", "b"] }  ])
 
+    def test_lookupsUseIndexesAndReturnViews(self):
+        m = Manifest(self.writeTestJsonFile({
+            "ProjectName": "projectname",
+            "BucketName": "bucket",
+            "Documents": [
+              { "Name": "document{0}".format(i),
+                "Direction": ["LocalToAWS", "AWSToLocal", "Static"][i % 3],
+                "LocalPath": ".",
+                "AWSInstancePath": "path{0}".format(i % 2) } for i in range(9)],
+            "InstanceJobs": [
+              { "Id": i, "RequiredS3Data": [], "Commands": [] } for i in range(5)]}))
+
+        byName = m.GetS3Documents(filter={"Name": "document4"})
+        self.assertEqual(len(byName), 1)
+        self.assertTrue(byName[0] is m.data["Documents"][4])
+        self.assertEqual(list(m.GetS3Documents(filter={"Name": "missing"})), [])
+        self.assertEqual([d["Name"] for d in m.GetS3Documents(filter={"Direction": "Static"})],
+                         ["document2", "document5", "document8"])
+        self.assertEqual([d["Name"] for d in m.GetS3Documents(
+                             filter={"Direction": "LocalToAWS", "AWSInstancePath": "path0"})],
+                         ["document0", "document6"])
+        self.assertEqual(len(m.GetS3Documents(filter={"Name": "document4", "Direction": "Static"})), 0)
+
+        # views see the manifest data rather than copies of it
+        view = m.GetS3Documents(filter={"AWSInstancePath": "path1"})
+        m.data["Documents"][0]["AWSInstancePath"] = "path1"
+        self.assertEqual(view[0]["Name"], "document0")
+        # the conditions are checked once, when the view is first used
+        m.data["Documents"][0]["AWSInstancePath"] = "path0"
+        self.assertEqual(len(view), 5)
+        self.assertEqual(view[0]["Name"], "document0")
+
+        jobs = m.GetJobs()
+        self.assertEqual(len(jobs), 5)
+        self.assertEqual([j["Id"] for j in jobs], [0, 1, 2, 3, 4])
+        self.assertTrue(m.GetJob(3) is jobs[3])
+
+    def invalidManifest(self):
+        return {
+            "ProjectName": "projectname",
+            "BucketName": "bucket",
+            "Documents": [
+              { "Name": "document1", "Direction": "Sideways",
+                "LocalPath": ".", "AWSInstancePath": "path" },
+              { "Name": "document2", "Direction": "AWSToLocal", "Mode": "Bundle",
+                "LocalPath": ".", "AWSInstancePath": "path" },
+              { "Name": "document1", "Direction": "Static",
+                "LocalPath": ".", "AWSInstancePath": "path" }],
+            "InstanceJobs": [
+              { "Id": 1, "RequiredS3Data": [ "document2", "missing" ], "Commands": [] },
+              { "Id": 1, "RequiredS3Data": [ "document2" ], "Commands": [] }]}
+
+    def test_allErrorsAreReportedTogether(self):
+        with self.assertRaises(ValueError) as context:
+            Manifest(self.writeTestJsonFile(self.invalidManifest()))
+        message = str(context.exception)
+        self.assertTrue(message.startswith("manifest has 6 errors:"))
+        for error in ["direction 'Sideways'",
+                      "mode 'Bundle'",
+                      "duplicate document name detected in manifest 'document1'",
+                      "duplicate job id detected in manifest '1'",
+                      "Referenced S3 document 'missing' not found",
+                      "AWSToLocal document 'document2' found in more than one job"]:
+            self.assertTrue(error in message, error)
+
+    def test_signedManifestIsNotValidatedAgain(self):
+        path = self.writeTestJsonFile(self.invalidManifest())
+        with open(path, "rb") as f:
+            contents = f.read()
+        digest = ManifestDigest(ManifestDigest.NewKey())
+        # the manifest is invalid, so loading it shows validation was skipped
+        m = Manifest(path, digest, digest.sign(contents))
+        self.assertEqual(m.GetJob(1)["RequiredS3Data"], [ "document2" ])
+        self.assertEqual(len(m.GetS3Documents(filter={"Direction": "Sideways"})), 1)
+
+        self.assertRaises(ValueError, lambda: Manifest(path, digest, digest.sign(contents + b" ")))
+        self.assertRaises(ValueError, lambda: Manifest(
+            path, ManifestDigest(ManifestDigest.NewKey()), digest.sign(contents)))
+        self.assertRaises(ValueError, lambda: Manifest(path, digest, None))
+
+    def test_GetJobSlice(self):
+        m = Manifest(self.writeTestJsonFile({
+            "ProjectName": "projectname",
+            "BucketName": "bucket",
+            "Documents": [
+              { "Name": "document{0}".format(i),
+                "Direction": "AWSToLocal" if i == 3 else "LocalToAWS",
+                "LocalPath": ".",
+                "AWSInstancePath": "path{0}".format(i) } for i in range(5)],
+            "InstanceJobs": [
+              { "Id": 1, "RequiredS3Data": [ "document0" ], "Commands": [] },
+              { "Id": 2,
+                "RequiredS3Data": [ "document3", { "Name": "document1", "Include": [ "a/*" ] } ],
+                "Commands": [ { "Command": "run.exe", "Args": [] } ] }]}))
+        jobSlice = m.GetJobSlice(2)
+        self.assertEqual(jobSlice["ProjectName"], "projectname")
+        self.assertEqual(jobSlice["BucketName"], "bucket")
+        self.assertEqual([d["Name"] for d in jobSlice["Documents"]], ["document3", "document1"])
+        self.assertEqual(jobSlice["InstanceJobs"][0]["RequiredS3Data"],
+                         [ "document3", { "Name": "document1", "Include": [ "a/*" ] } ])
+        # the manifest itself is unchanged
+        self.assertEqual(m.GetJob(2)["RequiredS3Data"], [ "document3", "document1" ])
+
+        s = Manifest(self.writeTestJsonFile(jobSlice))
+        self.assertEqual(s.GetJob(2), m.GetJob(2))
+        self.assertEqual(s.GetIncludePatterns(2, "document1"), [ "a/*" ])
+        self.assertEqual(s.GetS3KeyPrefix(), "projectname")
+        self.assertRaises(ValueError, lambda: s.GetJob(1))
+        self.assertRaises(ValueError, lambda: m.GetJobSlice(3))
+
+    def test_cachedManifestIsNotParsedOrValidatedAgain(self):
+        cacheDir = os.path.join(os.getcwd(), "tests", "temp_manifestcache")
+        contents = {
+            "ProjectName": "projectname",
+            "BucketName": "bucket",
+            "Documents": [
+              { "Name": "document{0}".format(i), "Direction": "LocalToAWS",
+                "LocalPath": ".", "AWSInstancePath": "path" } for i in range(3)],
+            "InstanceJobs": [
+              { "Id": 1, "RequiredS3Data": [ "document0", { "Name": "document2", "Include": [ "a/*" ] } ],
+                "Commands": [] }]}
+        path = self.writeTestJsonFile(contents)
+        try:
+            m = Manifest(path, cacheDir=cacheDir)
+            self.assertEqual(len(os.listdir(cacheDir)), 1)
+            with patch("manifest.json.loads", side_effect=AssertionError("parsed again")):
+                cached = Manifest(path, cacheDir=cacheDir)
+            self.assertEqual(cached.data, m.data)
+            self.assertEqual(cached.GetJob(1)["RequiredS3Data"], [ "document0", "document2" ])
+            self.assertEqual(cached.GetIncludePatterns(1, "document2"), [ "a/*" ])
+            self.assertTrue(cached.GetS3Documents(filter={"Name": "document1"})[0]
+                            is cached.data["Documents"][1])
+
+            # a changed manifest is parsed and validated again
+            contents["InstanceJobs"][0]["RequiredS3Data"].append("missing")
+            self.writeTestJsonFile(contents)
+            self.assertRaises(ValueError, lambda: Manifest(path, cacheDir=cacheDir))
+            contents["InstanceJobs"][0]["RequiredS3Data"].pop()
+            contents["BucketName"] = "other"
+            self.writeTestJsonFile(contents)
+            self.assertEqual(Manifest(path, cacheDir=cacheDir).GetBucketName(), "other")
+            self.assertEqual(len(os.listdir(cacheDir)), 1)
+
+            # an unreadable entry is replaced
+            entry = os.path.join(cacheDir, os.listdir(cacheDir)[0])
+            with open(entry, "wb") as f:
+                f.write(b"corrupt")
+            self.assertEqual(Manifest(path, cacheDir=cacheDir).GetBucketName(), "other")
+            with patch("manifest.json.loads", side_effect=AssertionError("parsed again")):
+                self.assertEqual(Manifest(path, cacheDir=cacheDir).GetBucketName(), "other")
+        finally:
+            shutil.rmtree(cacheDir)
+
 if __name__ == '__main__':
     unittest.main()
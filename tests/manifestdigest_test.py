@@ -0,0 +1,23 @@
+import unittest
+from manifestdigest import ManifestDigest
+
+class ManifestDigest_Test(unittest.TestCase):
+
+    def test_signature_verifies_only_the_signed_contents_and_key(self):
+        key = ManifestDigest.NewKey()
+        self.assertEqual(len(key), 64)
+        self.assertNotEqual(key, ManifestDigest.NewKey())
+        digest = ManifestDigest(key)
+        signature = digest.sign(b'{"ProjectName": "p"}')
+        self.assertTrue(digest.verify(b'{"ProjectName": "p"}', signature))
+        self.assertTrue(digest.verify(b'{"ProjectName": "p"}', signature + "\n"))
+        self.assertFalse(digest.verify(b'{"ProjectName": "q"}', signature))
+        self.assertFalse(ManifestDigest(ManifestDigest.NewKey()).verify(
+            b'{"ProjectName": "p"}', signature))
+
+    def test_SignatureKey(self):
+        self.assertEqual(ManifestDigest.SignatureKey("project/manifest.json"),
+                         "project/manifest.json.digest")
+
+if __name__ == '__main__':
+    unittest.main()
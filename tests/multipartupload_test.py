@@ -0,0 +1,48 @@
+import unittest
+from multipartupload import MultipartUploadStream
+from s3interface_test import MockS3Bucket
+
+class MultipartUploadStream_Test(unittest.TestCase):
+
+    def test_data_is_uploaded_in_parts(self):
+        bucket = MockS3Bucket("b")
+        stream = MultipartUploadStream(bucket, "key", partSize=10, queueDepth=3)
+        for i in range(7):
+            stream.write(b"0123456")
+        stream.close()
+        upload = bucket.multipartUploads[0]
+        self.assertEqual(sorted(upload.parts.keys()), [1, 2, 3, 4, 5])
+        self.assertTrue(all(len(upload.parts[n]) == 10 for n in range(1, 5)))
+        self.assertEqual(bucket.objects["key"], b"0123456" * 7)
+        self.assertEqual(stream.bytesWritten, 49)
+
+    def test_part_size_grows_to_stay_within_the_part_limit(self):
+        bucket = MockS3Bucket("b")
+        stream = MultipartUploadStream(bucket, "key", partSize=1, queueDepth=4)
+        data = bytes(bytearray(i % 251 for i in range(20000)))
+        for i in range(0, len(data), 7):
+            stream.write(data[i:i + 7])
+        stream.close()
+        upload = bucket.multipartUploads[0]
+        # 1000 parts of each of 1, 2, 4 and 8 bytes, then 16 byte parts
+        self.assertEqual(len(upload.parts), 4313)
+        self.assertEqual([len(upload.parts[n]) for n in [1000, 1001, 3001, 4001, 4312]],
+                         [1, 2, 8, 16, 16])
+        self.assertEqual(bucket.objects["key"], data)
+
+    def test_empty_upload_has_one_part(self):
+        bucket = MockS3Bucket("b")
+        stream = MultipartUploadStream(bucket, "key", partSize=10)
+        stream.close()
+        self.assertEqual(bucket.objects["key"], b"")
+
+    def test_abort(self):
+        bucket = MockS3Bucket("b")
+        stream = MultipartUploadStream(bucket, "key", partSize=10)
+        stream.write(b"a" * 25)
+        stream.abort()
+        self.assertTrue(bucket.multipartUploads[0].aborted)
+        self.assertFalse("key" in bucket.objects)
+
+if __name__ == '__main__':
+    unittest.main()
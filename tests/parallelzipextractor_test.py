@@ -0,0 +1,67 @@
+import unittest, os, shutil, zipfile
+from mock import patch
+from parallelzipextractor import ParallelZipExtractor
+
+class ParallelZipExtractor_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        self.archivePath = os.path.join(self.tempPath, "archive.zip")
+        self.extractPath = os.path.join(self.tempPath, "extract")
+        os.makedirs(self.tempPath)
+        self.contents = {}
+        with zipfile.ZipFile(self.archivePath, "w", zipfile.ZIP_DEFLATED) as z:
+            z.writestr("empty/", b"")
+            for i in range(40):
+                name = "d{0}/sub{1}/file{2}".format(i % 3, i % 2, i)
+                self.contents[name] = os.urandom(50 * i) + b"x" * 1000 * i
+                z.writestr(name, self.contents[name])
+
+    def tearDown(self):
+        shutil.rmtree(self.tempPath)
+
+    def assertExtracted(self):
+        self.assertTrue(os.path.isdir(os.path.join(self.extractPath, "empty")))
+        for name, value in self.contents.items():
+            with open(os.path.join(self.extractPath, *name.split("/")), "rb") as f:
+                self.assertEqual(f.read(), value)
+
+    def test_parallel_extraction(self):
+        opened = []
+        original = zipfile.ZipFile.__init__
+        def init(z, *args, **kwargs):
+            opened.append(args[0])
+            original(z, *args, **kwargs)
+        with patch.object(zipfile.ZipFile, "__init__", init):
+            ParallelZipExtractor(4, minParallelSize=0).extractAll(
+                self.archivePath, self.extractPath)
+        # one handle to read the member list plus one per worker
+        self.assertEqual(len(opened), 5)
+        self.assertExtracted()
+
+    def test_small_archives_are_extracted_serially(self):
+        opened = []
+        original = zipfile.ZipFile.__init__
+        def init(z, *args, **kwargs):
+            opened.append(args[0])
+            original(z, *args, **kwargs)
+        with patch.object(zipfile.ZipFile, "__init__", init):
+            ParallelZipExtractor(4).extractAll(self.archivePath, self.extractPath)
+        self.assertEqual(len(opened), 1)
+        self.assertExtracted()
+
+    def test_worker_errors_are_raised(self):
+        with open(self.archivePath, "r+b") as f:
+            data = bytearray(f.read())
+        # corrupt the data of the largest member
+        with zipfile.ZipFile(self.archivePath) as z:
+            info = z.getinfo("d0/sub1/file39")
+        offset = info.header_offset + 30 + len(info.filename) + 10
+        data[offset:offset + 100] = b"\0" * 100
+        with open(self.archivePath, "wb") as f:
+            f.write(bytes(data))
+        self.assertRaises(Exception, lambda: ParallelZipExtractor(4, minParallelSize=0)
+                          .extractAll(self.archivePath, self.extractPath))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest, os, shutil, zipfile, io
+from parallelzipstreamwriter import ParallelZipStreamWriter
+from compressioncodec import CompressionCodec
+from remotezip import LocalZipArchive
+
+class ParallelZipStreamWriter_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        os.makedirs(self.tempPath)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempPath)
+
+    def writeFile(self, name, contents):
+        path = os.path.join(self.tempPath, name)
+        with open(path, 'wb') as f:
+            f.write(contents)
+        return path
+
+    def test_multi_block_members_are_readable_by_zipfile(self):
+        contents = {
+            "empty": b"",
+            "small": b"small file",
+            "blocks": (os.urandom(3000) + b"compressible " * 2000) * 3,
+            "exact": b"x" * 4096 }
+        data = io.BytesIO()
+        with ParallelZipStreamWriter(data, workers=3, blockSize=1024) as z:
+            z.write(self.tempPath, "dir")
+            for name in sorted(contents):
+                z.write(self.writeFile(name, contents[name]), "dir/" + name)
+            z.writestr("flag", "")
+
+        with zipfile.ZipFile(io.BytesIO(data.getvalue())) as z:
+            self.assertEqual(z.namelist(), ["dir/"] + ["dir/" + n for n in sorted(contents)] + ["flag"])
+            self.assertIsNone(z.testzip())
+            for name, value in contents.items():
+                self.assertEqual(z.read("dir/" + name), value)
+            info = z.getinfo("dir/blocks")
+            self.assertTrue(info.compress_size < info.file_size)
+
+    def test_stored_members(self):
+        data = io.BytesIO()
+        contents = os.urandom(5000)
+        with ParallelZipStreamWriter(data, 2, CompressionCodec.get("store"), blockSize=1000) as z:
+            z.write(self.writeFile("a", contents), "a")
+        with zipfile.ZipFile(io.BytesIO(data.getvalue())) as z:
+            self.assertEqual(z.getinfo("a").compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(z.read("a"), contents)
+
+    def test_unsplittable_codec_members_are_written_in_order(self):
+        contents = b"bzip2 data " * 5000
+        archivePath = os.path.join(self.tempPath, "archive.zip")
+        with open(archivePath, "wb") as f:
+            with ParallelZipStreamWriter(f, 2, CompressionCodec.get("bzip2"), blockSize=1000) as z:
+                z.write(self.writeFile("a", contents), "a")
+                z.writestr("b", "small")
+        archive = LocalZipArchive(archivePath)
+        self.assertEqual(archive.namelist(), ["a", "b"])
+        self.assertEqual([m.compressType for m in archive.members], [12, 12])
+        outputDir = os.path.join(self.tempPath, "out")
+        archive.extractAll(outputDir)
+        with open(os.path.join(outputDir, "a"), "rb") as f:
+            self.assertEqual(f.read(), contents)
+
+    def test_error_discards_workers(self):
+        data = io.BytesIO()
+        def fail():
+            with ParallelZipStreamWriter(data, 2) as z:
+                z.writestr("a", "b")
+                raise IOError("failed")
+        self.assertRaises(IOError, fail)
+
+if __name__ == '__main__':
+    unittest.main()
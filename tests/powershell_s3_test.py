@@ -0,0 +1,192 @@
+import unittest, os, sys, shutil, time, json, logging, threading
+from powershell_s3 import powershell_s3, PowerShellS3Error
+from s3interface import S3Interface
+
+# stands in for the powershell session script: speaks the same protocol,
+# storing objects as files under a directory
+fakeSession = r"""
+import sys, os, json, shutil, time
+root, starts, delay = sys.argv[1], sys.argv[2], float(sys.argv[3])
+with open(starts, "a") as f:
+    f.write("start\n")
+print("loading module")
+print("##ready")
+sys.stdout.flush()
+for line in iter(sys.stdin.readline, ""):
+    c = json.loads(line)
+    time.sleep(delay)
+    path = os.path.join(root, c["Bucket"], c["Key"])
+    if c["Op"] == "download" and not os.path.exists(path):
+        result = {"Ok": False, "Code": "404", "Message": "not found"}
+    else:
+        if c["Op"] == "download":
+            shutil.copyfile(path, c["File"])
+        else:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            shutil.copyfile(c["File"], path)
+            with open(path + ".command", "w") as f:
+                json.dump(c, f)
+        result = {"Ok": True}
+    print("##result " + json.dumps(result))
+    sys.stdout.flush()
+"""
+
+class powershell_s3_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        self.root = os.path.join(self.tempPath, "buckets")
+        os.makedirs(os.path.join(self.root, "b"))
+        self.script = os.path.join(self.tempPath, "session.py")
+        with open(self.script, "w") as f:
+            f.write(fakeSession)
+        self.starts = os.path.join(self.tempPath, "starts")
+
+    def tearDown(self):
+        shutil.rmtree(self.tempPath)
+
+    def newS3(self, concurrency=4, delay=0.0):
+        return powershell_s3(concurrency, [sys.executable, self.script, self.root,
+                                           self.starts, str(delay)]).Bucket("b")
+
+    def sessionsStarted(self):
+        with open(self.starts) as f:
+            return len(f.readlines())
+
+    def writeFile(self, name, contents):
+        path = os.path.join(self.tempPath, name)
+        with open(path, "w") as f:
+            f.write(contents)
+        return path
+
+    def command(self, key):
+        with open(os.path.join(self.root, "b", key + ".command")) as f:
+            return json.load(f)
+
+    def test_transfers_reuse_a_session(self):
+        s3 = self.newS3()
+        source = self.writeFile("source", "contents")
+        sizes = []
+        s3.upload_file(source, "k1", ExtraArgs={"Metadata": {"a": "b"}}, Callback=sizes.append)
+        s3.upload_file(source, "k2")
+        destination = os.path.join(self.tempPath, "destination")
+        s3.download_file("k1", destination, Callback=sizes.append)
+        s3.close()
+        with open(destination) as f:
+            self.assertEqual(f.read(), "contents")
+        self.assertEqual(sizes, [8, 8])
+        self.assertEqual(self.command("k1")["Metadata"], {"a": "b"})
+        self.assertEqual(self.sessionsStarted(), 1)
+
+    def test_files_are_uploaded_in_place_unless_being_logged(self):
+        s3 = self.newS3()
+        source = self.writeFile("source", "contents")
+        s3.upload_file(source, "in_place")
+        command = self.command("in_place")
+        self.assertTrue(command["Shared"])
+        self.assertEqual(command["File"], os.path.abspath(source))
+
+        logPath = os.path.join(self.tempPath, "log.txt")
+        handler = logging.FileHandler(logPath)
+        logging.getLogger().addHandler(handler)
+        try:
+            s3.upload_file(logPath, "log")
+        finally:
+            logging.getLogger().removeHandler(handler)
+            handler.close()
+        s3.close()
+        command = self.command("log")
+        self.assertFalse(command["Shared"])
+        self.assertEqual(command["File"], os.path.abspath(logPath) + ".tmp")
+        self.assertFalse(os.path.exists(logPath + ".tmp"))
+
+    def test_transfers_run_concurrently(self):
+        s3 = self.newS3(concurrency=4, delay=0.25)
+        source = self.writeFile("source", "contents")
+        errors = []
+        def upload(i):
+            try:
+                s3.upload_file(source, str(i))
+            except Exception as ex:
+                errors.append(ex)
+        threads = [threading.Thread(target=upload, args=(i,)) for i in range(8)]
+        start = time.time()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.time() - start
+        s3.close()
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(x for x in os.listdir(os.path.join(self.root, "b"))
+                                if not x.endswith(".command")), [str(i) for i in range(8)])
+        self.assertLessEqual(self.sessionsStarted(), 4)
+        # 8 transfers one at a time would take at least 2 seconds
+        self.assertLess(elapsed, 1.5)
+
+    def test_failed_transfer_raises_with_the_error_code(self):
+        s3 = self.newS3()
+        try:
+            s3.download_file("missing", os.path.join(self.tempPath, "x"))
+            self.fail("no error raised")
+        except PowerShellS3Error as ex:
+            self.assertEqual(ex.response["Error"]["Code"], "404")
+        # the session is still usable
+        s3.upload_file(self.writeFile("source", "contents"), "k")
+        s3.close()
+        self.assertEqual(self.sessionsStarted(), 1)
+
+    def test_documents_round_trip_through_S3Interface(self):
+        s3 = powershell_s3(2, [sys.executable, self.script, self.root, self.starts, "0"])
+        workPath = os.path.join(self.tempPath, "work")
+        os.makedirs(workPath)
+        s3interface = S3Interface(s3, "b", workPath)
+        source = os.path.join(self.tempPath, "source")
+        os.makedirs(os.path.join(source, "sub"))
+        with open(os.path.join(source, "sub", "file"), "w") as f:
+            f.write("contents")
+        document = {"Name": "doc"}
+        s3interface.uploadDocument("p", document, source)
+        # only the archive is stored, without object level checksums
+        self.assertEqual(sorted(os.listdir(os.path.join(self.root, "b", "p"))),
+                         ["doc.zip", "doc.zip.command"])
+        destination = os.path.join(self.tempPath, "destination")
+        s3interface.downloadDocument("p", document, destination)
+        s3.close()
+        with open(os.path.join(destination, "sub", "file")) as f:
+            self.assertEqual(f.read(), "contents")
+        self.assertEqual(os.listdir(workPath), [])
+
+    def test_object_level_document_options_raise(self):
+        s3 = powershell_s3(1, [sys.executable, self.script, self.root, self.starts, "0"])
+        s3interface = S3Interface(s3, "b", self.tempPath)
+        def message(fn):
+            with self.assertRaises(ValueError) as context:
+                fn()
+            return str(context.exception)
+        self.assertTrue('"Mode": "Sync"' in message(lambda: s3interface.uploadDocument(
+            "p", {"Name": "doc", "Mode": "Sync"}, self.tempPath)))
+        self.assertTrue("skipUnchanged" in message(lambda: s3interface.uploadDocument(
+            "p", {"Name": "doc"}, self.tempPath, skipUnchanged=True)))
+        self.assertTrue('"Format": "tar", "PipelinedDownload"' in message(
+            lambda: s3interface.downloadDocument(
+                "p", {"Name": "doc", "Format": "tar", "PipelinedDownload": True}, self.tempPath)))
+        self.assertTrue("include patterns" in message(lambda: s3interface.downloadDocument(
+            "p", {"Name": "doc"}, self.tempPath, include=["*.txt"])))
+        s3interface.documentCache = object()
+        self.assertTrue("document cache" in message(lambda: s3interface.downloadDocument(
+            "p", {"Name": "doc"}, self.tempPath)))
+        # nothing was transferred
+        self.assertFalse(os.path.exists(self.starts))
+
+    def test_session_that_exits_raises(self):
+        s3 = powershell_s3(1, [sys.executable, "-c", "print('##ready')"]).Bucket("b")
+        self.assertRaises(ValueError, lambda: s3.upload_file(
+            self.writeFile("source", "contents"), "k"))
+
+    def test_concurrency_must_be_positive(self):
+        self.assertRaises(ValueError, lambda: powershell_s3(0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest, threading
+from rangedreader import RangedStreamReader
+
+class RangedStreamReader_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.data = bytes(bytearray(i % 256 for i in range(1000)))
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def fetchRange(self, start, end):
+        with self.lock:
+            self.requests.append((start, end))
+        return self.data[start:end]
+
+    def test_reads_span_in_order(self):
+        with RangedStreamReader(self.fetchRange, [(0, 1000)], 64, 4) as r:
+            out = b"".join(iter(lambda: r.read(50), b""))
+        self.assertEqual(out, self.data)
+        self.assertEqual(sorted(self.requests), [(s, min(s + 64, 1000)) for s in range(0, 1000, 64)])
+
+    def test_reads_multiple_spans_and_seeks(self):
+        spans = [(10, 100), (500, 620)]
+        with RangedStreamReader(self.fetchRange, spans, 32, 2) as r:
+            self.assertEqual(r.read(20), self.data[10:30])
+            r.seek(90)
+            self.assertEqual(r.read(10), self.data[90:100])
+            r.seek(510)
+            self.assertEqual(r.read(1000), self.data[510:620])
+            self.assertEqual(r.read(1), b"")
+        self.assertTrue(all(start >= 10 and end <= 620 for start, end in self.requests))
+
+    def test_chunks_end_at_multiples_of_the_alignment(self):
+        with RangedStreamReader(self.fetchRange, [(10, 300), (700, 750)], 100, 2, 64) as r:
+            self.assertEqual(r.read(290), self.data[10:300])
+            r.seek(700)
+            self.assertEqual(r.read(50), self.data[700:750])
+        self.assertEqual(sorted(self.requests),
+                         [(10, 64), (64, 128), (128, 192), (192, 256), (256, 300), (700, 750)])
+
+    def test_seek_backwards_raises(self):
+        with RangedStreamReader(self.fetchRange, [(0, 100)], 32, 2) as r:
+            r.read(50)
+            self.assertRaises(ValueError, lambda: r.seek(10))
+
+    def test_reading_outside_spans_raises(self):
+        with RangedStreamReader(self.fetchRange, [(0, 10), (50, 60)], 32, 2) as r:
+            r.seek(20)
+            self.assertRaises(ValueError, lambda: r.read(5))
+
+    def test_short_fetch_raises(self):
+        with RangedStreamReader(lambda s, e: b"x", [(0, 10)], 32, 2) as r:
+            self.assertRaises(IOError, lambda: r.read(5))
+
+if __name__ == '__main__':
+    unittest.main()
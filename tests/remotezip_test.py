@@ -0,0 +1,134 @@
+import unittest, os, shutil, io, zipfile
+from mock import patch
+from remotezip import RemoteZipArchive
+from zipstreamwriter import ZipStreamWriter
+from compressioncodec import CompressionCodec
+from archivechecksum import ArchiveChecksum
+from s3interface_test import MockS3Bucket, MockS3Object
+
+class RemoteZipArchive_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        os.makedirs(self.tempPath)
+        self.bucket = MockS3Bucket("b")
+        self.contents = dict(("dir/file{0}".format(i), os.urandom(100) + b"x" * 1000 * i)
+                             for i in range(5))
+        data = io.BytesIO()
+        with zipfile.ZipFile(data, "w", zipfile.ZIP_DEFLATED) as z:
+            z.writestr("dir/", b"")
+            for name, value in sorted(self.contents.items()):
+                z.writestr(name, value)
+            z.writestr("stored", b"stored contents", zipfile.ZIP_STORED)
+        self.bucket.objects["key"] = data.getvalue()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempPath)
+
+    def test_reads_central_directory_from_tail(self):
+        a = RemoteZipArchive(self.bucket, "key")
+        self.assertEqual(a.namelist(),
+                         ["dir/"] + sorted(self.contents.keys()) + ["stored"])
+        self.assertEqual(len(self.bucket.rangeRequests), 1)
+        self.assertEqual(a.members[1].fileSize, 100)
+
+    def test_extractAll(self):
+        a = RemoteZipArchive(self.bucket, "key", chunkSize=128, concurrency=3)
+        a.extractAll(self.tempPath)
+        for name, value in self.contents.items():
+            with open(os.path.join(self.tempPath, name), 'rb') as f:
+                self.assertEqual(f.read(), value)
+        with open(os.path.join(self.tempPath, "stored"), 'rb') as f:
+            self.assertEqual(f.read(), b"stored contents")
+
+    def test_extract_fetches_only_selected_members(self):
+        a = RemoteZipArchive(self.bucket, "key", chunkSize=100000)
+        member = [m for m in a.members if m.name == "dir/file2"][0]
+        a.extract([member], lambda m: os.path.join(self.tempPath, "out"))
+        with open(os.path.join(self.tempPath, "out"), 'rb') as f:
+            self.assertEqual(f.read(), self.contents["dir/file2"])
+        fetched = self.bucket.rangeRequests[1:]
+        self.assertEqual(len(fetched), 1)
+        self.assertEqual(fetched[0][0], member.headerOffset)
+        self.assertTrue(fetched[0][1] - fetched[0][0] < 2 * member.compressSize + 200)
+
+    def test_corrupt_member_fails_crc_check(self):
+        data = bytearray(self.bucket.objects["key"])
+        a = RemoteZipArchive(self.bucket, "key")
+        member = [m for m in a.members if m.name == "stored"][0]
+        data[member.headerOffset + 30 + len("stored")] ^= 0xff
+        self.bucket.objects["key"] = bytes(data)
+        self.assertRaises(ValueError, lambda: a.extract([member],
+                          lambda m: os.path.join(self.tempPath, "out")))
+
+    def checksumArchive(self, blockSize):
+        checksum = ArchiveChecksum(blockSize)
+        checksum.update(self.bucket.objects["key"])
+        return checksum.finish()
+
+    def corruptingGet(self, offset):
+        """returns a MockS3Object.get corrupting the byte at offset the first
+        time it is fetched"""
+        get = MockS3Object.get
+        corrupted = []
+        def corruptGet(obj, Range=None, IfMatch=None):
+            response = get(obj, Range, IfMatch)
+            start = int(Range[len("bytes="):].split("-")[0])
+            body = bytearray(response["Body"].read())
+            if not corrupted and start <= offset < start + len(body):
+                corrupted.append(start)
+                body[offset - start] ^= 0xff
+            response["Body"] = io.BytesIO(bytes(body))
+            return response
+        return corruptGet
+
+    def test_checksum_repairs_corrupt_blocks(self):
+        a = RemoteZipArchive(self.bucket, "key", chunkSize=150, concurrency=3,
+                             checksum=self.checksumArchive(64))
+        member = [m for m in a.members if m.name == "dir/file2"][0]
+        offset = member.headerOffset + 60
+        del self.bucket.rangeRequests[:]
+        with patch.object(MockS3Object, "get", self.corruptingGet(offset)):
+            a.extractAll(self.tempPath)
+        with open(os.path.join(self.tempPath, "dir/file2"), 'rb') as f:
+            self.assertEqual(f.read(), self.contents["dir/file2"])
+        # the chunks are whole blocks apart from the end of the members
+        # span, and only the corrupt block is fetched again
+        block = offset - offset % 64
+        chunks = sorted(self.bucket.rangeRequests)
+        chunks.remove((block, block + 63))
+        self.assertEqual(chunks[-1][1], a.centralDirOffset - 1)
+        for start, end in chunks:
+            self.assertEqual(start % 64, 0)
+        for start, end in chunks[:-1]:
+            self.assertEqual((end + 1) % 64, 0)
+        self.assertEqual(sum(end + 1 - start for start, end in chunks), a.centralDirOffset)
+
+    def test_checksum_verifies_the_blocks_a_range_covers(self):
+        a = RemoteZipArchive(self.bucket, "key", checksum=self.checksumArchive(256))
+        data = self.bucket.objects["key"]
+        del self.bucket.rangeRequests[:]
+        with patch.object(MockS3Object, "get", self.corruptingGet(300)):
+            self.assertEqual(a.fetchRange(200, 900), data[200:900])
+        # the range is not widened to whole blocks
+        self.assertEqual(self.bucket.rangeRequests, [(200, 899), (256, 511)])
+        self.assertEqual(a.fetchRange(len(data) - 10, len(data)), data[-10:])
+        self.assertEqual(self.bucket.rangeRequests[-1], (len(data) - 10, len(data) - 1))
+
+    def test_reads_zip64_end_records(self):
+        data = io.BytesIO()
+        with ZipStreamWriter(data, CompressionCodec.get("store")) as z:
+            for i in range(0x10000):
+                z.writestr("m{0}".format(i), "")
+        self.bucket.objects["key64"] = data.getvalue()
+        a = RemoteZipArchive(self.bucket, "key64")
+        self.assertEqual(len(a.members), 0x10000)
+        self.assertEqual(a.members[-1].name, "m65535")
+
+    def test_memberPath_drops_unsafe_components(self):
+        self.assertEqual(RemoteZipArchive.memberPath("d", "../../a/./b"),
+                         os.path.join("d", "a", "b"))
+        self.assertEqual(RemoteZipArchive.memberPath("d", "/abs"), os.path.join("d", "abs"))
+
+if __name__ == '__main__':
+    unittest.main()
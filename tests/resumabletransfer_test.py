@@ -0,0 +1,191 @@
+import unittest, os, shutil, io
+from mock import patch
+from resumabletransfer import ResumableUpload, ResumableDownload, TransferState
+from archivechecksum import ArchiveChecksum
+from s3interface_test import MockS3Bucket, MockS3Object, MockMultipartUpload
+
+class ResumableTransfer_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        os.makedirs(self.tempPath)
+        self.localPath = os.path.join(self.tempPath, "file")
+        self.statePath = os.path.join(self.tempPath, "transfers", "state.json")
+        self.contents = os.urandom(95)
+        with open(self.localPath, "wb") as f:
+            f.write(self.contents)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempPath)
+
+    def failingPart(self, failures):
+        """patch MockMultipartUpload.Part to fail the upload of the
+        specified part numbers, recording the parts uploaded"""
+        part = MockMultipartUpload.Part
+        uploaded = []
+        def Part(upload, partNumber):
+            if partNumber in failures:
+                raise IOError("connection lost")
+            uploaded.append(partNumber)
+            return part(upload, partNumber)
+        return patch.object(MockMultipartUpload, "Part", Part), uploaded
+
+    def failingGet(self, starts):
+        """patch MockS3Object.get to fail the ranged GETs starting at the
+        specified offsets"""
+        get = MockS3Object.get
+        def failingGet(obj, Range=None, IfMatch=None):
+            if int(Range[len("bytes="):].split("-")[0]) in starts:
+                raise IOError("connection lost")
+            return get(obj, Range, IfMatch)
+        return patch.object(MockS3Object, "get", failingGet)
+
+    def countingSave(self):
+        """patch TransferState.save to record the number of parts of each
+        state saved"""
+        save = TransferState.save
+        saved = []
+        def countingSave(state, values):
+            saved.append(len(values["Parts"]))
+            save(state, values)
+        return patch.object(TransferState, "save", countingSave), saved
+
+    def test_partSizeFor_respects_part_limit(self):
+        self.assertEqual(TransferState.partSizeFor(100, 10), 10)
+        self.assertEqual(TransferState.partSizeFor(1000001, 10, 10000), 101)
+
+    def test_upload_completes_and_removes_state(self):
+        bucket = MockS3Bucket("b")
+        ResumableUpload(bucket, "key", self.localPath, self.statePath, partSize=10,
+                        concurrency=3, metadata={"a": "b"}).run()
+        self.assertEqual(bucket.objects["key"], self.contents)
+        self.assertEqual(bucket.metadata["key"], {"a": "b"})
+        self.assertEqual(sorted(bucket.multipartUploads[0].parts), list(range(1, 11)))
+        self.assertFalse(os.path.exists(self.statePath))
+
+    def test_interrupted_upload_resumes_missing_parts(self):
+        bucket = MockS3Bucket("b")
+        patcher, uploaded = self.failingPart([3, 7])
+        with patcher:
+            upload = ResumableUpload(bucket, "key", self.localPath, self.statePath,
+                                     partSize=10, concurrency=2, tag=["t"])
+            self.assertRaises(IOError, upload.run)
+        self.assertFalse("key" in bucket.objects)
+        self.assertEqual(ResumableUpload.readTag(self.statePath), (["t"], self.localPath))
+
+        patcher, uploaded = self.failingPart([])
+        with patcher:
+            ResumableUpload(bucket, "key", self.localPath, self.statePath,
+                            partSize=10, concurrency=2).run()
+        self.assertEqual(sorted(uploaded), [3, 7])
+        self.assertEqual(len(bucket.multipartUploads), 1)
+        self.assertEqual(bucket.objects["key"], self.contents)
+        self.assertFalse(os.path.exists(self.statePath))
+
+    def test_upload_restarts_when_file_changes(self):
+        bucket = MockS3Bucket("b")
+        patcher, uploaded = self.failingPart([2])
+        with patcher:
+            upload = ResumableUpload(bucket, "key", self.localPath, self.statePath, partSize=10)
+            self.assertRaises(IOError, upload.run)
+        with open(self.localPath, "wb") as f:
+            f.write(b"changed" * 20)
+        ResumableUpload(bucket, "key", self.localPath, self.statePath, partSize=10).run()
+        self.assertEqual(len(bucket.multipartUploads), 2)
+        self.assertEqual([u.aborted for u in bucket.multipartUploads], [True, False])
+        self.assertEqual(bucket.objects["key"], b"changed" * 20)
+
+    def test_upload_restarts_when_interrupted_upload_no_longer_exists(self):
+        bucket = MockS3Bucket("b")
+        patcher, uploaded = self.failingPart([2])
+        with patcher:
+            upload = ResumableUpload(bucket, "key", self.localPath, self.statePath, partSize=10)
+            self.assertRaises(IOError, upload.run)
+        # eg. aborted by a bucket lifecycle rule
+        del bucket.multipartUploads[:]
+        ResumableUpload(bucket, "key", self.localPath, self.statePath, partSize=10).run()
+        self.assertEqual(bucket.objects["key"], self.contents)
+
+    def test_interrupted_download_resumes_missing_ranges(self):
+        bucket = MockS3Bucket("b")
+        bucket.objects["key"] = self.contents
+        destination = os.path.join(self.tempPath, "downloaded")
+        download = ResumableDownload(bucket, "key", destination, self.statePath,
+                                     partSize=10, concurrency=2)
+        with self.failingGet([20, 50, 60]):
+            self.assertRaises(IOError, download.run)
+        self.assertFalse(os.path.exists(destination))
+        self.assertEqual(sorted(TransferState(self.statePath).read()["Parts"]),
+                         [0, 1, 3, 4, 7, 8, 9])
+
+        del bucket.rangeRequests[:]
+        ResumableDownload(bucket, "key", destination, self.statePath,
+                          partSize=10, concurrency=2).run()
+        self.assertEqual(sorted(bucket.rangeRequests), [(20, 29), (50, 59), (60, 69)])
+        with open(destination, "rb") as f:
+            self.assertEqual(f.read(), self.contents)
+        self.assertFalse(os.path.exists(self.statePath))
+        self.assertFalse(os.path.exists(destination + ".partial"))
+
+    def test_download_with_checksum_refetches_corrupt_blocks(self):
+        bucket = MockS3Bucket("b")
+        bucket.objects["key"] = self.contents
+        checksum = ArchiveChecksum(20)
+        checksum.update(self.contents)
+        checksum.finish()
+        destination = os.path.join(self.tempPath, "downloaded")
+        get = MockS3Object.get
+        def corruptFirstGet(obj, Range=None, IfMatch=None):
+            response = get(obj, Range, IfMatch)
+            if len(bucket.rangeRequests) == 1:
+                response["Body"] = io.BytesIO(b"x" * 20 + self.contents[20:40])
+            return response
+        with patch.object(MockS3Object, "get", corruptFirstGet):
+            ResumableDownload(bucket, "key", destination, self.statePath, partSize=30,
+                              concurrency=1, checksum=checksum).run()
+        # parts are aligned to 40 byte blocks, and only the corrupt block
+        # of the first part is fetched again
+        self.assertEqual(bucket.rangeRequests, [(0, 39), (0, 19), (40, 79), (80, 94)])
+        with open(destination, "rb") as f:
+            self.assertEqual(f.read(), self.contents)
+
+    def test_download_restarts_when_object_changes(self):
+        bucket = MockS3Bucket("b")
+        bucket.objects["key"] = self.contents
+        destination = os.path.join(self.tempPath, "downloaded")
+        with self.failingGet([20]):
+            self.assertRaises(IOError, ResumableDownload(
+                bucket, "key", destination, self.statePath, partSize=10, concurrency=1).run)
+        self.assertEqual(len(TransferState(self.statePath).read()["Parts"]), 9)
+        bucket.objects["key"] = b"new contents" * 3
+        del bucket.rangeRequests[:]
+        ResumableDownload(bucket, "key", destination, self.statePath, partSize=10).run()
+        self.assertEqual(len(bucket.rangeRequests), 4)
+        with open(destination, "rb") as f:
+            self.assertEqual(f.read(), b"new contents" * 3)
+
+    def test_parts_are_checkpointed_at_most_every_interval(self):
+        bucket = MockS3Bucket("b")
+        bucket.objects["key"] = self.contents
+        destination = os.path.join(self.tempPath, "downloaded")
+        patcher, saved = self.countingSave()
+        with patcher, patch("os.fsync") as fsync:
+            ResumableUpload(bucket, "uploaded", self.localPath, self.statePath,
+                            partSize=10, concurrency=2).run()
+            ResumableDownload(bucket, "key", destination, self.statePath,
+                              partSize=10, concurrency=2).run()
+        # only the initial states, as the parts complete within interval
+        # seconds of them
+        self.assertEqual(saved, [0, 0])
+        # the partial file is synced once, before it is renamed
+        self.assertEqual(fsync.call_count, 1)
+        self.assertEqual(bucket.objects["uploaded"], self.contents)
+
+        patcher, saved = self.countingSave()
+        with patcher:
+            ResumableDownload(bucket, "key", destination, self.statePath,
+                              partSize=10, concurrency=1, checkpointInterval=0).run()
+        self.assertEqual(saved, list(range(11)))
+
+if __name__ == '__main__':
+    unittest.main()
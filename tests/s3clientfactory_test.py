@@ -0,0 +1,76 @@
+import unittest, sys, types, threading, argparse
+from mock import patch, Mock
+from s3clientfactory import S3ClientFactory
+
+class S3ClientFactory_Test(unittest.TestCase):
+
+    def setUp(self):
+        S3ClientFactory.reset()
+        self.defaultPoolSize = S3ClientFactory.maxPoolConnections
+        self.sessions = []
+        test = self
+        boto3 = types.ModuleType("boto3")
+        boto3.session = types.ModuleType("boto3.session")
+        class Session(object):
+            def __init__(self):
+                test.sessions.append(self)
+            def resource(self, name, config):
+                return ("resource", name, config)
+        boto3.session.Session = Session
+        config = types.ModuleType("botocore.config")
+        config.Config = lambda **kwargs: kwargs
+        self.modules = patch.dict(sys.modules, {
+            "boto3": boto3, "boto3.session": boto3.session,
+            "botocore": types.ModuleType("botocore"), "botocore.config": config })
+        self.modules.start()
+
+    def tearDown(self):
+        self.modules.stop()
+        S3ClientFactory.reset()
+        S3ClientFactory.maxPoolConnections = self.defaultPoolSize
+
+    def test_resource_is_shared(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(S3ClientFactory.resource()))
+                   for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(self.sessions), 1)
+        self.assertTrue(all(r is results[0] for r in results))
+        self.assertEqual(results[0], ("resource", "s3", {"max_pool_connections": 50}))
+
+    def test_configure_pool_size(self):
+        parser = argparse.ArgumentParser()
+        S3ClientFactory.addArguments(parser)
+        resource = S3ClientFactory.FromArguments(vars(parser.parse_args(["--maxPoolConnections", "128"])))
+        self.assertEqual(resource[2], {"max_pool_connections": 128})
+        self.assertRaises(ValueError, lambda: S3ClientFactory.configure(10))
+        S3ClientFactory.reset()
+        self.assertRaises(ValueError, lambda: S3ClientFactory.configure(0))
+
+    def test_local_resource_from_arguments(self):
+        from local_s3 import LocalS3
+        parser = argparse.ArgumentParser()
+        S3ClientFactory.addArguments(parser)
+        resource = S3ClientFactory.FromArguments(vars(parser.parse_args(
+            ["--localS3Dir", "buckets", "--localS3Latency", "0.01",
+             "--localS3BytesPerSecond", "1000000"])))
+        self.assertIsInstance(resource, LocalS3)
+        self.assertEqual((resource.rootDir, resource.link.latency, resource.link.bytesPerSecond),
+                         ("buckets", 0.01, 1000000))
+        self.assertTrue(S3ClientFactory.resource() is resource)
+        self.assertEqual(self.sessions, [])
+        self.assertRaises(ValueError, lambda: S3ClientFactory.configureLocal("other"))
+
+    def test_s3interface_uses_shared_resource(self):
+        from s3interface import S3Interface
+        resource = Mock()
+        with patch.object(S3ClientFactory, "resource", return_value=resource):
+            s = S3Interface(None, "bucket", "temp")
+        resource.Bucket.assert_called_once_with("bucket")
+        self.assertEqual(s.bucket, resource.Bucket.return_value)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,9 @@
-import unittest, os, shutil, glob
+import unittest, os, shutil, glob, io, zipfile, sys, types, hashlib, json, threading
+from mock import patch
 from s3interface import S3Interface
+from transfersettings import TransferSettings
+from documentcache import DocumentCache
+from transferscheduler import TransferScheduler
 
 class MockS3Resource(object):
 
@@ -9,10 +13,115 @@ class MockS3Resource(object):
     def Bucket(self, name):
         return self.bucket_method(name);
 
+class MockMultipartUpload(object):
+
+    def __init__(self, bucket, key):
+        self.bucket = bucket
+        self.key = key
+        self.id = "upload{0}".format(len(bucket.multipartUploads) + 1)
+        self.parts = {}
+        self.aborted = False
+
+    def Part(self, partNumber):
+        upload = self
+        class Part(object):
+            def upload(self, Body):
+                upload.parts[partNumber] = Body
+                return {"ETag": "etag{0}".format(partNumber)}
+        return Part()
+
+    def complete(self, MultipartUpload):
+        parts = MultipartUpload["Parts"]
+        assert [p["PartNumber"] for p in parts] == sorted(self.parts.keys())
+        self.bucket.objects[self.key] = b"".join(
+            self.parts[p["PartNumber"]] for p in parts)
+
+    def abort(self):
+        self.aborted = True
+
+class MockS3Object(object):
+
+    def __init__(self, bucket, key):
+        self.bucket = bucket
+        self.key = key
+
+    def __head(self):
+        # as boto3, an Object is loaded by one HEAD request
+        if not getattr(self, "loaded", False):
+            self.bucket.headRequests.append(self.key)
+            self.loaded = True
+        if self.key not in self.bucket.objects:
+            error = Exception("Not Found")
+            error.response = {"Error": {"Code": "404"}}
+            raise error
+
+    @property
+    def content_length(self):
+        self.__head()
+        return len(self.bucket.objects[self.key])
+
+    def get(self, Range=None, IfMatch=None):
+        # as S3, the condition is evaluated by the GET itself
+        if IfMatch is not None and \
+           IfMatch != '"{0}"'.format(hashlib.md5(self.bucket.objects[self.key]).hexdigest()):
+            error = Exception("Precondition Failed")
+            error.response = {"Error": {"Code": "PreconditionFailed"}}
+            raise error
+        if Range is None:
+            data = self.bucket.objects[self.key]
+            return {"Body": io.BytesIO(data), "ContentLength": len(data),
+                    "Metadata": self.bucket.metadata.get(self.key, {})}
+        start, end = Range[len("bytes="):].split("-")
+        self.bucket.rangeRequests.append((int(start), int(end)))
+        return {"Body": io.BytesIO(self.bucket.objects[self.key][int(start):int(end) + 1])}
+
+    @property
+    def metadata(self):
+        self.__head()
+        return self.bucket.metadata.get(self.key, {})
+
+    @property
+    def e_tag(self):
+        self.__head()
+        return '"{0}"'.format(hashlib.md5(self.bucket.objects[self.key]).hexdigest())
+
+    def delete(self):
+        self.bucket.objects.pop(self.key, None)
+        self.bucket.metadata.pop(self.key, None)
+
+    def put(self, Body, Metadata=None):
+        self.bucket.objects[self.key] = Body
+        if Metadata is not None:
+            self.bucket.metadata[self.key] = Metadata
+
+    def initiate_multipart_upload(self, Metadata=None):
+        if Metadata is not None:
+            self.bucket.metadata[self.key] = Metadata
+        upload = MockMultipartUpload(self.bucket, self.key)
+        self.bucket.multipartUploads.append(upload)
+        return upload
+
+    def MultipartUpload(self, id):
+        for upload in self.bucket.multipartUploads:
+            if upload.id == id and upload.key == self.key:
+                return upload
+        error = Exception("No Such Upload")
+        error.response = {"Error": {"Code": "NoSuchUpload"}}
+        raise error
+
 class MockS3Bucket(object):
 
     def __init__(self, name):
         self.name = name
+        self.objects = {}
+        self.multipartUploads = []
+        self.rangeRequests = []
+        self.headRequests = []
+        self.metadata = {}
+        self.transferConfigs = []
+
+    def Object(self, key):
+        return MockS3Object(self, key)
 
     def bind_download_file_method(self, method):
         self.download_file_method = method
@@ -20,10 +129,14 @@ class MockS3Bucket(object):
     def bind_upload_file_method(self, method):
         self.upload_file_method = method
 
-    def download_file(self, keyName, localPath):
+    def download_file(self, keyName, localPath, Config=None, Callback=None):
+        self.transferConfigs.append(Config)
         self.download_file_method(keyName, localPath)
 
-    def upload_file(self, localPath, keyName):
+    def upload_file(self, localPath, keyName, ExtraArgs=None, Config=None, Callback=None):
+        self.transferConfigs.append(Config)
+        if ExtraArgs is not None:
+            self.metadata[keyName] = ExtraArgs["Metadata"]
         self.upload_file_method(localPath, keyName)
 
 class S3Interface_Test(unittest.TestCase):
@@ -226,5 +339,657 @@ class S3Interface_Test(unittest.TestCase):
         finally:
             shutil.rmtree(tempPath)
 
+    def test_uploadCompressedStreamDirectory(self):
+        tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        compressPath = os.path.join(tempPath, "compress")
+        extractPath = os.path.join(tempPath, "extract")
+
+        m = MockS3Resource()
+        m.bind_bucket_method(lambda name: MockS3Bucket(name))
+        s = S3Interface(m, "b", tempPath)
+        s.multipartPartSize = 1024
+        os.makedirs(os.path.join(compressPath, "sub"))
+        os.makedirs(os.path.join(compressPath, "empty"))
+        os.makedirs(extractPath)
+        try:
+            for i in range(1,10):
+                with open(os.path.join(compressPath, "sub", "tempfile{0}".format(i)), 'wb') as f:
+                    f.write(os.urandom(300 * i))
+            s.uploadCompressed("keyPrefix", "docName", compressPath, streaming=True)
+
+            # no temporary archive was written
+            self.assertEqual(sorted(os.listdir(tempPath)), ["compress", "extract"])
+            upload = s.bucket.multipartUploads[0]
+            self.assertTrue(len(upload.parts) > 1)
+            archive = os.path.join(tempPath, "docName.zip")
+            with open(archive, 'wb') as f:
+                f.write(s.bucket.objects["keyPrefix/docName.zip"])
+            s.unpackFileOrDirectory(archive, extractPath)
+            self.assertTrue(os.path.isdir(os.path.join(extractPath, "empty")))
+            for i in range(1,10):
+                name = os.path.join("sub", "tempfile{0}".format(i))
+                with open(os.path.join(compressPath, name), 'rb') as expected:
+                    with open(os.path.join(extractPath, name), 'rb') as actual:
+                        self.assertEqual(expected.read(), actual.read())
+        finally:
+            shutil.rmtree(tempPath)
+
+    def test_uploadCompressedStreamFile(self):
+        tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        extractPath = os.path.join(tempPath, "extract")
+
+        m = MockS3Resource()
+        m.bind_bucket_method(lambda name: MockS3Bucket(name))
+        s = S3Interface(m, "b", tempPath)
+        os.makedirs(extractPath)
+        try:
+            fn = os.path.join(tempPath, "tempfile")
+            with open(fn, 'w') as f:
+                f.write("testfile contents")
+            s.uploadCompressed("keyPrefix", "docName", fn, streaming=True)
+            archive = os.path.join(tempPath, "docName.zip")
+            with open(archive, 'wb') as f:
+                f.write(s.bucket.objects["keyPrefix/docName.zip"])
+            s.unpackFileOrDirectory(archive, os.path.join(extractPath, "renamed"))
+            with open(os.path.join(extractPath, "renamed"), 'r') as f:
+                self.assertEqual(f.read(), "testfile contents")
+        finally:
+            shutil.rmtree(tempPath)
+
+    def test_uploadCompressedStreamAbortsOnError(self):
+        tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        m = MockS3Resource()
+        m.bind_bucket_method(lambda name: MockS3Bucket(name))
+        s = S3Interface(m, "b", tempPath)
+        os.makedirs(tempPath)
+        try:
+            fn = os.path.join(tempPath, "tempfile")
+            with open(fn, 'w') as f:
+                f.write("testfile contents")
+            def fail(*args, **kwargs):
+                raise IOError("connection lost")
+            original = MockMultipartUpload.Part
+            MockMultipartUpload.Part = lambda self, n: type("P", (), {"upload": fail})()
+            try:
+                self.assertRaises(IOError,
+                    lambda: s.uploadCompressed("keyPrefix", "docName", fn, streaming=True))
+            finally:
+                MockMultipartUpload.Part = original
+            self.assertTrue(s.bucket.multipartUploads[0].aborted)
+            self.assertFalse("keyPrefix/docName.zip" in s.bucket.objects)
+        finally:
+            shutil.rmtree(tempPath)
+
+    def putArchive(self, s, path, keyName, compression="deflate"):
+        archive = s.archiveFileOrDirectory(path, "archive", compression)
+        with open(archive, 'rb') as f:
+            s.bucket.objects[keyName] = f.read()
+        os.remove(archive)
+
+    def test_downloadCompressedPipelinedDirectory(self):
+        tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        compressPath = os.path.join(tempPath, "compress")
+        extractPath = os.path.join(tempPath, "extract")
+
+        m = MockS3Resource()
+        m.bind_bucket_method(lambda name: MockS3Bucket(name))
+        s = S3Interface(m, "b", tempPath)
+        s.rangeChunkSize = 500
+        s.rangeConcurrency = 3
+        os.makedirs(os.path.join(compressPath, "empty"))
+        try:
+            for i in range(1,10):
+                subdir = os.path.join(compressPath, str(i))
+                os.makedirs(subdir)
+                with open(os.path.join(subdir, "tempfile{0}".format(i)), 'wb') as f:
+                    f.write(os.urandom(200 * i))
+            self.putArchive(s, compressPath, "keyPrefix/docName.zip")
+            size = s.downloadCompressed("keyPrefix", "docName", extractPath, pipelined=True)
+
+            self.assertEqual(size, len(s.bucket.objects["keyPrefix/docName.zip"]))
+            self.assertTrue(len(s.bucket.rangeRequests) > 2)
+            self.assertTrue(all(end - start < 500 for start, end in s.bucket.rangeRequests[1:]))
+            self.assertTrue(os.path.isdir(os.path.join(extractPath, "empty")))
+            for i in range(1,10):
+                name = os.path.join(str(i), "tempfile{0}".format(i))
+                with open(os.path.join(compressPath, name), 'rb') as expected:
+                    with open(os.path.join(extractPath, name), 'rb') as actual:
+                        self.assertEqual(expected.read(), actual.read())
+            # nothing was staged in the temp dir
+            self.assertEqual(sorted(os.listdir(tempPath)), ["compress", "extract"])
+        finally:
+            shutil.rmtree(tempPath)
+
+    def test_downloadCompressedPipelinedFile(self):
+        tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        extractPath = os.path.join(tempPath, "extract")
+
+        m = MockS3Resource()
+        m.bind_bucket_method(lambda name: MockS3Bucket(name))
+        s = S3Interface(m, "b", tempPath)
+        os.makedirs(extractPath)
+        try:
+            fn = os.path.join(tempPath, "tempfile")
+            with open(fn, 'w') as f:
+                f.write("testfile contents")
+            self.putArchive(s, fn, "keyPrefix/docName.zip")
+            s.downloadCompressed("keyPrefix", "docName",
+                                 os.path.join(extractPath, "renamed"), pipelined=True)
+            self.assertEqual(os.listdir(extractPath), ["renamed"])
+            with open(os.path.join(extractPath, "renamed"), 'r') as f:
+                self.assertEqual(f.read(), "testfile contents")
+        finally:
+            shutil.rmtree(tempPath)
+
+    def test_downloadMembersFetchesOnlyMatchingMembers(self):
+        tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        compressPath = os.path.join(tempPath, "compress")
+        extractPath = os.path.join(tempPath, "extract")
+
+        m = MockS3Resource()
+        m.bind_bucket_method(lambda name: MockS3Bucket(name))
+        s = S3Interface(m, "b", tempPath)
+        s.compressionWorkers = 1
+        os.makedirs(os.path.join(compressPath, "data"))
+        try:
+            for i in range(10):
+                ext = "csv" if i in [3, 7] else "bin"
+                with open(os.path.join(compressPath, "data", "f{0}.{1}".format(i, ext)), 'wb') as f:
+                    f.write(os.urandom(100000))
+            self.putArchive(s, compressPath, "keyPrefix/docName.zip")
+            self.assertEqual(len(s.listDocumentMembers("keyPrefix", "docName")), 12)
+            size = s.downloadDocument("keyPrefix", {"Name": "docName"}, extractPath,
+                                      include=["data/*.csv"])
+            self.assertEqual(sorted(os.listdir(os.path.join(extractPath, "data"))),
+                             ["f3.csv", "f7.csv"])
+            for name in ["f3.csv", "f7.csv"]:
+                with open(os.path.join(compressPath, "data", name), 'rb') as expected:
+                    with open(os.path.join(extractPath, "data", name), 'rb') as actual:
+                        self.assertEqual(expected.read(), actual.read())
+            self.assertTrue(size < len(s.bucket.objects["keyPrefix/docName.zip"]) / 2)
+        finally:
+            shutil.rmtree(tempPath)
+
+    def test_transfersUseEffectiveTransferSettings(self):
+        m = MockS3Resource()
+        m.bind_bucket_method(lambda name: MockS3Bucket(name))
+        s = S3Interface(m, "b", "temp")
+        s.bucket.bind_upload_file_method(lambda localPath, keyName: None)
+        s.bucket.bind_download_file_method(lambda keyName, localPath: None)
+        transfer = types.ModuleType("boto3.s3.transfer")
+        transfer.TransferConfig = lambda **kwargs: kwargs
+        with patch.dict(sys.modules, {"boto3": types.ModuleType("boto3"),
+                                      "boto3.s3": types.ModuleType("boto3.s3"),
+                                      "boto3.s3.transfer": transfer}):
+            s.uploadFile("a", "b")
+            s.transferSettings = TransferSettings({"MaxConcurrency": 20})
+            s.downloadFile("b", "a")
+            s.uploadFile("a", "b", transferSettings=s.documentTransferSettings(
+                {"Name": "doc", "TransferSettings": {"MultipartChunkSize": 1024}}))
+        self.assertIsNone(s.bucket.transferConfigs[0])
+        self.assertEqual(s.bucket.transferConfigs[1]["max_concurrency"], 20)
+        self.assertEqual(s.bucket.transferConfigs[1]["multipart_chunksize"], 8 * 1024 * 1024)
+        self.assertEqual(s.bucket.transferConfigs[2]["max_concurrency"], 20)
+        self.assertEqual(s.bucket.transferConfigs[2]["multipart_chunksize"], 1024)
+        self.assertIs(s.documentTransferSettings({"Name": "doc"}), s.transferSettings)
+
+    def test_downloadDocumentUsesDocumentCache(self):
+        tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        compressPath = os.path.join(tempPath, "compress")
+
+        m = MockS3Resource()
+        m.bind_bucket_method(lambda name: MockS3Bucket(name))
+        s = S3Interface(m, "b", tempPath)
+        os.makedirs(os.path.join(compressPath, "sub"))
+        try:
+            s.documentCache = DocumentCache(os.path.join(tempPath, "cache"), 1024 * 1024)
+            with open(os.path.join(compressPath, "sub", "file"), 'w') as f:
+                f.write("contents 1")
+            self.putArchive(s, compressPath, "p/doc.zip")
+            downloads = []
+            def download(keyName, localPath):
+                downloads.append(keyName)
+                with open(localPath, 'wb') as f:
+                    f.write(s.bucket.objects[keyName])
+            s.bucket.bind_download_file_method(download)
+            self.assertFalse(s.stagesArchive({"Name": "doc"}))
+
+            for i in range(2):
+                destination = os.path.join(tempPath, "out{0}".format(i))
+                size = s.downloadDocument("p", {"Name": "doc"}, destination)
+                with open(os.path.join(destination, "sub", "file")) as f:
+                    self.assertEqual(f.read(), "contents 1")
+            self.assertEqual(downloads, ["p/doc.zip"])
+            self.assertEqual(size, 0)
+
+            # a changed object has a new ETag, so it is downloaded again
+            with open(os.path.join(compressPath, "sub", "file"), 'w') as f:
+                f.write("contents 2")
+            self.putArchive(s, compressPath, "p/doc.zip")
+            s.downloadDocument("p", {"Name": "doc"}, os.path.join(tempPath, "out2"))
+            with open(os.path.join(tempPath, "out2", "sub", "file")) as f:
+                self.assertEqual(f.read(), "contents 2")
+            self.assertEqual(len(downloads), 2)
+            self.assertRaises(ValueError, lambda: s.downloadDocument(
+                "p", {"Name": "missing"}, os.path.join(tempPath, "out3")))
+        finally:
+            shutil.rmtree(tempPath)
+
+    def test_getMetadataReturnsNoneForMissingObject(self):
+        m = MockS3Resource()
+        m.bind_bucket_method(lambda name: MockS3Bucket(name))
+        s = S3Interface(m, "b", "temp")
+        self.assertIsNone(s.getMetadata("missing"))
+        s.bucket.objects["key"] = b""
+        s.bucket.metadata["key"] = {"a": "b"}
+        self.assertEqual(s.getMetadata("key"), {"a": "b"})
+
+    def test_uploadCompressedSkipsUnchangedDocument(self):
+        tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        compressPath = os.path.join(tempPath, "compress")
+
+        m = MockS3Resource()
+        m.bind_bucket_method(lambda name: MockS3Bucket(name))
+        s = S3Interface(m, "b", tempPath)
+        os.makedirs(compressPath)
+        try:
+            uploads = []
+            def upload(localPath, keyName):
+                with open(localPath, 'rb') as f:
+                    s.bucket.objects[keyName] = f.read()
+                uploads.append(keyName)
+            s.bucket.bind_upload_file_method(upload)
+            for i in range(1,5):
+                with open(os.path.join(compressPath,"tempfile{0}".format(i)), 'w') as f:
+                    f.write("testfile contents {0}".format(i))
+
+            s.uploadCompressed("keyPrefix", "docName", compressPath, skipUnchanged=True)
+            self.assertEqual(uploads, ["keyPrefix/docName.zip"])
+            self.assertTrue("fingerprint" in s.bucket.metadata["keyPrefix/docName.zip"])
+            self.assertTrue(os.path.exists(os.path.join(tempPath, "fingerprints", "docName.json")))
+
+            s.uploadCompressed("keyPrefix", "docName", compressPath, skipUnchanged=True)
+            self.assertEqual(len(uploads), 1)
+
+            with open(os.path.join(compressPath,"tempfile2"), 'w') as f:
+                f.write("changed contents")
+            s.uploadCompressed("keyPrefix", "docName", compressPath, skipUnchanged=True)
+            self.assertEqual(len(uploads), 2)
+
+            # a streamed upload records the fingerprint too
+            os.remove(os.path.join(compressPath,"tempfile3"))
+            s.uploadCompressed("keyPrefix", "docName", compressPath, streaming=True,
+                               skipUnchanged=True)
+            s.uploadCompressed("keyPrefix", "docName", compressPath, skipUnchanged=True)
+            self.assertEqual(len(uploads), 2)
+            self.assertEqual(len(s.bucket.multipartUploads), 1)
+
+            # changing the compression setting uploads the document again
+            s.uploadCompressed("keyPrefix", "docName", compressPath, skipUnchanged=True,
+                               compression="store")
+            self.assertEqual(len(uploads), 3)
+            self.assertEqual(s.bucket.metadata["keyPrefix/docName.zip"]["compression"], "store")
+        finally:
+            shutil.rmtree(tempPath)
+
+    def test_uploadDocumentAndDownloadDocumentDispatchOnMode(self):
+        m = MockS3Resource()
+        m.bind_bucket_method(lambda name: MockS3Bucket(name))
+        s = S3Interface(m, "b", "temp")
+        calls = []
+        s.uploadCompressed = lambda *args, **kwargs: calls.append(("uploadCompressed", args, kwargs))
+        s.downloadCompressed = lambda *args, **kwargs: calls.append(("downloadCompressed", args, kwargs))
+        s.uploadDocument("p", {"Name": "a", "StreamingUpload": True, "Compression": "bzip2"},
+                         "path", skipUnchanged=True)
+        s.downloadDocument("p", {"Name": "a", "PipelinedDownload": True,
+                                 "TransferSettings": {"MaxConcurrency": 4}}, "path")
+        settings = calls[1][2].pop("transferSettings")
+        self.assertEqual(settings.values["MaxConcurrency"], 4)
+        self.assertEqual(calls, [
+            ("uploadCompressed", ("p", "a", "path"),
+             {"streaming": True, "skipUnchanged": True, "compression": "bzip2",
+              "transferSettings": None, "shardSize": None, "maxShards": None}),
+            ("downloadCompressed", ("p", "a", "path"), {"pipelined": True})])
+        self.assertTrue(s.stagesArchive({"Name": "a"}))
+        self.assertFalse(s.stagesArchive({"Name": "a", "PipelinedDownload": True}))
+        self.assertFalse(s.stagesArchive({"Name": "a", "Mode": "Sync"}))
+
+    def test_documentTransfersAreScheduledWithDocumentPriority(self):
+        m = MockS3Resource()
+        m.bind_bucket_method(lambda name: MockS3Bucket(name))
+        s = S3Interface(m, "b", "temp")
+        s.scheduler = TransferScheduler(maxInFlight=1, bytesPerSecond=10 ** 9)
+        calls = []
+        s.bucket.bind_upload_file_method(
+            lambda localPath, keyName: calls.append((keyName, s.scheduler.current(),
+                                                     s.scheduler.inFlight)))
+        s.uploadCompressed = lambda *args, **kwargs: s.uploadFile("path", "doc")
+        s.downloadCompressed = lambda *args, **kwargs: s.uploadFile("path", "out")
+        s.uploadDocument("p", {"Name": "a", "Direction": "LocalToAWS"}, "path")
+        s.downloadDocument("p", {"Name": "b", "Direction": "AWSToLocal"}, "path")
+        s.uploadFile("path", "log")
+        self.assertEqual(calls, [
+            ("doc", (TransferScheduler.INPUT, "a"), 1),
+            ("out", (TransferScheduler.OUTPUT, "b"), 1),
+            ("log", (TransferScheduler.STATUS, None), 1)])
+        self.assertEqual(s.scheduler.inFlight, 0)
+
+    def test_interruptedCompressedUploadResumesWithExistingArchive(self):
+        tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        compressPath = os.path.join(tempPath, "compress")
+        extractPath = os.path.join(tempPath, "extract")
+        m = MockS3Resource()
+        m.bind_bucket_method(lambda name: MockS3Bucket(name))
+        s = S3Interface(m, "b", tempPath)
+        s.resumableThreshold = 0
+        s.transferSettings = TransferSettings({"MultipartChunkSize": 1000})
+        os.makedirs(compressPath)
+        try:
+            with open(os.path.join(compressPath, "data"), "wb") as f:
+                f.write(os.urandom(5000))
+            archived = []
+            archive = s.archiveFileOrDirectory
+            s.archiveFileOrDirectory = lambda *args: archived.append(args) or archive(*args)
+            with patch("os.fsync"), patch.object(MockMultipartUpload, "complete",
+                                                 side_effect=IOError("connection lost")):
+                self.assertRaises(IOError, lambda: s.uploadCompressed("p", "doc", compressPath))
+            parts = dict(s.bucket.multipartUploads[0].parts)
+            s.uploadCompressed("p", "doc", compressPath)
+            self.assertEqual(len(archived), 1)
+            self.assertEqual(len(s.bucket.multipartUploads), 1)
+            self.assertEqual(s.bucket.multipartUploads[0].parts, parts)
+            self.assertEqual(os.listdir(os.path.join(tempPath, "transfers")), [])
+
+            # a modified document is archived again
+            with open(os.path.join(compressPath, "data2"), "wb") as f:
+                f.write(b"more")
+            with patch.object(MockMultipartUpload, "complete",
+                              side_effect=IOError("connection lost")):
+                self.assertRaises(IOError, lambda: s.uploadCompressed("p", "doc", compressPath))
+            os.remove(os.path.join(compressPath, "data2"))
+            s.uploadCompressed("p", "doc", compressPath)
+            self.assertEqual(len(archived), 3)
+
+            s.downloadCompressed("p", "doc", extractPath)
+            with open(os.path.join(extractPath, "data"), "rb") as f:
+                with open(os.path.join(compressPath, "data"), "rb") as g:
+                    self.assertEqual(f.read(), g.read())
+        finally:
+            shutil.rmtree(tempPath)
+
+    def test_failedCompressedUploadRemovesArchive(self):
+        tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        compressPath = os.path.join(tempPath, "compress")
+        m = MockS3Resource()
+        m.bind_bucket_method(lambda name: MockS3Bucket(name))
+        s = S3Interface(m, "b", tempPath)
+        s.checksumBlockSize = 1000
+        def upload(localPath, keyName):
+            raise IOError("connection lost")
+        s.bucket.bind_upload_file_method(upload)
+        os.makedirs(compressPath)
+        try:
+            with open(os.path.join(compressPath, "data"), "wb") as f:
+                f.write(os.urandom(5000))
+            self.assertRaises(IOError, lambda: s.uploadCompressed("p", "doc", compressPath))
+            self.assertEqual(sorted(os.listdir(tempPath)), ["compress", "transfers"])
+            self.assertEqual(os.listdir(os.path.join(tempPath, "transfers")), [])
+        finally:
+            shutil.rmtree(tempPath)
+
+    def test_tarDocumentRoundTrip(self):
+        tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        compressPath = os.path.join(tempPath, "compress")
+        extractPath = os.path.join(tempPath, "extract")
+        m = MockS3Resource()
+        m.bind_bucket_method(lambda name: MockS3Bucket(name))
+        s = S3Interface(m, "b", tempPath)
+        s.multipartPartSize = 1024
+        s.checksumBlockSize = 1000
+        def upload(localPath, keyName):
+            with open(localPath, 'rb') as f:
+                s.bucket.objects[keyName] = f.read()
+        s.bucket.bind_upload_file_method(upload)
+        os.makedirs(os.path.join(compressPath, "sub"))
+        try:
+            for i in range(1,5):
+                with open(os.path.join(compressPath, "sub", "tempfile{0}".format(i)), 'wb') as f:
+                    f.write(os.urandom(1000 * i))
+            for streaming in [False, True]:
+                document = {"Name": "docName", "Format": "tar", "StreamingUpload": streaming,
+                            "Compression": "deflate:1"}
+                s.uploadDocument("keyPrefix", document, compressPath)
+                self.assertEqual(sorted(os.listdir(tempPath)), ["compress"])
+                self.assertEqual(sorted(s.bucket.objects),
+                                 ["keyPrefix/docName.tar", "keyPrefix/docName.tar.checksum.json"])
+                metadata = dict(s.bucket.metadata["keyPrefix/docName.tar"])
+                self.assertTrue("checksum" in metadata)
+                del metadata["checksum"]
+                self.assertEqual(metadata, {"compression": "deflate:1", "content": "directory"})
+                self.assertFalse(s.stagesArchive(document))
+                size = s.downloadDocument("keyPrefix", document, extractPath)
+                self.assertEqual(size, len(s.bucket.objects["keyPrefix/docName.tar"]))
+                for i in range(1,5):
+                    name = os.path.join("sub", "tempfile{0}".format(i))
+                    with open(os.path.join(compressPath, name), 'rb') as expected:
+                        with open(os.path.join(extractPath, name), 'rb') as actual:
+                            self.assertEqual(expected.read(), actual.read())
+                shutil.rmtree(extractPath)
+            self.assertEqual(len(s.bucket.multipartUploads), 1)
+
+            # a single file is recorded in the metadata rather than the stream
+            filePath = os.path.join(compressPath, "sub", "tempfile1")
+            s.uploadTarStream("keyPrefix", "file", filePath, skipUnchanged=True)
+            self.assertEqual(s.bucket.metadata["keyPrefix/file.tar"]["content"], "file")
+            s.downloadTarStream("keyPrefix", "file", os.path.join(extractPath, "renamed"))
+            with open(filePath, 'rb') as expected:
+                with open(os.path.join(extractPath, "renamed"), 'rb') as actual:
+                    self.assertEqual(expected.read(), actual.read())
+            s.bucket.objects["keyPrefix/file.tar"] = b"unchanged"
+            s.uploadTarStream("keyPrefix", "file", filePath, skipUnchanged=True)
+            self.assertEqual(s.bucket.objects["keyPrefix/file.tar"], b"unchanged")
+        finally:
+            shutil.rmtree(tempPath)
+
+    def test_downloadTarStreamRepairsCorruptBlocksWithOneRequestSlot(self):
+        tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        compressPath = os.path.join(tempPath, "compress")
+        extractPath = os.path.join(tempPath, "extract")
+        m = MockS3Resource()
+        m.bind_bucket_method(lambda name: MockS3Bucket(name))
+        s = S3Interface(m, "b", tempPath)
+        s.checksumBlockSize = 1000
+        s.multipartPartSize = 1024
+        s.scheduler = TransferScheduler(maxInFlight=1)
+        os.makedirs(compressPath)
+        try:
+            contents = os.urandom(5000)
+            with open(os.path.join(compressPath, "data"), 'wb') as f:
+                f.write(contents)
+            s.uploadTarStream("p", "doc", compressPath, streaming=True, compression="store")
+            get = MockS3Object.get
+            def corruptGet(obj, Range=None, IfMatch=None):
+                response = get(obj, Range, IfMatch)
+                if Range is None and obj.key == "p/doc.tar":
+                    data = response["Body"].read()
+                    response["Body"] = io.BytesIO(data[:2500] + b"corrupt" + data[2507:])
+                return response
+            errors = []
+            def download():
+                try:
+                    s.downloadTarStream("p", "doc", extractPath)
+                except Exception as ex:
+                    errors.append(ex)
+            with patch.object(MockS3Object, "get", corruptGet):
+                thread = threading.Thread(target=download)
+                thread.daemon = True
+                thread.start()
+                thread.join(10)
+            self.assertFalse(thread.is_alive())
+            self.assertEqual(errors, [])
+            self.assertEqual(s.bucket.rangeRequests, [(2000, 2999)])
+            self.assertEqual(s.scheduler.inFlight, 0)
+            with open(os.path.join(extractPath, "data"), 'rb') as f:
+                self.assertEqual(f.read(), contents)
+        finally:
+            shutil.rmtree(tempPath)
+
+    def test_downloadCompressedRefetchesOnlyCorruptRanges(self):
+        tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        compressPath = os.path.join(tempPath, "compress")
+        extractPath = os.path.join(tempPath, "extract")
+        m = MockS3Resource()
+        m.bind_bucket_method(lambda name: MockS3Bucket(name))
+        s = S3Interface(m, "b", tempPath)
+        s.checksumBlockSize = 1000
+        s.multipartPartSize = 2048
+        def upload(localPath, keyName):
+            with open(localPath, 'rb') as f:
+                s.bucket.objects[keyName] = f.read()
+        get = MockS3Object.get
+        def corruptGet(obj, Range=None, IfMatch=None):
+            response = get(obj, Range, IfMatch)
+            if Range is not None and Range.startswith("bytes=0-"):
+                data = response["Body"].read()
+                response["Body"] = io.BytesIO(data[:2500] + b"corrupt" + data[2507:])
+            return response
+        s.bucket.bind_upload_file_method(upload)
+        os.makedirs(compressPath)
+        try:
+            contents = os.urandom(8000)
+            with open(os.path.join(compressPath, "data"), 'wb') as f:
+                f.write(contents)
+            for streaming in [False, True]:
+                s.uploadCompressed("p", "doc", compressPath, streaming=streaming,
+                                   compression="store")
+                metadata = s.bucket.metadata["p/doc.zip"]
+                self.assertEqual(json.loads(s.bucket.objects["p/doc.zip.checksum.json"]
+                                            .decode("utf-8"))["Id"], metadata["checksum"])
+                del s.bucket.rangeRequests[:]
+                # archives stored with checksums are verified whether or not
+                # checksums are stored by this interface
+                s.checksumBlockSize = None
+                with patch.object(MockS3Object, "get", corruptGet):
+                    s.downloadCompressed("p", "doc", extractPath)
+                s.checksumBlockSize = 1000
+                # the archive is verified as its ranges arrive, without
+                # checkpoints, and only the corrupt block is fetched again
+                size = len(s.bucket.objects["p/doc.zip"])
+                self.assertEqual(s.bucket.rangeRequests, [(0, size - 1), (2000, 2999)])
+                self.assertEqual(glob.glob(os.path.join(tempPath, "transfers", "*.download.json")),
+                                 [])
+                with open(os.path.join(extractPath, "data"), 'rb') as f:
+                    self.assertEqual(f.read(), contents)
+                shutil.rmtree(extractPath)
+
+            # pipelined downloads verify the ranges they fetch
+            get = MockS3Object.get
+            corrupted = []
+            def corruptGet(obj, Range=None, IfMatch=None):
+                response = get(obj, Range, IfMatch)
+                if Range == "bytes=2000-2999" and not corrupted:
+                    corrupted.append(Range)
+                    response["Body"] = io.BytesIO(b"corrupt" + response["Body"].read()[7:])
+                return response
+            s.rangeChunkSize = 1000
+            with patch.object(MockS3Object, "get", corruptGet):
+                s.downloadCompressed("p", "doc", extractPath, pipelined=True)
+            self.assertEqual(corrupted, ["bytes=2000-2999"])
+            with open(os.path.join(extractPath, "data"), 'rb') as f:
+                self.assertEqual(f.read(), contents)
+            shutil.rmtree(extractPath)
+
+            # the archive is inspected with a single HEAD request
+            del s.bucket.headRequests[:]
+            s.removeArchive(s.downloadArchive("p", "doc"))
+            self.assertEqual(s.bucket.headRequests, ["p/doc.zip"])
+
+            # checksums of another upload are not applied
+            s.bucket.metadata["p/doc.zip"]["checksum"] = "other"
+            def download(keyName, localPath):
+                with open(localPath, 'wb') as f:
+                    f.write(s.bucket.objects[keyName])
+            s.bucket.bind_download_file_method(download)
+            del s.bucket.rangeRequests[:]
+            s.downloadCompressed("p", "doc", extractPath)
+            self.assertEqual(s.bucket.rangeRequests, [])
+        finally:
+            shutil.rmtree(tempPath)
+
+    def test_archive_and_extract_with_parallel_compression(self):
+        tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        compressPath = os.path.join(tempPath, "compress")
+        extractPath = os.path.join(tempPath, "extract")
+
+        m = MockS3Resource()
+        m.bind_bucket_method(lambda name: MockS3Bucket(name))
+        s = S3Interface(m, "b", tempPath)
+        s.compressionWorkers = 4
+        s.extractionWorkers = 4
+        s.parallelExtractionMinSize = 0
+        os.makedirs(os.path.join(compressPath, "sub"))
+        os.makedirs(extractPath)
+        try:
+            contents = os.urandom(1000) + b"abc" * 1000000
+            with open(os.path.join(compressPath, "sub", "big"), 'wb') as f:
+                f.write(contents)
+            name = s.archiveFileOrDirectory(compressPath, "dir")
+            s.unpackFileOrDirectory(name, extractPath)
+            with open(os.path.join(extractPath, "sub", "big"), 'rb') as f:
+                self.assertEqual(f.read(), contents)
+
+            name = s.archiveFileOrDirectory(os.path.join(compressPath, "sub", "big"), "file")
+            s.unpackFileOrDirectory(name, os.path.join(extractPath, "renamed"))
+            with open(os.path.join(extractPath, "renamed"), 'rb') as f:
+                self.assertEqual(f.read(), contents)
+        finally:
+            shutil.rmtree(tempPath)
+
+    def test_archive_and_extract_with_compression_settings(self):
+        tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        compressPath = os.path.join(tempPath, "compress")
+        extractPath = os.path.join(tempPath, "extract")
+
+        m = MockS3Resource()
+        m.bind_bucket_method(lambda name: MockS3Bucket(name))
+        s = S3Interface(m, "b", tempPath)
+        s.compressionWorkers = 1
+        s.rangeChunkSize = 1000
+        os.makedirs(os.path.join(compressPath, "sub"))
+        try:
+            contents = {
+                "random": os.urandom(20000),
+                "text": b"compressible " * 5000 }
+            for name, value in contents.items():
+                with open(os.path.join(compressPath, "sub", name), 'wb') as f:
+                    f.write(value)
+            for compression in ["store", "deflate:1", "bzip2", "auto"]:
+                archive = s.archiveFileOrDirectory(compressPath, "dir", compression)
+                with zipfile.ZipFile(archive) as z:
+                    methods = dict((i.filename, i.compress_type) for i in z.infolist())
+                s.unpackFileOrDirectory(archive, os.path.join(extractPath, compression))
+                os.remove(archive)
+                self.putArchive(s, compressPath, "p/{0}.zip".format(compression), compression)
+                s.downloadCompressed("p", compression,
+                                     os.path.join(extractPath, compression + "_pipelined"),
+                                     pipelined=True)
+                for name, value in contents.items():
+                    for suffix in ["", "_pipelined"]:
+                        with open(os.path.join(extractPath, compression + suffix, "sub", name), 'rb') as f:
+                            self.assertEqual(f.read(), value)
+                if compression == "auto":
+                    self.assertEqual(methods["sub/random"], zipfile.ZIP_STORED)
+                    self.assertEqual(methods["sub/text"], zipfile.ZIP_DEFLATED)
+                elif compression == "bzip2":
+                    self.assertEqual(methods["sub/text"], 12)
+
+            fn = os.path.join(compressPath, "sub", "text")
+            archive = s.archiveFileOrDirectory(fn, "file", "bzip2")
+            s.unpackFileOrDirectory(archive, os.path.join(extractPath, "renamed"))
+            with open(os.path.join(extractPath, "renamed"), 'rb') as f:
+                self.assertEqual(f.read(), contents["text"])
+        finally:
+            shutil.rmtree(tempPath)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,159 @@
+import unittest, os, shutil
+from s3interface import S3Interface
+from shardeddocument import ShardedDocument
+from s3interface_test import MockS3Resource, MockS3Bucket
+
+class ShardedDocument_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        self.sourcePath = os.path.join(self.tempPath, "source")
+        self.destPath = os.path.join(self.tempPath, "dest")
+        os.makedirs(os.path.join(self.sourcePath, "sub", "deeper"))
+        os.makedirs(os.path.join(self.sourcePath, "empty"))
+        self.files = {
+            "a": os.urandom(4000),
+            os.path.join("sub", "b"): os.urandom(3000),
+            os.path.join("sub", "c.txt"): b"c" * 2000,
+            os.path.join("sub", "deeper", "d"): os.urandom(1000),
+            "e.txt": b"e" * 10 }
+        for relpath, contents in self.files.items():
+            with open(os.path.join(self.sourcePath, relpath), 'wb') as f:
+                f.write(contents)
+
+        m = MockS3Resource()
+        m.bind_bucket_method(lambda name: MockS3Bucket(name))
+        self.s3 = S3Interface(m, "b", self.tempPath)
+        self.s3.shardSize = 3000
+        self.s3.checksumBlockSize = 1000
+        bucket = self.s3.bucket
+        def upload(localPath, keyName):
+            with open(localPath, 'rb') as f:
+                bucket.objects[keyName] = f.read()
+        def download(keyName, localPath):
+            with open(localPath, 'wb') as f:
+                f.write(bucket.objects[keyName])
+        bucket.bind_upload_file_method(upload)
+        bucket.bind_download_file_method(download)
+        self.sharded = ShardedDocument(self.s3)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempPath)
+
+    def assertTreesEqual(self, relpaths=None):
+        for relpath, contents in self.files.items():
+            path = os.path.join(self.destPath, relpath)
+            if relpaths is None or relpath in relpaths:
+                with open(path, 'rb') as f:
+                    self.assertEqual(f.read(), contents)
+            else:
+                self.assertFalse(os.path.exists(path))
+        if relpaths is None:
+            self.assertTrue(os.path.isdir(os.path.join(self.destPath, "empty")))
+
+    def test_partition_balances_files_and_keeps_directories_in_first_shard(self):
+        entries = [("r", ".", None), ("f1", "f1", 10), ("s", "s", None),
+                   ("f2", "s/f2", 6), ("f3", "s/f3", 5), ("f4", "f4", 4)]
+        shards = ShardedDocument.partition(entries, 2)
+        self.assertEqual([[e[1] for e in s] for s in shards],
+                         [[".", "f1", "s", "f4"], ["s/f2", "s/f3"]])
+
+    def test_shardCount(self):
+        self.assertEqual(ShardedDocument.shardCount(self.sourcePath, None, 64), 1)
+        self.assertEqual(ShardedDocument.shardCount(self.sourcePath, 3000, 64), 4)
+        self.assertEqual(ShardedDocument.shardCount(self.sourcePath, 3000, 2), 2)
+        self.assertEqual(ShardedDocument.shardCount(self.sourcePath, 100000, 64), 1)
+        self.assertEqual(ShardedDocument.shardCount(
+            os.path.join(self.sourcePath, "a"), 10, 64), 1)
+
+    def test_large_directory_is_uploaded_and_downloaded_as_shards(self):
+        self.s3.uploadCompressed("p", "doc", self.sourcePath, compression="bzip2")
+        objects = self.s3.bucket.objects
+        self.assertFalse("p/doc.zip" in objects)
+        index = self.sharded.readIndex("p", "doc")
+        self.assertEqual(len(index["Shards"]), 4)
+        self.assertEqual(sorted(objects), sorted(["p/doc.shards.json"] +
+                                                 [s["Key"] for s in index["Shards"]]))
+        self.assertEqual(sum(s["Bytes"] for s in index["Shards"]),
+                         sum(len(c) for c in self.files.values()))
+        self.assertEqual(self.s3.bucket.metadata["p/doc.shards.json"], {"compression": "bzip2"})
+
+        size = self.s3.downloadCompressed("p", "doc", self.destPath)
+        self.assertEqual(size, sum(s["Size"] for s in index["Shards"]))
+        self.assertTreesEqual()
+        # the downloaded shards are removed
+        self.assertEqual(sorted(os.listdir(self.tempPath)), ["dest", "source"])
+
+    def test_sharded_pipelined_and_member_downloads(self):
+        self.s3.uploadCompressed("p", "doc", self.sourcePath, streaming=True)
+        self.assertEqual(sorted(self.s3.listDocumentMembers("p", "doc")),
+                         sorted(["./", "empty/", "sub/", "sub/deeper/", "a", "e.txt",
+                                 "sub/b", "sub/c.txt", "sub/deeper/d"]))
+        self.s3.downloadCompressedPipelined("p", "doc", self.destPath)
+        self.assertTreesEqual()
+        shutil.rmtree(self.destPath)
+        self.s3.downloadMembers("p", "doc", self.destPath, ["*.txt"])
+        self.assertTreesEqual(["e.txt", os.path.join("sub", "c.txt")])
+
+    def test_reupload_removes_unreferenced_shards_and_layouts(self):
+        self.s3.uploadCompressed("p", "doc", self.sourcePath)
+        self.s3.shardSize = 6000
+        self.s3.uploadCompressed("p", "doc", self.sourcePath)
+        index = self.sharded.readIndex("p", "doc")
+        self.assertEqual(len(index["Shards"]), 2)
+        self.assertEqual(len(self.s3.bucket.objects), 3)
+
+        self.s3.shardSize = 10 ** 9
+        self.s3.uploadCompressed("p", "doc", self.sourcePath)
+        self.assertEqual(sorted(self.s3.bucket.objects), ["p/doc.zip", "p/doc.zip.checksum.json"])
+        # only an upload replacing shards looks for them
+        del self.s3.bucket.headRequests[:]
+        self.s3.uploadCompressed("p", "doc", self.sourcePath)
+        self.assertEqual(self.s3.bucket.headRequests, ["p/doc.shards.json"])
+        self.s3.shardSize = None
+        del self.s3.bucket.headRequests[:]
+        self.s3.uploadCompressed("p", "doc", self.sourcePath)
+        self.assertEqual(self.s3.bucket.headRequests, [])
+        self.s3.shardSize = 3000
+        self.s3.uploadCompressed("p", "doc", self.sourcePath)
+        self.assertFalse("p/doc.zip" in self.s3.bucket.objects)
+        self.s3.downloadCompressed("p", "doc", self.destPath)
+        self.assertTreesEqual()
+
+    def test_failed_reupload_keeps_the_previous_version(self):
+        self.s3.uploadCompressed("p", "doc", self.sourcePath)
+        objects = dict(self.s3.bucket.objects)
+        self.assertTrue(all(k.startswith("p/doc.shards/" + self.sharded.readIndex("p", "doc")["Id"])
+                            for k in objects if k != "p/doc.shards.json"))
+        bucket = self.s3.bucket
+        def failingUpload(localPath, keyName):
+            if keyName.endswith("00001.zip"):
+                raise IOError("connection lost")
+            with open(localPath, 'rb') as f:
+                bucket.objects[keyName] = f.read()
+        bucket.bind_upload_file_method(failingUpload)
+        with open(os.path.join(self.sourcePath, "a"), 'wb') as f:
+            f.write(os.urandom(4000))
+        self.assertRaises(ValueError, lambda: self.s3.uploadCompressed("p", "doc", self.sourcePath))
+        # the new shards are removed, and the previous ones are untouched
+        self.assertEqual(bucket.objects, objects)
+        self.s3.downloadCompressed("p", "doc", self.destPath)
+        with open(os.path.join(self.destPath, "a"), 'rb') as f:
+            self.assertEqual(f.read(), self.files["a"])
+
+    def test_document_shard_settings_override_the_interface(self):
+        # sharding is opt-in
+        m = MockS3Resource()
+        m.bind_bucket_method(lambda name: MockS3Bucket(name))
+        self.assertIsNone(S3Interface(m, "b", self.tempPath).shardSize)
+        self.s3.shardSize = None
+        self.s3.uploadDocument("p", {"Name": "single"}, self.sourcePath)
+        self.assertTrue("p/single.zip" in self.s3.bucket.objects)
+        self.s3.uploadDocument("p", {"Name": "doc", "ShardSize": 3000, "MaxShards": 2},
+                               self.sourcePath)
+        self.assertEqual(len(self.sharded.readIndex("p", "doc")["Shards"]), 2)
+        self.s3.downloadCompressed("p", "doc", self.destPath)
+        self.assertTreesEqual()
+
+if __name__ == '__main__':
+    unittest.main()
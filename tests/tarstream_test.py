@@ -0,0 +1,85 @@
+import unittest, os, shutil, io, tarfile
+from tarstream import TarStream, _DecompressingReader
+from compressioncodec import CompressionCodec
+
+class TarStream_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        self.sourcePath = os.path.join(self.tempPath, "source")
+        self.destPath = os.path.join(self.tempPath, "dest")
+        os.makedirs(os.path.join(self.sourcePath, "sub", "empty"))
+        self.files = {
+            "a": os.urandom(5000),
+            os.path.join("sub", "b.txt"): b"b" * 20000 }
+        for relpath, contents in self.files.items():
+            with open(os.path.join(self.sourcePath, relpath), 'wb') as f:
+                f.write(contents)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempPath)
+
+    def roundTrip(self, tar, localPath, destinationPath, onRead=None):
+        stream = io.BytesIO()
+        kind = tar.write(stream, localPath)
+        stream.seek(0)
+        tar.extract(stream, destinationPath, kind, onRead)
+        return kind, len(stream.getvalue())
+
+    def test_directory_round_trip(self):
+        for setting in ["deflate", "deflate:1", "bzip2", "store"]:
+            tar = TarStream(CompressionCodec.get(setting), chunkSize=1000)
+            reads = []
+            kind, size = self.roundTrip(tar, self.sourcePath, self.destPath, reads.append)
+            self.assertEqual(kind, TarStream.DIRECTORY)
+            self.assertEqual(sum(reads), size)
+            for relpath, contents in self.files.items():
+                with open(os.path.join(self.destPath, relpath), 'rb') as f:
+                    self.assertEqual(f.read(), contents)
+            self.assertTrue(os.path.isdir(os.path.join(self.destPath, "sub", "empty")))
+            shutil.rmtree(self.destPath)
+
+    def test_file_round_trip_extracts_to_destination_path(self):
+        destination = os.path.join(self.destPath, "renamed")
+        kind, size = self.roundTrip(TarStream(), os.path.join(self.sourcePath, "a"), destination)
+        self.assertEqual(kind, TarStream.FILE)
+        with open(destination, 'rb') as f:
+            self.assertEqual(f.read(), self.files["a"])
+
+    def test_directory_stream_is_not_extracted_as_file(self):
+        stream = io.BytesIO()
+        TarStream().write(stream, self.sourcePath)
+        stream.seek(0)
+        self.assertRaises(ValueError, lambda: TarStream().extract(
+            stream, os.path.join(self.destPath, "file"), TarStream.FILE))
+
+    def test_members_outside_destination_are_rejected(self):
+        raw = io.BytesIO()
+        with tarfile.open(fileobj=raw, mode="w") as t:
+            info = tarfile.TarInfo("../escaped")
+            info.size = 1
+            t.addfile(info, io.BytesIO(b"x"))
+        stream = io.BytesIO()
+        compressor = CompressionCodec.get("deflate").compressor()
+        stream.write(compressor.compress(raw.getvalue()) + compressor.flush())
+        stream.seek(0)
+        self.assertRaises(ValueError, lambda: TarStream().extract(
+            stream, self.destPath, TarStream.DIRECTORY))
+        self.assertFalse(os.path.exists(os.path.join(self.tempPath, "escaped")))
+
+    def test_decompressing_reader_returns_the_data_in_reads_of_any_size(self):
+        data = os.urandom(3000) * 20
+        compressor = CompressionCodec.get("deflate").compressor()
+        stream = io.BytesIO(compressor.compress(data) + compressor.flush())
+        reader = _DecompressingReader(stream, CompressionCodec.get("deflate").decompressor(), 50000)
+        chunks = [reader.read(n) for n in [1, 7, 100, 0, 4096]]
+        chunks.append(reader.read())
+        self.assertEqual([len(c) for c in chunks[:5]], [1, 7, 100, 0, 4096])
+        self.assertEqual(b"".join(chunks), data)
+        self.assertEqual(reader.read(10), b"")
+
+    def test_auto_compression_is_rejected(self):
+        self.assertRaises(ValueError, lambda: TarStream(CompressionCodec.get("auto")))
+
+if __name__ == '__main__':
+    unittest.main()
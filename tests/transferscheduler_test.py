@@ -0,0 +1,89 @@
+import unittest, threading, time
+from transferscheduler import TransferScheduler
+
+class TransferScheduler_Test(unittest.TestCase):
+
+    def test_constructor_rejects_invalid_limits(self):
+        self.assertRaises(ValueError, lambda: TransferScheduler(0))
+        self.assertRaises(ValueError, lambda: TransferScheduler(None, 0))
+
+    def test_context_sets_and_restores_thread_priority(self):
+        s = TransferScheduler()
+        self.assertEqual(s.current(), (TransferScheduler.STATUS, None))
+        with s.context(TransferScheduler.OUTPUT, "a"):
+            with s.context(TransferScheduler.INPUT, "b"):
+                self.assertEqual(s.current(), (TransferScheduler.INPUT, "b"))
+            self.assertEqual(s.current(), (TransferScheduler.OUTPUT, "a"))
+            other = []
+            t = threading.Thread(target=lambda: other.append(s.current()))
+            t.start()
+            t.join()
+            self.assertEqual(other, [(TransferScheduler.STATUS, None)])
+        self.assertEqual(s.current(), (TransferScheduler.STATUS, None))
+
+    def test_unlimited_scheduler_does_not_block(self):
+        s = TransferScheduler()
+        with s.request():
+            with s.transfer(10 ** 12):
+                pass
+
+    def serve(self, s, requests):
+        """queue the (priority, owner) requests behind a held slot and
+        return the order they are served in"""
+        order = []
+        threads = []
+        def run(priority, owner):
+            with s.request(priority, owner):
+                order.append((priority, owner))
+        with s.request():
+            for priority, owner in requests:
+                t = threading.Thread(target=run, args=(priority, owner))
+                t.start()
+                threads.append(t)
+                # queue in a known order
+                time.sleep(0.05)
+        for t in threads:
+            t.join()
+        return order
+
+    def test_requests_are_served_by_priority(self):
+        s = TransferScheduler(maxInFlight=1)
+        order = self.serve(s, [(TransferScheduler.OUTPUT, "out"),
+                               (TransferScheduler.INPUT, "in"),
+                               (TransferScheduler.STATUS, "log")])
+        self.assertEqual([owner for priority, owner in order], ["log", "in", "out"])
+
+    def test_owners_share_a_priority_class_fairly(self):
+        s = TransferScheduler(maxInFlight=1)
+        p = TransferScheduler.OUTPUT
+        order = self.serve(s, [(p, "a"), (p, "a"), (p, "a"), (p, "b"), (p, "b")])
+        self.assertEqual([owner for priority, owner in order], ["a", "b", "a", "b", "a"])
+
+    def test_request_limits_in_flight(self):
+        s = TransferScheduler(maxInFlight=2)
+        lock = threading.Lock()
+        state = {"active": 0, "max": 0}
+        def run():
+            with s.request():
+                with lock:
+                    state["active"] += 1
+                    state["max"] = max(state["max"], state["active"])
+                time.sleep(0.01)
+                with lock:
+                    state["active"] -= 1
+        threads = [threading.Thread(target=run) for i in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(state["max"], 2)
+        self.assertEqual(s.inFlight, 0)
+
+    def test_consume_limits_bytes_per_second(self):
+        s = TransferScheduler(bytesPerSecond=20000)
+        start = time.time()
+        # the first second of transfer is available immediately
+        s.consume(20000)
+        self.assertTrue(time.time() - start < 0.5)
+        s.consume(30000)
+        self.assertTrue(time.time() - start >= 1.3)
@@ -0,0 +1,38 @@
+import unittest, argparse
+from transfersettings import TransferSettings
+
+class TransferSettings_Test(unittest.TestCase):
+
+    def test_defaults_and_overrides(self):
+        settings = TransferSettings({"MaxConcurrency": 4})
+        self.assertEqual(settings.values["MaxConcurrency"], 4)
+        self.assertEqual(settings.values["MultipartChunkSize"], 8 * 1024 * 1024)
+        overridden = settings.override({"MaxQueueDepth": 5})
+        self.assertEqual(overridden.values["MaxConcurrency"], 4)
+        self.assertEqual(overridden.values["MaxQueueDepth"], 5)
+        self.assertEqual(settings.values["MaxQueueDepth"], 100)
+        self.assertTrue("concurrency 4" in str(settings))
+
+    def test_invalid_settings(self):
+        self.assertRaises(ValueError, lambda: TransferSettings({"Threads": 4}))
+        self.assertRaises(ValueError, lambda: TransferSettings({"MaxConcurrency": 0}))
+        self.assertRaises(ValueError, lambda: TransferSettings({"MaxConcurrency": "4"}))
+        self.assertRaises(ValueError, lambda: TransferSettings().override({"MaxConcurrency": True}))
+        # a long on python 2
+        self.assertEqual(TransferSettings({"MultipartChunkSize": 4 * 1024 ** 3})
+                         .values["MultipartChunkSize"], 4 * 1024 ** 3)
+
+    def test_command_line_arguments(self):
+        parser = argparse.ArgumentParser()
+        TransferSettings.addArguments(parser)
+        self.assertIsNone(TransferSettings.FromArguments(vars(parser.parse_args([]))))
+        settings = TransferSettings.FromArguments(vars(parser.parse_args(
+            ["--maxConcurrency", "3", "--multipartThreshold", "1000"])))
+        self.assertEqual(settings.values["MaxConcurrency"], 3)
+        self.assertEqual(settings.values["MultipartThreshold"], 1000)
+        roundTrip = TransferSettings.FromArguments(vars(parser.parse_args(
+            settings.toArguments().split())))
+        self.assertEqual(roundTrip.values, settings.values)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest, threading, time
+from workerpool import WorkerPool
+
+class WorkerPool_Test(unittest.TestCase):
+
+    def test_constructor_rejects_invalid_concurrency(self):
+        self.assertRaises(ValueError, lambda: WorkerPool(0))
+
+    def test_run_returns_results_in_item_order(self):
+        results = WorkerPool(4).run(lambda x: x * 2, range(20))
+        self.assertEqual([r[0] for r in results], list(range(20)))
+        self.assertEqual([r[1] for r in results], [x * 2 for x in range(20)])
+        self.assertTrue(all(r[2] is None for r in results))
+
+    def test_run_records_per_item_errors(self):
+        def func(x):
+            if x % 3 == 0:
+                raise ValueError("bad item {0}".format(x))
+            return x
+        results = WorkerPool(3).run(func, range(7))
+        failures = WorkerPool.failures(results)
+        self.assertEqual([f[0] for f in failures], [0, 3, 6])
+        self.assertTrue(all(isinstance(f[1], ValueError) for f in failures))
+        self.assertEqual(results[1], (1, 1, None))
+
+    def test_run_limits_concurrency(self):
+        lock = threading.Lock()
+        state = {"active": 0, "max": 0}
+        def func(x):
+            with lock:
+                state["active"] += 1
+                state["max"] = max(state["max"], state["active"])
+            time.sleep(0.01)
+            with lock:
+                state["active"] -= 1
+        WorkerPool(3).run(func, range(12))
+        self.assertTrue(state["max"] <= 3)
+        self.assertTrue(state["max"] > 1)
+
+    def test_serial_run_uses_calling_thread(self):
+        threads = WorkerPool(1).run(lambda x: threading.current_thread(), range(3))
+        self.assertTrue(all(r[1] is threading.current_thread() for r in threads))
+
+if __name__ == '__main__':
+    unittest.main()
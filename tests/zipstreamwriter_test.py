@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import unittest, os, shutil, zipfile, io
+from zipstreamwriter import ZipStreamWriter
+from compressioncodec import CompressionCodec
+
+class UnseekableSink(object):
+
+    def __init__(self):
+        self.data = io.BytesIO()
+
+    def write(self, data):
+        self.data.write(data)
+
+class ZipStreamWriter_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tempPath = os.path.join(os.getcwd(), "tests", "temp")
+        os.makedirs(self.tempPath)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempPath)
+
+    def test_archive_is_readable_by_zipfile(self):
+        fn = os.path.join(self.tempPath, "file.bin")
+        contents = os.urandom(5000) + b"a" * 100000
+        with open(fn, 'wb') as f:
+            f.write(contents)
+        sink = UnseekableSink()
+        with ZipStreamWriter(sink, chunkSize=1000) as z:
+            z.write(self.tempPath, "dir")
+            z.write(fn, "dir/file.bin")
+            z.writestr("flag", "")
+            z.writestr(u"unicodé", "text")
+
+        with zipfile.ZipFile(io.BytesIO(sink.data.getvalue())) as z:
+            self.assertEqual(z.namelist(), ["dir/", "dir/file.bin", "flag", u"unicodé"])
+            self.assertIsNone(z.testzip())
+            self.assertEqual(z.read("dir/file.bin"), contents)
+            self.assertEqual(z.read("flag"), b"")
+            self.assertEqual(z.read(u"unicodé"), b"text")
+            info = z.getinfo("dir/file.bin")
+            self.assertEqual(info.compress_type, zipfile.ZIP_DEFLATED)
+            self.assertTrue(info.compress_size < info.file_size)
+
+    def test_stored_members(self):
+        sink = UnseekableSink()
+        z = ZipStreamWriter(sink, CompressionCodec.get("store"))
+        z.writestr("a", "contents")
+        z.close()
+        with zipfile.ZipFile(io.BytesIO(sink.data.getvalue())) as z:
+            info = z.getinfo("a")
+            self.assertEqual(info.compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(z.read("a"), b"contents")
+
+    def test_auto_codec_stores_incompressible_members(self):
+        sink = UnseekableSink()
+        with ZipStreamWriter(sink, CompressionCodec.get("auto")) as z:
+            z.writestr("random", os.urandom(10000))
+            z.writestr("text", "compressible " * 1000)
+        with zipfile.ZipFile(io.BytesIO(sink.data.getvalue())) as z:
+            self.assertEqual(z.getinfo("random").compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(z.getinfo("text").compress_type, zipfile.ZIP_DEFLATED)
+            self.assertIsNone(z.testzip())
+
+    def test_many_members_use_zip64_end_record(self):
+        sink = UnseekableSink()
+        with ZipStreamWriter(sink, CompressionCodec.get("store")) as z:
+            for i in range(0x10000):
+                z.writestr(str(i), "")
+        with zipfile.ZipFile(io.BytesIO(sink.data.getvalue())) as z:
+            self.assertEqual(len(z.namelist()), 0x10000)
+            self.assertEqual(z.namelist()[-1], str(0xFFFF))
+
+    def test_closed_archive_rejects_members(self):
+        z = ZipStreamWriter(UnseekableSink())
+        z.close()
+        self.assertRaises(ValueError, lambda: z.writestr("a", "b"))
+
+if __name__ == '__main__':
+    unittest.main()
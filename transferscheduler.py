@@ -0,0 +1,144 @@
+import time, threading, itertools
+from contextlib import contextmanager
+
+class TransferScheduler(object):
+    """limits the S3 requests in flight and the bytes per second transferred
+    by all uploads and downloads of a process.
+
+    Each transfer belongs to a priority class and an owner, normally the
+    document it transfers. Waiting transfers are served strictly by class,
+    status and log traffic first, then input documents, then output
+    documents. Within a class the owner served least recently goes first,
+    so concurrent documents share the budgets fairly. Bandwidth is limited
+    with a token bucket holding up to one second of transfer.
+
+    The class and owner of the transfers made on a thread are set with
+    context, and default to the status class.
+    """
+
+    STATUS = 0
+    INPUT = 1
+    OUTPUT = 2
+
+    def __init__(self, maxInFlight=None, bytesPerSecond=None):
+        """
+        Args:
+            maxInFlight: optional limit on the number of concurrent requests
+            bytesPerSecond: optional limit on the total transfer rate
+        """
+        if maxInFlight is not None and maxInFlight < 1:
+            raise ValueError("maxInFlight must be at least 1, got {0}".format(maxInFlight))
+        if bytesPerSecond is not None and bytesPerSecond < 1:
+            raise ValueError("bytesPerSecond must be at least 1, got {0}".format(bytesPerSecond))
+        self.maxInFlight = maxInFlight
+        self.bytesPerSecond = bytesPerSecond
+        self.inFlight = 0
+        self.__condition = threading.Condition()
+        self.__local = threading.local()
+        self.__sequence = itertools.count()
+        self.__lastServed = {}
+        self.__slotWaiters = []
+        self.__tokenWaiters = []
+        self.__tokens = float(bytesPerSecond or 0)
+        self.__refilled = time.time()
+
+    @contextmanager
+    def context(self, priority, owner=None):
+        """set the class and owner of transfers made on the calling thread"""
+        previous = self.current()
+        self.__local.priority, self.__local.owner = priority, owner
+        try:
+            yield
+        finally:
+            self.__local.priority, self.__local.owner = previous
+
+    def current(self):
+        """returns the (priority, owner) of transfers on the calling thread"""
+        return getattr(self.__local, "priority", self.STATUS), getattr(self.__local, "owner", None)
+
+    @contextmanager
+    def request(self, priority=None, owner=None):
+        """hold one of the maxInFlight request slots. priority and owner
+        default to those of the calling thread"""
+        if self.maxInFlight is None:
+            yield
+            return
+        priority, owner = self.__resolve(priority, owner)
+        self.__wait(self.__slotWaiters, priority, owner,
+                    lambda: self.inFlight < self.maxInFlight, self.__takeSlot, None)
+        try:
+            yield
+        finally:
+            with self.__condition:
+                self.inFlight -= 1
+                self.__condition.notify_all()
+
+    def consume(self, nbytes, priority=None, owner=None):
+        """block until nbytes may be transferred within bytesPerSecond"""
+        if self.bytesPerSecond is None:
+            return
+        priority, owner = self.__resolve(priority, owner)
+        while nbytes > 0:
+            n = min(nbytes, self.bytesPerSecond)
+            self.__wait(self.__tokenWaiters, priority, owner,
+                        lambda: self.__refill() >= n, lambda: self.__takeTokens(n),
+                        lambda: (n - self.__tokens) / self.bytesPerSecond)
+            nbytes -= n
+
+    @contextmanager
+    def transfer(self, nbytes, priority=None, owner=None):
+        """hold a request slot for a request transferring nbytes, which are
+        consumed from the bandwidth budget before the request is made"""
+        with self.request(priority, owner):
+            self.consume(nbytes, priority, owner)
+            yield
+
+    def __resolve(self, priority, owner):
+        current = self.current()
+        return (current[0] if priority is None else priority,
+                current[1] if owner is None else owner)
+
+    def __wait(self, waiters, priority, owner, ready, take, delay):
+        with self.__condition:
+            entry = [priority, 0, next(self.__sequence), owner]
+            waiters.append(entry)
+            try:
+                while True:
+                    for w in waiters:
+                        w[1] = self.__lastServed.get(w[3], -1)
+                    if min(waiters) is entry and ready():
+                        take()
+                        self.__lastServed[owner] = next(self.__sequence)
+                        self.__condition.notify_all()
+                        return
+                    # tokens accumulate without notification, so waiters
+                    # for bandwidth wake up when enough should be available
+                    self.__condition.wait(None if delay is None else max(0.001, delay()))
+            finally:
+                waiters.remove(entry)
+
+    def __takeSlot(self):
+        self.inFlight += 1
+
+    def __takeTokens(self, n):
+        self.__tokens -= n
+
+    def __refill(self):
+        now = time.time()
+        self.__tokens = min(float(self.bytesPerSecond),
+                            self.__tokens + (now - self.__refilled) * self.bytesPerSecond)
+        self.__refilled = now
+        return self.__tokens
+
+    @staticmethod
+    def addArguments(parser):
+        """add the optional scheduler arguments to an argparse parser"""
+        parser.add_argument("--maxRequests", type=int, default=None, required=False,
+                            help = "optional limit on concurrent S3 requests across all transfers")
+        parser.add_argument("--maxBytesPerSecond", type=int, default=None, required=False,
+                            help = "optional limit on the total S3 transfer rate in bytes per second")
+
+    @staticmethod
+    def FromArguments(args):
+        """returns the scheduler configured by a dictionary of parsed arguments"""
+        return TransferScheduler(args.get("maxRequests"), args.get("maxBytesPerSecond"))
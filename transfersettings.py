@@ -0,0 +1,81 @@
+import numbers
+
+class TransferSettings(object):
+    """the multipart settings of managed S3 transfers (upload_file and
+    download_file). Settings are read from a dictionary such as the
+    "TransferSettings" of the instance config's BootStrapperConfig or of a
+    manifest document, or from command line arguments, and are passed to
+    boto3 as a TransferConfig
+    """
+
+    # dictionary key, command line argument, boto3 TransferConfig argument
+    # and the boto3 default
+    fields = [
+        ("MultipartThreshold", "multipartThreshold", "multipart_threshold", 8 * 1024 * 1024),
+        ("MultipartChunkSize", "multipartChunkSize", "multipart_chunksize", 8 * 1024 * 1024),
+        ("MaxConcurrency", "maxConcurrency", "max_concurrency", 10),
+        ("MaxQueueDepth", "maxQueueDepth", "max_io_queue", 100)
+    ]
+
+    def __init__(self, values=None):
+        """
+        Args:
+            values: optional dictionary of setting names to positive
+            integers, unspecified settings take the boto3 defaults
+        """
+        self.values = dict((key, default) for key, arg, name, default in self.fields)
+        if values is not None:
+            self.__update(values)
+
+    def override(self, values):
+        """returns a copy of these settings with the specified values replaced"""
+        settings = TransferSettings(self.values)
+        settings.__update(values)
+        return settings
+
+    def toTransferConfig(self):
+        """returns the equivalent boto3.s3.transfer.TransferConfig"""
+        from boto3.s3.transfer import TransferConfig
+        return TransferConfig(**dict((name, self.values[key])
+                                     for key, arg, name, default in self.fields))
+
+    def toArguments(self):
+        """returns the command line arguments that reproduce these settings"""
+        args = []
+        for key, arg, name, default in self.fields:
+            args.append("--{0} {1}".format(arg, self.values[key]))
+        return " ".join(args)
+
+    def __update(self, values):
+        keys = [key for key, arg, name, default in self.fields]
+        for key, value in values.items():
+            if key not in keys:
+                raise ValueError("unknown transfer setting '{0}', expected one of {1}"
+                                 .format(key, ",".join(keys)))
+            # numbers.Integral includes the long of python 2
+            if not isinstance(value, numbers.Integral) or isinstance(value, bool) or value < 1:
+                raise ValueError("transfer setting '{0}' must be a positive integer, got {1}"
+                                 .format(key, value))
+            self.values[key] = value
+
+    def __str__(self):
+        return "multipart threshold {0} bytes, chunk size {1} bytes, concurrency {2}, queue depth {3}" \
+            .format(*[self.values[key] for key, arg, name, default in self.fields])
+
+    @staticmethod
+    def addArguments(parser):
+        """add the optional transfer setting arguments to an argparse parser"""
+        for key, arg, name, default in TransferSettings.fields:
+            parser.add_argument("--{0}".format(arg), type=int, default=None, required=False,
+                                help = "optional S3 transfer setting {0} (boto3 default {1})"
+                                .format(key, default))
+
+    @staticmethod
+    def FromArguments(args):
+        """returns the settings given in a dictionary of parsed arguments, or
+        None if no transfer setting argument was specified"""
+        values = dict((key, args[arg]) for key, arg, name, default in TransferSettings.fields
+                      if args.get(arg) is not None)
+        if len(values) == 0:
+            return None
+        return TransferSettings(values)
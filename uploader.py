@@ -1,6 +1,11 @@
-import boto3, logging, argparse, os, sys
+import logging, argparse, os, sys
 from application import Application
+from manifest import Manifest
 from loghelper import LogHelper
+from transfersettings import TransferSettings
+from s3clientfactory import S3ClientFactory
+from transferscheduler import TransferScheduler
+from archivesettings import ArchiveSettings
 
 def main():
 
@@ -11,15 +16,25 @@ def main():
 
     parser.add_argument("--manifestPath", help = "path to a manifest file describing the jobs and data requirements for the application", required=True)
     parser.add_argument("--localWorkingDir", help = "path to dir with read/write for processing data for upload and download to AWS S3", required=True)
+    parser.add_argument("--skipUnchanged", help = "optional flag: skip archiving and uploading documents whose contents match the copy already in S3", action="store_true")
+    parser.add_argument("--concurrency", help = "optional number of documents to archive and upload in parallel (default 1)", type=int, default=1, required=False)
+    TransferSettings.addArguments(parser)
+    S3ClientFactory.addArguments(parser)
+    Manifest.addArguments(parser)
+    TransferScheduler.addArguments(parser)
+    ArchiveSettings.addArguments(parser)
     try:
         args = vars(parser.parse_args())
         manifestPath = os.path.abspath(args["manifestPath"])
         localWorkingDir = os.path.abspath(args["localWorkingDir"])
 
-        s3 = boto3.resource('s3')
+        s3 = S3ClientFactory.FromArguments(args)
 
-        app = Application(s3, manifestPath, localWorkingDir)
-        app.uploadS3Documents()
+        app = Application(s3, manifestPath, localWorkingDir,
+                          TransferSettings.FromArguments(args), args["manifestCacheDir"])
+        app.s3interface.scheduler = TransferScheduler.FromArguments(args)
+        ArchiveSettings.FromArguments(args).apply(app.s3interface)
+        app.uploadS3Documents(args["concurrency"], args["skipUnchanged"])
     except Exception as ex:
         logging.exception("error in launcher")
         sys.exit(1)
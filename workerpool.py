@@ -0,0 +1,48 @@
+import logging
+from multiprocessing.pool import ThreadPool
+
+class WorkerPool(object):
+    """runs a function over a sequence of work items using a bounded pool of
+    worker threads, recording the result or error of each item"""
+
+    def __init__(self, concurrency):
+        """
+        Args:
+            concurrency: the maximum number of work items processed at once.
+            A value of 1 processes items serially on the calling thread
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1, got {0}"
+                             .format(concurrency))
+        self.concurrency = concurrency
+
+    def run(self, func, items):
+        """call func on each of the specified items
+
+        Returns:
+            a list of (item, result, exception) tuples in the same order as
+            items. For each item exactly one of result or exception is set
+        """
+        items = list(items)
+
+        def task(item):
+            try:
+                return (item, func(item), None)
+            except Exception as ex:
+                logging.exception("error processing work item {0}".format(item))
+                return (item, None, ex)
+
+        if self.concurrency == 1 or len(items) <= 1:
+            return [task(item) for item in items]
+
+        pool = ThreadPool(min(self.concurrency, len(items)))
+        try:
+            return pool.map(task, items)
+        finally:
+            pool.close()
+            pool.join()
+
+    @staticmethod
+    def failures(results):
+        """filter the result of run to the (item, exception) pairs that failed"""
+        return [(item, ex) for item, result, ex in results if ex is not None]
@@ -0,0 +1,213 @@
+import os, stat, struct, time, zlib
+from compressioncodec import CompressionCodec
+
+class ZipStreamWriter(object):
+    """writes a zip archive in a single forward pass to any object with a
+    write method, so the output does not need to be seekable.
+
+    The CRC and sizes of each member follow its data in a data descriptor,
+    and are repeated in the central directory written on close. The result is
+    a standard (zip64 where needed) archive readable by zipfile.ZipFile
+    """
+
+    __localHeader = struct.Struct("<4s2B4HL2L2H")
+    __dataDescriptor = struct.Struct("<4sL2L")
+    __dataDescriptor64 = struct.Struct("<4sL2Q")
+    __centralDir = struct.Struct("<4s4B4HL2L5H2L")
+    __endArchive = struct.Struct("<4s4H2LH")
+    __endArchive64 = struct.Struct("<4sQ2H2L4Q")
+    __endArchive64Locator = struct.Struct("<4sLQL")
+    __zip64Limit = (1 << 31) - 1
+    __descriptorFlag = 0x08
+    __utf8Flag = 0x800
+
+    def __init__(self, fileobj, codec=None, chunkSize=1024 * 1024):
+        """
+        Args:
+            fileobj: the destination, only its write method is used
+            codec: the CompressionCodec of file members, deflate by default
+            chunkSize: the number of bytes read from source files at a time
+        """
+        self.fileobj = fileobj
+        self.codec = CompressionCodec.get("deflate") if codec is None else codec
+        self.chunkSize = chunkSize
+        self.offset = 0
+        self.members = []
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # on error the archive is left incomplete, the caller is expected
+        # to discard the destination
+        if exc_type is None:
+            self.close()
+
+    def write(self, filename, arcname=None):
+        """add the file or directory at filename to the archive, in the same
+        way as zipfile.ZipFile.write"""
+        st = os.stat(filename)
+        isdir = stat.S_ISDIR(st.st_mode)
+        arcname = self.__normalizeArcname(filename if arcname is None else arcname, isdir)
+        mode = (st.st_mode & 0xFFFF) << 16
+        if isdir:
+            self._addMember(arcname, st.st_mtime, mode | 0x10,
+                            CompressionCodec.get("store"), 0)
+        else:
+            self._addMember(arcname, st.st_mtime, mode, self.codec.forFile(filename),
+                            st.st_size, filename=filename)
+
+    def writestr(self, arcname, data):
+        """add a member with the specified string contents to the archive"""
+        if not isinstance(data, bytes):
+            data = data.encode("utf-8")
+        self._addMember(self.__normalizeArcname(arcname, False), time.time(),
+                        0o600 << 16, self.codec.forData(data), len(data), data=data)
+
+    def close(self):
+        """write the central directory, completing the archive"""
+        if self.closed:
+            return
+        self.closed = True
+        centralDirOffset = self.offset
+        for m in self.members:
+            extra = b""
+            fileSize, compressSize, headerOffset = m["FileSize"], m["CompressSize"], m["HeaderOffset"]
+            zip64Fields = []
+            if fileSize > self.__zip64Limit or compressSize > self.__zip64Limit:
+                zip64Fields.extend([fileSize, compressSize])
+                fileSize = compressSize = 0xffffffff
+            if headerOffset > self.__zip64Limit:
+                zip64Fields.append(headerOffset)
+                headerOffset = 0xffffffff
+            if len(zip64Fields) > 0:
+                extra = struct.pack("<HH" + "Q" * len(zip64Fields), 1,
+                                    8 * len(zip64Fields), *zip64Fields)
+            version = 45 if len(zip64Fields) > 0 else 20
+            self.__emit(self.__centralDir.pack(
+                b"PK\x01\x02", version, 3, version, 0, m["Flags"],
+                m["CompressType"], m["DosTime"], m["DosDate"], m["CRC"],
+                compressSize, fileSize, len(m["Name"]), len(extra), 0, 0, 0,
+                m["ExternalAttr"], headerOffset))
+            self.__emit(m["Name"])
+            self.__emit(extra)
+
+        count = len(self.members)
+        centralDirSize = self.offset - centralDirOffset
+        if count >= 0xFFFF or centralDirOffset > self.__zip64Limit \
+           or centralDirSize > self.__zip64Limit:
+            zip64EndOffset = self.offset
+            self.__emit(self.__endArchive64.pack(
+                b"PK\x06\x06", 44, 45, 45, 0, 0, count, count,
+                centralDirSize, centralDirOffset))
+            self.__emit(self.__endArchive64Locator.pack(
+                b"PK\x06\x07", 0, zip64EndOffset, 1))
+            count = min(count, 0xFFFF)
+            centralDirOffset = min(centralDirOffset, 0xffffffff)
+            centralDirSize = min(centralDirSize, 0xffffffff)
+        self.__emit(self.__endArchive.pack(
+            b"PK\x05\x06", 0, 0, count, count, centralDirSize,
+            centralDirOffset, 0))
+
+    def _addMember(self, arcname, mtime, externalAttr, codec, fileSize,
+                   filename=None, data=b""):
+        """write a complete member whose contents are read from filename, or
+        otherwise are data"""
+        member = self._beginMember(arcname, mtime, externalAttr, codec.method, fileSize)
+        compressor = codec.compressor()
+        if filename is None:
+            chunks = [data]
+        else:
+            f = open(filename, "rb")
+            chunks = iter(lambda: f.read(self.chunkSize), b"")
+        try:
+            for chunk in chunks:
+                self._writeBlock(member, chunk, compressor.compress(chunk))
+        finally:
+            if filename is not None:
+                f.close()
+        self._writeBlock(member, b"", compressor.flush())
+        self._endMember(member)
+
+    def _beginMember(self, arcname, mtime, externalAttr, compressType, fileSize):
+        """write the local header of a member, returning the state passed to
+        _writeBlock and _endMember"""
+        if self.closed:
+            raise ValueError("cannot add members to a closed archive")
+        name, flags = self.__encodeName(arcname)
+        flags |= self.__descriptorFlag
+        dosTime, dosDate = self.__dosDateTime(mtime)
+        # the sizes are only known once the data is written, so a zip64
+        # header is reserved whenever they could exceed the limit
+        zip64 = fileSize * 1.05 > self.__zip64Limit
+        extra = struct.pack("<HHQQ", 1, 16, 0, 0) if zip64 else b""
+        headerOffset = self.offset
+        self.__emit(self.__localHeader.pack(
+            b"PK\x03\x04", 45 if zip64 else 20, 0, flags, compressType,
+            dosTime, dosDate, 0,
+            0xffffffff if zip64 else 0, 0xffffffff if zip64 else 0,
+            len(name), len(extra)))
+        self.__emit(name)
+        self.__emit(extra)
+        return {
+            "Name": name, "ArcName": arcname, "Flags": flags,
+            "CompressType": compressType, "DosTime": dosTime, "DosDate": dosDate,
+            "CRC": 0, "FileSize": 0, "DataOffset": self.offset, "Zip64": zip64,
+            "HeaderOffset": headerOffset, "ExternalAttr": externalAttr }
+
+    def _writeBlock(self, member, raw, compressed):
+        """write the compressed form of the next block of a member's data.
+        raw is the uncompressed block, used for the CRC and size"""
+        member["CRC"] = zlib.crc32(raw, member["CRC"])
+        member["FileSize"] += len(raw)
+        self.__emit(compressed)
+
+    def _endMember(self, member):
+        """write the data descriptor of a member"""
+        crc = member["CRC"] = member["CRC"] & 0xffffffff
+        fileSize = member["FileSize"]
+        compressSize = member["CompressSize"] = self.offset - member.pop("DataOffset")
+        if member.pop("Zip64"):
+            self.__emit(self.__dataDescriptor64.pack(b"PK\x07\x08", crc, compressSize, fileSize))
+        elif compressSize > self.__zip64Limit or fileSize > self.__zip64Limit:
+            raise ValueError("member '{0}' grew beyond the zip64 limit while it was archived"
+                             .format(member["ArcName"]))
+        else:
+            self.__emit(self.__dataDescriptor.pack(b"PK\x07\x08", crc, compressSize, fileSize))
+        self.members.append(member)
+
+    def __emit(self, data):
+        if len(data) > 0:
+            self.fileobj.write(data)
+            self.offset += len(data)
+
+    @staticmethod
+    def __normalizeArcname(arcname, isdir):
+        # mirrors the arcname handling in zipfile.ZipFile.write
+        arcname = os.path.normpath(os.path.splitdrive(arcname)[1])
+        while arcname[0] in (os.sep, os.altsep):
+            arcname = arcname[1:]
+        if os.sep != "/":
+            arcname = arcname.replace(os.sep, "/")
+        if isdir:
+            arcname += "/"
+        return arcname
+
+    @staticmethod
+    def __encodeName(arcname):
+        if isinstance(arcname, bytes):
+            return arcname, 0
+        try:
+            return arcname.encode("ascii"), 0
+        except UnicodeEncodeError:
+            return arcname.encode("utf-8"), ZipStreamWriter.__utf8Flag
+
+    @staticmethod
+    def __dosDateTime(mtime):
+        t = time.localtime(mtime)
+        if t.tm_year < 1980:
+            return 0, (1 << 5) | 1
+        dosDate = (t.tm_year - 1980) << 9 | t.tm_mon << 5 | t.tm_mday
+        dosTime = t.tm_hour << 11 | t.tm_min << 5 | (t.tm_sec // 2)
+        return dosTime, dosDate